@@ -0,0 +1 @@
+"""Benchmarks for xcp_d's post-processing hot paths, run with airspeed velocity (asv)."""
@@ -0,0 +1,71 @@
+"""Benchmarks for parcellation and functional connectivity."""
+import os
+
+import nibabel as nb
+import numpy as np
+from benchmarks.common import (
+    CIFTI_ATLAS,
+    CIFTI_ATLAS_LABELS,
+    N_VOLUMES,
+    Benchmark,
+    make_cifti,
+    make_confounds,
+)
+
+
+def _make_pscalar(out_file):
+    """Parcellate the CIFTI atlas with itself, as wb_command -cifti-parcellate would."""
+    atlas_img = nb.load(CIFTI_ATLAS)
+    brain_models = atlas_img.header.get_axis(1)
+    label_table = atlas_img.header.get_axis(0).label[0]
+    atlas_data = np.asanyarray(atlas_img.dataobj)[0]
+
+    parcels = []
+    for value in np.unique(atlas_data):
+        if value == 0:
+            continue
+
+        parcels.append((label_table[int(value)][0], brain_models[atlas_data == value]))
+
+    parcels_axis = nb.cifti2.ParcelsAxis.from_brain_models(parcels)
+    img = nb.Cifti2Image(
+        np.arange(1, len(parcels_axis) + 1, dtype=np.float32)[None, :],
+        (nb.cifti2.ScalarAxis(["atlas"]), parcels_axis),
+    )
+    img.nifti_header.set_intent("ConnParcelScalr")
+    img.to_filename(out_file)
+    return out_file
+
+
+class CiftiConnect(Benchmark):
+    """Parcellate a 91k CIFTI and compute its correlation matrices."""
+
+    params = [N_VOLUMES]
+    param_names = ["n_volumes"]
+
+    def setup(self, n_volumes):
+        """Write the dtseries, the parcellated atlas, and the temporal mask."""
+        super().setup(n_volumes)
+        self.data_file = make_cifti(os.path.join(self.tmpdir, "bold.dtseries.nii"), n_volumes)
+        self.pscalar_file = _make_pscalar(os.path.join(self.tmpdir, "atlas.pscalar.nii"))
+        _, self.temporal_mask_file, _ = make_confounds(self.tmpdir, n_volumes)
+
+    def _run(self):
+        from xcp_d.interfaces.connectivity import CiftiConnect
+
+        CiftiConnect(
+            data_file=self.data_file,
+            atlas_file=CIFTI_ATLAS,
+            parcellated_atlas=self.pscalar_file,
+            atlas_labels=CIFTI_ATLAS_LABELS,
+            temporal_mask=self.temporal_mask_file,
+            correlate=True,
+        ).run(cwd=self.tmpdir)
+
+    def time_cifti_connect(self, n_volumes):
+        """Time CiftiConnect."""
+        self._run()
+
+    def peakmem_cifti_connect(self, n_volumes):
+        """Measure CiftiConnect's peak memory."""
+        self._run()
@@ -0,0 +1,100 @@
+"""Benchmarks for denoising and temporal filtering."""
+import pandas as pd
+from benchmarks.common import (
+    N_VOLUMES,
+    SPACES,
+    TR,
+    Benchmark,
+    get_n_elements,
+    make_bold_array,
+    make_confounds,
+)
+
+
+class DenoiseWithNilearn(Benchmark):
+    """Regress confounds, interpolate high-motion volumes, and band-pass filter."""
+
+    params = [SPACES, N_VOLUMES, [False, True]]
+    param_names = ["space", "n_volumes", "compose_filter"]
+
+    def setup(self, space, n_volumes, compose_filter):
+        """Simulate the BOLD data and confounds."""
+        super().setup(space, n_volumes)
+        self.compose_filter = compose_filter
+        self.bold_arr = make_bold_array(get_n_elements(space), n_volumes)
+        self.confounds_file, self.temporal_mask_file, _ = make_confounds(self.tmpdir, n_volumes)
+
+    def _run(self):
+        from xcp_d.utils.utils import denoise_with_nilearn
+
+        denoise_with_nilearn(
+            preprocessed_bold=self.bold_arr,
+            confounds_file=self.confounds_file,
+            temporal_mask=self.temporal_mask_file,
+            low_pass=0.08,
+            high_pass=0.01,
+            filter_order=2,
+            TR=TR,
+            compose_filter=self.compose_filter,
+        )
+
+    def time_denoise_with_nilearn(self, space, n_volumes, compose_filter):
+        """Time denoise_with_nilearn."""
+        self._run()
+
+    def peakmem_denoise_with_nilearn(self, space, n_volumes, compose_filter):
+        """Measure denoise_with_nilearn's peak memory."""
+        self._run()
+
+
+class ButterBandpass(Benchmark):
+    """Band-pass filter the BOLD data."""
+
+    params = [SPACES, N_VOLUMES]
+    param_names = ["space", "n_volumes"]
+
+    def setup(self, space, n_volumes):
+        """Simulate the BOLD data."""
+        super().setup(space, n_volumes)
+        self.bold_arr = make_bold_array(get_n_elements(space), n_volumes)
+
+    def _run(self):
+        from xcp_d.utils.utils import butter_bandpass
+
+        butter_bandpass(self.bold_arr, sampling_rate=1 / TR, low_pass=0.08, high_pass=0.01)
+
+    def time_butter_bandpass(self, space, n_volumes):
+        """Time butter_bandpass."""
+        self._run()
+
+    def peakmem_butter_bandpass(self, space, n_volumes):
+        """Measure butter_bandpass's peak memory."""
+        self._run()
+
+
+class InterpolateVolumes(Benchmark):
+    """Interpolate high-motion volumes with the precomputed temporal operator."""
+
+    params = [SPACES, N_VOLUMES]
+    param_names = ["space", "n_volumes"]
+
+    def setup(self, space, n_volumes):
+        """Simulate the BOLD data and temporal mask."""
+        super().setup(space, n_volumes)
+        self.bold_arr = make_bold_array(get_n_elements(space), n_volumes)
+        _, temporal_mask_file, _ = make_confounds(self.tmpdir, n_volumes)
+        censoring_df = pd.read_table(temporal_mask_file)
+        self.sample_mask = ~censoring_df["framewise_displacement"].to_numpy().astype(bool)
+
+    def _run(self):
+        from xcp_d.utils.temporal import interpolate_volumes
+
+        interpolate_volumes(self.bold_arr, sample_mask=self.sample_mask, TR=TR)
+
+    def time_interpolate_volumes(self, space, n_volumes):
+        """Time interpolate_volumes."""
+        self._run()
+
+    def peakmem_interpolate_volumes(self, space, n_volumes):
+        """Measure interpolate_volumes's peak memory."""
+        self._run()
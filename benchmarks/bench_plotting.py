@@ -0,0 +1,87 @@
+"""Benchmarks for the QC and executive summary figures."""
+import os
+
+import matplotlib
+import pandas as pd
+from benchmarks.common import (
+    N_VOLUMES,
+    SPACES,
+    TR,
+    Benchmark,
+    make_cifti,
+    make_confounds,
+    make_nifti,
+)
+
+matplotlib.use("Agg")
+
+
+class _PlotBenchmark(Benchmark):
+    params = [SPACES, N_VOLUMES]
+    param_names = ["space", "n_volumes"]
+
+    def setup(self, space, n_volumes):
+        """Write the BOLD data, masks, and motion file."""
+        super().setup(space, n_volumes)
+        self.mask_file, self.seg_file = None, None
+        if space == "fsLR":
+            self.bold_file = make_cifti(os.path.join(self.tmpdir, "bold.dtseries.nii"), n_volumes)
+        else:
+            self.bold_file, self.mask_file, self.seg_file = make_nifti(self.tmpdir, n_volumes)
+
+        _, _, self.motion_file = make_confounds(self.tmpdir, n_volumes)
+
+
+class FMRIPlot(_PlotBenchmark):
+    """Plot the QC carpet plot."""
+
+    def _run(self):
+        import matplotlib.pyplot as plt
+
+        from xcp_d.utils.plotting import FMRIPlot
+
+        confounds_df = pd.read_table(self.motion_file)[["framewise_displacement"]]
+        fig = FMRIPlot(
+            func_file=self.bold_file,
+            seg_file=self.seg_file,
+            data=confounds_df.rename(columns={"framewise_displacement": "FD"}),
+            mask_file=self.mask_file,
+        ).plot(labelsize=8)
+        fig.savefig(os.path.join(self.tmpdir, "qcplot.svg"), bbox_inches="tight")
+        plt.close(fig)
+
+    def time_fmriplot(self, space, n_volumes):
+        """Time FMRIPlot."""
+        self._run()
+
+    def peakmem_fmriplot(self, space, n_volumes):
+        """Measure FMRIPlot's peak memory."""
+        self._run()
+
+
+class PlotFMRIES(_PlotBenchmark):
+    """Plot the executive summary's pre- and post-processing carpet plots."""
+
+    def _run(self):
+        from xcp_d.utils.plotting import plot_fmri_es
+
+        plot_fmri_es(
+            preprocessed_bold=self.bold_file,
+            uncensored_denoised_bold=self.bold_file,
+            interpolated_filtered_bold=self.bold_file,
+            TR=TR,
+            filtered_motion=self.motion_file,
+            preprocessed_bold_figure=os.path.join(self.tmpdir, "preprocessed.svg"),
+            denoised_bold_figure=os.path.join(self.tmpdir, "denoised.svg"),
+            standardize=False,
+            mask=self.mask_file,
+            seg_data=self.seg_file,
+        )
+
+    def time_plot_fmri_es(self, space, n_volumes):
+        """Time plot_fmri_es."""
+        self._run()
+
+    def peakmem_plot_fmri_es(self, space, n_volumes):
+        """Measure plot_fmri_es's peak memory."""
+        self._run()
@@ -0,0 +1,60 @@
+"""Benchmarks for quality control measures."""
+import os
+
+from benchmarks.common import (
+    N_VOLUMES,
+    SPACES,
+    TR,
+    Benchmark,
+    get_n_elements,
+    make_bold_array,
+    make_confounds,
+)
+
+
+class ComputeDVARS(Benchmark):
+    """Compute DVARS for every grayordinate or in-mask voxel."""
+
+    params = [SPACES, N_VOLUMES]
+    param_names = ["space", "n_volumes"]
+
+    def setup(self, space, n_volumes):
+        """Simulate the (S, T) BOLD data."""
+        super().setup(space, n_volumes)
+        self.bold_arr = make_bold_array(get_n_elements(space), n_volumes).T
+
+    def time_compute_dvars(self, space, n_volumes):
+        """Time compute_dvars."""
+        from xcp_d.utils.qcmetrics import compute_dvars
+
+        compute_dvars(self.bold_arr)
+
+    def peakmem_compute_dvars(self, space, n_volumes):
+        """Measure compute_dvars's peak memory."""
+        from xcp_d.utils.qcmetrics import compute_dvars
+
+        compute_dvars(self.bold_arr)
+
+
+class MakeDCANDf(Benchmark):
+    """Write the DCAN motion HDF5 file."""
+
+    params = [N_VOLUMES]
+    param_names = ["n_volumes"]
+
+    def setup(self, n_volumes):
+        """Write the filtered motion file."""
+        super().setup(n_volumes)
+        _, _, self.motion_file = make_confounds(self.tmpdir, n_volumes)
+
+    def time_make_dcan_df(self, n_volumes):
+        """Time make_dcan_df."""
+        from xcp_d.utils.qcmetrics import make_dcan_df
+
+        make_dcan_df(self.motion_file, os.path.join(self.tmpdir, "dcan.hdf5"), TR)
+
+    def peakmem_make_dcan_df(self, n_volumes):
+        """Measure make_dcan_df's peak memory."""
+        from xcp_d.utils.qcmetrics import make_dcan_df
+
+        make_dcan_df(self.motion_file, os.path.join(self.tmpdir, "dcan.hdf5"), TR)
@@ -0,0 +1,87 @@
+"""Benchmarks for ALFF and ReHo."""
+from benchmarks.common import (
+    N_VOLUMES,
+    SPACES,
+    TR,
+    Benchmark,
+    get_n_elements,
+    get_surface_adjacency,
+    make_bold_array,
+)
+
+
+class ComputeALFF(Benchmark):
+    """Compute ALFF for every grayordinate or in-mask voxel."""
+
+    params = [SPACES, N_VOLUMES]
+    param_names = ["space", "n_volumes"]
+
+    def setup(self, space, n_volumes):
+        """Simulate the (S, T) BOLD data."""
+        super().setup(space, n_volumes)
+        self.bold_arr = make_bold_array(get_n_elements(space), n_volumes).T
+
+    def _run(self):
+        from xcp_d.utils.restingstate import compute_alff
+
+        compute_alff(self.bold_arr, low_pass=0.08, high_pass=0.01, TR=TR)
+
+    def time_compute_alff(self, space, n_volumes):
+        """Time compute_alff."""
+        self._run()
+
+    def peakmem_compute_alff(self, space, n_volumes):
+        """Measure compute_alff's peak memory."""
+        self._run()
+
+
+class Compute2DReHo(Benchmark):
+    """Compute surface ReHo for one 32k fsLR hemisphere."""
+
+    params = [N_VOLUMES]
+    param_names = ["n_volumes"]
+
+    def setup(self, n_volumes):
+        """Build the hemisphere's adjacency matrix and simulate its (V, T) data."""
+        super().setup(n_volumes)
+        self.adjacency = get_surface_adjacency()
+        self.bold_arr = make_bold_array(self.adjacency.shape[0], n_volumes).T
+
+    def _run(self):
+        from xcp_d.utils.restingstate import compute_2d_reho
+
+        compute_2d_reho(datat=self.bold_arr, adjacency_matrix=self.adjacency)
+
+    def time_compute_2d_reho(self, n_volumes):
+        """Time compute_2d_reho."""
+        self._run()
+
+    def peakmem_compute_2d_reho(self, n_volumes):
+        """Measure compute_2d_reho's peak memory."""
+        self._run()
+
+
+class MeshAdjacency(Benchmark):
+    """Build the 32k fsLR vertex adjacency matrix from the TemplateFlow sphere."""
+
+    def setup(self):
+        """Skip the benchmark if the sphere cannot be fetched from TemplateFlow."""
+        super().setup()
+        from templateflow.api import get as get_template
+
+        try:
+            get_template("fsLR", space="fsaverage", hemi="L", suffix="sphere", density="32k")
+        except Exception as exc:
+            raise NotImplementedError(f"TemplateFlow is unavailable: {exc}")
+
+    def time_mesh_adjacency(self):
+        """Time mesh_adjacency."""
+        from xcp_d.utils.restingstate import mesh_adjacency
+
+        mesh_adjacency("L")
+
+    def peakmem_mesh_adjacency(self):
+        """Measure mesh_adjacency's peak memory."""
+        from xcp_d.utils.restingstate import mesh_adjacency
+
+        mesh_adjacency("L")
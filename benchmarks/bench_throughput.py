@@ -0,0 +1,87 @@
+"""Benchmarks for the throughput of concurrent post-processing nodes.
+
+The MultiProc plugin runs up to ``--nthreads`` nodes at once, each in its own process.
+These benchmarks denoise the runs of a multi-run subject the same way,
+with each node's BLAS/OpenMP thread pools either capped at its share of the CPUs
+(as xcp_d does) or left at the number of CPUs (the NumPy/SciPy default).
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from benchmarks.common import TR, Benchmark, make_cifti, make_confounds
+
+N_RUNS = 8
+N_VOLUMES = 400
+
+
+def _denoise_run(run_dir, num_threads):
+    """Denoise one run in its own process, as a MultiProc worker would."""
+    from xcp_d.interfaces.nilearn import DenoiseCifti
+
+    DenoiseCifti(
+        preprocessed_bold=os.path.join(run_dir, "bold.dtseries.nii"),
+        confounds_file=os.path.join(run_dir, "confounds.tsv"),
+        temporal_mask=os.path.join(run_dir, "temporal_mask.tsv"),
+        TR=TR,
+        bandpass_filter=True,
+        low_pass=0.08,
+        high_pass=0.01,
+        filter_order=2,
+        num_threads=num_threads,
+    ).run(cwd=run_dir)
+
+
+class ConcurrentDenoising(Benchmark):
+    """Denoise the fsLR runs of one subject with ``--nthreads`` concurrent nodes."""
+
+    params = [[1, 2, 4, 8, 16], [False, True]]
+    param_names = ["nthreads", "thread_control"]
+
+    def setup(self, nthreads, thread_control):
+        """Simulate the runs' BOLD data and confounds."""
+        if nthreads > os.cpu_count():
+            raise NotImplementedError(f"Only {os.cpu_count()} CPUs are available.")
+
+        super().setup(nthreads, thread_control)
+        self.run_dirs = []
+        for i_run in range(N_RUNS):
+            run_dir = os.path.join(self.tmpdir, f"run-{i_run}")
+            os.makedirs(run_dir)
+            make_cifti(os.path.join(run_dir, "bold.dtseries.nii"), N_VOLUMES, seed=i_run)
+            make_confounds(run_dir, N_VOLUMES, seed=i_run)
+            self.run_dirs.append(run_dir)
+
+        # With thread control, each node gets an equal share of the CPUs,
+        # as with --omp-nthreads set to the number of CPUs divided by --nthreads.
+        if thread_control:
+            self.num_threads = max(os.cpu_count() // nthreads, 1)
+        else:
+            self.num_threads = os.cpu_count()
+
+        self.nthreads = nthreads
+
+    def _run(self):
+        with ProcessPoolExecutor(
+            max_workers=self.nthreads,
+            mp_context=get_context("forkserver"),
+        ) as executor:
+            futures = [
+                executor.submit(_denoise_run, run_dir, self.num_threads)
+                for run_dir in self.run_dirs
+            ]
+            for future in futures:
+                future.result()
+
+    def time_concurrent_denoising(self, nthreads, thread_control):
+        """Time denoising all of the runs."""
+        self._run()
+
+    def track_runs_per_minute(self, nthreads, thread_control):
+        """Measure the throughput, in denoised runs per minute."""
+        start = time.perf_counter()
+        self._run()
+        return N_RUNS * 60 / (time.perf_counter() - start)
+
+    track_runs_per_minute.unit = "runs/minute"
@@ -0,0 +1,169 @@
+"""Synthetic data and shared settings for the benchmarks.
+
+The data match the sizes of real post-processing inputs:
+91,282-grayordinate fsLR CIFTIs and 2 mm MNI152NLin6Asym NIfTIs,
+with 400, 1200, or 2000 volumes.
+"""
+import os
+import shutil
+import tempfile
+
+import nibabel as nb
+import numpy as np
+import pandas as pd
+from pkg_resources import resource_filename as pkgrf
+
+N_VOLUMES = [400, 1200, 2000]
+SPACES = ["fsLR", "MNI152NLin6Asym"]
+TR = 0.8
+
+# The Tian atlas covers all 91,282 grayordinates, so its brain models are used for the CIFTIs.
+CIFTI_ATLAS = pkgrf("xcp_d", "data/atlases/tpl-fsLR_atlas-Tian_den-32k_dseg.dlabel.nii")
+CIFTI_ATLAS_LABELS = pkgrf("xcp_d", "data/atlases/atlas-Tian_dseg.tsv")
+MNI_SHAPE = (91, 109, 91)
+MNI_AFFINE = np.array(
+    [
+        [-2.0, 0.0, 0.0, 90.0],
+        [0.0, 2.0, 0.0, -126.0],
+        [0.0, 0.0, 2.0, -72.0],
+        [0.0, 0.0, 0.0, 1.0],
+    ]
+)
+
+
+class Benchmark:
+    """Base class for benchmarks that work on files in a temporary directory.
+
+    Each benchmark runs once per repeat, since a single run takes seconds to minutes.
+    """
+
+    number = 1
+    repeat = (1, 3, 120.0)
+    timeout = 3600
+
+    def setup(self, *params):
+        """Create the temporary directory."""
+        self.tmpdir = tempfile.mkdtemp()
+
+    def teardown(self, *params):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def get_brain_models():
+    """Get the 91,282 fsLR brain models."""
+    return nb.load(CIFTI_ATLAS).header.get_axis(1)
+
+
+def get_mni_mask():
+    """Make an ellipsoid brain mask on the 2 mm MNI grid, with about 230,000 voxels."""
+    grid = np.indices(MNI_SHAPE, dtype=np.float32)
+    center = np.array([45, 63, 36], dtype=np.float32)[:, None, None, None]
+    radii = np.array([34, 44, 36], dtype=np.float32)[:, None, None, None]
+    return (np.sum(((grid - center) / radii) ** 2, axis=0) <= 1).astype(np.uint8)
+
+
+def make_bold_array(n_elements, n_volumes, seed=0):
+    """Simulate a (T, S) BOLD array with a shared slow signal, drift, and white noise."""
+    rng = np.random.default_rng(seed)
+    time = np.arange(n_volumes, dtype=np.float32) * TR
+    shared = np.sin(2 * np.pi * 0.03 * time) + 0.002 * time
+    data = rng.standard_normal((n_volumes, n_elements), dtype=np.float32)
+    data += shared[:, None].astype(np.float32)
+    data += 1000
+    return data
+
+
+def get_n_elements(space):
+    """Get the number of grayordinates or in-mask voxels in a space."""
+    if space == "fsLR":
+        return len(get_brain_models())
+
+    return int(get_mni_mask().sum())
+
+
+def make_cifti(out_file, n_volumes, seed=0):
+    """Write a (n_volumes, 91282) dtseries file."""
+    brain_models = get_brain_models()
+    img = nb.Cifti2Image(
+        make_bold_array(len(brain_models), n_volumes, seed=seed),
+        (nb.cifti2.SeriesAxis(start=0, step=TR, size=n_volumes), brain_models),
+    )
+    img.nifti_header.set_intent("ConnDenseSeries")
+    img.to_filename(out_file)
+    return out_file
+
+
+def make_nifti(out_dir, n_volumes, seed=0):
+    """Write a 2 mm MNI BOLD file, its brain mask, and a segmentation for the carpet plots.
+
+    The segmentation has one label from each of the carpet plot's four tissue classes.
+    """
+    rng = np.random.default_rng(seed)
+    mask = get_mni_mask()
+    mask_file = os.path.join(out_dir, "mask.nii.gz")
+    nb.Nifti1Image(mask, MNI_AFFINE).to_filename(mask_file)
+
+    seg = mask * rng.choice(np.array([1, 50, 150, 255], dtype=np.uint8), size=MNI_SHAPE)
+    seg_file = os.path.join(out_dir, "dseg.nii.gz")
+    nb.Nifti1Image(seg, MNI_AFFINE).to_filename(seg_file)
+
+    data = np.zeros(MNI_SHAPE + (n_volumes,), dtype=np.float32)
+    data[mask.astype(bool)] = make_bold_array(int(mask.sum()), n_volumes, seed=seed).T
+    img = nb.Nifti1Image(data, MNI_AFFINE)
+    img.header.set_zooms((2.0, 2.0, 2.0, TR))
+    bold_file = os.path.join(out_dir, "bold.nii.gz")
+    img.to_filename(bold_file)
+
+    return bold_file, mask_file, seg_file
+
+
+def make_confounds(out_dir, n_volumes, n_regressors=36, seed=0):
+    """Write a confounds file, a temporal mask, and a filtered motion file.
+
+    The confounds end with linear trend and intercept columns, as in xcp_d's design matrices,
+    and about 10% of the volumes are flagged as high-motion outliers.
+    """
+    rng = np.random.default_rng(seed)
+
+    confounds_df = pd.DataFrame(
+        rng.standard_normal((n_volumes, n_regressors)),
+        columns=[f"regressor_{i:02d}" for i in range(n_regressors)],
+    )
+    confounds_df["linear_trend"] = np.arange(n_volumes)
+    confounds_df["intercept"] = 1
+    confounds_file = os.path.join(out_dir, "confounds.tsv")
+    confounds_df.to_csv(confounds_file, sep="\t", index=False)
+
+    fd = np.abs(rng.normal(0.1, 0.15, size=n_volumes))
+    motion_df = pd.DataFrame(
+        rng.normal(0, 0.1, size=(n_volumes, 6)),
+        columns=["trans_x", "trans_y", "trans_z", "rot_x", "rot_y", "rot_z"],
+    )
+    motion_df["framewise_displacement"] = fd
+    motion_file = os.path.join(out_dir, "motion.tsv")
+    motion_df.to_csv(motion_file, sep="\t", index=False)
+
+    outliers = fd > np.quantile(fd, 0.9)
+    temporal_mask_df = pd.DataFrame({"framewise_displacement": outliers.astype(int)})
+    temporal_mask_file = os.path.join(out_dir, "temporal_mask.tsv")
+    temporal_mask_df.to_csv(temporal_mask_file, sep="\t", index=False)
+
+    return confounds_file, temporal_mask_file, motion_file
+
+
+def get_surface_adjacency(structure="CIFTI_STRUCTURE_CORTEX_LEFT"):
+    """Build a hemisphere's dense vertex adjacency matrix from the bundled fsLR surface.
+
+    This has the same format as :func:`~xcp_d.utils.restingstate.mesh_adjacency`'s output,
+    without needing TemplateFlow.
+    """
+    from xcp_d.utils.smoothing import SURFACE_FILES
+
+    faces = nb.load(SURFACE_FILES[structure]).agg_data("triangle")
+    n_vertices = faces.max() + 1
+    adjacency = np.zeros((n_vertices, n_vertices), dtype=np.uint8)
+    for i, j in ((0, 1), (1, 2), (2, 0)):
+        adjacency[faces[:, i], faces[:, j]] = 1
+
+    return adjacency + adjacency.T
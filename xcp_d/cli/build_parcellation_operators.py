@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Precompute the atlases bundled with xcp_d on the standard grids.
+
+Each atlas is resampled to the MNI152NLin6Asym 2 mm grid (NIfTI)
+and the fsLR 91k brain models (CIFTI) exactly as in the xcp_d workflow,
+and is written to the output directory along with its parcellation operator.
+When the BOLD data are on one of these grids, xcp_d uses the precomputed atlases and operators
+instead of resampling the atlases.
+"""
+import os
+import shutil
+import tempfile
+from argparse import ArgumentParser, RawTextHelpFormatter
+from pathlib import Path
+
+from xcp_d.utils.parcellation import OPERATOR_DIR
+
+
+def get_parser():
+    """Build parser object."""
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+
+    parser.add_argument(
+        "--nifti-reference",
+        "--nifti_reference",
+        dest="nifti_reference",
+        action="store",
+        type=Path,
+        default=None,
+        help=(
+            "3D image on the MNI152NLin6Asym 2 mm grid. "
+            "If not provided, no NIfTI atlases are precomputed."
+        ),
+    )
+    parser.add_argument(
+        "--cifti-reference",
+        "--cifti_reference",
+        dest="cifti_reference",
+        action="store",
+        type=Path,
+        default=None,
+        help=(
+            "CIFTI file with the fsLR 91k brain models. "
+            "If not provided, no CIFTI atlases are precomputed."
+        ),
+    )
+    parser.add_argument(
+        "--atlases",
+        action="store",
+        nargs="+",
+        type=str,
+        default=None,
+        help="Atlases to process. Default is all of the atlases used by xcp_d.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        "--output_dir",
+        "-o",
+        dest="output_dir",
+        action="store",
+        type=Path,
+        default=Path(OPERATOR_DIR),
+        help="Directory in which to write the atlases. Default is xcp_d's data directory.",
+    )
+
+    return parser
+
+
+def _store_atlas(atlas_file, prefix, parcellated_atlas_file=None):
+    """Copy a resampled atlas into the output directory and save its operator next to it."""
+    from xcp_d.utils.parcellation import get_parcellation_operator
+
+    extension = ".dlabel.nii" if atlas_file.endswith(".dlabel.nii") else ".nii.gz"
+    shutil.copyfile(atlas_file, f"{prefix}_dseg{extension}")
+    if parcellated_atlas_file:
+        shutil.copyfile(parcellated_atlas_file, f"{prefix}_dseg.pscalar.nii")
+
+    get_parcellation_operator(atlas_file).save(f"{prefix}_operator.npz")
+
+
+def main(args=None):
+    """Precompute the atlases and their parcellation operators."""
+    from xcp_d.interfaces.connectivity import ResampleAtlasToCifti, WarpAtlasToBOLD
+    from xcp_d.utils.atlas import get_atlas_cifti, get_atlas_names, get_atlas_nifti
+    from xcp_d.utils.parcellation import PRECOMPUTED_GRIDS
+
+    opts = get_parser().parse_args(args)
+    atlas_names = opts.atlases or get_atlas_names("all")
+    os.makedirs(opts.output_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for atlas_name in atlas_names:
+            atlas_dir = os.path.join(work_dir, atlas_name)
+            os.makedirs(atlas_dir)
+
+            if opts.nifti_reference:
+                try:
+                    atlas_file = get_atlas_nifti(atlas_name)[0]
+                except FileNotFoundError as exc:
+                    print(f"Skipping NIfTI {atlas_name}: {exc}")
+                else:
+                    warp_atlas = WarpAtlasToBOLD(
+                        atlas_file=atlas_file,
+                        reference_image=str(opts.nifti_reference.absolute()),
+                        transforms=["identity"],
+                    )
+                    warped_file = warp_atlas.run(cwd=atlas_dir).outputs.output_image
+                    prefix = os.path.join(
+                        opts.output_dir,
+                        f"atlas-{atlas_name}_{PRECOMPUTED_GRIDS['nifti']}",
+                    )
+                    _store_atlas(warped_file, prefix)
+                    print(f"NIfTI {atlas_name}: {prefix}")
+
+            if opts.cifti_reference:
+                try:
+                    atlas_file = get_atlas_cifti(atlas_name)[0]
+                except FileNotFoundError as exc:
+                    print(f"Skipping CIFTI {atlas_name}: {exc}")
+                    continue
+
+                resample_atlas = ResampleAtlasToCifti(
+                    atlas_file=atlas_file,
+                    template_cifti=str(opts.cifti_reference.absolute()),
+                )
+                resample_results = resample_atlas.run(cwd=atlas_dir).outputs
+                prefix = os.path.join(
+                    opts.output_dir,
+                    f"atlas-{atlas_name}_{PRECOMPUTED_GRIDS['cifti']}",
+                )
+                _store_atlas(
+                    resample_results.int16_atlas_file,
+                    prefix,
+                    parcellated_atlas_file=resample_results.parcellated_atlas_file,
+                )
+                print(f"CIFTI {atlas_name}: {prefix}")
+
+
+if __name__ == "__main__":
+    raise RuntimeError("this should be run with the xcp_d-build-parcellation-operators command")
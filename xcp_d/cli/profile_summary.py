@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Aggregate xcp_d profiling traces into a per-phase cost table.
+
+Traces are written by ``xcp_d --profile`` to ``<output_dir>/xcp_d/logs/profiles``.
+The table has one row per interface and phase, with the number of runs and subjects,
+wall and CPU times in seconds, peak memory in megabytes,
+and the fraction of all profiled wall time that each phase accounts for.
+Each interface's "total" row covers its whole run.
+"""
+from argparse import ArgumentParser, RawTextHelpFormatter
+from pathlib import Path
+
+
+def get_parser():
+    """Build parser object."""
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+
+    parser.add_argument(
+        "traces",
+        action="store",
+        nargs="+",
+        type=Path,
+        help="JSON traces, or directories (e.g., several subjects' log directories) to search.",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        dest="output",
+        action="store",
+        type=Path,
+        default=Path("profile_summary.tsv"),
+        help="Output TSV file. Default is 'profile_summary.tsv'.",
+    )
+
+    return parser
+
+
+def main(args=None):
+    """Summarize the profiling traces."""
+    from xcp_d.utils.profiling import summarize_traces
+
+    opts = get_parser().parse_args(args)
+
+    summary = summarize_traces([str(trace) for trace in opts.traces])
+    summary.to_csv(opts.output, sep="\t", index=False, na_rep="n/a")
+    print(summary.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    raise RuntimeError("this should be run with the xcp_d-profile-summary command")
@@ -113,6 +113,21 @@ def get_parser():
         default=False,
         help="After denoising, concatenate each derivative from each task across runs.",
     )
+    g_bids.add_argument(
+        "--combineruns-mode",
+        "--combineruns_mode",
+        dest="combineruns_mode",
+        action="store",
+        choices=["dense", "parcellated"],
+        default="dense",
+        help=(
+            "Which derivatives to concatenate across runs when '--combineruns' is used. "
+            "'dense' concatenates the dense BOLD derivatives as well as the parcellated "
+            "time series. "
+            "'parcellated' only concatenates the parcellated time series and the motion "
+            "and outlier files, which is much cheaper when only connectivity is needed."
+        ),
+    )
 
     g_surfx = parser.add_argument_group("Options for cifti processing")
     g_surfx.add_argument(
@@ -126,6 +141,24 @@ def get_parser():
             "This flag is enabled by default for the 'hcp' and 'dcan' input types."
         ),
     )
+    g_surfx.add_argument(
+        "--dense-connectivity",
+        "--dense_connectivity",
+        dest="dense_connectivity",
+        choices=["none", "seeds", "all"],
+        default="none",
+        help=(
+            "Grayordinate-wise functional connectivity to compute from the censored, denoised "
+            "CIFTI data. "
+            "'seeds' correlates each parcel's time series with every grayordinate, "
+            "writing one .dpconn.nii file per atlas. "
+            "'all' also correlates every pair of grayordinates, writing a dense connectome "
+            "(.dconn.nii), which takes about 33 GB of disk space for 91k grayordinates. "
+            "The correlations are computed in blocks and written straight to disk, "
+            "so they are never held in memory. "
+            "Requires '--cifti'."
+        ),
+    )
 
     g_perfm = parser.add_argument_group("Options for resource management")
     g_perfm.add_argument(
@@ -141,7 +174,12 @@ def get_parser():
         action="store",
         type=int,
         default=1,
-        help="Maximum number of threads per process.",
+        help=(
+            "Maximum number of threads per process. "
+            "The BLAS and OpenMP thread pools of the numeric steps "
+            "(denoising, parcellation, ALFF, ReHo, and QC) are capped at this number, "
+            "so concurrent steps do not oversubscribe the CPUs."
+        ),
     )
     g_perfm.add_argument(
         "--mem_gb",
@@ -202,6 +240,21 @@ def get_parser():
         default=False,
         help="Despike the BOLD data before postprocessing.",
     )
+    g_param.add_argument(
+        "--despike-method",
+        "--despike_method",
+        dest="despike_method",
+        action="store",
+        choices=["afni", "native"],
+        default="afni",
+        help=(
+            "How to despike the BOLD data when '--despike' is used. "
+            "'afni' runs AFNI's 3dDespike with the -NEW option, "
+            "converting CIFTI data to NIfTI and back. "
+            "'native' runs an in-process reimplementation of 3dDespike's L1 fit, "
+            "which despikes NIfTI and CIFTI data directly."
+        ),
+    )
     g_param.add_argument(
         "-p",
         "--nuisance-regressors",
@@ -226,6 +279,35 @@ def get_parser():
             "Descriptions of each of the options are included in xcp_d's documentation."
         ),
     )
+    g_param.add_argument(
+        "--additional-nuisance-regressors",
+        "--additional_nuisance_regressors",
+        dest="additional_nuisance_regressors",
+        required=False,
+        nargs="+",
+        choices=[
+            "27P",
+            "36P",
+            "24P",
+            "acompcor",
+            "aroma",
+            "acompcor_gsr",
+            "aroma_gsr",
+            "custom",
+            "none",
+        ],
+        default=[],
+        type=str,
+        help=(
+            "Additional nuisance regression strategies to compare against the one selected "
+            "with '--nuisance-regressors'. "
+            "The BOLD data are read once and denoised with every strategy in a single pass. "
+            "Each additional strategy's denoised BOLD data, design matrix, parcellated time "
+            "series, and correlation matrices are written with a 'desc' entity named after the "
+            "strategy (e.g., 'desc-denoised24P_bold', 'desc-24P_timeseries'). "
+            "All other outputs, including QC, use the primary strategy."
+        ),
+    )
     g_param.add_argument(
         "-c",
         "--custom_confounds",
@@ -282,6 +364,66 @@ def get_parser():
         ),
     )
 
+    g_param.add_argument(
+        "--dynamic-window",
+        "--dynamic_window",
+        dest="dynamic_window",
+        default=None,
+        type=float,
+        metavar="SECONDS",
+        help=(
+            "Length, in seconds, of the sliding windows in which to compute dynamic functional "
+            "connectivity from each atlas's parcellated time series. "
+            "Censored volumes are skipped, and windows with fewer than half of their volumes "
+            "retained are written as NaNs. "
+            "The windows' correlation matrices are written to a chunked HDF5 file per atlas. "
+            "By default, dynamic connectivity is not computed."
+        ),
+    )
+    g_param.add_argument(
+        "--dynamic-step",
+        "--dynamic_step",
+        dest="dynamic_step",
+        default=None,
+        type=float,
+        metavar="SECONDS",
+        help=(
+            "Time, in seconds, between the onsets of consecutive dynamic connectivity windows. "
+            "By default, a window starts at every volume."
+        ),
+    )
+    g_param.add_argument(
+        "--dynamic-taper",
+        "--dynamic_taper",
+        dest="dynamic_taper",
+        choices=["boxcar", "exponential"],
+        default="boxcar",
+        help=(
+            "How volumes are weighted within each dynamic connectivity window. "
+            "'boxcar' weights all volumes equally. "
+            "'exponential' down-weights older volumes, so that the oldest volume in a window "
+            "has about 5%% of the weight of the newest."
+        ),
+    )
+
+    g_param.add_argument(
+        "--connectivity-measures",
+        "--connectivity_measures",
+        dest="connectivity_measures",
+        nargs="+",
+        choices=["ledoitwolfcovariance", "partialcorrelation"],
+        default=[],
+        help=(
+            "Regularized connectivity measures to estimate from each atlas's parcellated time "
+            "series, in addition to Pearson correlations, for the whole run and for each "
+            "'--exact-time' subset. "
+            "'ledoitwolfcovariance' is the Ledoit-Wolf shrinkage covariance, which "
+            "'xcp_d-tangent-connectivity' embeds in a group tangent space after xcp_d has run. "
+            "'partialcorrelation' is the partial correlation from the shrunk covariance's "
+            "inverse."
+        ),
+    )
+
     g_param.add_argument(
         "--random-seed",
         "--random_seed",
@@ -336,6 +478,23 @@ def get_parser():
         type=int,
         help="Number of filter coefficients for the Butterworth bandpass filter.",
     )
+    g_filter.add_argument(
+        "--compose-filter",
+        "--compose_filter",
+        dest="compose_filter",
+        action="store_true",
+        default=False,
+        help=(
+            "Interpolate censored volumes and bandpass filter the denoised BOLD data with a "
+            "single temporal operator, which is precomputed once per run and applied to all "
+            "voxels/vertices as one matrix multiplication. "
+            "The results match the two-step interpolation and filtering to within "
+            "floating-point precision. "
+            "The matrix multiplication scales with the square of the number of volumes, "
+            "so this is only faster than filtering each voxel/vertex separately when many "
+            "BLAS threads are available."
+        ),
+    )
     g_filter.add_argument(
         "--motion-filter-type",
         "--motion_filter_type",
@@ -456,6 +615,21 @@ This parameter is used in conjunction with ``motion-filter-order`` and ``band-st
             "Use of this flag is not recommended when running concurrent processes of xcp_d."
         ),
     )
+    g_other.add_argument(
+        "--work-compression",
+        "--work_compression",
+        dest="work_compression",
+        action="store",
+        choices=["none", "fast"],
+        default="fast",
+        help=(
+            "Compression of the intermediate NIfTI files written to the working directory. "
+            "'none' writes uncompressed files, which are memory-mapped when read, "
+            "at the cost of more disk space. "
+            "'fast' writes gzipped files with the fastest compression level. "
+            "NIfTI derivatives are always gzipped."
+        ),
+    )
     g_other.add_argument(
         "--resource-monitor",
         "--resource_monitor",
@@ -463,6 +637,84 @@ This parameter is used in conjunction with ``motion-filter-order`` and ``band-st
         default=False,
         help="Enable Nipype's resource monitoring to keep track of memory and CPU usage.",
     )
+    g_other.add_argument(
+        "--result-cache",
+        "--result_cache",
+        dest="result_cache",
+        metavar="PATH",
+        type=Path,
+        default=None,
+        help=(
+            "Directory of a content-addressed cache of intermediate results "
+            "(dummy volume removal, confound generation, denoising, and smoothing), "
+            "which can be shared across working directories, runs, and users. "
+            "Results are keyed by the contents of their input files and the parameters "
+            "that affect them, so re-running xcp_d with different downstream options "
+            "(e.g., a new atlas) reuses them. "
+            "By default, results are only reused within the working directory."
+        ),
+    )
+    g_other.add_argument(
+        "--result-cache-size",
+        "--result_cache_size",
+        dest="result_cache_size",
+        metavar="GB",
+        type=float,
+        default=50,
+        help=(
+            "Maximum size of the result cache, in GB. "
+            "Least recently used results are evicted once it is exceeded. "
+            "Default is 50."
+        ),
+    )
+    g_other.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help=(
+            "Time and memory-track the phases (e.g., load, compute, write) of xcp_d's "
+            "interfaces, and write one JSON trace per node to "
+            "<output_dir>/xcp_d/logs/profiles. "
+            "Traces can be aggregated with the xcp_d-profile-summary command."
+        ),
+    )
+    g_other.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        help=(
+            "Keep running, and post-process new or changed preprocessed BOLD runs as they "
+            "appear in fmri_dir (e.g., new sessions of an ongoing study). "
+            "Only the participants and sessions with new runs are indexed and post-processed. "
+            "Post-processed runs are recorded in <output_dir>/xcp_d/logs/watch_state.json, "
+            "so they are skipped when xcp_d is restarted."
+        ),
+    )
+    g_other.add_argument(
+        "--watch-interval",
+        "--watch_interval",
+        dest="watch_interval",
+        metavar="SECONDS",
+        type=float,
+        default=60,
+        help=(
+            "Time between checks for new runs in watch mode, in seconds. "
+            "Runs are only post-processed once their files have not changed for this long. "
+            "Default is 60."
+        ),
+    )
+    g_other.add_argument(
+        "--watch-workers",
+        "--watch_workers",
+        dest="watch_workers",
+        type=int,
+        default=1,
+        help=(
+            "Maximum number of participants to post-process at once in watch mode. "
+            "'--nthreads' and '--mem-gb' are divided among them. "
+            "Default is 1."
+        ),
+    )
     g_other.add_argument(
         "--notrack",
         action="store_true",
@@ -517,9 +769,35 @@ def _main(args=None):
 
 def main(args=None):
     """Run the main workflow."""
+    opts = get_parser().parse_args(args)
+    if opts.watch:
+        _watch(opts)
+    else:
+        _run(opts)
+
+
+def _run(opts):
+    """Build and run the workflow, then generate the reports."""
     from multiprocessing import Manager, Process
 
-    opts = get_parser().parse_args(args)
+    from xcp_d.utils.cache import RESULT_CACHE_ENV, RESULT_CACHE_SIZE_ENV
+    from xcp_d.utils.columnar import COLUMNAR_STORE_ENV
+    from xcp_d.utils.filemanip import WORK_COMPRESSION_ENV
+    from xcp_d.utils.profiling import PROFILE_DIR_ENV
+
+    # Intermediate files are written by each node's own process,
+    # so the compression policy is passed through the environment.
+    os.environ[WORK_COMPRESSION_ENV] = opts.work_compression
+    # Confounds TSVs are parsed once per run, into a columnar store in the working directory.
+    os.environ[COLUMNAR_STORE_ENV] = str((opts.work_dir / "columnar_store").absolute())
+    if opts.result_cache:
+        os.environ[RESULT_CACHE_ENV] = str(opts.result_cache.absolute())
+        os.environ[RESULT_CACHE_SIZE_ENV] = str(opts.result_cache_size)
+
+    if opts.profile:
+        os.environ[PROFILE_DIR_ENV] = str(
+            (opts.output_dir / "xcp_d" / "logs" / "profiles").absolute()
+        )
 
     exec_env = os.name
 
@@ -678,6 +956,89 @@ def main(args=None):
         sys.exit(int((errno + failed_reports) > 0))
 
 
+def _watch(opts):
+    """Post-process new or changed preprocessed runs as they arrive, until interrupted."""
+    from functools import partial
+
+    from nipype import logging as nlogging
+
+    from xcp_d.utils.watch import watch_dataset
+
+    log_level = int(max(25 - 5 * opts.verbose_count, logging.DEBUG))
+    logger.setLevel(log_level)
+    nlogging.getLogger("nipype.utils").setLevel(log_level)
+
+    # Check the parameters once up front, rather than in every batch.
+    opts, return_code = _validate_parameters(opts, logger)
+    if return_code != 0:
+        sys.exit(return_code)
+
+    if opts.clean_workdir:
+        logger.warning(
+            "'--clean-workdir' is ignored in watch mode, "
+            "since all batches share the working directory."
+        )
+        opts.clean_workdir = False
+
+    # Concurrent batches share the CPUs and memory.
+    opts.nthreads = max(opts.nthreads // opts.watch_workers, 1)
+    opts.omp_nthreads = min(opts.omp_nthreads, opts.nthreads)
+    if opts.mem_gb:
+        opts.mem_gb = max(opts.mem_gb // opts.watch_workers, 1)
+
+    logger.log(
+        25,
+        f"Watching {opts.fmri_dir} for new or changed preprocessed runs, "
+        f"every {opts.watch_interval} seconds.",
+    )
+    failed_runs = watch_dataset(
+        str(opts.fmri_dir),
+        str(opts.output_dir / "xcp_d"),
+        partial(_run_watch_batch, opts),
+        cifti=opts.cifti,
+        participant_label=opts.participant_label,
+        task_id=opts.task_id,
+        interval=opts.watch_interval,
+        n_workers=opts.watch_workers,
+    )
+    sys.exit(int(len(failed_runs) > 0))
+
+
+def _run_watch_batch(opts, subject, sessions):
+    """Post-process one participant's new or changed runs in a separate process.
+
+    Parameters
+    ----------
+    opts : :obj:`argparse.Namespace`
+        The validated command-line options.
+    subject : :obj:`str`
+        The participant ID, without the "sub-" prefix.
+    sessions : :obj:`list` of :obj:`str` or None
+        The sessions to post-process. If None, all of the participant's runs are post-processed.
+
+    Returns
+    -------
+    return_code : :obj:`int`
+        The batch's exit code.
+    """
+    from copy import deepcopy
+    from multiprocessing import get_context
+
+    from xcp_d.utils.watch import restrict_bids_filters
+
+    batch_opts = deepcopy(opts)
+    batch_opts.watch = False
+    batch_opts.participant_label = [subject]
+    batch_opts.bids_filters = restrict_bids_filters(opts.bids_filters, sessions)
+
+    # Batches are started from the watcher's worker threads, and forking a multi-threaded
+    # process can deadlock, so use a fork server regardless of the global start method.
+    p = get_context("forkserver").Process(target=_run, args=(batch_opts,))
+    p.start()
+    p.join()
+    return p.exitcode
+
+
 def _validate_parameters(opts, build_log):
     """Validate parameters.
 
@@ -752,6 +1113,19 @@ def _validate_parameters(opts, build_log):
         opts.band_stop_max = None
         opts.motion_filter_order = None
 
+    # Additional nuisance regression strategies
+    if opts.nuisance_regressors in opts.additional_nuisance_regressors:
+        build_log.warning(
+            f"'{opts.nuisance_regressors}' is already the primary nuisance regression strategy, "
+            "so it will not be repeated as an additional strategy."
+        )
+    opts.additional_nuisance_regressors = [
+        params
+        for i_params, params in enumerate(opts.additional_nuisance_regressors)
+        if params != opts.nuisance_regressors
+        and params not in opts.additional_nuisance_regressors[:i_params]
+    ]
+
     # Motion filtering parameters
     if opts.motion_filter_type == "notch":
         if not (opts.band_stop_min and opts.band_stop_max):
@@ -810,6 +1184,51 @@ def _validate_parameters(opts, build_log):
             )
             opts.process_surfaces = True
 
+    if opts.combineruns_mode != "dense" and not opts.combineruns:
+        build_log.warning("'--combineruns-mode' is ignored when '--combineruns' is not set.")
+
+    if opts.despike_method != "afni" and not opts.despike:
+        build_log.warning("'--despike-method' is ignored when '--despike' is not set.")
+
+    if opts.dynamic_window is not None and opts.dynamic_window <= 0:
+        build_log.error(f"'--dynamic-window' ({opts.dynamic_window}) must be greater than zero.")
+        return_code = 1
+    elif opts.dynamic_step is not None and opts.dynamic_step <= 0:
+        build_log.error(f"'--dynamic-step' ({opts.dynamic_step}) must be greater than zero.")
+        return_code = 1
+    elif opts.dynamic_window is None and (
+        opts.dynamic_step is not None or opts.dynamic_taper != "boxcar"
+    ):
+        build_log.warning(
+            "'--dynamic-step' and '--dynamic-taper' are ignored when '--dynamic-window' is "
+            "not set."
+        )
+
+    if opts.watch:
+        if opts.input_type in ("dcan", "hcp"):
+            build_log.error(
+                f"Watch mode (--watch) is not available with input_type {opts.input_type}, "
+                "since those datasets are converted to BIDS before post-processing."
+            )
+            return_code = 1
+
+        if opts.watch_interval <= 0:
+            build_log.error(
+                f"'--watch-interval' ({opts.watch_interval}) must be greater than zero."
+            )
+            return_code = 1
+
+        if opts.watch_workers < 1:
+            build_log.error(f"'--watch-workers' ({opts.watch_workers}) must be at least 1.")
+            return_code = 1
+
+    if opts.dense_connectivity != "none" and not opts.cifti:
+        build_log.error(
+            "Dense connectivity (--dense-connectivity) can only be computed with "
+            "cifti processing (--cifti)."
+        )
+        return_code = 1
+
     # process_surfaces and nifti processing are incompatible.
     if opts.process_surfaces and not opts.cifti:
         build_log.error(
@@ -834,7 +1253,7 @@ def build_workflow(opts, retval):
     from nipype import config as ncfg
     from nipype import logging as nlogging
 
-    from xcp_d.utils.bids import collect_participants
+    from xcp_d.utils.bids import collect_participants, get_participant_indexer
     from xcp_d.workflows.base import init_xcpd_wf
 
     log_level = int(max(25 - 5 * opts.verbose_count, logging.DEBUG))
@@ -898,7 +1317,13 @@ def build_workflow(opts, retval):
     run_uuid = f"{strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4()}"
     retval["run_uuid"] = run_uuid
 
-    layout = BIDSLayout(str(opts.fmri_dir), validate=False, derivatives=True)
+    # Only the requested participants are indexed.
+    layout = BIDSLayout(
+        str(opts.fmri_dir),
+        validate=False,
+        derivatives=True,
+        indexer=get_participant_indexer(opts.participant_label),
+    )
     subject_list = collect_participants(layout, participant_label=opts.participant_label)
     retval["subject_list"] = subject_list
 
@@ -994,6 +1419,7 @@ Running xcp_d version {__version__}:
         high_pass=opts.lower_bpf,
         low_pass=opts.upper_bpf,
         bpf_order=opts.bpf_order,
+        compose_filter=opts.compose_filter,
         bandpass_filter=opts.bandpass_filter,
         motion_filter_type=opts.motion_filter_type,
         motion_filter_order=opts.motion_filter_order,
@@ -1004,8 +1430,15 @@ Running xcp_d version {__version__}:
         task_id=opts.task_id,
         bids_filters=opts.bids_filters,
         despike=opts.despike,
+        despike_method=opts.despike_method,
         smoothing=opts.smoothing,
         params=opts.nuisance_regressors,
+        additional_params=opts.additional_nuisance_regressors,
+        dense_connectivity=opts.dense_connectivity,
+        dynamic_window=opts.dynamic_window,
+        dynamic_step=opts.dynamic_step,
+        dynamic_taper=opts.dynamic_taper,
+        connectivity_measures=opts.connectivity_measures,
         cifti=opts.cifti,
         analysis_level=opts.analysis_level,
         output_dir=str(opts.output_dir),
@@ -1021,6 +1454,7 @@ Running xcp_d version {__version__}:
         min_time=opts.min_time,
         exact_time=opts.exact_time,
         combineruns=opts.combineruns,
+        combineruns_mode=opts.combineruns_mode,
         name="xcpd_wf",
     )
 
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Evaluate how many volumes survive censoring across a grid of FD thresholds.
+
+For each confounds file, framewise displacement is calculated once per motion filter,
+and all requested thresholds are then applied at once.
+The result is a tab-delimited table with one row per file, motion filter, and threshold.
+"""
+import os
+from argparse import ArgumentParser, RawTextHelpFormatter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from xcp_d.cli.parser_utils import _int_or_auto
+
+
+def get_parser():
+    """Build parser object."""
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+
+    parser.add_argument(
+        "confounds_files",
+        action="store",
+        nargs="+",
+        type=Path,
+        help="Confounds TSV files from the preprocessing derivatives.",
+    )
+    parser.add_argument(
+        "--tr",
+        "-t",
+        dest="TR",
+        action="store",
+        type=float,
+        required=True,
+        help="Repetition time of the BOLD runs, in seconds.",
+    )
+    parser.add_argument(
+        "--fd-thresh",
+        "--fd_thresh",
+        dest="fd_thresh",
+        action="store",
+        nargs="+",
+        type=float,
+        default=np.round(np.arange(0.05, 1.0001, 0.05), 2).tolist(),
+        help="Framewise displacement thresholds to evaluate, in mm. "
+        "Default is 0.05 to 1.0, in steps of 0.05.",
+    )
+    parser.add_argument(
+        "--motion-filter-type",
+        "--motion_filter_type",
+        dest="motion_filter_type",
+        action="store",
+        nargs="+",
+        type=str,
+        default=["none"],
+        choices=["none", "lp", "notch"],
+        help="Motion filters to evaluate. Default is 'none'.",
+    )
+    parser.add_argument(
+        "--band-stop-min",
+        "--band_stop_min",
+        dest="band_stop_min",
+        default=None,
+        type=float,
+        metavar="BPM",
+        help="Lower frequency for the motion filter, in breaths-per-minute (bpm).",
+    )
+    parser.add_argument(
+        "--band-stop-max",
+        "--band_stop_max",
+        dest="band_stop_max",
+        default=None,
+        type=float,
+        metavar="BPM",
+        help="Upper frequency for the notch motion filter, in breaths-per-minute (bpm).",
+    )
+    parser.add_argument(
+        "--motion-filter-order",
+        "--motion_filter_order",
+        dest="motion_filter_order",
+        default=4,
+        type=int,
+        help="Number of filter coefficients for the motion parameter filter.",
+    )
+    parser.add_argument(
+        "--head-radius",
+        "--head_radius",
+        dest="head_radius",
+        default=50,
+        type=float,
+        help="Head radius used to calculate framewise displacement, in mm.",
+    )
+    parser.add_argument(
+        "--dummy-scans",
+        "--dummy_scans",
+        dest="dummy_scans",
+        default=0,
+        type=_int_or_auto,
+        metavar="{{auto,INT}}",
+        help="Number of volumes to remove from the beginning of each run.",
+    )
+    parser.add_argument(
+        "--min-time",
+        "--min_time",
+        dest="min_time",
+        default=100,
+        type=float,
+        help="Minimum post-scrubbing duration, in seconds, for a run to be processed.",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        dest="output",
+        action="store",
+        type=Path,
+        default=Path("censoring_sweep.tsv"),
+        help="Output TSV file. Default is 'censoring_sweep.tsv'.",
+    )
+
+    return parser
+
+
+def main(args=None):
+    """Run the censoring threshold sweep."""
+    from xcp_d.utils.modified_data import sweep_censoring_thresholds
+
+    opts = get_parser().parse_args(args)
+
+    motion_filters = []
+    for motion_filter_type in opts.motion_filter_type:
+        if motion_filter_type == "none":
+            motion_filters.append({"motion_filter_type": None})
+            continue
+
+        motion_filters.append(
+            {
+                "motion_filter_type": motion_filter_type,
+                "motion_filter_order": opts.motion_filter_order,
+                "band_stop_min": opts.band_stop_min,
+                "band_stop_max": opts.band_stop_max if motion_filter_type == "notch" else None,
+            }
+        )
+
+    dfs = []
+    for confounds_file in opts.confounds_files:
+        sweep_df, _ = sweep_censoring_thresholds(
+            fmriprep_confounds_file=str(confounds_file),
+            TR=opts.TR,
+            fd_thresholds=opts.fd_thresh,
+            motion_filters=motion_filters,
+            dummy_scans=opts.dummy_scans,
+            head_radius=opts.head_radius,
+            min_time=opts.min_time,
+        )
+        sweep_df.insert(0, "confounds_file", os.path.basename(confounds_file))
+        dfs.append(sweep_df)
+
+    df = pd.concat(dfs, axis=0)
+    df.to_csv(opts.output, sep="\t", index=False, na_rep="n/a")
+
+
+if __name__ == "__main__":
+    raise RuntimeError("this should be run with the xcp_d-sweep-censoring command")
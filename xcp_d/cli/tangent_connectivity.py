@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Embed xcp_d's Ledoit-Wolf covariance matrices in a group tangent space.
+
+Run xcp_d with ``--connectivity-measures ledoitwolfcovariance`` first.
+The covariance matrices are grouped by atlas and description (e.g., exact numbers of volumes),
+each group's reference is the log-Euclidean mean of its covariance matrices,
+and each run's ``measure-tangent`` matrix is the matrix logarithm of its covariance matrix
+whitened by the reference.
+The files are streamed, so only one covariance matrix is held in memory at a time.
+"""
+from argparse import ArgumentParser, RawTextHelpFormatter
+from pathlib import Path
+
+
+def get_parser():
+    """Build parser object."""
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+
+    parser.add_argument(
+        "inputs",
+        action="store",
+        nargs="+",
+        type=Path,
+        help=(
+            "Covariance TSV files, or directories (e.g., the xcp_d output directory) to search "
+            "for '*_measure-ledoitwolfcovariance_conmat.tsv' files."
+        ),
+    )
+    parser.add_argument(
+        "--output-dir",
+        "--output_dir",
+        "-o",
+        dest="output_dir",
+        action="store",
+        type=Path,
+        default=Path("."),
+        help="Directory in which to write the tangent-space matrices. Default is '.'.",
+    )
+
+    return parser
+
+
+def main(args=None):
+    """Embed the covariance matrices in their group tangent spaces."""
+    from xcp_d.utils.connectivity import write_tangent_embeddings
+
+    opts = get_parser().parse_args(args)
+
+    covariance_files = []
+    for input_path in opts.inputs:
+        if input_path.is_dir():
+            covariance_files += sorted(
+                str(f) for f in input_path.rglob("*_measure-ledoitwolfcovariance_conmat.tsv")
+            )
+        else:
+            covariance_files.append(str(input_path))
+
+    if not covariance_files:
+        raise FileNotFoundError(f"No covariance files found in {', '.join(map(str, opts.inputs))}")
+
+    out_files = write_tangent_embeddings(covariance_files, str(opts.output_dir))
+    print(f"Wrote {len(out_files)} tangent-space matrices to {opts.output_dir}.")
+
+
+if __name__ == "__main__":
+    raise RuntimeError("this should be run with the xcp_d-tangent-connectivity command")
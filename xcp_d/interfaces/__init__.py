@@ -13,6 +13,7 @@ from xcp_d.interfaces import (
     report,
     report_core,
     restingstate,
+    smoothing,
     workbench,
 )
 
@@ -28,5 +29,6 @@ __all__ = [
     "report",
     "report_core",
     "restingstate",
+    "smoothing",
     "workbench",
 ]
@@ -1,12 +1,17 @@
 """Adapted interfaces from Niworkflows."""
+import os
 from json import loads
 from pathlib import Path
 
 from bids.layout import Config
 from nipype import logging
+from nipype.interfaces.base import isdefined
 from niworkflows.interfaces.bids import DerivativesDataSink as BaseDerivativesDataSink
 from pkg_resources import resource_filename as pkgrf
 
+from xcp_d.utils.filemanip import ensure_list, split_filename
+from xcp_d.utils.manifest import write_manifest_entries
+
 # NOTE: Modified for xcpd's purposes
 xcp_d_spec = loads(Path(pkgrf("xcp_d", "data/xcp_d_bids_config.json")).read_text())
 bids_config = Config.load("bids")
@@ -22,10 +27,17 @@ config_entities = frozenset({e["name"] for e in merged_entities})
 LOGGER = logging.getLogger("nipype.interface")
 
 
+def _is_nifti(in_file):
+    """Check if a file is a NIfTI (not a CIFTI or GIFTI) image."""
+    return split_filename(str(in_file))[2] in (".nii", ".nii.gz")
+
+
 class DerivativesDataSink(BaseDerivativesDataSink):
     """Store derivative files.
 
     A child class of the niworkflows DerivativesDataSink, using xcp_d's configuration files.
+    Every written file is also recorded in the xcp_d derivatives manifest,
+    which is used to build the reports without indexing the output directory.
     """
 
     out_path_base = "xcp_d"
@@ -33,3 +45,26 @@ class DerivativesDataSink(BaseDerivativesDataSink):
     _config_entities = config_entities
     _config_entities_dict = merged_entities
     _file_patterns = xcp_d_spec["default_path_patterns"]
+
+    def _run_interface(self, runtime):
+        if not self.inputs.compress:
+            # Intermediate NIfTIs may be uncompressed (see --work-compression),
+            # but NIfTI derivatives are always gzipped.
+            self.inputs.compress = [
+                True if _is_nifti(in_file) else None
+                for in_file in ensure_list(self.inputs.in_file)
+            ]
+
+        runtime = super()._run_interface(runtime)
+
+        base_directory = runtime.cwd
+        if isdefined(self.inputs.base_directory):
+            base_directory = self.inputs.base_directory
+
+        write_manifest_entries(
+            xcpd_dir=os.path.join(os.path.abspath(base_directory), self.out_path_base),
+            out_files=self._results["out_file"],
+            source_file=self.inputs.source_file,
+        )
+
+        return runtime
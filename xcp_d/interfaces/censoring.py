@@ -1,4 +1,5 @@
 """Interfaces for the post-processing workflows."""
+import json
 import os
 
 import nibabel as nb
@@ -13,8 +14,10 @@ from nipype.interfaces.base import (
     traits,
 )
 
+from xcp_d.utils.cache import cache_results
+from xcp_d.utils.columnar import read_columns, read_metadata, write_columns
 from xcp_d.utils.confounds import _infer_dummy_scans, load_confound_matrix, load_motion
-from xcp_d.utils.filemanip import fname_presuffix
+from xcp_d.utils.filemanip import fname_presuffix, set_work_extension
 from xcp_d.utils.modified_data import _drop_dummy_scans, compute_fd
 
 LOGGER = logging.getLogger("nipype.interface")
@@ -92,6 +95,7 @@ class RemoveDummyVolumes(SimpleInterface):
     input_spec = _RemoveDummyVolumesInputSpec
     output_spec = _RemoveDummyVolumesOutputSpec
 
+    @cache_results
     def _run_interface(self, runtime):
         dummy_scans = _infer_dummy_scans(
             dummy_scans=self.inputs.dummy_scans,
@@ -113,11 +117,13 @@ class RemoveDummyVolumes(SimpleInterface):
             return runtime
 
         # get the file names to output to
-        self._results["bold_file_dropped_TR"] = fname_presuffix(
-            self.inputs.bold_file,
-            newpath=runtime.cwd,
-            suffix="_dropped",
-            use_ext=True,
+        self._results["bold_file_dropped_TR"] = set_work_extension(
+            fname_presuffix(
+                self.inputs.bold_file,
+                newpath=runtime.cwd,
+                suffix="_dropped",
+                use_ext=True,
+            )
         )
         self._results["fmriprep_confounds_file_dropped_TR"] = fname_presuffix(
             self.inputs.fmriprep_confounds_file,
@@ -139,16 +145,19 @@ class RemoveDummyVolumes(SimpleInterface):
         )
 
         # Remove the dummy volumes
-        dropped_image = _drop_dummy_scans(self.inputs.bold_file, dummy_scans=dummy_scans)
-        dropped_image.to_filename(self._results["bold_file_dropped_TR"])
+        _drop_dummy_scans(
+            self.inputs.bold_file,
+            dummy_scans=dummy_scans,
+            out_file=self._results["bold_file_dropped_TR"],
+        )
 
         # Drop the first N rows from the pandas dataframe
-        fmriprep_confounds_df = pd.read_table(self.inputs.fmriprep_confounds_file)
+        fmriprep_confounds_df = read_columns(self.inputs.fmriprep_confounds_file)
         fmriprep_confounds_df_dropped = fmriprep_confounds_df.drop(np.arange(dummy_scans))
-        fmriprep_confounds_df_dropped.to_csv(
+        write_columns(
+            fmriprep_confounds_df_dropped,
             self._results["fmriprep_confounds_file_dropped_TR"],
-            sep="\t",
-            index=False,
+            metadata=read_metadata(self.inputs.fmriprep_confounds_file),
         )
 
         # Drop the first N rows from the confounds file
@@ -261,11 +270,13 @@ class Censor(SimpleInterface):
             )
 
         # get the output
-        self._results["censored_denoised_bold"] = fname_presuffix(
-            self.inputs.in_file,
-            suffix="_censored",
-            newpath=runtime.cwd,
-            use_ext=True,
+        self._results["censored_denoised_bold"] = set_work_extension(
+            fname_presuffix(
+                self.inputs.in_file,
+                suffix="_censored",
+                newpath=runtime.cwd,
+                use_ext=True,
+            )
         )
 
         bold_img_censored.to_filename(self._results["censored_denoised_bold"])
@@ -451,8 +462,9 @@ class GenerateConfounds(SimpleInterface):
     input_spec = _GenerateConfoundsInputSpec
     output_spec = _GenerateConfoundsOutputSpec
 
+    @cache_results
     def _run_interface(self, runtime):
-        fmriprep_confounds_df = pd.read_table(self.inputs.fmriprep_confounds_file)
+        fmriprep_confounds_df = read_columns(self.inputs.fmriprep_confounds_file)
         motion_df = load_motion(
             fmriprep_confounds_df.copy(),
             TR=self.inputs.TR,
@@ -490,10 +502,15 @@ class GenerateConfounds(SimpleInterface):
 
             fmriprep_confounds_df[col] = motion_df[col]
 
-        fmriprep_confounds_df.to_csv(
+        # The filtered confounds are added to the columnar store as they are written,
+        # so selecting the nuisance regressors below does not parse them again.
+        with open(self.inputs.fmriprep_confounds_json, "r") as fobj:
+            fmriprep_confounds_metadata = json.load(fobj)
+
+        write_columns(
+            fmriprep_confounds_df,
             self._results["filtered_confounds_file"],
-            sep="\t",
-            index=False,
+            metadata=fmriprep_confounds_metadata,
         )
 
         # Load nuisance regressors, but use filtered motion parameters.
@@ -2,6 +2,7 @@
 import itertools
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 from nipype import logging
@@ -262,13 +263,14 @@ class FilterOutFailedRuns(SimpleInterface):
 class _ConcatenateInputsInputSpec(BaseInterfaceInputSpec):
     censored_denoised_bold = traits.List(
         File(exists=True),
-        mandatory=True,
-        desc="Denoised BOLD data.",
+        desc="Denoised BOLD data. Only used for dense concatenation.",
     )
     preprocessed_bold = traits.List(
         File(exists=True),
-        mandatory=True,
-        desc="Preprocessed BOLD files, after dummy volume removal.",
+        desc=(
+            "Preprocessed BOLD files, after dummy volume removal. "
+            "Only used for dense concatenation."
+        ),
     )
     fmriprep_confounds_file = traits.List(
         File(exists=True),
@@ -287,13 +289,11 @@ class _ConcatenateInputsInputSpec(BaseInterfaceInputSpec):
     )
     uncensored_denoised_bold = traits.List(
         File(exists=True),
-        mandatory=True,
-        desc="Denoised BOLD data.",
+        desc="Denoised BOLD data. Only used for dense concatenation.",
     )
     interpolated_filtered_bold = traits.List(
         File(exists=True),
-        mandatory=True,
-        desc="Denoised BOLD data.",
+        desc="Denoised BOLD data. Only used for dense concatenation.",
     )
     smoothed_denoised_bold = traits.List(
         traits.Either(
@@ -316,6 +316,11 @@ class _ConcatenateInputsInputSpec(BaseInterfaceInputSpec):
             "Only defined for CIFTI processing."
         ),
     )
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        desc="Number of output files to concatenate in parallel.",
+    )
 
 
 class _ConcatenateInputsOutputSpec(TraitedSpec):
@@ -397,9 +402,15 @@ class ConcatenateInputs(SimpleInterface):
 
         self._results["run_index"] = run_index
 
+        # Collect the concatenation jobs, so that they can be run in parallel.
+        jobs = []
         for name, run_files in merge_inputs.items():
-            LOGGER.info(f"Concatenating {name}")
-            if len(run_files) == 0 or any(not isdefined(f) for f in run_files):
+            if not isdefined(run_files):
+                # Inputs that are not connected (e.g., dense files in parcellated mode).
+                self._results[name] = Undefined
+                continue
+
+            elif len(run_files) == 0 or any(not isdefined(f) for f in run_files):
                 LOGGER.warning(f"No {name} files found")
                 self._results[name] = Undefined
                 continue
@@ -418,12 +429,7 @@ class ConcatenateInputs(SimpleInterface):
                 for i_atlas, parc_files in enumerate(transposed_run_files):
                     extension = ".".join(os.path.basename(parc_files[0]).split(".")[1:])
                     out_file = os.path.join(runtime.cwd, f"{name}_{i_atlas}.{extension}")
-                    if out_file.endswith(".tsv"):
-                        concatenate_tsvs(parc_files, out_file=out_file)
-                    else:
-                        concatenate_niimgs(parc_files, out_file=out_file)
-
-                    assert os.path.isfile(out_file), f"Output file {out_file} not created."
+                    jobs.append((name, parc_files, out_file))
                     out_files.append(out_file)
 
                 self._results[name] = out_files
@@ -431,12 +437,22 @@ class ConcatenateInputs(SimpleInterface):
                 # Files are a single list of paths.
                 extension = ".".join(os.path.basename(run_files[0]).split(".")[1:])
                 out_file = os.path.join(runtime.cwd, f"{name}.{extension}")
-                if out_file.endswith(".tsv"):
-                    concatenate_tsvs(run_files, out_file=out_file)
-                else:
-                    concatenate_niimgs(run_files, out_file=out_file)
-
-                assert os.path.isfile(out_file), f"Output file {out_file} not created."
+                jobs.append((name, run_files, out_file))
                 self._results[name] = out_file
 
+        with ThreadPoolExecutor(max_workers=max(self.inputs.num_threads, 1)) as executor:
+            # Consume the results so that any exceptions are raised here.
+            list(executor.map(lambda job: _concatenate_files(*job), jobs))
+
         return runtime
+
+
+def _concatenate_files(name, in_files, out_file):
+    """Concatenate TSV or imaging files, based on the output file's extension."""
+    LOGGER.info(f"Concatenating {name}")
+    if out_file.endswith(".tsv"):
+        concatenate_tsvs(in_files, out_file=out_file)
+    else:
+        concatenate_niimgs(in_files, out_file=out_file)
+
+    assert os.path.isfile(out_file), f"Output file {out_file} not created."
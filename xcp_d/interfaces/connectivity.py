@@ -1,13 +1,13 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 """Handling functional connectvity."""
-import warnings
+import os
 
+import h5py
 import matplotlib.pyplot as plt
 import nibabel as nb
 import numpy as np
 import pandas as pd
-from nilearn.maskers import NiftiLabelsMasker
 from nilearn.plotting import plot_matrix
 from nipype import logging
 from nipype.interfaces.base import (
@@ -16,11 +16,32 @@ from nipype.interfaces.base import (
     InputMultiObject,
     SimpleInterface,
     TraitedSpec,
+    isdefined,
     traits,
 )
 
+from xcp_d.interfaces.ants import ApplyTransforms
+from xcp_d.interfaces.workbench import CiftiCreateDenseFromTemplate, CiftiParcellate
+from xcp_d.utils.atlas import (
+    get_atlas_cache_key,
+    get_cached_atlas_files,
+    store_cached_atlas_files,
+)
+from xcp_d.utils.connectivity import (
+    CONNECTIVITY_MEASURES,
+    DENSE_BLOCK_SIZE,
+    correlate_columns,
+    estimate_connectivity,
+    get_sliding_windows,
+    sliding_window_correlations,
+    standardize_columns,
+)
 from xcp_d.utils.filemanip import fname_presuffix
-from xcp_d.utils.write_save import get_cifti_intents
+from xcp_d.utils.modified_data import cast_cifti_to_int16
+from xcp_d.utils.parcellation import get_parcellation_operator
+from xcp_d.utils.profiling import phase, profile_run
+from xcp_d.utils.threadpools import limit_threads
+from xcp_d.utils.write_save import create_cifti_memmap, get_cifti_intents
 
 LOGGER = logging.getLogger("nipype.interface")
 
@@ -49,6 +70,21 @@ class _NiftiConnectInputSpec(BaseInterfaceInputSpec):
         mandatory=True,
         desc="Whether to return correlations (True) or not (False).",
     )
+    connectivity_measures = traits.List(
+        traits.Enum(*CONNECTIVITY_MEASURES),
+        value=[],
+        usedefault=True,
+        desc=(
+            "Regularized connectivity measures to estimate in addition to Pearson correlations. "
+            "Only used if correlate is True."
+        ),
+    )
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
 
 
 class _NiftiConnectOutputSpec(TraitedSpec):
@@ -61,6 +97,20 @@ class _NiftiConnectOutputSpec(TraitedSpec):
         desc="Correlation matrix files limited to an exact number of volumes.",
     )
 
+    connectivity = traits.Either(
+        None,
+        traits.List(File(exists=True)),
+        desc="Connectivity matrix files, one per measure in connectivity_measures.",
+    )
+    connectivity_exact = traits.Either(
+        None,
+        traits.List(File(exists=True)),
+        desc=(
+            "Connectivity matrix files limited to exact numbers of volumes, "
+            "for each measure and then each exact number of volumes."
+        ),
+    )
+
 
 class NiftiConnect(SimpleInterface):
     """Extract timeseries and compute connectivity matrices.
@@ -73,6 +123,8 @@ class NiftiConnect(SimpleInterface):
     input_spec = _NiftiConnectInputSpec
     output_spec = _NiftiConnectOutputSpec
 
+    @profile_run
+    @limit_threads
     def _run_interface(self, runtime):
         filtered_file = self.inputs.filtered_file
         mask = self.inputs.mask
@@ -81,6 +133,7 @@ class NiftiConnect(SimpleInterface):
         min_coverage = self.inputs.min_coverage
         correlate = self.inputs.correlate
 
+        phase("load")
         node_labels_df = pd.read_table(atlas_labels, index_col="index")
         node_labels_df.sort_index(inplace=True)  # ensure index is in order
 
@@ -94,42 +147,47 @@ class NiftiConnect(SimpleInterface):
 
         node_labels = node_labels_df["label"].tolist()
 
-        # Before anything, we need to measure coverage
-        atlas_img = nb.load(atlas)
-        atlas_data = atlas_img.get_fdata()
-        atlas_data_bin = (atlas_data > 0).astype(np.float32)
-        atlas_img_bin = nb.Nifti1Image(atlas_data_bin, atlas_img.affine, atlas_img.header)
-
-        sum_masker_masked = NiftiLabelsMasker(
-            labels_img=atlas,
-            labels=node_labels,
-            mask_img=mask,
-            smoothing_fwhm=None,
-            standardize=False,
-            strategy="sum",
-            resampling_target=None,  # they should be in the same space/resolution already
-        )
-        sum_masker_unmasked = NiftiLabelsMasker(
-            labels_img=atlas,
-            labels=node_labels,
-            smoothing_fwhm=None,
-            standardize=False,
-            strategy="sum",
-            resampling_target=None,  # they should be in the same space/resolution already
+        # Parcellate with a sparse (parcels x labeled elements) operator.
+        operator = get_parcellation_operator(atlas)
+
+        data_img = nb.load(filtered_file)
+        if data_img.shape[:3] != operator.shape:
+            raise ValueError(
+                f"Atlas shape {operator.shape} does not match data shape {data_img.shape[:3]}."
+            )
+
+        mask_arr = np.asanyarray(nb.load(mask).dataobj).ravel()
+        good_voxels = mask_arr[operator.element_idx] > 0
+        # Only read the labeled voxels, in the data's own dtype, instead of the whole 4D array.
+        data_arr = np.asanyarray(data_img.dataobj)[
+            np.unravel_index(operator.element_idx, operator.shape)
+        ].T
+        phase("parcellate")
+        timeseries_found, coverage_found = operator.parcellate(
+            data_arr,
+            good_voxels,
+            n_threads=self.inputs.num_threads,
         )
-        n_voxels_in_masked_parcels = sum_masker_masked.fit_transform(atlas_img_bin)
-        n_voxels_in_parcels = sum_masker_unmasked.fit_transform(atlas_img_bin)
-        parcel_coverage = np.squeeze(n_voxels_in_masked_parcels / n_voxels_in_parcels)
-        coverage_thresholded = parcel_coverage < min_coverage
+
+        extra_labels = np.setdiff1d(operator.labels, node_labels_df.index)
+        if extra_labels.size:
+            LOGGER.warning(
+                f"{extra_labels.size} parcels in the atlas file are not in the atlas labels file "
+                "and will be ignored."
+            )
+
+        # Region indices in the atlas may not be sequential, so we map them to sequential ints.
+        node_idx = node_labels_df.index.to_numpy()
+        found_nodes = np.isin(node_idx, operator.labels)
+        found_rows = np.searchsorted(operator.labels, node_idx[found_nodes])
+        coverage_found = coverage_found[found_rows]
 
         n_nodes = len(node_labels)
-        n_found_nodes = coverage_thresholded.size
-        n_bad_nodes = np.sum(parcel_coverage == 0)
-        n_poor_parcels = np.sum(
-            np.logical_and(parcel_coverage > 0, parcel_coverage < min_coverage)
-        )
+        n_found_nodes = found_nodes.sum()
+        n_bad_nodes = np.sum(coverage_found == 0)
+        n_poor_parcels = np.sum(np.logical_and(coverage_found > 0, coverage_found < min_coverage))
         n_partial_parcels = np.sum(
-            np.logical_and(parcel_coverage >= min_coverage, parcel_coverage < 1)
+            np.logical_and(coverage_found >= min_coverage, coverage_found < 1)
         )
 
         if n_found_nodes != n_nodes:
@@ -154,46 +212,16 @@ class NiftiConnect(SimpleInterface):
                 "calculated from the remaining voxels."
             )
 
-        masker = NiftiLabelsMasker(
-            labels_img=atlas,
-            labels=node_labels,
-            mask_img=mask,
-            smoothing_fwhm=None,
-            standardize=False,
-            resampling_target=None,  # they should be in the same space/resolution already
-        )
-
-        # Use nilearn for time_series
-        timeseries_arr = masker.fit_transform(filtered_file)
-        assert timeseries_arr.shape[1] == n_found_nodes
+        # Parcels lost by warping/downsampling the atlas get NaNs and zero coverage.
+        timeseries_arr = np.full((data_arr.shape[0], n_nodes), fill_value=np.nan)
+        timeseries_arr[:, found_nodes] = timeseries_found[:, found_rows]
+        parcel_coverage = np.zeros(n_nodes)
+        parcel_coverage[found_nodes] = coverage_found
 
         # Apply the coverage mask
-        timeseries_arr[:, coverage_thresholded] = np.nan
-
-        # Region indices in the atlas may not be sequential, so we map them to sequential ints.
-        seq_mapper = {idx: i for i, idx in enumerate(node_labels_df.index.tolist())}
-
-        if n_found_nodes != n_nodes:  # parcels lost by warping/downsampling atlas
-            # Fill in any missing nodes in the timeseries array with NaNs.
-            new_timeseries_arr = np.full(
-                (timeseries_arr.shape[0], n_nodes),
-                fill_value=np.nan,
-                dtype=timeseries_arr.dtype,
-            )
-            for col in range(timeseries_arr.shape[1]):
-                label_col = seq_mapper[masker.labels_[col]]
-                new_timeseries_arr[:, label_col] = timeseries_arr[:, col]
-
-            timeseries_arr = new_timeseries_arr
-
-            # Fill in any missing nodes in the coverage array with zero.
-            new_parcel_coverage = np.zeros(n_nodes, dtype=parcel_coverage.dtype)
-            for row in range(parcel_coverage.shape[0]):
-                label_row = seq_mapper[masker.labels_[row]]
-                new_parcel_coverage[label_row] = parcel_coverage[row]
-
-            parcel_coverage = new_parcel_coverage
+        timeseries_arr[:, parcel_coverage < min_coverage] = np.nan
 
+        phase("write")
         # The time series file is tab-delimited, with node names included in the first row.
         self._results["timeseries"] = fname_presuffix(
             "timeseries.tsv",
@@ -204,6 +232,8 @@ class NiftiConnect(SimpleInterface):
         timeseries_df.to_csv(self._results["timeseries"], sep="\t", na_rep="n/a", index=False)
 
         self._results["correlations_exact"] = None
+        self._results["connectivity"] = None
+        self._results["connectivity_exact"] = None
         if correlate:
             self._results["correlations"] = fname_presuffix(
                 "correlations.tsv",
@@ -253,6 +283,17 @@ class NiftiConnect(SimpleInterface):
                 )
                 self._results["correlations_exact"].append(exact_correlations_file)
 
+            (
+                self._results["connectivity"],
+                self._results["connectivity_exact"],
+            ) = _write_connectivity_measures(
+                timeseries_df,
+                censored_censoring_df,
+                exact_columns,
+                self.inputs.connectivity_measures,
+                runtime.cwd,
+            )
+
         return runtime
 
 
@@ -298,6 +339,21 @@ class _CiftiConnectInputSpec(BaseInterfaceInputSpec):
         mandatory=True,
         desc="Whether to return correlations (True) or not (False).",
     )
+    connectivity_measures = traits.List(
+        traits.Enum(*CONNECTIVITY_MEASURES),
+        value=[],
+        usedefault=True,
+        desc=(
+            "Regularized connectivity measures to estimate in addition to Pearson correlations. "
+            "Only used if correlate is True."
+        ),
+    )
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
 
 
 class _CiftiConnectOutputSpec(TraitedSpec):
@@ -318,6 +374,20 @@ class _CiftiConnectOutputSpec(TraitedSpec):
         desc="Correlation matrix files limited to an exact number of volumes.",
     )
 
+    connectivity = traits.Either(
+        None,
+        traits.List(File(exists=True)),
+        desc="Connectivity matrix files, one per measure in connectivity_measures.",
+    )
+    connectivity_exact = traits.Either(
+        None,
+        traits.List(File(exists=True)),
+        desc=(
+            "Connectivity matrix files limited to exact numbers of volumes, "
+            "for each measure and then each exact number of volumes."
+        ),
+    )
+
 
 class CiftiConnect(SimpleInterface):
     """Extract timeseries and compute connectivity matrices.
@@ -330,6 +400,8 @@ class CiftiConnect(SimpleInterface):
     input_spec = _CiftiConnectInputSpec
     output_spec = _CiftiConnectOutputSpec
 
+    @profile_run
+    @limit_threads
     def _run_interface(self, runtime):
         min_coverage = self.inputs.min_coverage
         data_file = self.inputs.data_file
@@ -344,22 +416,25 @@ class CiftiConnect(SimpleInterface):
         assert atlas_file.endswith(".dlabel.nii"), atlas_file
         assert pscalar_file.endswith(".pscalar.nii"), pscalar_file
 
+        phase("load")
         data_img = nb.load(data_file)
         atlas_img = nb.load(atlas_file)
         pscalar_img = nb.load(pscalar_file)
         node_labels_df = pd.read_table(atlas_labels, index_col="index")
         node_labels_df.sort_index(inplace=True)  # ensure index is in order
 
-        data_arr = data_img.get_fdata()
-        atlas_arr = np.squeeze(atlas_img.get_fdata())  # first dim is singleton
+        # Parcellate with a sparse (parcels x labeled elements) operator.
+        operator = get_parcellation_operator(atlas_file)
+        if operator.shape != data_img.shape[1:]:
+            raise ValueError(
+                f"Atlas shape {operator.shape} does not match data shape {data_img.shape[1:]}."
+            )
+
+        # Only read the labeled grayordinates, in the data's own dtype.
+        data_arr = np.asanyarray(data_img.dataobj)[:, operator.element_idx]
 
-        # First, replace all bad vertices' time series with NaNs.
-        # This way, any partially-covered parcels will have NaNs in the bad portions,
-        # so those vertices will be ignored by wb_command -cifti-parcellate.
-        bad_vertices_idx = np.where(
-            np.all(np.logical_or(data_arr == 0, np.isnan(data_arr)), axis=0)
-        )[0]
-        data_arr[:, bad_vertices_idx] = np.nan
+        # First, flag bad vertices (all zeros or NaNs), which are ignored when parcellating.
+        good_vertices = ~np.all(np.logical_or(data_arr == 0, np.isnan(data_arr)), axis=0)
 
         # Now we can work to parcellate the data
         label_axis = atlas_img.header.get_axis(0)
@@ -429,54 +504,36 @@ class CiftiConnect(SimpleInterface):
             x for _, x in sorted(atlas_label_mapper.items(), key=lambda pair: pair[0])
         ]
 
-        timeseries_arr = np.zeros((data_arr.shape[0], len(atlas_label_mapper)), dtype=np.float32)
+        phase("parcellate")
+        timeseries_found, coverage_found = operator.parcellate(
+            data_arr,
+            good_vertices,
+            n_threads=self.inputs.num_threads,
+        )
+        # If a parcel has too much bad data, replace all of its values with NaNs.
+        timeseries_found[:, coverage_found < min_coverage] = np.nan
+
+        # Parcels not found in the atlas were probably erased by downsampling or something.
+        parcel_vals = np.array(sorted(atlas_label_mapper.keys()))
+        found_parcels = np.isin(parcel_vals, operator.labels)
+        found_rows = np.searchsorted(operator.labels, parcel_vals[found_parcels])
+
+        timeseries_arr = np.full((data_arr.shape[0], parcel_vals.size), fill_value=np.nan)
+        timeseries_arr[:, found_parcels] = timeseries_found[:, found_rows]
         timeseries_df = pd.DataFrame(columns=sorted_parcel_labels, data=timeseries_arr)
 
-        coverage_arr = np.zeros((len(atlas_label_mapper), 1), dtype=np.float32)
+        coverage_arr = np.zeros((parcel_vals.size, 1), dtype=np.float32)
+        coverage_arr[found_parcels, 0] = coverage_found[found_rows]
         coverage_df = pd.DataFrame(
             index=sorted_parcel_labels,
             columns=["coverage"],
             data=coverage_arr,
         )
 
-        parcels_in_atlas = []  # list of labels for parcels
-        for parcel_val, parcel_label in atlas_label_mapper.items():
-            parcel_idx = np.where(atlas_arr == parcel_val)[0]
-
-            if parcel_idx.size:  # parcel is found in atlas
-                # Determine which, if any, vertices in the parcel are missing.
-                bad_vertices_in_parcel_idx = np.intersect1d(parcel_idx, bad_vertices_idx)
-
-                # Determine the percentage of vertices with good data
-                parcel_coverage = 1 - (bad_vertices_in_parcel_idx.size / parcel_idx.size)
-                coverage_df.loc[parcel_label, "coverage"] = parcel_coverage
-
-                if parcel_coverage < min_coverage:
-                    # If the parcel has >=50% bad data, replace all of the values with zeros.
-                    data_arr[:, parcel_idx] = np.nan
-
-                parcels_in_atlas.append(parcel_label)
-                parcel_data = data_arr[:, parcel_idx]
-                with warnings.catch_warnings():
-                    # Ignore warning if calculating mean from only NaNs.
-                    warnings.simplefilter("ignore", category=RuntimeWarning)
-
-                    label_timeseries = np.nanmean(parcel_data, axis=1)
-
-            else:  # parcel not found in atlas
-                # Label was probably erased by downsampling or something.
-                label_timeseries = np.full(
-                    data_arr.shape[0],
-                    fill_value=np.nan,
-                    dtype=data_arr.dtype,
-                )
-                coverage_df.loc[parcel_label, "coverage"] = 0
-
-            timeseries_df[parcel_label] = label_timeseries
-
         # Use parcel names from tsv file instead of internal CIFTI parcel names for tsvs.
         timeseries_df = timeseries_df.rename(columns=parcel_label_mapper)
 
+        phase("write")
         # Save out the timeseries tsv
         self._results["timeseries"] = fname_presuffix(
             "timeseries.tsv",
@@ -487,6 +544,8 @@ class CiftiConnect(SimpleInterface):
 
         self._results["correlations_exact"] = None
         self._results["correlation_ciftis_exact"] = None
+        self._results["connectivity"] = None
+        self._results["connectivity_exact"] = None
         if correlate:
             # Save out the timeseries CIFTI
             time_axis = data_img.header.get_axis(0)
@@ -595,6 +654,350 @@ class CiftiConnect(SimpleInterface):
                 exact_conn_img.to_filename(exact_correlations_cifti_file)
                 self._results["correlation_ciftis_exact"].append(exact_correlations_cifti_file)
 
+            (
+                self._results["connectivity"],
+                self._results["connectivity_exact"],
+            ) = _write_connectivity_measures(
+                timeseries_df,
+                censored_censoring_df,
+                exact_columns,
+                self.inputs.connectivity_measures,
+                runtime.cwd,
+            )
+
+        return runtime
+
+
+def _write_connectivity_measures(
+    timeseries_df,
+    censored_censoring_df,
+    exact_columns,
+    measures,
+    out_dir,
+):
+    """Estimate and write regularized connectivity matrices for the run and its exact subsets.
+
+    The Ledoit-Wolf covariance of each set of volumes (and its Cholesky-based inverse,
+    if a precision-based measure is requested) is only estimated once for all of the measures,
+    and subsets that select the same volumes as an earlier set reuse its matrices.
+
+    Returns
+    -------
+    connectivity_files : :obj:`list` of :obj:`str` or None
+        One file per measure, for all of the volumes.
+    connectivity_exact_files : :obj:`list` of :obj:`str` or None
+        One file per measure and exact subset, in that order.
+    """
+    if not measures:
+        return None, None
+
+    node_labels = timeseries_df.columns
+    timeseries_arr = timeseries_df.to_numpy()
+    subsets = {None: np.ones(timeseries_arr.shape[0], dtype=bool)}
+    for exact_column in exact_columns:
+        subsets[exact_column] = censored_censoring_df[exact_column].to_numpy() == 0
+
+    cache = {}
+    connectivity_files, connectivity_exact_files = [], []
+    for measure in measures:
+        for subset_name, subset in subsets.items():
+            key = subset.tobytes()
+            if key not in cache:
+                cache[key] = estimate_connectivity(timeseries_arr[subset], measures)
+
+            suffix = measure if subset_name is None else f"{measure}_{subset_name}"
+            connectivity_file = fname_presuffix(
+                f"{suffix}.tsv",
+                newpath=out_dir,
+                use_ext=True,
+            )
+            pd.DataFrame(
+                cache[key][measure],
+                index=node_labels,
+                columns=node_labels,
+            ).to_csv(connectivity_file, sep="\t", na_rep="n/a", index_label="Node")
+            if subset_name is None:
+                connectivity_files.append(connectivity_file)
+            else:
+                connectivity_exact_files.append(connectivity_file)
+
+    return connectivity_files, connectivity_exact_files or None
+
+
+class _DenseConnectInputSpec(BaseInterfaceInputSpec):
+    data_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Dense CIFTI time series file to correlate.",
+    )
+    timeseries_ciftis = InputMultiObject(
+        File(exists=True),
+        mandatory=False,
+        desc=(
+            "Parcellated time series (ptseries) files from the same data, one per atlas. "
+            "Each parcel's time series is correlated with every grayordinate."
+        ),
+    )
+    dense = traits.Bool(
+        False,
+        usedefault=True,
+        desc="Whether to compute the grayordinate-by-grayordinate correlation matrix.",
+    )
+    block_size = traits.Int(
+        DENSE_BLOCK_SIZE,
+        usedefault=True,
+        nohash=True,
+        desc="Number of grayordinates that are correlated with all others at a time.",
+    )
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
+
+
+class _DenseConnectOutputSpec(TraitedSpec):
+    dense_correlations = File(exists=True, desc="Dense correlation matrix dconn.nii file.")
+    seed_correlations = traits.List(
+        File(exists=True),
+        desc="Parcel-to-grayordinate correlation dpconn.nii files, one per atlas.",
+    )
+
+
+class DenseConnect(SimpleInterface):
+    """Compute dense and seed-based connectivity from a dense CIFTI time series.
+
+    The time series are standardized once, and the correlations are computed in blocks of
+    grayordinates with matrix products that are written straight into memory-mapped CIFTIs,
+    so the correlation matrices are never held in memory.
+    """
+
+    input_spec = _DenseConnectInputSpec
+    output_spec = _DenseConnectOutputSpec
+
+    @profile_run
+    @limit_threads
+    def _run_interface(self, runtime):
+        data_file = self.inputs.data_file
+        assert data_file.endswith(".dtseries.nii"), data_file
+
+        phase("load")
+        data_img = nb.load(data_file)
+        brain_models = data_img.header.get_axis(1)
+        standardized = standardize_columns(data_img.get_fdata(dtype=np.float32))
+        del data_img
+
+        phase("compute")
+        self._results["seed_correlations"] = []
+        timeseries_ciftis = self.inputs.timeseries_ciftis or []
+        for i_atlas, timeseries_cifti in enumerate(timeseries_ciftis):
+            timeseries_img = nb.load(timeseries_cifti)
+            seed_correlations_file = os.path.join(
+                runtime.cwd,
+                f"seed_correlations_{i_atlas}.dpconn.nii",
+            )
+            # One row per parcel, as in dpconn files (ConnDenseParcel),
+            # whose first matrix dimension is the parcels axis.
+            seed_correlations = create_cifti_memmap(
+                seed_correlations_file,
+                (timeseries_img.header.get_axis(1), brain_models),
+            )
+            correlate_columns(
+                standardize_columns(timeseries_img.get_fdata(dtype=np.float32)),
+                standardized,
+                out=seed_correlations,
+                block_size=self.inputs.block_size,
+            )
+            seed_correlations.flush()
+            del seed_correlations
+            self._results["seed_correlations"].append(seed_correlations_file)
+
+        if self.inputs.dense:
+            self._results["dense_correlations"] = os.path.join(
+                runtime.cwd,
+                "correlations.dconn.nii",
+            )
+            dense_correlations = create_cifti_memmap(
+                self._results["dense_correlations"],
+                (brain_models, brain_models),
+            )
+            correlate_columns(
+                standardized,
+                standardized,
+                out=dense_correlations,
+                block_size=self.inputs.block_size,
+            )
+            dense_correlations.flush()
+            del dense_correlations
+
+        return runtime
+
+
+class _DynamicConnectInputSpec(BaseInterfaceInputSpec):
+    timeseries = File(
+        exists=True,
+        mandatory=True,
+        desc=(
+            "Parcellated time series TSV file, with one column for each node. "
+            "It may contain either all volumes or only the volumes retained by the temporal mask."
+        ),
+    )
+    temporal_mask = File(
+        exists=True,
+        mandatory=False,
+        desc="Temporal mask, after dummy scan removal. Censored volumes are skipped.",
+    )
+    window_length = traits.Int(
+        mandatory=True,
+        desc="Number of volumes in each window, including censored volumes.",
+    )
+    step = traits.Int(
+        1,
+        usedefault=True,
+        desc="Number of volumes between the onsets of consecutive windows.",
+    )
+    taper = traits.Enum(
+        "boxcar",
+        "exponential",
+        usedefault=True,
+        desc="How volumes are weighted within each window.",
+    )
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
+
+
+class _DynamicConnectOutputSpec(TraitedSpec):
+    dynamic_correlations = File(exists=True, desc="Sliding-window correlation matrices file.")
+
+
+class DynamicConnect(SimpleInterface):
+    """Compute sliding-window correlation matrices from a parcellated time series TSV file.
+
+    The correlation matrices are written, one window at a time, to a chunked HDF5 file with
+    the following datasets:
+
+    -   ``correlations``: (n_windows, n_nodes, n_nodes) float32 correlation matrices,
+        chunked by window.
+    -   ``window_onsets``: the index of each window's first volume, after dummy scan removal.
+    -   ``n_volumes``: the number of uncensored volumes in each window.
+        Windows with too few uncensored volumes are all NaNs.
+    -   ``node_names``: the names of the nodes.
+
+    The window length, step, and taper are stored as attributes of ``correlations``.
+    """
+
+    input_spec = _DynamicConnectInputSpec
+    output_spec = _DynamicConnectOutputSpec
+
+    @profile_run
+    @limit_threads
+    def _run_interface(self, runtime):
+        phase("load")
+        timeseries_df = pd.read_table(self.inputs.timeseries)
+        timeseries_arr = timeseries_df.to_numpy(dtype=np.float64)
+        if isdefined(self.inputs.temporal_mask):
+            censoring_df = pd.read_table(self.inputs.temporal_mask)
+            sample_mask = censoring_df["framewise_displacement"].to_numpy() == 0
+        else:
+            sample_mask = np.ones(timeseries_arr.shape[0], dtype=bool)
+
+        # Place the retained volumes at their acquisition times, so windows span fixed times.
+        if timeseries_arr.shape[0] == sample_mask.sum():
+            full_timeseries_arr = np.zeros((sample_mask.size, timeseries_arr.shape[1]))
+            full_timeseries_arr[sample_mask] = timeseries_arr
+            timeseries_arr = full_timeseries_arr
+        elif timeseries_arr.shape[0] != sample_mask.size:
+            raise ValueError(
+                f"The time series has {timeseries_arr.shape[0]} volumes, but the temporal mask "
+                f"has {sample_mask.size} volumes, of which {sample_mask.sum()} are retained."
+            )
+
+        phase("compute")
+        n_windows = get_sliding_windows(
+            sample_mask.size,
+            self.inputs.window_length,
+            self.inputs.step,
+        ).size
+        if n_windows == 0:
+            LOGGER.warning(
+                f"The run ({sample_mask.size} volumes) is shorter than a single window "
+                f"({self.inputs.window_length} volumes), so no windows will be written."
+            )
+
+        n_nodes = timeseries_arr.shape[1]
+        self._results["dynamic_correlations"] = fname_presuffix(
+            "dynamic_correlations.h5",
+            newpath=runtime.cwd,
+            use_ext=True,
+        )
+        with h5py.File(self._results["dynamic_correlations"], "w") as f:
+            correlations = f.create_dataset(
+                "correlations",
+                shape=(n_windows, n_nodes, n_nodes),
+                dtype=np.float32,
+                chunks=(1, n_nodes, n_nodes) if n_windows else None,
+            )
+            _, onsets, n_retained = sliding_window_correlations(
+                timeseries_arr,
+                window_length=self.inputs.window_length,
+                step=self.inputs.step,
+                taper=self.inputs.taper,
+                sample_mask=sample_mask,
+                out=correlations,
+            )
+            correlations.attrs["window_length"] = self.inputs.window_length
+            correlations.attrs["step"] = self.inputs.step
+            correlations.attrs["taper"] = self.inputs.taper
+            f.create_dataset("window_onsets", data=onsets)
+            f.create_dataset("n_volumes", data=n_retained)
+            f.create_dataset("node_names", data=timeseries_df.columns.tolist())
+
+        return runtime
+
+
+class _TSVConnectInputSpec(BaseInterfaceInputSpec):
+    timeseries = File(
+        exists=True,
+        mandatory=True,
+        desc="Parcellated time series TSV file, with one column for each node.",
+    )
+
+
+class _TSVConnectOutputSpec(TraitedSpec):
+    correlations = File(exists=True, desc="Correlation matrix file.")
+
+
+class TSVConnect(SimpleInterface):
+    """Compute a correlation matrix from a parcellated time series TSV file.
+
+    This is used for concatenated time series,
+    so the dense data do not need to be concatenated and re-parcellated.
+    """
+
+    input_spec = _TSVConnectInputSpec
+    output_spec = _TSVConnectOutputSpec
+
+    def _run_interface(self, runtime):
+        timeseries_df = pd.read_table(self.inputs.timeseries)
+        correlations_df = timeseries_df.corr()
+
+        self._results["correlations"] = fname_presuffix(
+            "correlations.tsv",
+            newpath=runtime.cwd,
+            use_ext=True,
+        )
+        correlations_df.to_csv(
+            self._results["correlations"],
+            sep="\t",
+            na_rep="n/a",
+            index_label="Node",
+        )
+
         return runtime
 
 
@@ -683,3 +1086,157 @@ class ConnectPlot(SimpleInterface):
         fig.savefig(self._results["connectplot"], bbox_inches="tight", pad_inches=None)
 
         return runtime
+
+
+class _WarpAtlasToBOLDInputSpec(BaseInterfaceInputSpec):
+    atlas_file = File(exists=True, mandatory=True, desc="Atlas file in MNI152NLin6Asym space.")
+    reference_image = File(
+        exists=True,
+        mandatory=True,
+        desc="3D reference image in the same space as the BOLD data.",
+    )
+    transforms = InputMultiObject(
+        traits.Str,
+        mandatory=True,
+        desc="Transforms from MNI152NLin6Asym to the BOLD data's space.",
+    )
+    cache_dir = traits.Either(
+        None,
+        traits.Str,
+        default=None,
+        usedefault=True,
+        desc="Directory in which warped atlases are cached. If None, nothing is cached.",
+    )
+    num_threads = traits.Int(1, usedefault=True, desc="Number of threads for ANTs.")
+
+
+class _WarpAtlasToBOLDOutputSpec(TraitedSpec):
+    output_image = File(exists=True, desc="Atlas file in the same space as the BOLD data.")
+
+
+class WarpAtlasToBOLD(SimpleInterface):
+    """Warp a NIfTI atlas to the BOLD data's space, reusing cached results when possible.
+
+    Warped atlases are cached under a hash of the atlas, the transforms,
+    and the reference image's grid, so each atlas is only warped once per space and resolution.
+    """
+
+    input_spec = _WarpAtlasToBOLDInputSpec
+    output_spec = _WarpAtlasToBOLDOutputSpec
+
+    def _run_interface(self, runtime):
+        cache_key = None
+        if self.inputs.cache_dir:
+            cache_key = get_atlas_cache_key(
+                self.inputs.atlas_file,
+                self.inputs.reference_image,
+                self.inputs.transforms,
+            )
+            cached_files = get_cached_atlas_files(self.inputs.cache_dir, cache_key)
+            if cached_files:
+                LOGGER.info(f"Using cached warped atlas for {self.inputs.atlas_file}")
+                self._results["output_image"] = cached_files["output_image"]
+                return runtime
+
+        warp_atlas = ApplyTransforms(
+            input_image=self.inputs.atlas_file,
+            reference_image=self.inputs.reference_image,
+            transforms=self.inputs.transforms,
+            interpolation="GenericLabel",
+            input_image_type=3,
+            dimension=3,
+            num_threads=self.inputs.num_threads,
+        )
+        warp_results = warp_atlas.run(cwd=runtime.cwd)
+        output_image = warp_results.outputs.output_image
+
+        if cache_key is not None:
+            cached_files = store_cached_atlas_files(
+                self.inputs.cache_dir,
+                cache_key,
+                {"output_image": output_image},
+            )
+            output_image = cached_files["output_image"]
+
+        self._results["output_image"] = output_image
+
+        return runtime
+
+
+class _ResampleAtlasToCiftiInputSpec(BaseInterfaceInputSpec):
+    atlas_file = File(exists=True, mandatory=True, desc="CIFTI atlas file.")
+    template_cifti = File(
+        exists=True,
+        mandatory=True,
+        desc="CIFTI file with the same brain models as the BOLD data.",
+    )
+    cache_dir = traits.Either(
+        None,
+        traits.Str,
+        default=None,
+        usedefault=True,
+        desc="Directory in which resampled atlases are cached. If None, nothing is cached.",
+    )
+
+
+class _ResampleAtlasToCiftiOutputSpec(TraitedSpec):
+    atlas_file = File(exists=True, desc="Atlas resampled to the BOLD data's brain models.")
+    parcellated_atlas_file = File(exists=True, desc="Parcellated atlas pscalar file.")
+    int16_atlas_file = File(exists=True, desc="Resampled atlas, cast to int16.")
+
+
+class ResampleAtlasToCifti(SimpleInterface):
+    """Resample a CIFTI atlas to the BOLD data's brain models, reusing cached results.
+
+    This runs ``wb_command -cifti-create-dense-from-template`` and ``-cifti-parcellate``
+    and casts the resampled atlas to int16.
+    The three outputs are cached under a hash of the atlas and the template's brain models.
+    """
+
+    input_spec = _ResampleAtlasToCiftiInputSpec
+    output_spec = _ResampleAtlasToCiftiOutputSpec
+
+    def _run_interface(self, runtime):
+        cache_key = None
+        if self.inputs.cache_dir:
+            cache_key = get_atlas_cache_key(
+                self.inputs.atlas_file,
+                self.inputs.template_cifti,
+            )
+            cached_files = get_cached_atlas_files(self.inputs.cache_dir, cache_key)
+            if cached_files:
+                LOGGER.info(f"Using cached resampled atlas for {self.inputs.atlas_file}")
+                self._results.update(cached_files)
+                return runtime
+
+        resample_dir = os.path.join(runtime.cwd, "resample")
+        os.makedirs(resample_dir, exist_ok=True)
+        resample_atlas = CiftiCreateDenseFromTemplate(
+            template_cifti=self.inputs.template_cifti,
+            label=self.inputs.atlas_file,
+        )
+        atlas_file = resample_atlas.run(cwd=resample_dir).outputs.cifti_out
+
+        parcellate_atlas = CiftiParcellate(
+            in_file=atlas_file,
+            atlas_label=self.inputs.atlas_file,
+            direction="COLUMN",
+            only_numeric=True,
+            out_file="parcellated_atlas.pscalar.nii",
+        )
+        parcellated_atlas_file = parcellate_atlas.run(cwd=runtime.cwd).outputs.out_file
+
+        # cast_cifti_to_int16 writes to the working directory, which must differ from the input's.
+        int16_atlas_file = cast_cifti_to_int16(atlas_file)
+
+        out_files = {
+            "atlas_file": atlas_file,
+            "parcellated_atlas_file": parcellated_atlas_file,
+            "int16_atlas_file": int16_atlas_file,
+        }
+        if cache_key is not None:
+            out_files = store_cached_atlas_files(self.inputs.cache_dir, cache_key, out_files)
+
+        self._results.update(out_files)
+
+        return runtime
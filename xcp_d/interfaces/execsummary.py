@@ -9,6 +9,8 @@ from bs4 import BeautifulSoup
 from jinja2 import Environment, FileSystemLoader, Markup
 from pkg_resources import resource_filename as pkgrf
 
+from xcp_d.utils.manifest import ManifestLayout, load_manifest
+
 
 class ExecutiveSummary(object):
     """A class to build an executive summary.
@@ -21,6 +23,13 @@ class ExecutiveSummary(object):
         Subject ID.
     session_id : None or :obj:`str`, optional
         Session ID.
+
+    Notes
+    -----
+    The derivatives are looked up in the manifest written by
+    :class:`~xcp_d.interfaces.bids.DerivativesDataSink`.
+    If no manifest exists for the subject (e.g., for derivatives from an older version of
+    xcp_d), the derivatives directory is indexed with a :class:`~bids.layout.BIDSLayout`.
     """
 
     def __init__(self, xcpd_path, subject_id, session_id=None):
@@ -31,7 +40,11 @@ class ExecutiveSummary(object):
         else:
             self.session_id = None
 
-        self.layout = BIDSLayout(xcpd_path, validate=False, derivatives=True)
+        manifest_files = load_manifest(xcpd_path, subject_id)
+        if manifest_files:
+            self.layout = ManifestLayout(xcpd_path, manifest_files)
+        else:
+            self.layout = BIDSLayout(xcpd_path, validate=False, derivatives=True)
 
     def write_html(self, document, filename):
         """Write an html document to a filename.
@@ -12,7 +12,11 @@ from nipype.interfaces.base import (
 )
 from nipype.interfaces.nilearn import NilearnBaseInterface
 
-from xcp_d.utils.utils import denoise_with_nilearn
+from xcp_d.utils.cache import cache_results
+from xcp_d.utils.filemanip import set_work_extension
+from xcp_d.utils.profiling import phase, profile_run
+from xcp_d.utils.threadpools import limit_threads
+from xcp_d.utils.utils import denoise_strategies_with_nilearn, denoise_with_nilearn
 from xcp_d.utils.write_save import read_ndata, write_ndata
 
 
@@ -52,7 +56,9 @@ class IndexImage(NilearnBaseInterface, SimpleInterface):
         from nilearn.image import index_img
 
         img_3d = index_img(self.inputs.in_file, self.inputs.index)
-        self._results["out_file"] = os.path.join(runtime.cwd, self.inputs.out_file)
+        self._results["out_file"] = set_work_extension(
+            os.path.join(runtime.cwd, self.inputs.out_file)
+        )
         img_3d.to_filename(self._results["out_file"])
 
         return runtime
@@ -89,7 +95,9 @@ class Merge(NilearnBaseInterface, SimpleInterface):
         from nilearn.image import concat_imgs
 
         img_4d = concat_imgs(self.inputs.in_files)
-        self._results["out_file"] = os.path.join(runtime.cwd, self.inputs.out_file)
+        self._results["out_file"] = set_work_extension(
+            os.path.join(runtime.cwd, self.inputs.out_file)
+        )
         img_4d.to_filename(self._results["out_file"])
 
         return runtime
@@ -138,7 +146,9 @@ class Smooth(NilearnBaseInterface, SimpleInterface):
         from nilearn.image import smooth_img
 
         img_smoothed = smooth_img(self.inputs.in_file, fwhm=self.inputs.fwhm)
-        self._results["out_file"] = os.path.join(runtime.cwd, self.inputs.out_file)
+        self._results["out_file"] = set_work_extension(
+            os.path.join(runtime.cwd, self.inputs.out_file)
+        )
         img_smoothed.to_filename(self._results["out_file"])
 
         return runtime
@@ -179,7 +189,9 @@ class BinaryMath(NilearnBaseInterface, SimpleInterface):
         from nilearn.image import math_img
 
         img_mathed = math_img(self.inputs.expression, img=self.inputs.in_file)
-        self._results["out_file"] = os.path.join(runtime.cwd, self.inputs.out_file)
+        self._results["out_file"] = set_work_extension(
+            os.path.join(runtime.cwd, self.inputs.out_file)
+        )
         img_mathed.to_filename(self._results["out_file"])
 
         return runtime
@@ -228,7 +240,9 @@ class ResampleToImage(NilearnBaseInterface, SimpleInterface):
             target_img=self.inputs.target_file,
             interpolation="continuous",
         )
-        self._results["out_file"] = os.path.join(runtime.cwd, self.inputs.out_file)
+        self._results["out_file"] = set_work_extension(
+            os.path.join(runtime.cwd, self.inputs.out_file)
+        )
         resampled_img.to_filename(self._results["out_file"])
 
 
@@ -259,6 +273,20 @@ class _DenoiseImageInputSpec(BaseInterfaceInputSpec):
     low_pass = traits.Float(mandatory=True, default_value=0.10, desc="Lowpass filter in Hz")
     high_pass = traits.Float(mandatory=True, default_value=0.01, desc="Highpass filter in Hz")
     filter_order = traits.Int(mandatory=True, default_value=2, desc="Filter order")
+    compose_filter = traits.Bool(
+        False,
+        usedefault=True,
+        desc=(
+            "Interpolate and band-pass filter the censored, denoised data with a single, "
+            "precomputed temporal operator."
+        ),
+    )
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
 
 
 class _DenoiseImageOutputSpec(TraitedSpec):
@@ -286,17 +314,22 @@ class DenoiseCifti(NilearnBaseInterface, SimpleInterface):
     input_spec = _DenoiseImageInputSpec
     output_spec = _DenoiseImageOutputSpec
 
+    @profile_run
+    @cache_results
+    @limit_threads
     def _run_interface(self, runtime):
         if not self.inputs.bandpass_filter:
             low_pass, high_pass = None, None
         else:
             low_pass, high_pass = self.inputs.low_pass, self.inputs.high_pass
 
+        phase("load")
         preprocessed_bold_arr = read_ndata(self.inputs.preprocessed_bold)
 
         # Transpose from SxT (xcpd order) to TxS (nilearn order)
         preprocessed_bold_arr = preprocessed_bold_arr.T
 
+        phase("denoise")
         (
             uncensored_denoised_bold,
             interpolated_filtered_bold,
@@ -308,12 +341,15 @@ class DenoiseCifti(NilearnBaseInterface, SimpleInterface):
             high_pass=high_pass,
             filter_order=self.inputs.filter_order,
             TR=self.inputs.TR,
+            compose_filter=self.inputs.compose_filter,
+            n_threads=self.inputs.num_threads,
         )
 
         # Transpose from TxS (nilearn order) to SxT (xcpd order)
         uncensored_denoised_bold = uncensored_denoised_bold.T
         interpolated_filtered_bold = interpolated_filtered_bold.T
 
+        phase("write")
         self._results["uncensored_denoised_bold"] = os.path.join(
             runtime.cwd,
             "uncensored_denoised.dtseries.nii",
@@ -353,12 +389,16 @@ class DenoiseNifti(NilearnBaseInterface, SimpleInterface):
     input_spec = _DenoiseNiftiInputSpec
     output_spec = _DenoiseImageOutputSpec
 
+    @profile_run
+    @cache_results
+    @limit_threads
     def _run_interface(self, runtime):
         if not self.inputs.bandpass_filter:
             low_pass, high_pass = None, None
         else:
             low_pass, high_pass = self.inputs.low_pass, self.inputs.high_pass
 
+        phase("load")
         # Use a NiftiMasker instead of apply_mask to retain TR in the image header.
         # Note that this doesn't use any of the masker's denoising capabilities.
         masker = maskers.NiftiMasker(
@@ -377,6 +417,7 @@ class DenoiseNifti(NilearnBaseInterface, SimpleInterface):
         )
         preprocessed_bold_arr = masker.fit_transform(self.inputs.preprocessed_bold)
 
+        phase("denoise")
         (
             uncensored_denoised_bold,
             interpolated_filtered_bold,
@@ -388,20 +429,183 @@ class DenoiseNifti(NilearnBaseInterface, SimpleInterface):
             high_pass=high_pass,
             filter_order=self.inputs.filter_order,
             TR=self.inputs.TR,
+            compose_filter=self.inputs.compose_filter,
+            n_threads=self.inputs.num_threads,
         )
 
-        self._results["uncensored_denoised_bold"] = os.path.join(
-            runtime.cwd,
-            "uncensored_denoised.nii.gz",
+        phase("write")
+        self._results["uncensored_denoised_bold"] = set_work_extension(
+            os.path.join(runtime.cwd, "uncensored_denoised.nii.gz")
         )
         uncensored_denoised_img = masker.inverse_transform(uncensored_denoised_bold)
         uncensored_denoised_img.to_filename(self._results["uncensored_denoised_bold"])
 
-        self._results["interpolated_filtered_bold"] = os.path.join(
-            runtime.cwd,
-            "filtered_denoised.nii.gz",
+        self._results["interpolated_filtered_bold"] = set_work_extension(
+            os.path.join(runtime.cwd, "filtered_denoised.nii.gz")
         )
         filtered_denoised_img = masker.inverse_transform(interpolated_filtered_bold)
         filtered_denoised_img.to_filename(self._results["interpolated_filtered_bold"])
 
         return runtime
+
+
+class _DenoiseStrategiesInputSpec(BaseInterfaceInputSpec):
+    preprocessed_bold = File(
+        exists=True,
+        mandatory=True,
+        desc=(
+            "Preprocessed BOLD data, after dummy volume removal, "
+            "but without any additional censoring."
+        ),
+    )
+    mask = File(exists=True, mandatory=False, desc="A binary brain mask. Only used for NIfTIs.")
+    params = traits.List(
+        traits.Str,
+        mandatory=True,
+        desc="The nuisance regression strategies to apply.",
+    )
+    name_source = traits.Str(
+        mandatory=True,
+        desc="The original BOLD file. Used to find the AROMA mixing matrix, if necessary.",
+    )
+    fmriprep_confounds_file = File(
+        exists=True,
+        mandatory=True,
+        desc=(
+            "fMRIPrep confounds tsv, with filtered motion parameters, "
+            "before dummy volume removal."
+        ),
+    )
+    fmriprep_confounds_json = File(exists=True, mandatory=True, desc="fMRIPrep confounds json.")
+    custom_confounds_file = traits.Either(
+        None,
+        File(exists=True),
+        mandatory=True,
+        desc="Custom confounds tsv.",
+    )
+    dummy_scans = traits.Int(mandatory=True, desc="Number of dummy volumes to drop.")
+    temporal_mask = File(
+        exists=True,
+        mandatory=True,
+        desc="The tab-delimited high-motion outliers file, after dummy volume removal.",
+    )
+    TR = traits.Float(mandatory=True, desc="Repetition time")
+    bandpass_filter = traits.Bool(mandatory=True, desc="To apply bandpass or not")
+    low_pass = traits.Float(mandatory=True, default_value=0.10, desc="Lowpass filter in Hz")
+    high_pass = traits.Float(mandatory=True, default_value=0.01, desc="Highpass filter in Hz")
+    filter_order = traits.Int(mandatory=True, default_value=2, desc="Filter order")
+    compose_filter = traits.Bool(
+        False,
+        usedefault=True,
+        desc=(
+            "Interpolate and band-pass filter the censored, denoised data with a single, "
+            "precomputed temporal operator."
+        ),
+    )
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
+
+
+class _DenoiseStrategiesOutputSpec(TraitedSpec):
+    confounds_files = traits.List(
+        traits.Either(File(exists=True), None),
+        desc="Each strategy's selected confounds, after dummy volume removal.",
+    )
+    censored_denoised_bold = traits.List(
+        File(exists=True),
+        desc=(
+            "Each strategy's censored, denoised, interpolated, filtered, and re-censored "
+            "BOLD data."
+        ),
+    )
+
+
+class DenoiseStrategies(SimpleInterface):
+    """Denoise a NIfTI or CIFTI BOLD file with several nuisance regression strategies.
+
+    The BOLD data are loaded once, and all of the strategies are regressed from them together
+    (see :func:`~xcp_d.utils.utils.denoise_strategies_with_nilearn`).
+    """
+
+    input_spec = _DenoiseStrategiesInputSpec
+    output_spec = _DenoiseStrategiesOutputSpec
+
+    @profile_run
+    @cache_results
+    @limit_threads
+    def _run_interface(self, runtime):
+        import numpy as np
+
+        from xcp_d.utils.confounds import get_strategy_label, load_confound_matrix
+
+        if not self.inputs.bandpass_filter:
+            low_pass, high_pass = None, None
+        else:
+            low_pass, high_pass = self.inputs.low_pass, self.inputs.high_pass
+
+        phase("confounds")
+        self._results["confounds_files"] = []
+        for params in self.inputs.params:
+            confounds_df = load_confound_matrix(
+                params=params,
+                img_file=self.inputs.name_source,
+                confounds_file=self.inputs.fmriprep_confounds_file,
+                confounds_json_file=self.inputs.fmriprep_confounds_json,
+                custom_confounds=self.inputs.custom_confounds_file,
+            )
+            if confounds_df is None:
+                self._results["confounds_files"].append(None)
+                continue
+
+            confounds_file = os.path.join(
+                runtime.cwd,
+                f"desc-{get_strategy_label(params)}_design.tsv",
+            )
+            confounds_df = confounds_df.iloc[self.inputs.dummy_scans :]
+            confounds_df.to_csv(confounds_file, sep="\t", index=False)
+            self._results["confounds_files"].append(confounds_file)
+
+        phase("load")
+        is_nifti = not self.inputs.preprocessed_bold.endswith(".dtseries.nii")
+        mask = self.inputs.mask if is_nifti else None
+        # Transpose from SxT (xcpd order) to TxS (nilearn order)
+        preprocessed_bold_arr = read_ndata(self.inputs.preprocessed_bold, maskfile=mask).T
+
+        phase("denoise")
+        denoised_strategies = denoise_strategies_with_nilearn(
+            preprocessed_bold=preprocessed_bold_arr,
+            confounds_files=self._results["confounds_files"],
+            temporal_mask=self.inputs.temporal_mask,
+            low_pass=low_pass,
+            high_pass=high_pass,
+            filter_order=self.inputs.filter_order,
+            TR=self.inputs.TR,
+            compose_filter=self.inputs.compose_filter,
+            n_threads=self.inputs.num_threads,
+        )
+
+        self._results["censored_denoised_bold"] = []
+        for params, censored_denoised_bold in zip(self.inputs.params, denoised_strategies):
+            extension = ".nii.gz" if is_nifti else ".dtseries.nii"
+            out_file = os.path.join(
+                runtime.cwd,
+                f"desc-denoised{get_strategy_label(params)}_bold{extension}",
+            )
+            if is_nifti:
+                out_file = set_work_extension(out_file)
+
+            # Transpose from TxS (nilearn order) to SxT (xcpd order)
+            write_ndata(
+                censored_denoised_bold.T.astype(np.float32),
+                template=self.inputs.preprocessed_bold,
+                filename=out_file,
+                mask=mask,
+                TR=self.inputs.TR,
+            )
+            self._results["censored_denoised_bold"].append(out_file)
+
+        return runtime
@@ -25,11 +25,14 @@ from nipype.interfaces.base import (
 )
 from nipype.interfaces.fsl.base import FSLCommand, FSLCommandInputSpec
 
-from xcp_d.utils.confounds import load_motion
+from xcp_d.utils.columnar import read_columns
+from xcp_d.utils.confounds import MOTION_COLUMNS, load_motion
 from xcp_d.utils.filemanip import fname_presuffix
 from xcp_d.utils.modified_data import compute_fd
 from xcp_d.utils.plotting import FMRIPlot, plot_fmri_es
+from xcp_d.utils.profiling import phase, profile_run
 from xcp_d.utils.qcmetrics import compute_dvars, compute_registration_qc
+from xcp_d.utils.threadpools import limit_threads
 from xcp_d.utils.write_save import read_ndata
 
 LOGGER = logging.getLogger("nipype.interface")
@@ -67,7 +70,7 @@ class CensoringPlot(SimpleInterface):
 
     def _run_interface(self, runtime):
         # Load confound matrix and load motion with motion filtering
-        confounds_df = pd.read_table(self.inputs.fmriprep_confounds_file)
+        confounds_df = read_columns(self.inputs.fmriprep_confounds_file, MOTION_COLUMNS)
         preproc_motion_df = load_motion(
             confounds_df.copy(),
             TR=self.inputs.TR,
@@ -241,6 +244,12 @@ class _QCPlotsInputSpec(BaseInterfaceInputSpec):
     template_mask = File(exists=True, mandatory=False, desc="Template mask")
     bold2T1w_mask = File(exists=True, mandatory=False, desc="Bold mask in MNI")
     bold2temp_mask = File(exists=True, mandatory=False, desc="Bold mask in T1W")
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
 
 
 class _QCPlotsOutputSpec(TraitedSpec):
@@ -276,9 +285,15 @@ class QCPlots(SimpleInterface):
     input_spec = _QCPlotsInputSpec
     output_spec = _QCPlotsOutputSpec
 
+    @profile_run
+    @limit_threads
     def _run_interface(self, runtime):
         # Load confound matrix and load motion with motion filtering
-        confounds_df = pd.read_table(self.inputs.fmriprep_confounds_file)
+        phase("confounds")
+        confounds_df = read_columns(
+            self.inputs.fmriprep_confounds_file,
+            MOTION_COLUMNS + ["rmsd"],
+        )
         preproc_motion_df = load_motion(
             confounds_df.copy(),
             TR=self.inputs.TR,
@@ -316,6 +331,7 @@ class QCPlots(SimpleInterface):
             use_ext=False,
         )
 
+        phase("dvars")
         dvars_before_processing = compute_dvars(
             read_ndata(
                 datafile=self.inputs.bold_file,
@@ -339,6 +355,7 @@ class QCPlots(SimpleInterface):
             }
         )
 
+        phase("plot")
         preproc_fig = FMRIPlot(
             func_file=self.inputs.bold_file,
             seg_file=self.inputs.seg_file,
@@ -381,6 +398,7 @@ class QCPlots(SimpleInterface):
             qc_values_dict[entity.split("-")[0]] = entity.split("-")[1]
 
         # Calculate QC measures
+        phase("metrics")
         mean_fd = np.mean(preproc_fd_timeseries)
         mean_rms = np.nanmean(rmsd_censored)  # first value can be NaN if no dummy scans
         mean_dvars_before_processing = np.mean(dvars_before_processing)
@@ -14,6 +14,7 @@ from niworkflows.reports.core import Report as _Report
 from xcp_d.interfaces.execsummary import ExecutiveSummary
 from xcp_d.utils.bids import get_entity
 from xcp_d.utils.doc import fill_doc
+from xcp_d.utils.manifest import ManifestLayout, load_manifest
 
 LOGGER = logging.getLogger("cli")
 
@@ -38,6 +39,20 @@ class Report(_Report):
 
         self.index(settings["sections"])
 
+    def init_layout(self):
+        """Collect the reportlets from the derivatives manifest, if available.
+
+        Falls back to indexing the reportlets directory when no manifest was written.
+        """
+        manifest_files = []
+        if self.subject_id is not None:
+            manifest_files = load_manifest(self.out_dir, self.subject_id)
+
+        if manifest_files:
+            self.layout = ManifestLayout(self.root, manifest_files)
+        else:
+            super().init_layout()
+
 
 #
 # The following are the interface used directly by fMRIPrep
@@ -142,17 +157,24 @@ def generate_reports(
     else:
         LOGGER.info("Generating executive summary.")
         for subject_label in subject_list:
-            brainplotfile = glob.glob(
-                os.path.join(
-                    output_dir,
-                    f"xcp_d/sub-{subject_label}",
-                    "figures/*_bold.svg",
-                ),
-            )[0]
+            xcpd_dir = os.path.join(output_dir, "xcp_d")
+            brainplotfiles = ManifestLayout(
+                xcpd_dir,
+                load_manifest(xcpd_dir, subject_label),
+            ).get(datatype="figures", suffix="bold", extension=".svg", return_type="file")
+            if not brainplotfiles:
+                brainplotfiles = glob.glob(
+                    os.path.join(
+                        output_dir,
+                        f"xcp_d/sub-{subject_label}",
+                        "figures/*_bold.svg",
+                    ),
+                )
+
             exsumm = ExecutiveSummary(
-                xcpd_path=os.path.join(output_dir, "xcp_d"),
+                xcpd_path=xcpd_dir,
                 subject_id=subject_label,
-                session_id=get_entity(brainplotfile, "ses"),
+                session_id=get_entity(brainplotfiles[0], "ses"),
             )
             exsumm.collect_inputs()
             exsumm.generate_report()
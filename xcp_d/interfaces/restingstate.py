@@ -8,6 +8,8 @@
 import os
 import shutil
 
+import nibabel as nb
+import numpy as np
 from nipype import logging
 from nipype.interfaces.afni.preprocess import Despike, DespikeInputSpec
 from nipype.interfaces.afni.utils import ReHoInputSpec, ReHoOutputSpec
@@ -20,8 +22,15 @@ from nipype.interfaces.base import (
     traits_extension,
 )
 
-from xcp_d.utils.filemanip import fname_presuffix
-from xcp_d.utils.restingstate import compute_2d_reho, compute_alff, mesh_adjacency
+from xcp_d.utils.filemanip import fname_presuffix, set_work_extension
+from xcp_d.utils.profiling import phase, profile_run
+from xcp_d.utils.restingstate import (
+    compute_2d_reho,
+    compute_alff,
+    despike_data,
+    mesh_adjacency,
+)
+from xcp_d.utils.threadpools import limit_threads
 from xcp_d.utils.write_save import read_gii, read_ndata, write_gii, write_ndata
 
 LOGGER = logging.getLogger("nipype.interface")
@@ -32,6 +41,12 @@ class _SurfaceReHoInputSpec(BaseInterfaceInputSpec):
     surf_bold = File(exists=True, mandatory=True, desc="left or right hemisphere gii ")
     # TODO: Change to Enum
     surf_hemi = traits.Str(mandatory=True, desc="L or R ")
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
 
 
 class _SurfaceReHoOutputSpec(TraitedSpec):
@@ -59,17 +74,26 @@ class SurfaceReHo(SimpleInterface):
     input_spec = _SurfaceReHoInputSpec
     output_spec = _SurfaceReHoOutputSpec
 
+    @profile_run
+    @limit_threads
     def _run_interface(self, runtime):
         # Read the gifti data
+        phase("load")
         data_matrix = read_gii(self.inputs.surf_bold)
 
         # Get the mesh adjacency matrix
         mesh_matrix = mesh_adjacency(self.inputs.surf_hemi)
 
         # Compute reho
-        reho_surf = compute_2d_reho(datat=data_matrix, adjacency_matrix=mesh_matrix)
+        phase("compute")
+        reho_surf = compute_2d_reho(
+            datat=data_matrix,
+            adjacency_matrix=mesh_matrix,
+            n_threads=self.inputs.num_threads,
+        )
 
         # Write the output out
+        phase("write")
         self._results["surf_gii"] = fname_presuffix(
             self.inputs.surf_bold, suffix=".shape.gii", newpath=runtime.cwd, use_ext=False
         )
@@ -101,6 +125,12 @@ class _ComputeALFFInputSpec(BaseInterfaceInputSpec):
         mandatory=False,
         desc=" brain mask for nifti file",
     )
+    num_threads = traits.Int(
+        1,
+        usedefault=True,
+        nohash=True,
+        desc="Maximum number of BLAS/OpenMP threads.",
+    )
 
 
 class _ComputeALFFOutputSpec(TraitedSpec):
@@ -113,29 +143,36 @@ class ComputeALFF(SimpleInterface):
     input_spec = _ComputeALFFInputSpec
     output_spec = _ComputeALFFOutputSpec
 
+    @profile_run
+    @limit_threads
     def _run_interface(self, runtime):
         # Get the nifti/cifti into matrix form
+        phase("load")
         data_matrix = read_ndata(datafile=self.inputs.in_file, maskfile=self.inputs.mask)
         # compute the ALFF
+        phase("compute")
         alff_mat = compute_alff(
             data_matrix=data_matrix,
             low_pass=self.inputs.low_pass,
             high_pass=self.inputs.high_pass,
             TR=self.inputs.TR,
+            n_threads=self.inputs.num_threads,
         )
 
         # Write out the data
-
+        phase("write")
         if self.inputs.in_file.endswith(".dtseries.nii"):
             suffix = "_alff.dscalar.nii"
-        elif self.inputs.in_file.endswith(".nii.gz"):
+        else:
             suffix = "_alff.nii.gz"
 
-        self._results["alff"] = fname_presuffix(
-            self.inputs.in_file,
-            suffix=suffix,
-            newpath=runtime.cwd,
-            use_ext=False,
+        self._results["alff"] = set_work_extension(
+            fname_presuffix(
+                self.inputs.in_file,
+                suffix=suffix,
+                newpath=runtime.cwd,
+                use_ext=False,
+            )
         )
         write_ndata(
             data_matrix=alff_mat,
@@ -222,3 +259,76 @@ class DespikePatch(Despike):
         outputs = self.output_spec().get()
         outputs["out_file"] = os.path.abspath(self._gen_filename("out_file"))
         return outputs
+
+
+class _NativeDespikeInputSpec(BaseInterfaceInputSpec):
+    in_file = File(exists=True, mandatory=True, desc="NIfTI or CIFTI BOLD file to despike.")
+    corder = traits.Either(
+        None,
+        traits.Int,
+        usedefault=True,
+        desc=(
+            "Number of sine/cosine pairs in the fitted curve. "
+            "If None, round(n_volumes / 30) is used, as in 3dDespike."
+        ),
+    )
+    cut = traits.Tuple(
+        (2.5, 4.0),
+        traits.Float,
+        traits.Float,
+        usedefault=True,
+        desc="Spike threshold and upper range of the squashed values, in standard deviations.",
+    )
+    num_threads = traits.Int(1, usedefault=True, desc="Number of threads to use.")
+
+
+class _NativeDespikeOutputSpec(TraitedSpec):
+    out_file = File(exists=True, desc="Despiked BOLD file.")
+
+
+class NativeDespike(SimpleInterface):
+    """Despike a NIfTI or CIFTI file in-process, with the 3dDespike algorithm.
+
+    The data are despiked as a (time, elements) array,
+    so CIFTI files do not need to be converted to NIfTI and back.
+    """
+
+    input_spec = _NativeDespikeInputSpec
+    output_spec = _NativeDespikeOutputSpec
+
+    def _run_interface(self, runtime):
+        in_file = self.inputs.in_file
+        img = nb.load(in_file)
+        data = img.get_fdata(dtype=np.float32)
+        if isinstance(img, nb.Cifti2Image):
+            despiked_data, n_spikes = despike_data(
+                data,
+                corder=self.inputs.corder,
+                cut=self.inputs.cut,
+                n_threads=self.inputs.num_threads,
+            )
+            out_img = nb.Cifti2Image(despiked_data, img.header, nifti_header=img.nifti_header)
+        else:
+            # Reshape to (time, voxels), despike, and reshape back.
+            flat_data = data.reshape(-1, data.shape[-1]).T
+            despiked_data, n_spikes = despike_data(
+                flat_data,
+                corder=self.inputs.corder,
+                cut=self.inputs.cut,
+                n_threads=self.inputs.num_threads,
+            )
+            out_img = nb.Nifti1Image(
+                despiked_data.T.reshape(data.shape),
+                img.affine,
+                img.header,
+            )
+            out_img.set_data_dtype(np.float32)
+
+        LOGGER.info(f"{n_spikes} values were despiked in {in_file}.")
+
+        self._results["out_file"] = set_work_extension(
+            fname_presuffix(in_file, suffix="_despiked", newpath=runtime.cwd, use_ext=True)
+        )
+        out_img.to_filename(self._results["out_file"])
+
+        return runtime
@@ -0,0 +1,112 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Interfaces for smoothing NIfTI and CIFTI data in-process."""
+import nibabel as nb
+import numpy as np
+from nipype import logging
+from nipype.interfaces.base import (
+    BaseInterfaceInputSpec,
+    File,
+    SimpleInterface,
+    TraitedSpec,
+    isdefined,
+    traits,
+)
+
+from xcp_d.utils.cache import cache_results
+from xcp_d.utils.filemanip import fname_presuffix, set_work_extension, split_filename
+from xcp_d.utils.smoothing import (
+    get_cifti_smoothing_kernel,
+    smooth_cifti_data,
+    smooth_nifti_img,
+)
+from xcp_d.utils.write_save import get_cifti_intents
+
+LOGGER = logging.getLogger("nipype.interface")
+
+
+class _GaussianSmoothInputSpec(BaseInterfaceInputSpec):
+    in_file = File(exists=True, mandatory=True, desc="NIfTI or CIFTI file to smooth.")
+    fwhm = traits.Float(
+        mandatory=True,
+        desc="Full width at half maximum of the Gaussian kernel, in millimeters.",
+    )
+    cache_dir = traits.Either(
+        None,
+        traits.Str,
+        default=None,
+        usedefault=True,
+        nohash=True,
+        desc=(
+            "Directory in which CIFTI smoothing kernels are cached. "
+            "If None, nothing is cached, unless the XCPD_KERNEL_CACHE environment variable is set."
+        ),
+    )
+    left_surf = File(
+        exists=True,
+        desc=(
+            "Left hemisphere surface on which CIFTI cortical vertices are smoothed. "
+            "If not provided, the fsLR 32k midthickness surface is used."
+        ),
+    )
+    right_surf = File(
+        exists=True,
+        desc=(
+            "Right hemisphere surface on which CIFTI cortical vertices are smoothed. "
+            "If not provided, the fsLR 32k midthickness surface is used."
+        ),
+    )
+
+
+class _GaussianSmoothOutputSpec(TraitedSpec):
+    out_file = File(exists=True, desc="Smoothed file.")
+
+
+class GaussianSmooth(SimpleInterface):
+    """Smooth a NIfTI or CIFTI file with a Gaussian kernel.
+
+    CIFTI files are smoothed with a cached sparse kernel, built on the fsLR 32k midthickness
+    surfaces unless other surfaces are provided,
+    and written with the intent code that matches their extension.
+    NIfTI files are smoothed with separable 1-D convolutions.
+    """
+
+    input_spec = _GaussianSmoothInputSpec
+    output_spec = _GaussianSmoothOutputSpec
+
+    @cache_results
+    def _run_interface(self, runtime):
+        in_file = self.inputs.in_file
+        img = nb.load(in_file)
+
+        if isinstance(img, nb.Cifti2Image):
+            surface_files = {}
+            if isdefined(self.inputs.left_surf):
+                surface_files["CIFTI_STRUCTURE_CORTEX_LEFT"] = self.inputs.left_surf
+
+            if isdefined(self.inputs.right_surf):
+                surface_files["CIFTI_STRUCTURE_CORTEX_RIGHT"] = self.inputs.right_surf
+
+            kernel = get_cifti_smoothing_kernel(
+                in_file,
+                self.inputs.fwhm,
+                cache_dir=self.inputs.cache_dir,
+                surface_files=surface_files,
+            )
+            smoothed_data = smooth_cifti_data(img.get_fdata(dtype=np.float32), kernel)
+            out_img = nb.Cifti2Image(smoothed_data, img.header, nifti_header=img.nifti_header)
+            out_img.set_data_dtype(np.float32)
+
+            _, _, extension = split_filename(in_file)
+            intent = get_cifti_intents().get(extension, None)
+            if intent is not None:
+                out_img.nifti_header.set_intent(intent)
+        else:
+            out_img = smooth_nifti_img(img, self.inputs.fwhm)
+
+        self._results["out_file"] = set_work_extension(
+            fname_presuffix(in_file, suffix="_smoothed", newpath=runtime.cwd, use_ext=True)
+        )
+        out_img.to_filename(self._results["out_file"])
+
+        return runtime
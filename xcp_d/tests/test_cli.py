@@ -220,6 +220,7 @@ def test_pnc_cifti(data_dir, output_dir, working_dir):
         f"--bids-filter-file={filter_file}",
         "--nuisance-regressors=acompcor_gsr",
         "--despike",
+        "--despike-method=native",
         "--head_radius=40",
         "--smoothing=6",
         "--motion-filter-type=notch",
@@ -39,6 +39,20 @@ def base_opts():
         "input_type": "fmriprep",
         "cifti": True,
         "process_surfaces": True,
+        "combineruns": False,
+        "combineruns_mode": "dense",
+        "despike": False,
+        "despike_method": "afni",
+        "nuisance_regressors": "36P",
+        "additional_nuisance_regressors": [],
+        "dense_connectivity": "none",
+        "dynamic_window": None,
+        "dynamic_step": None,
+        "dynamic_taper": "boxcar",
+        "connectivity_measures": [],
+        "watch": False,
+        "watch_interval": 60,
+        "watch_workers": 1,
         "fs_license_file": Path(os.environ["FS_LICENSE"]),
     }
     opts = FakeOptions(**opts_dict)
@@ -307,3 +321,104 @@ def test_validate_parameters_19(base_opts, caplog):
 
     assert "Freesurfer license DNE" in caplog.text
     assert return_code == 1
+
+
+def test_validate_parameters_20(base_opts, caplog):
+    """Test run._validate_parameters."""
+    opts = deepcopy(base_opts)
+    opts.combineruns_mode = "parcellated"
+
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+
+    assert "'--combineruns-mode' is ignored" in caplog.text
+    assert return_code == 0
+
+
+def test_validate_parameters_21(base_opts, caplog):
+    """Test run._validate_parameters."""
+    opts = deepcopy(base_opts)
+    opts.additional_nuisance_regressors = ["24P", "36P", "acompcor", "24P"]
+
+    opts, return_code = run._validate_parameters(deepcopy(opts), build_log)
+
+    assert "'36P' is already the primary nuisance regression strategy" in caplog.text
+    assert opts.additional_nuisance_regressors == ["24P", "acompcor"]
+    assert return_code == 0
+
+
+def test_validate_parameters_22(base_opts, caplog):
+    """Test run._validate_parameters."""
+    opts = deepcopy(base_opts)
+    opts.dense_connectivity = "seeds"
+
+    # Dense connectivity is only available for CIFTI data.
+    opts.cifti = False
+    opts.process_surfaces = False
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+
+    assert "Dense connectivity (--dense-connectivity) can only be computed" in caplog.text
+    assert return_code == 1
+
+    opts.cifti = True
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+    assert return_code == 0
+
+
+def test_validate_parameters_23(base_opts, caplog):
+    """Test run._validate_parameters."""
+    opts = deepcopy(base_opts)
+
+    # The step and taper do nothing without a window.
+    opts.dynamic_taper = "exponential"
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+    assert "'--dynamic-step' and '--dynamic-taper' are ignored" in caplog.text
+    assert return_code == 0
+
+    opts.dynamic_window = 0
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+    assert "'--dynamic-window' (0) must be greater than zero." in caplog.text
+    assert return_code == 1
+
+    opts.dynamic_window = 60
+    opts.dynamic_step = -1
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+    assert "'--dynamic-step' (-1) must be greater than zero." in caplog.text
+    assert return_code == 1
+
+    opts.dynamic_step = 2
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+    assert return_code == 0
+
+
+def test_validate_parameters_24(base_opts, caplog):
+    """Test run._validate_parameters."""
+    opts = deepcopy(base_opts)
+    opts.watch = True
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+    assert return_code == 0
+
+    opts.watch_interval = 0
+    opts.watch_workers = 0
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+    assert "'--watch-interval' (0) must be greater than zero." in caplog.text
+    assert "'--watch-workers' (0) must be at least 1." in caplog.text
+    assert return_code == 1
+
+    # DCAN and HCP datasets are converted to BIDS before post-processing.
+    opts.watch_interval = 60
+    opts.watch_workers = 1
+    opts.input_type = "hcp"
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+    assert "Watch mode (--watch) is not available with input_type hcp" in caplog.text
+    assert return_code == 1
+
+
+def test_validate_parameters_25(base_opts, caplog):
+    """Test run._validate_parameters."""
+    opts = deepcopy(base_opts)
+    opts.despike_method = "native"
+
+    _, return_code = run._validate_parameters(deepcopy(opts), build_log)
+
+    assert "'--despike-method' is ignored" in caplog.text
+    assert return_code == 0
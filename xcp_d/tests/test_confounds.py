@@ -1,12 +1,20 @@
 """Test confounds handling."""
+import json
 import os
 
 import numpy as np
 import pandas as pd
 import pytest
 from nilearn.glm.first_level import make_first_level_design_matrix
+from nilearn.interfaces.fmriprep.load_confounds import _load_single_confounds_file
 
-from xcp_d.utils.confounds import describe_regression, load_confound_matrix
+from xcp_d.utils import columnar
+from xcp_d.utils.confounds import (
+    PARAM_KWARGS,
+    _load_fmriprep_confounds,
+    describe_regression,
+    load_confound_matrix,
+)
 
 
 def test_custom_confounds(ds001419_data, tmp_path_factory):
@@ -205,3 +213,129 @@ def test_load_confounds(ds001419_data):
             confounds_file=confounds_file,
             confounds_json_file=confounds_json,
         )
+
+
+def test_load_fmriprep_confounds(tmp_path_factory, monkeypatch):
+    """Check that selecting confounds through the columnar store matches load_confounds."""
+    import json
+
+    from nilearn.interfaces.fmriprep.load_confounds import _load_single_confounds_file
+
+    from xcp_d.utils import columnar
+    from xcp_d.utils.confounds import _load_fmriprep_confounds
+
+    tmpdir = tmp_path_factory.mktemp("test_load_fmriprep_confounds")
+    monkeypatch.setenv(columnar.COLUMNAR_STORE_ENV, os.path.join(tmpdir, "store"))
+
+    n_volumes = 30
+    rng = np.random.default_rng(0)
+    columns = ["global_signal", "csf", "white_matter"]
+    columns += ["trans_x", "trans_y", "trans_z", "rot_x", "rot_y", "rot_z"]
+    columns = [f"{c}{suffix}" for c in columns for suffix in ("", "_derivative1")]
+    columns = columns + [f"{c}_power2" for c in columns]
+    columns += [f"a_comp_cor_{i:02d}" for i in range(12)] + [
+        f"t_comp_cor_{i:02d}" for i in range(4)
+    ]
+    columns += ["cosine00", "cosine01", "non_steady_state_outlier00", "rmsd", "std_dvars"]
+    confounds_df = pd.DataFrame(rng.normal(size=(n_volumes, len(columns))), columns=columns)
+    confounds_df.loc[0, [c for c in columns if "derivative1" in c]] = np.nan
+    confounds_file = os.path.join(tmpdir, "desc-confounds_timeseries.tsv")
+    confounds_df.to_csv(confounds_file, sep="\t", index=False)
+
+    metadata = {f"a_comp_cor_{i:02d}": {"Mask": "CSF" if i < 6 else "WM"} for i in range(12)}
+    metadata.update({f"t_comp_cor_{i:02d}": {"Method": "tCompCor"} for i in range(4)})
+    confounds_json = os.path.join(tmpdir, "desc-confounds_timeseries.json")
+    with open(confounds_json, "w") as fobj:
+        json.dump(metadata, fobj)
+
+    strategies = [
+        {"strategy": ["motion"], "motion": "full"},
+        {
+            "strategy": ["motion", "global_signal", "wm_csf"],
+            "motion": "full",
+            "global_signal": "full",
+            "wm_csf": "full",
+        },
+        {
+            "strategy": ["motion", "high_pass", "compcor", "global_signal"],
+            "motion": "derivatives",
+            "compcor": "anat_separated",
+            "global_signal": "basic",
+            "n_compcor": 5,
+        },
+    ]
+    for kwargs in strategies:
+        expected = _load_single_confounds_file(
+            confounds_file=confounds_file,
+            demean=False,
+            confounds_json_file=confounds_json,
+            **kwargs,
+        )[1]
+        for json_file in (confounds_json, None):
+            selected = _load_fmriprep_confounds(
+                confounds_file=confounds_file,
+                confounds_json_file=json_file,
+                **kwargs,
+            )
+            pd.testing.assert_frame_equal(selected, expected)
+
+
+def test_load_fmriprep_confounds_subset(tmp_path_factory, monkeypatch):
+    """Test that loading only a strategy's columns matches load_confounds on the full file."""
+    tmpdir = tmp_path_factory.mktemp("test_load_fmriprep_confounds_subset")
+    rng = np.random.default_rng(0)
+    n_volumes = 40
+
+    columns, metadata = [], {}
+    for base in ["trans_x", "trans_y", "trans_z", "rot_x", "rot_y", "rot_z"] + [
+        "global_signal",
+        "csf",
+        "white_matter",
+    ]:
+        columns += [base, f"{base}_derivative1", f"{base}_power2", f"{base}_derivative1_power2"]
+
+    columns += ["csf_wm", "framewise_displacement", "dvars", "std_dvars", "rmsd"]
+    columns += [f"cosine{i:02d}" for i in range(3)]
+    columns += ["non_steady_state_outlier00"]
+    for prefix, masks in [("a", ["CSF"] * 5 + ["WM"] * 5), ("c", ["CSF"] * 6), ("w", ["WM"] * 6)]:
+        for i, mask in enumerate(masks):
+            column = f"{prefix}_comp_cor_{i:02d}"
+            columns.append(column)
+            metadata[column] = {"Method": "aCompCor", "Mask": mask, "Retained": True}
+
+    confounds_df = pd.DataFrame(rng.normal(size=(n_volumes, len(columns))), columns=columns)
+    for column in columns:
+        if "derivative1" in column or column in ("framewise_displacement", "dvars", "std_dvars"):
+            confounds_df.loc[0, column] = np.nan
+
+    confounds_df["non_steady_state_outlier00"] = 0
+    confounds_df.loc[0, "non_steady_state_outlier00"] = 1
+
+    confounds_file = os.path.join(tmpdir, "sub-01_task-rest_desc-confounds_timeseries.tsv")
+    confounds_json = os.path.join(tmpdir, "sub-01_task-rest_desc-confounds_timeseries.json")
+    confounds_df.to_csv(confounds_file, sep="\t", index=False, na_rep="n/a")
+    with open(confounds_json, "w") as fobj:
+        json.dump(metadata, fobj)
+
+    for store_dir in (None, str(tmpdir / "store")):
+        if store_dir is None:
+            monkeypatch.delenv(columnar.COLUMNAR_STORE_ENV, raising=False)
+        else:
+            os.makedirs(store_dir)
+            monkeypatch.setenv(columnar.COLUMNAR_STORE_ENV, store_dir)
+
+        for params, kwargs in PARAM_KWARGS.items():
+            expected = _load_single_confounds_file(
+                confounds_file=confounds_file,
+                demean=False,
+                confounds_json_file=confounds_json,
+                **kwargs,
+            )[1]
+            for json_file in (confounds_json, None):
+                # Without a JSON file, the metadata are read from the store (or the sidecar).
+                selected = _load_fmriprep_confounds(
+                    confounds_file=confounds_file,
+                    confounds_json_file=json_file,
+                    **kwargs,
+                )
+                pd.testing.assert_frame_equal(selected, expected, obj=params)
@@ -7,16 +7,141 @@ Arguments have to be passed to these functions because the data may be
 mounted in a container somewhere unintuitively.
 """
 import os
+import shutil
 
 import nibabel as nb
 import numpy as np
+import pytest
 from nipype.pipeline import engine as pe
+from scipy.optimize import linprog
 
-from xcp_d.interfaces.restingstate import DespikePatch
+from xcp_d.interfaces.restingstate import DespikePatch, NativeDespike
 from xcp_d.interfaces.workbench import CiftiConvert
+from xcp_d.utils.restingstate import _despike_regressors, despike_data
 from xcp_d.utils.write_save import read_ndata, write_ndata
 
 
+def _simulate_spiky_data(n_volumes, n_series, seed=0):
+    """Simulate drifting, heavy-tailed time series with a few large spikes."""
+    rng = np.random.default_rng(seed)
+    data = np.cumsum(rng.normal(size=(n_volumes, n_series)), axis=0)
+    data += rng.standard_t(3, size=(n_volumes, n_series)) * 2 + 100
+    data[n_volumes // 3, :] += 50
+    data[n_volumes // 2, :] -= 50
+    return data
+
+
+def _reference_despike(data, corder, cut=(2.5, 4.0)):
+    """Despike each time series with an exact L1 fit, from a linear program."""
+    n_volumes = data.shape[0]
+    regressors = _despike_regressors(n_volumes, corder)
+    n_regressors = regressors.shape[1]
+    # Minimize sum(u + v) subject to X @ beta + u - v = y, with u, v >= 0.
+    c = np.concatenate((np.zeros(n_regressors), np.ones(2 * n_volumes)))
+    a_eq = np.hstack((regressors, np.eye(n_volumes), -np.eye(n_volumes)))
+    bounds = [(None, None)] * n_regressors + [(0, None)] * (2 * n_volumes)
+
+    despiked = data.copy()
+    for i_series in range(data.shape[1]):
+        y = data[:, i_series]
+        res = linprog(c, A_eq=a_eq, b_eq=y, bounds=bounds, method="highs")
+        fitted = regressors @ res.x[:n_regressors]
+        sigma = np.sqrt(np.pi / 2) * np.mean(np.abs(y - fitted))
+        s = (y - fitted) / sigma
+        squashed = cut[0] + (cut[1] - cut[0]) * np.tanh((np.abs(s) - cut[0]) / (cut[1] - cut[0]))
+        despiked[:, i_series] = np.where(
+            np.abs(s) > cut[0],
+            fitted + np.sign(s) * squashed * sigma,
+            y,
+        )
+
+    return despiked
+
+
+def test_despike_data():
+    """Compare despike_data to a despiking reference with an exact L1 fit."""
+    data = _simulate_spiky_data(200, 20)
+    data[:, 5] = 3  # constant series are left alone
+
+    despiked, n_spikes = despike_data(data, block_size=7, n_threads=2)
+    assert despiked.dtype == np.float32
+    assert n_spikes > 2 * (data.shape[1] - 1)
+    np.testing.assert_array_equal(despiked[:, 5], data[:, 5])
+
+    # The injected spikes are squashed, and most other values are unchanged.
+    spiky = np.arange(data.shape[1]) != 5
+    assert np.all(despiked[66, spiky] < data[66, spiky] - 10)
+    assert np.all(despiked[100, spiky] > data[100, spiky] + 10)
+    assert np.mean(despiked == data.astype(np.float32)) > 0.9
+
+    # The L1 fit is approximate, so allow small differences from the exact solution.
+    reference = _reference_despike(data, corder=7)
+    scale = np.std(data, axis=0)
+    diff = np.abs(despiked - reference) / np.where(scale > 0, scale, 1)
+    assert np.mean(diff < 0.05) > 0.97
+
+    with pytest.raises(ValueError, match="too large"):
+        despike_data(data[:20, :], corder=5)
+
+
+@pytest.mark.skipif(shutil.which("3dDespike") is None, reason="AFNI is not installed.")
+def test_native_despike_afni(tmp_path_factory):
+    """Compare NativeDespike to 3dDespike with the L1 fit (no -NEW) on NIfTI data."""
+    tempdir = tmp_path_factory.mktemp("test_native_despike_afni")
+    data = _simulate_spiky_data(150, 4 * 5 * 3, seed=1).T.reshape((4, 5, 3, 150))
+    in_file = os.path.join(tempdir, "spiky.nii.gz")
+    nb.Nifti1Image(data.astype(np.float32), np.eye(4)).to_filename(in_file)
+
+    native = NativeDespike(in_file=in_file, num_threads=2)
+    native_results = native.run(cwd=tempdir)
+    afni = DespikePatch(in_file=in_file, outputtype="NIFTI_GZ", args="-nomask")
+    afni_results = afni.run(cwd=tempdir)
+
+    in_data = nb.load(in_file).get_fdata()
+    native_data = nb.load(native_results.outputs.out_file).get_fdata()
+    afni_data = nb.load(afni_results.outputs.out_file).get_fdata()
+    assert native_data.shape == afni_data.shape
+
+    # Both methods flag (almost) the same values as spikes.
+    afni_spikes = ~np.isclose(afni_data, in_data, rtol=0, atol=1e-4)
+    native_spikes = ~np.isclose(native_data, in_data, rtol=0, atol=1e-4)
+    assert afni_spikes.sum() > 2 * afni_spikes[..., 0].size
+    assert np.mean(native_spikes[afni_spikes]) > 0.98
+    assert np.mean(afni_spikes[native_spikes]) > 0.98
+
+    # Only compare the values that AFNI changed, since most values are left alone by both.
+    scale = np.broadcast_to(np.std(in_data, axis=-1, keepdims=True), in_data.shape)
+    diff = np.abs(native_data - afni_data)[afni_spikes] / scale[afni_spikes]
+    assert np.median(diff) < 0.005
+    assert np.mean(diff < 0.05) > 0.95
+
+
+def test_native_despike_cifti(ds001419_data, tmp_path_factory):
+    """Test that NativeDespike despikes CIFTI files without changing their headers."""
+    tempdir = tmp_path_factory.mktemp("test_native_despike_cifti")
+    boldfile = ds001419_data["cifti_file"]
+
+    file_data = read_ndata(boldfile)
+    voxel_data = file_data[2, :]
+    voxel_data[2] = np.mean(voxel_data) + 10 * np.std(voxel_data)
+    file_data[2, :] = voxel_data
+    filename = os.path.join(tempdir, "test.dtseries.nii")
+    write_ndata(data_matrix=file_data, template=boldfile, TR=0.8, filename=filename)
+
+    despike = NativeDespike(in_file=filename)
+    results = despike.run(cwd=tempdir)
+    despiked_file = results.outputs.out_file
+    assert despiked_file.endswith(".dtseries.nii")
+
+    despiked_data = read_ndata(despiked_file)
+    assert despiked_data[2, 2] < file_data[2, 2]
+    assert despiked_data.shape == file_data.shape
+
+    despiked_img, original_img = nb.load(despiked_file), nb.load(filename)
+    assert despiked_img.nifti_header.get_intent()[0] == original_img.nifti_header.get_intent()[0]
+    assert despiked_img.header.get_axis(1) == original_img.header.get_axis(1)
+
+
 def test_nifti_despike(fmriprep_without_freesurfer_data, tmp_path_factory):
     """Test Nifti despiking.
 
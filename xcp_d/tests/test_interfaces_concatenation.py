@@ -1,9 +1,11 @@
 """Tests for the xcp_d.interfaces.concatenation module."""
 import os
 
+import numpy as np
+import pandas as pd
 from nipype.interfaces.base import Undefined, isdefined
 
-from xcp_d.interfaces import concatenation
+from xcp_d.interfaces import concatenation, connectivity
 
 
 def test_cleannamesource(datasets):
@@ -138,3 +140,62 @@ def test_concatenateinputs(ds001419_data, tmp_path_factory):
     assert os.path.isfile(out.temporal_mask)
     assert len(out.timeseries) == n_atlases
     assert all(os.path.isfile(f) for f in out.timeseries)
+
+
+def test_concatenateinputs_parcellated(tmp_path_factory):
+    """Test ConcatenateInputs without dense inputs, followed by TSVConnect.
+
+    This mimics the "parcellated" combineruns mode.
+    """
+    tmpdir = tmp_path_factory.mktemp("test_concatenateinputs_parcellated")
+    rng = np.random.default_rng(0)
+
+    n_runs, n_atlases = 3, 2
+    temporal_mask, timeseries, timeseries_arrs = [], [], []
+    for i_run in range(n_runs):
+        tmask_file = os.path.join(tmpdir, f"run-{i_run}_outliers.tsv")
+        pd.DataFrame({"framewise_displacement": np.zeros(10, dtype=int)}).to_csv(
+            tmask_file,
+            sep="\t",
+            index=False,
+        )
+        temporal_mask.append(tmask_file)
+
+        run_timeseries = []
+        for i_atlas in range(n_atlases):
+            arr = rng.standard_normal((10, 4))
+            arr[:, 3] = np.nan  # a parcel with no coverage
+            timeseries_file = os.path.join(tmpdir, f"run-{i_run}_atlas-{i_atlas}_timeseries.tsv")
+            pd.DataFrame(arr, columns=["a", "b", "c", "d"]).to_csv(
+                timeseries_file,
+                sep="\t",
+                na_rep="n/a",
+                index=False,
+            )
+            run_timeseries.append(timeseries_file)
+            if i_atlas == 0:
+                timeseries_arrs.append(arr)
+
+        timeseries.append(run_timeseries)
+
+    interface = concatenation.ConcatenateInputs(
+        fmriprep_confounds_file=temporal_mask,
+        filtered_motion=temporal_mask,
+        temporal_mask=temporal_mask,
+        timeseries=timeseries,
+    )
+    results = interface.run(cwd=tmpdir)
+    out = results.outputs
+    assert not isdefined(out.censored_denoised_bold)
+    assert not isdefined(out.preprocessed_bold)
+    assert not isdefined(out.timeseries_ciftis)
+    assert out.run_index == [10, 20]
+    assert pd.read_table(out.temporal_mask).shape[0] == 10 * n_runs
+    assert len(out.timeseries) == n_atlases
+
+    correlations = connectivity.TSVConnect(timeseries=out.timeseries[0]).run(cwd=tmpdir)
+    correlations_df = pd.read_table(correlations.outputs.correlations, index_col="Node")
+    expected = pd.DataFrame(np.vstack(timeseries_arrs), columns=["a", "b", "c", "d"]).corr()
+    assert correlations_df.shape == (4, 4)
+    assert np.allclose(correlations_df.to_numpy(), expected.to_numpy(), equal_nan=True, atol=1e-4)
+    assert correlations_df["d"].isna().all()
@@ -0,0 +1,238 @@
+"""Tests for the xcp_d.interfaces.connectivity module."""
+import os
+
+import h5py
+import nibabel as nb
+import numpy as np
+import pandas as pd
+
+from xcp_d.interfaces import connectivity
+from xcp_d.interfaces.connectivity import (
+    DenseConnect,
+    DynamicConnect,
+    NiftiConnect,
+    WarpAtlasToBOLD,
+)
+from xcp_d.utils.atlas import (
+    get_atlas_cache_key,
+    get_atlas_nifti,
+    store_cached_atlas_files,
+)
+
+
+def test_warpatlastobold_cached(tmp_path_factory):
+    """Check that WarpAtlasToBOLD reuses cached atlases instead of calling ANTs."""
+    tmpdir = tmp_path_factory.mktemp("test_warpatlastobold_cached")
+
+    atlas_file, _, _ = get_atlas_nifti("Gordon")
+    reference_file = os.path.join(tmpdir, "boldref.nii.gz")
+    nb.Nifti1Image(np.zeros((10, 10, 10)), np.eye(4)).to_filename(reference_file)
+    warped_file = os.path.join(tmpdir, "warped_atlas.nii.gz")
+    nb.Nifti1Image(np.ones((10, 10, 10), dtype=np.int16), np.eye(4)).to_filename(warped_file)
+
+    cache_dir = os.path.join(tmpdir, "atlas_cache")
+    cache_key = get_atlas_cache_key(atlas_file, reference_file, ["identity"])
+    cached_files = store_cached_atlas_files(cache_dir, cache_key, {"output_image": warped_file})
+
+    interface = WarpAtlasToBOLD(
+        atlas_file=atlas_file,
+        reference_image=reference_file,
+        transforms=["identity"],
+        cache_dir=cache_dir,
+    )
+    results = interface.run(cwd=tmpdir)
+    assert results.outputs.output_image == cached_files["output_image"]
+
+
+def test_nifticonnect(tmp_path_factory):
+    """Compare NiftiConnect's parcellated time series to per-parcel means of the raw data."""
+    tmpdir = tmp_path_factory.mktemp("test_nifticonnect")
+
+    rng = np.random.default_rng(0)
+    shape, n_volumes = (4, 5, 6), 20
+    atlas = np.zeros(shape, dtype=np.int16)
+    atlas[:2, :, :3] = 2
+    atlas[2:, :, 3:] = 5
+    atlas_file = os.path.join(tmpdir, "atlas.nii.gz")
+    nb.Nifti1Image(atlas, np.eye(4)).to_filename(atlas_file)
+
+    # Integer data are read in their own dtype, rather than as a float64 copy of the whole run.
+    data = rng.integers(-100, 100, size=shape + (n_volumes,)).astype(np.int16)
+    data_file = os.path.join(tmpdir, "denoised.nii.gz")
+    nb.Nifti1Image(data, np.eye(4)).to_filename(data_file)
+
+    mask = np.ones(shape, dtype=np.uint8)
+    mask[0, 0, 0] = 0
+    mask_file = os.path.join(tmpdir, "mask.nii.gz")
+    nb.Nifti1Image(mask, np.eye(4)).to_filename(mask_file)
+
+    atlas_labels_file = os.path.join(tmpdir, "atlas_labels.tsv")
+    pd.DataFrame({"index": [2, 3, 5], "label": ["a", "b", "c"]}).to_csv(
+        atlas_labels_file, sep="\t", index=False
+    )
+
+    results = NiftiConnect(
+        filtered_file=data_file,
+        mask=mask_file,
+        atlas=atlas_file,
+        atlas_labels=atlas_labels_file,
+        correlate=False,
+    ).run(cwd=tmpdir)
+
+    timeseries_df = pd.read_table(results.outputs.timeseries)
+    assert timeseries_df.columns.tolist() == ["a", "b", "c"]
+    np.testing.assert_allclose(
+        timeseries_df["a"],
+        data[(atlas == 2) & (mask > 0)].mean(axis=0),
+    )
+    assert timeseries_df["b"].isna().all()
+    np.testing.assert_allclose(timeseries_df["c"], data[atlas == 5].mean(axis=0))
+
+
+def test_denseconnect(tmp_path_factory):
+    """Compare DenseConnect's blocked, memory-mapped correlations to numpy's."""
+    tmpdir = tmp_path_factory.mktemp("test_denseconnect")
+
+    rng = np.random.default_rng(0)
+    mask = np.ones((3, 4, 5), dtype=bool)
+    brain_models = nb.cifti2.BrainModelAxis.from_mask(mask, affine=np.eye(4))
+    n_volumes, n_grayordinates = 40, mask.sum()
+    data = rng.normal(size=(n_volumes, n_grayordinates)).astype(np.float32)
+    data[:, 7] = 0  # an empty grayordinate
+    time_axis = nb.cifti2.SeriesAxis(start=0, step=2, size=n_volumes)
+    data_file = os.path.join(tmpdir, "denoised.dtseries.nii")
+    nb.Cifti2Image(data, nb.cifti2.Cifti2Header.from_axes((time_axis, brain_models))).to_filename(
+        data_file
+    )
+
+    parcels_axis = nb.cifti2.ParcelsAxis.from_brain_models(
+        [("parcel1", brain_models[:20]), ("parcel2", brain_models[20:])]
+    )
+    timeseries = np.stack([data[:, :20].mean(axis=1), data[:, 20:].mean(axis=1)], axis=1)
+    timeseries_file = os.path.join(tmpdir, "timeseries.ptseries.nii")
+    nb.Cifti2Image(
+        timeseries,
+        nb.cifti2.Cifti2Header.from_axes((time_axis, parcels_axis)),
+    ).to_filename(timeseries_file)
+
+    results = DenseConnect(
+        data_file=data_file,
+        timeseries_ciftis=[timeseries_file],
+        dense=True,
+        block_size=16,
+    ).run(cwd=tmpdir)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        expected = np.corrcoef(np.hstack((timeseries, data)).T)
+
+    dense_img = nb.load(results.outputs.dense_correlations)
+    assert dense_img.nifti_header.get_intent()[0] == "ConnDense"
+    assert dense_img.header.get_axis(0) == brain_models
+    np.testing.assert_allclose(dense_img.get_fdata(), expected[2:, 2:], atol=1e-5)
+
+    assert len(results.outputs.seed_correlations) == 1
+    seed_img = nb.load(results.outputs.seed_correlations[0])
+    assert results.outputs.seed_correlations[0].endswith(".dpconn.nii")
+    assert seed_img.nifti_header.get_intent()[0] == "ConnDenseParcel"
+    assert seed_img.header.get_axis(0) == parcels_axis
+    assert seed_img.header.get_axis(1) == brain_models
+    np.testing.assert_allclose(seed_img.get_fdata(), expected[:2, 2:], atol=1e-5)
+
+
+def test_dynamicconnect(tmp_path_factory):
+    """Test that DynamicConnect places censored time series in time and writes HDF5 files."""
+    tmpdir = tmp_path_factory.mktemp("test_dynamicconnect")
+
+    rng = np.random.default_rng(0)
+    n_volumes, window_length = 50, 10
+    censored = np.zeros(n_volumes, dtype=int)
+    censored[[3, 4, 20, 41]] = 1
+    temporal_mask = os.path.join(tmpdir, "outliers.tsv")
+    pd.DataFrame({"framewise_displacement": censored}).to_csv(temporal_mask, sep="\t", index=False)
+
+    # Censored data only include the retained volumes.
+    node_names = ["a", "b", "c", "d"]
+    timeseries_arr = rng.normal(size=(n_volumes, len(node_names)))
+    timeseries = os.path.join(tmpdir, "timeseries.tsv")
+    pd.DataFrame(timeseries_arr[censored == 0], columns=node_names).to_csv(
+        timeseries, sep="\t", index=False
+    )
+
+    results = DynamicConnect(
+        timeseries=timeseries,
+        temporal_mask=temporal_mask,
+        window_length=window_length,
+        step=5,
+    ).run(cwd=tmpdir)
+
+    with h5py.File(results.outputs.dynamic_correlations, "r") as f:
+        correlations = f["correlations"]
+        assert correlations.shape == (9, 4, 4)
+        assert correlations.chunks == (1, 4, 4)
+        assert correlations.attrs["window_length"] == window_length
+        np.testing.assert_array_equal(f["window_onsets"][:], np.arange(0, 41, 5))
+        assert f["n_volumes"][0] == 8
+        assert [name.decode() for name in f["node_names"][:]] == node_names
+
+        # The second window (volumes 5-14) has no censored volumes.
+        np.testing.assert_allclose(
+            correlations[1],
+            np.corrcoef(timeseries_arr[5:15].T),
+            atol=1e-6,
+        )
+        # The first window skips the censored volumes.
+        retained = [i for i in range(window_length) if not censored[i]]
+        np.testing.assert_allclose(
+            correlations[0],
+            np.corrcoef(timeseries_arr[retained].T),
+            atol=1e-6,
+        )
+
+
+def test_write_connectivity_measures(tmp_path_factory):
+    """Test that regularized connectivity is written for the run and its exact subsets."""
+    tmpdir = tmp_path_factory.mktemp("test_write_connectivity_measures")
+
+    rng = np.random.default_rng(0)
+    timeseries_df = pd.DataFrame(rng.normal(size=(40, 5)), columns=list("abcde"))
+    censoring_df = pd.DataFrame(
+        {
+            "framewise_displacement": np.zeros(40, dtype=int),
+            "exact_20": np.repeat([0, 1], 20),
+            # An exact subset with every volume reuses the run's matrices.
+            "exact_40": np.zeros(40, dtype=int),
+        }
+    )
+
+    connectivity_files, connectivity_exact_files = connectivity._write_connectivity_measures(
+        timeseries_df,
+        censoring_df,
+        ["exact_20", "exact_40"],
+        ["ledoitwolfcovariance", "partialcorrelation"],
+        str(tmpdir),
+    )
+    assert [os.path.basename(f) for f in connectivity_files] == [
+        "ledoitwolfcovariance.tsv",
+        "partialcorrelation.tsv",
+    ]
+    assert [os.path.basename(f) for f in connectivity_exact_files] == [
+        "ledoitwolfcovariance_exact_20.tsv",
+        "ledoitwolfcovariance_exact_40.tsv",
+        "partialcorrelation_exact_20.tsv",
+        "partialcorrelation_exact_40.tsv",
+    ]
+
+    covariance_df = pd.read_table(connectivity_files[0], index_col="Node")
+    assert covariance_df.columns.tolist() == list("abcde")
+    pd.testing.assert_frame_equal(
+        pd.read_table(connectivity_exact_files[1], index_col="Node"),
+        covariance_df,
+    )
+    assert not np.allclose(
+        pd.read_table(connectivity_exact_files[0], index_col="Node").to_numpy(),
+        covariance_df.to_numpy(),
+    )
+
+    assert connectivity._write_connectivity_measures(
+        timeseries_df, censoring_df, [], [], str(tmpdir)
+    ) == (None, None)
@@ -1,6 +1,8 @@
 """Tests for the xcp_d.utils.atlas module."""
 import os
 
+import nibabel as nb
+import numpy as np
 import pytest
 
 from xcp_d.utils import atlas
@@ -43,3 +45,45 @@ def test_get_atlas_cifti():
 
     with pytest.raises(FileNotFoundError, match="DNE"):
         atlas.get_atlas_cifti("tofail")
+
+
+def test_atlas_cache(tmp_path_factory):
+    """Test the atlas cache keys and storage."""
+    tmpdir = tmp_path_factory.mktemp("test_atlas_cache")
+
+    atlas_file, _, _ = atlas.get_atlas_nifti("Gordon")
+    transforms = ["identity"]
+
+    affine = np.diag([2, 2, 2, 1])
+    reference_file = os.path.join(tmpdir, "reference.nii.gz")
+    nb.Nifti1Image(np.zeros((10, 10, 10)), affine).to_filename(reference_file)
+    # Same grid, different data
+    reference_file2 = os.path.join(tmpdir, "reference2.nii.gz")
+    nb.Nifti1Image(np.ones((10, 10, 10)), affine).to_filename(reference_file2)
+    # Different grid
+    reference_file3 = os.path.join(tmpdir, "reference3.nii.gz")
+    nb.Nifti1Image(np.zeros((10, 10, 11)), affine).to_filename(reference_file3)
+
+    key = atlas.get_atlas_cache_key(atlas_file, reference_file, transforms)
+    assert key == atlas.get_atlas_cache_key(atlas_file, reference_file2, transforms)
+    assert key != atlas.get_atlas_cache_key(atlas_file, reference_file3, transforms)
+    assert key != atlas.get_atlas_cache_key(atlas_file, reference_file, [reference_file])
+    other_atlas_file, _, _ = atlas.get_atlas_nifti("Glasser")
+    assert key != atlas.get_atlas_cache_key(other_atlas_file, reference_file, transforms)
+
+    cache_dir = os.path.join(tmpdir, "atlas_cache")
+    assert atlas.get_cached_atlas_files(cache_dir, key) is None
+    cached_files = atlas.store_cached_atlas_files(
+        cache_dir,
+        key,
+        {"atlas_file": reference_file, "other_file": reference_file},
+    )
+    assert sorted(cached_files.keys()) == ["atlas_file", "other_file"]
+    assert os.path.basename(cached_files["atlas_file"]) == "reference.nii.gz"
+    assert cached_files["atlas_file"] != cached_files["other_file"]
+    assert atlas.get_cached_atlas_files(cache_dir, key) == cached_files
+
+    # A second store under the same key keeps the original entry.
+    cached_files2 = atlas.store_cached_atlas_files(cache_dir, key, {"atlas_file": reference_file3})
+    assert cached_files2 == cached_files
+    assert sorted(os.listdir(cache_dir)) == [key]
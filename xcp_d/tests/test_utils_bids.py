@@ -30,6 +30,33 @@ def test_collect_participants(datasets):
     assert found_labels == ["01"]
 
 
+def test_get_participant_indexer(tmp_path_factory):
+    """Test that only the requested participants are indexed."""
+    bids_dir = tmp_path_factory.mktemp("test_get_participant_indexer")
+    with open(os.path.join(bids_dir, "dataset_description.json"), "w") as fo:
+        json.dump(
+            {
+                "Name": "Test",
+                "BIDSVersion": "1.8.0",
+                "DatasetType": "derivative",
+                "GeneratedBy": [{"Name": "fMRIPrep"}],
+            },
+            fo,
+        )
+
+    for subject in ("01", "010", "02"):
+        func_dir = os.path.join(bids_dir, f"sub-{subject}", "func")
+        os.makedirs(func_dir)
+        open(os.path.join(func_dir, f"sub-{subject}_task-rest_bold.nii.gz"), "w").close()
+
+    assert xbids.get_participant_indexer(None) is None
+
+    indexer = xbids.get_participant_indexer(["sub-01", "02"])
+    layout = BIDSLayout(str(bids_dir), derivatives=True, indexer=indexer)
+    assert layout.get_subjects() == ["01", "02"]
+    assert xbids.collect_participants(layout, participant_label=["01"]) == ["01"]
+
+
 def test_collect_data_pnc(datasets):
     """Test the collect_data function."""
     bids_dir = datasets["ds001419"]
@@ -0,0 +1,145 @@
+"""Tests for the xcp_d.utils.cache module."""
+import os
+
+import nibabel as nb
+import numpy as np
+import pandas as pd
+import pytest
+
+from xcp_d.interfaces import censoring
+from xcp_d.utils import cache
+
+
+def _make_inputs(in_dir, n_volumes=20):
+    """Write a BOLD file and the confounds files that RemoveDummyVolumes needs."""
+    os.makedirs(in_dir)
+    rng = np.random.default_rng(0)
+    bold_file = os.path.join(in_dir, "sub-01_task-rest_bold.nii.gz")
+    bold_data = rng.normal(size=(4, 4, 4, n_volumes)).astype(np.float32)
+    nb.Nifti1Image(bold_data, np.eye(4)).to_filename(bold_file)
+
+    confounds_file = os.path.join(in_dir, "confounds.tsv")
+    pd.DataFrame(
+        rng.normal(size=(n_volumes, 3)),
+        columns=["a", "b", "framewise_displacement"],
+    ).to_csv(confounds_file, sep="\t", index=False)
+    return bold_file, confounds_file
+
+
+def _run_remove_dummy_volumes(node_dir, bold_file, confounds_file, dummy_scans):
+    os.makedirs(node_dir)
+    return censoring.RemoveDummyVolumes(
+        bold_file=bold_file,
+        fmriprep_confounds_file=confounds_file,
+        confounds_file=confounds_file,
+        motion_file=confounds_file,
+        temporal_mask=confounds_file,
+        dummy_scans=dummy_scans,
+    ).run(cwd=node_dir)
+
+
+def test_cache_results(tmp_path_factory, monkeypatch):
+    """Test that results are reused across working directories."""
+    tmpdir = str(tmp_path_factory.mktemp("test_cache_results"))
+    cache_dir = os.path.join(tmpdir, "cache")
+    monkeypatch.setenv(cache.RESULT_CACHE_ENV, cache_dir)
+
+    bold_file, confounds_file = _make_inputs(os.path.join(tmpdir, "inputs"))
+    first = _run_remove_dummy_volumes(
+        os.path.join(tmpdir, "work1", "node"),
+        bold_file,
+        confounds_file,
+        dummy_scans=2,
+    ).outputs
+    assert len([d for d in os.listdir(cache_dir) if d.startswith("RemoveDummyVolumes-")]) == 1
+
+    # A copy of the inputs, in another directory, hits the cache.
+    copied_dir = os.path.join(tmpdir, "copied_inputs")
+    os.makedirs(copied_dir)
+    copied_bold_file = os.path.join(copied_dir, os.path.basename(bold_file))
+    copied_confounds_file = os.path.join(copied_dir, os.path.basename(confounds_file))
+    for in_file, out_file in (
+        (bold_file, copied_bold_file),
+        (confounds_file, copied_confounds_file),
+    ):
+        with open(in_file, "rb") as fin, open(out_file, "wb") as fout:
+            fout.write(fin.read())
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("The results should have been loaded from the cache.")
+
+    monkeypatch.setattr(censoring, "_drop_dummy_scans", _fail)
+    work_dir = os.path.join(tmpdir, "work2", "node")
+    second = _run_remove_dummy_volumes(
+        work_dir,
+        copied_bold_file,
+        copied_confounds_file,
+        dummy_scans=2,
+    ).outputs
+    assert second.dummy_scans == 2
+    assert os.path.dirname(second.bold_file_dropped_TR) == work_dir
+    assert os.path.basename(second.bold_file_dropped_TR) == os.path.basename(
+        first.bold_file_dropped_TR
+    )
+    np.testing.assert_array_equal(
+        nb.load(second.bold_file_dropped_TR).get_fdata(),
+        nb.load(first.bold_file_dropped_TR).get_fdata(),
+    )
+    assert os.path.dirname(second.temporal_mask_dropped_TR) == work_dir
+
+    # A different parameter misses the cache.
+    with pytest.raises(AssertionError, match="loaded from the cache"):
+        _run_remove_dummy_volumes(
+            os.path.join(tmpdir, "work3", "node"),
+            bold_file,
+            confounds_file,
+            dummy_scans=3,
+        )
+
+    # Files that are passed through from the inputs point to the current inputs.
+    monkeypatch.undo()
+    monkeypatch.setenv(cache.RESULT_CACHE_ENV, cache_dir)
+    for i_run, in_file in enumerate((bold_file, copied_bold_file)):
+        outputs = _run_remove_dummy_volumes(
+            os.path.join(tmpdir, f"passthrough{i_run}", "node"),
+            in_file,
+            confounds_file,
+            dummy_scans=0,
+        ).outputs
+        assert outputs.bold_file_dropped_TR == in_file
+
+
+def test_evict_cached_results(tmp_path_factory, monkeypatch):
+    """Test that the least recently used entries are evicted first."""
+    tmpdir = str(tmp_path_factory.mktemp("test_evict_cached_results"))
+    cache_dir = os.path.join(tmpdir, "cache")
+    monkeypatch.setenv(cache.RESULT_CACHE_ENV, cache_dir)
+
+    bold_file, confounds_file = _make_inputs(os.path.join(tmpdir, "inputs"))
+    for i_run, dummy_scans in enumerate((1, 2, 3)):
+        _run_remove_dummy_volumes(
+            os.path.join(tmpdir, f"work{i_run}", "node"),
+            bold_file,
+            confounds_file,
+            dummy_scans=dummy_scans,
+        )
+        # Make the access times distinct.
+        for i_entry, entry in enumerate(sorted(os.listdir(cache_dir))):
+            manifest_file = os.path.join(cache_dir, entry, "manifest.json")
+            if os.path.isfile(manifest_file):
+                os.utime(manifest_file, (i_entry, i_entry))
+
+    entries = [e for e in os.listdir(cache_dir) if not e.startswith(".")]
+    assert len(entries) == 3
+    mtimes = {e: os.stat(os.path.join(cache_dir, e, "manifest.json")).st_mtime for e in entries}
+    oldest, newest = min(mtimes, key=mtimes.get), max(mtimes, key=mtimes.get)
+
+    sizes = {e: cache._entry_size(os.path.join(cache_dir, e)) for e in entries}
+    evicted = cache.evict_cached_results(
+        cache_dir,
+        max_size=sizes[newest],
+        keep=(newest,),
+    )
+    assert oldest in evicted
+    assert newest not in evicted
+    assert os.listdir(cache_dir).count(newest) == 1
@@ -0,0 +1,64 @@
+"""Tests for the xcp_d.utils.columnar module."""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from xcp_d.utils import columnar
+
+
+def test_read_columns(tmp_path_factory, monkeypatch):
+    """Test that TSVs round-trip through the columnar store."""
+    tmpdir = tmp_path_factory.mktemp("test_read_columns")
+    store_dir = os.path.join(tmpdir, "store")
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "trans_x": rng.normal(size=10),
+            "outlier": np.arange(10),
+            "label": ["a", "b", None] + ["c"] * 7,
+        }
+    )
+    df.loc[0, "trans_x"] = np.nan
+    tsv_file = os.path.join(tmpdir, "desc-confounds_timeseries.tsv")
+    df.to_csv(tsv_file, sep="\t", index=False)
+    with open(os.path.join(tmpdir, "desc-confounds_timeseries.json"), "w") as fobj:
+        json.dump({"trans_x": {"Units": "mm"}}, fobj)
+
+    # Without a store, the TSV is parsed directly.
+    assert columnar.get_store_file(tsv_file) is None
+    expected = pd.read_table(tsv_file)
+    pd.testing.assert_frame_equal(columnar.read_columns(tsv_file), expected)
+    assert columnar.read_metadata(tsv_file) == {"trans_x": {"Units": "mm"}}
+
+    monkeypatch.setenv(columnar.COLUMNAR_STORE_ENV, store_dir)
+    store_file = columnar.get_store_file(tsv_file)
+    assert not os.path.isfile(store_file)
+
+    assert columnar.read_column_names(tsv_file) == ["trans_x", "outlier", "label"]
+    assert os.path.isfile(store_file)
+    pd.testing.assert_frame_equal(columnar.read_columns(tsv_file), expected)
+    pd.testing.assert_frame_equal(
+        columnar.read_columns(tsv_file, ["label", "trans_x"]),
+        expected[["label", "trans_x"]],
+    )
+    assert columnar.read_metadata(tsv_file) == {"trans_x": {"Units": "mm"}}
+
+    with pytest.raises(KeyError, match="not found"):
+        columnar.read_columns(tsv_file, ["rot_x"])
+
+    # A modified TSV is parsed again.
+    df.iloc[::2].to_csv(tsv_file, sep="\t", index=False)
+    assert columnar.get_store_file(tsv_file) != store_file
+    assert columnar.read_columns(tsv_file, ["outlier"])["outlier"].tolist() == [0, 2, 4, 6, 8]
+
+    # Written TSVs are added to the store, with their metadata.
+    out_file = os.path.join(tmpdir, "filtered.tsv")
+    columnar.write_columns(expected, out_file, metadata={"Sources": [tsv_file]})
+    assert os.path.isfile(columnar.get_store_file(out_file))
+    pd.testing.assert_frame_equal(pd.read_table(out_file), expected)
+    pd.testing.assert_frame_equal(columnar.read_columns(out_file), expected)
+    assert columnar.read_metadata(out_file) == {"Sources": [tsv_file]}
@@ -78,3 +78,54 @@ def test_concatenate_niimgs(ds001419_data, tmp_path_factory):
     concat_cifti_img = nb.load(concat_cifti_file)
     assert concat_cifti_img.shape[0] == cifti_img.shape[0] * n_repeats
     assert concat_cifti_img.shape[1] == cifti_img.shape[1]
+
+
+def test_concatenate_niimgs_streaming(tmp_path_factory):
+    """Test that concatenate_niimgs matches in-memory concatenation across blocks.
+
+    A tiny block size is used so that each run is copied over multiple blocks.
+    """
+    from nibabel.cifti2 import cifti2_axes
+
+    tmpdir = tmp_path_factory.mktemp("test_concatenate_niimgs_streaming")
+    rng = np.random.default_rng(0)
+    n_volumes = [3, 7, 5]
+    affine = np.diag([2, 2, 2, 1])
+
+    # Scaled integer NIfTIs are written out as floats.
+    nifti_files, nifti_data = [], []
+    for i_run, n_vols in enumerate(n_volumes):
+        img = nb.Nifti1Image((rng.random((4, 5, 6, n_vols)) * 1000).astype(np.int16), affine)
+        img.header.set_slope_inter(0.5, 1)
+        nifti_files.append(os.path.join(tmpdir, f"run-{i_run}.nii.gz"))
+        img.to_filename(nifti_files[-1])
+        nifti_data.append(nb.load(nifti_files[-1]).get_fdata())
+
+    concat_nifti_file = os.path.join(tmpdir, "concat.nii.gz")
+    concatenation.concatenate_niimgs(nifti_files, out_file=concat_nifti_file, block_size=1e-4)
+    concat_nifti_img = nb.load(concat_nifti_file)
+    assert concat_nifti_img.shape == (4, 5, 6, sum(n_volumes))
+    assert np.allclose(concat_nifti_img.affine, affine)
+    assert np.allclose(concat_nifti_img.get_fdata(), np.concatenate(nifti_data, axis=3))
+
+    # Dense time series CIFTIs
+    brain_models = cifti2_axes.BrainModelAxis.from_mask(np.ones((2, 3, 4), bool), affine=affine)
+    cifti_files, cifti_data = [], []
+    for i_run, n_vols in enumerate(n_volumes):
+        data = rng.random((n_vols, len(brain_models))).astype(np.float32)
+        img = nb.Cifti2Image(data, (cifti2_axes.SeriesAxis(0, 2, n_vols), brain_models))
+        img.nifti_header.set_intent("ConnDenseSeries")
+        cifti_files.append(os.path.join(tmpdir, f"run-{i_run}.dtseries.nii"))
+        img.to_filename(cifti_files[-1])
+        cifti_data.append(data)
+
+    concat_cifti_file = os.path.join(tmpdir, "concat.dtseries.nii")
+    concatenation.concatenate_niimgs(cifti_files, out_file=concat_cifti_file, block_size=1e-5)
+    concat_cifti_img = nb.load(concat_cifti_file)
+    assert concat_cifti_img.shape == (sum(n_volumes), len(brain_models))
+    assert concat_cifti_img.get_data_dtype() == np.float32
+    assert concat_cifti_img.nifti_header.get_intent()[0] == "ConnDenseSeries"
+    assert concat_cifti_img.header.get_axis(1) == brain_models
+    series = concat_cifti_img.header.get_axis(0)
+    assert (series.size, series.step) == (sum(n_volumes), 2)
+    assert np.array_equal(concat_cifti_img.get_fdata(), np.vstack(cifti_data))
@@ -0,0 +1,182 @@
+"""Tests for the xcp_d.utils.connectivity module."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from xcp_d.utils import connectivity
+
+
+def test_correlate_columns():
+    """Test that blocked correlations of standardized data match numpy's."""
+    rng = np.random.default_rng(0)
+    data_a = rng.normal(size=(30, 5))
+    data_b = rng.normal(size=(30, 23))
+    data_b[:, 3] = 1  # a constant column
+    data_b[4, 6] = np.nan
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        expected = np.corrcoef(data_a.T, data_b.T)[:5, 5:]
+
+    standardized_a = connectivity.standardize_columns(data_a)
+    standardized_b = connectivity.standardize_columns(data_b)
+    assert standardized_b.dtype == np.float32
+    for block_size in (None, 1, 4):
+        correlations = connectivity.correlate_columns(
+            standardized_a,
+            standardized_b,
+            block_size=block_size,
+        )
+        assert correlations.shape == (5, 23)
+        assert np.all(np.isnan(correlations[:, [3, 6]]))
+        np.testing.assert_allclose(correlations, expected, atol=1e-5)
+
+    with pytest.raises(ValueError, match="different numbers of volumes"):
+        connectivity.correlate_columns(standardized_a, standardized_b[1:])
+
+
+def _weighted_correlations(data, weights):
+    """Compute a weighted correlation matrix directly."""
+    means = weights @ data / weights.sum()
+    centered = data - means
+    covariance = (centered * weights[:, None]).T @ centered
+    stds = np.sqrt(np.diag(covariance))
+    return covariance / np.outer(stds, stds)
+
+
+@pytest.mark.parametrize("taper", ["boxcar", "exponential"])
+def test_sliding_window_correlations(taper, monkeypatch):
+    """Test that rank-1 updates give the same correlations as computing each window."""
+    # Force the running sums to be rescaled during the run.
+    monkeypatch.setattr(connectivity, "MAX_WEIGHT", 1e3)
+
+    rng = np.random.default_rng(0)
+    n_volumes, window_length, step = 120, 30, 4
+    timeseries = rng.normal(loc=3, scale=5, size=(n_volumes, 10))
+    timeseries[:, 2] = np.nan  # a parcel with insufficient coverage
+    timeseries[40:80, 5] = 1  # a parcel that is constant in some windows
+    sample_mask = rng.random(n_volumes) > 0.2
+    sample_mask[60:85] = False  # windows with too few retained volumes
+
+    correlations, onsets, n_retained = connectivity.sliding_window_correlations(
+        timeseries,
+        window_length,
+        step=step,
+        taper=taper,
+        sample_mask=sample_mask,
+    )
+    np.testing.assert_array_equal(onsets, np.arange(0, n_volumes - window_length + 1, step))
+    assert correlations.shape == (onsets.size, 10, 10)
+
+    decay = np.exp(-3 / window_length) if taper == "exponential" else 1
+    for i_window, onset in enumerate(onsets):
+        volumes = np.arange(onset, onset + window_length)
+        weights = decay ** (volumes[-1] - volumes)
+        volumes, weights = volumes[sample_mask[volumes]], weights[sample_mask[volumes]]
+        assert n_retained[i_window] == volumes.size
+        if volumes.size < window_length // 2:
+            assert np.all(np.isnan(correlations[i_window]))
+            continue
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            expected = _weighted_correlations(timeseries[volumes], weights)
+
+        if np.ptp(timeseries[volumes, 5]) == 0:
+            expected[5, :] = np.nan
+            expected[:, 5] = np.nan
+
+        np.testing.assert_allclose(correlations[i_window], expected, atol=1e-5)
+
+    with pytest.raises(ValueError, match="at least two volumes"):
+        connectivity.sliding_window_correlations(timeseries, 1)
+
+
+def test_estimate_connectivity():
+    """Test the Ledoit-Wolf covariance and partial correlations against scikit-learn's."""
+    from sklearn.covariance import ledoit_wolf
+
+    rng = np.random.default_rng(0)
+    timeseries = rng.normal(size=(80, 12)) @ rng.normal(size=(12, 12))
+    expected_covariance, expected_shrinkage = ledoit_wolf(timeseries)
+
+    covariance, shrinkage = connectivity.ledoit_wolf_covariance(timeseries)
+    assert np.isclose(shrinkage, expected_shrinkage)
+    np.testing.assert_allclose(covariance, expected_covariance, atol=1e-10)
+    np.testing.assert_allclose(
+        connectivity.invert_covariance(covariance),
+        np.linalg.inv(expected_covariance),
+        rtol=1e-8,
+    )
+
+    timeseries[:, 3] = np.nan
+    results = connectivity.estimate_connectivity(
+        timeseries,
+        ["ledoitwolfcovariance", "partialcorrelation"],
+    )
+    good_parcels = np.delete(np.arange(12), 3)
+    expected_covariance = ledoit_wolf(timeseries[:, good_parcels])[0]
+    expected_precision = np.linalg.inv(expected_covariance)
+    expected_stds = np.sqrt(np.diag(expected_precision))
+    expected_partial = -expected_precision / np.outer(expected_stds, expected_stds)
+    np.fill_diagonal(expected_partial, 1)
+    good_idx = np.ix_(good_parcels, good_parcels)
+    np.testing.assert_allclose(
+        results["ledoitwolfcovariance"][good_idx],
+        expected_covariance,
+        atol=1e-10,
+    )
+    np.testing.assert_allclose(results["partialcorrelation"][good_idx], expected_partial)
+    assert np.all(np.isnan(results["partialcorrelation"][3]))
+
+    with pytest.raises(ValueError, match="Unknown connectivity measures: tangent"):
+        connectivity.estimate_connectivity(timeseries, ["tangent"])
+
+
+def test_write_tangent_embeddings(tmp_path_factory):
+    """Test the group tangent-space embeddings against a direct computation."""
+    from scipy.linalg import expm, inv, logm, sqrtm
+
+    from xcp_d.cli import tangent_connectivity
+
+    tmpdir = tmp_path_factory.mktemp("test_write_tangent_embeddings")
+
+    rng = np.random.default_rng(0)
+    node_labels = [f"node{i}" for i in range(6)]
+    covariances = []
+    for i_run in range(3):
+        timeseries = rng.normal(size=(50, 6))
+        covariance = connectivity.estimate_connectivity(timeseries, ["ledoitwolfcovariance"])[
+            "ledoitwolfcovariance"
+        ]
+        if i_run == 1:
+            covariance[4, :] = np.nan
+            covariance[:, 4] = np.nan
+
+        covariances.append(covariance)
+        pd.DataFrame(covariance, index=node_labels, columns=node_labels).to_csv(
+            tmpdir / f"sub-{i_run}_task-rest_atlas-Gordon_measure-ledoitwolfcovariance_conmat.tsv",
+            sep="\t",
+            na_rep="n/a",
+            index_label="Node",
+        )
+
+    out_dir = tmpdir / "tangent"
+    tangent_connectivity.main([str(tmpdir), "-o", str(out_dir)])
+
+    # Node 4 is missing in one run, so it's excluded from every run's embedding.
+    good_idx = np.ix_(np.arange(6) != 4, np.arange(6) != 4)
+    good_covariances = [covariance[good_idx] for covariance in covariances]
+    reference = expm(np.mean([logm(covariance) for covariance in good_covariances], axis=0))
+    whitening = inv(sqrtm(reference))
+    for i_run, covariance in enumerate(good_covariances):
+        tangent = pd.read_table(
+            out_dir / f"sub-{i_run}_task-rest_atlas-Gordon_measure-tangent_conmat.tsv",
+            index_col="Node",
+        ).to_numpy()
+        assert np.all(np.isnan(tangent[4]))
+        np.testing.assert_allclose(
+            tangent[good_idx],
+            np.real(logm(whitening @ covariance @ whitening)),
+            atol=1e-10,
+        )
+
+    assert (out_dir / "atlas-Gordon_measure-ledoitwolfcovariance_stat-mean_conmat.tsv").is_file()
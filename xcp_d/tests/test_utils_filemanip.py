@@ -0,0 +1,66 @@
+"""Tests for the xcp_d.utils.filemanip module."""
+import os
+
+import nibabel as nb
+import numpy as np
+import pytest
+
+from xcp_d.interfaces.bids import DerivativesDataSink
+from xcp_d.interfaces.smoothing import GaussianSmooth
+from xcp_d.utils import filemanip
+
+
+def test_set_work_extension(monkeypatch):
+    """Test the working directory's compression policy."""
+    monkeypatch.delenv(filemanip.WORK_COMPRESSION_ENV, raising=False)
+    assert filemanip.get_work_compression() == "fast"
+    assert filemanip.set_work_extension("/work/bold.nii") == "/work/bold.nii.gz"
+
+    monkeypatch.setenv(filemanip.WORK_COMPRESSION_ENV, "none")
+    assert filemanip.set_work_extension("/work/bold.nii.gz") == "/work/bold.nii"
+    assert filemanip.set_work_extension("bold.nii.gz") == "bold.nii"
+    # CIFTIs and other files are left alone.
+    assert filemanip.set_work_extension("/work/bold.dtseries.nii") == "/work/bold.dtseries.nii"
+    assert filemanip.set_work_extension("/work/confounds.tsv") == "/work/confounds.tsv"
+
+    monkeypatch.setenv(filemanip.WORK_COMPRESSION_ENV, "bz2")
+    with pytest.raises(ValueError, match="Unsupported"):
+        filemanip.get_work_compression()
+
+
+def test_uncompressed_work_files(tmp_path_factory, monkeypatch):
+    """Test that intermediate NIfTIs are uncompressed, but derivatives are gzipped."""
+    tmpdir = tmp_path_factory.mktemp("test_uncompressed_work_files")
+    monkeypatch.setenv(filemanip.WORK_COMPRESSION_ENV, "none")
+
+    in_file = os.path.join(tmpdir, "bold.nii.gz")
+    data = np.random.default_rng(0).normal(size=(5, 5, 5, 3)).astype(np.float32)
+    nb.Nifti1Image(data, np.eye(4)).to_filename(in_file)
+
+    results = GaussianSmooth(in_file=in_file, fwhm=2).run(cwd=tmpdir)
+    work_file = results.outputs.out_file
+    assert work_file.endswith("_smoothed.nii")
+    # Uncompressed files are memory-mapped when they are read.
+    assert isinstance(nb.load(work_file).dataobj.get_unscaled(), np.memmap)
+
+    source_file = os.path.join(
+        tmpdir,
+        "sub-01",
+        "func",
+        "sub-01_task-rest_space-MNI152NLin6Asym_desc-preproc_bold.nii.gz",
+    )
+    ds = DerivativesDataSink(
+        base_directory=str(tmpdir),
+        source_file=source_file,
+        in_file=work_file,
+        desc="denoisedSmoothed",
+        suffix="bold",
+        check_hdr=False,
+    )
+    results = ds.run(cwd=tmpdir)
+    assert results.outputs.out_file.endswith("_desc-denoisedSmoothed_bold.nii.gz")
+    assert results.outputs.compression
+    np.testing.assert_allclose(
+        nb.load(results.outputs.out_file).get_fdata(),
+        nb.load(work_file).get_fdata(),
+    )
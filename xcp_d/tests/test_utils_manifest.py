@@ -0,0 +1,125 @@
+"""Tests for the xcp_d.utils.manifest module."""
+import os
+
+from bids.layout import Query
+
+from xcp_d.interfaces.bids import DerivativesDataSink
+from xcp_d.utils import manifest
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fo:
+        fo.write("")
+
+    return path
+
+
+def test_write_and_load_manifest(tmp_path_factory):
+    """Test write_manifest_entries and load_manifest."""
+    tmpdir = tmp_path_factory.mktemp("test_write_and_load_manifest")
+    xcpd_dir = os.path.join(tmpdir, "xcp_d")
+
+    files = [
+        "sub-01/figures/sub-01_desc-mosaic_T1w.png",
+        "sub-01/figures/sub-01_ses-1_task-rest_run-1_desc-preprocESQC_bold.svg",
+        "sub-01/figures/sub-01_ses-1_task-rest_run-2_desc-preprocESQC_bold.svg",
+        "sub-01/figures/sub-01_ses-1_task-rest_desc-preprocESQC_bold.svg",
+        "sub-02/figures/sub-02_ses-1_task-rest_run-1_desc-preprocESQC_bold.svg",
+    ]
+    files = [_touch(os.path.join(xcpd_dir, f)) for f in files]
+    outside_file = _touch(os.path.join(tmpdir, "sub-01_desc-outside_bold.svg"))
+
+    manifest.write_manifest_entries(xcpd_dir, files + [outside_file], source_file="sub-01_bold")
+    # Recording a file twice must not duplicate it.
+    manifest.write_manifest_entries(xcpd_dir, files[1])
+
+    run_dirs = sorted(os.listdir(os.path.join(xcpd_dir, "logs", "manifests", "sub-01")))
+    assert run_dirs == [
+        "sub-01",
+        "sub-01_ses-1_task-rest",
+        "sub-01_ses-1_task-rest_run-1",
+        "sub-01_ses-1_task-rest_run-2",
+    ]
+
+    found = manifest.load_manifest(xcpd_dir, "sub-01")
+    assert found == sorted(files[:4])
+    assert manifest.load_manifest(xcpd_dir, "02") == [files[4]]
+    assert manifest.load_manifest(xcpd_dir, "03") == []
+
+    # Deleted files are dropped from the loaded manifest.
+    os.remove(files[0])
+    assert manifest.load_manifest(xcpd_dir, "01") == sorted(files[1:4])
+
+
+def test_manifest_layout(tmp_path_factory):
+    """Test ManifestLayout queries."""
+    tmpdir = tmp_path_factory.mktemp("test_manifest_layout")
+    xcpd_dir = os.path.join(tmpdir, "xcp_d")
+
+    files = [
+        "sub-01/figures/sub-01_desc-mosaic_T1w.png",
+        "sub-01/figures/sub-01_task-rest_run-1_desc-preprocESQC_bold.svg",
+        "sub-01/figures/sub-01_task-rest_run-2_desc-preprocESQC_bold.svg",
+        "sub-01/figures/sub-01_task-rest_desc-preprocESQC_bold.svg",
+        "sub-01/func/sub-01_task-rest_run-1_space-MNI152NLin6Asym_desc-denoised_bold.nii.gz",
+    ]
+    files = [_touch(os.path.join(xcpd_dir, f)) for f in files]
+
+    layout = manifest.ManifestLayout(xcpd_dir, files)
+    assert len(layout.get()) == 5
+
+    found = layout.get(subject="01", desc="mosaic", suffix="T1w", extension=".png")
+    assert [f.path for f in found] == [files[0]]
+
+    # Integers and strings both match the run entity.
+    found = layout.get(task="rest", run=1, desc="preprocESQC", return_type="file")
+    assert found == [files[1]]
+    found = layout.get(task="rest", run="2", desc="preprocESQC", return_type="file")
+    assert found == [files[2]]
+
+    # None and Query.NONE require the entity to be absent.
+    found = layout.get(task="rest", run=None, desc="preprocESQC", return_type="file")
+    assert found == [files[3]]
+    found = layout.get(task="rest", run=Query.NONE, desc="preprocESQC", return_type="file")
+    assert found == [files[3]]
+
+    # Query.ANY requires the entity to be present, and lists match any value.
+    found = layout.get(run=Query.ANY, extension=[".svg", ".png"], return_type="file")
+    assert found == files[1:3]
+
+    found = layout.get(datatype="func", suffix="bold", extension=[".dtseries.nii", ".nii.gz"])
+    assert len(found) == 1
+    assert found[0].get_entities()["space"] == "MNI152NLin6Asym"
+
+    # Only files within the root are included.
+    layout = manifest.ManifestLayout(os.path.join(xcpd_dir, "sub-01", "figures"), files)
+    assert len(layout.get()) == 4
+
+
+def test_derivativesdatasink_manifest(tmp_path_factory):
+    """Test that DerivativesDataSink records its outputs in the manifest."""
+    tmpdir = tmp_path_factory.mktemp("test_derivativesdatasink_manifest")
+    in_file = _touch(os.path.join(tmpdir, "work", "figure.svg"))
+
+    ds = DerivativesDataSink(
+        base_directory=str(tmpdir),
+        source_file=os.path.join(
+            tmpdir,
+            "sub-01",
+            "func",
+            "sub-01_task-rest_run-1_space-MNI152NLin6Asym_desc-preproc_bold.nii.gz",
+        ),
+        in_file=in_file,
+        datatype="figures",
+        desc="preprocESQC",
+        suffix="bold",
+        check_hdr=False,
+    )
+    results = ds.run(cwd=os.path.join(tmpdir, "work"))
+
+    xcpd_dir = os.path.join(tmpdir, "xcp_d")
+    assert manifest.load_manifest(xcpd_dir, "01") == [results.outputs.out_file]
+    assert os.path.isdir(
+        os.path.join(xcpd_dir, "logs", "manifests", "sub-01", "sub-01_task-rest_run-1")
+    )
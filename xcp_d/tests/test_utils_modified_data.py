@@ -3,6 +3,7 @@ import os
 
 import nibabel as nb
 import numpy as np
+import pandas as pd
 import pytest
 
 from xcp_d.tests.utils import chdir
@@ -33,3 +34,112 @@ def test_cast_cifti_to_int16(ds001419_data, tmp_path_factory):
     assert isinstance(mod_cifti_img, nb.Cifti2Image)
     assert mod_cifti_img.nifti_header.get_data_dtype() == np.int16
     assert mod_cifti_img.dataobj.dtype == np.int16
+
+
+def test_sweep_censoring_thresholds(tmp_path_factory):
+    """Compare sweep_censoring_thresholds to flag_bad_run, one threshold at a time."""
+    tmpdir = tmp_path_factory.mktemp("test_sweep_censoring_thresholds")
+
+    rng = np.random.default_rng(0)
+    columns = ["trans_x", "trans_y", "trans_z", "rot_x", "rot_y", "rot_z"]
+    motion = np.cumsum(rng.normal(scale=0.05, size=(200, 6)), axis=0)
+    motion[:, 3:] /= 50
+    confounds_file = os.path.join(tmpdir, "sub-01_task-rest_desc-confounds_timeseries.tsv")
+    pd.DataFrame(motion, columns=columns).to_csv(confounds_file, sep="\t", index=False)
+
+    TR = 0.8
+    fd_thresholds = [0, 0.05, 0.1, 0.2, 0.5]
+    motion_filters = [
+        {"motion_filter_type": None},
+        {"motion_filter_type": "lp", "band_stop_min": 6, "motion_filter_order": 4},
+        {"motion_filter_type": "notch", "band_stop_min": 12, "band_stop_max": 18},
+    ]
+    sweep_df, temporal_masks = modified_data.sweep_censoring_thresholds(
+        fmriprep_confounds_file=confounds_file,
+        TR=TR,
+        fd_thresholds=fd_thresholds,
+        motion_filters=motion_filters,
+        dummy_scans=5,
+        head_radius=50,
+        min_time=100,
+    )
+    assert sweep_df.shape[0] == len(fd_thresholds) * len(motion_filters)
+    assert temporal_masks.shape == (len(motion_filters), len(fd_thresholds), 195)
+    assert (sweep_df["n_volumes"] == 195).all()
+
+    for i_filter, motion_filter in enumerate(motion_filters):
+        for j_thresh, fd_thresh in enumerate(fd_thresholds):
+            row = sweep_df.iloc[i_filter * len(fd_thresholds) + j_thresh]
+            assert row["fd_thresh"] == fd_thresh
+            assert row["motion_filter_type"] == motion_filter["motion_filter_type"]
+
+            duration = modified_data.flag_bad_run(
+                fmriprep_confounds_file=confounds_file,
+                dummy_scans=5,
+                TR=TR,
+                motion_filter_type=motion_filter["motion_filter_type"],
+                motion_filter_order=motion_filter.get("motion_filter_order", 4),
+                band_stop_min=motion_filter.get("band_stop_min"),
+                band_stop_max=motion_filter.get("band_stop_max"),
+                head_radius=50,
+                fd_thresh=fd_thresh,
+            )
+            assert row["passes_min_time"] == (duration >= 100)
+            assert row["n_censored_volumes"] == temporal_masks[i_filter, j_thresh].sum()
+            if fd_thresh > 0:
+                assert np.isclose(row["retained_duration"], duration)
+            else:
+                assert row["n_censored_volumes"] == 0
+
+    # Lower thresholds never censor fewer volumes.
+    assert np.all(np.diff(temporal_masks[:, 1:].sum(axis=2), axis=1) <= 0)
+
+
+def test_drop_dummy_scans(tmp_path_factory):
+    """Test that _drop_dummy_scans copies the retained volumes without changing them."""
+    tmpdir = tmp_path_factory.mktemp("test_drop_dummy_scans")
+
+    data = np.random.default_rng(0).normal(size=(5, 6, 7, 10)).astype(np.float32)
+    float_img = nb.Nifti1Image(data, np.diag([2.0, 2.0, 2.0, 1.0]))
+    float_img.header.set_zooms((2.0, 2.0, 2.0, 0.8))
+    float_img.header.extensions.append(nb.nifti1.Nifti1Extension(6, b"extension"))
+    scaled_img = nb.Nifti1Image(data * 3, np.eye(4))
+    scaled_img.set_data_dtype(np.int16)
+
+    for img in (float_img, scaled_img):
+        for in_ext in (".nii", ".nii.gz"):
+            in_file = os.path.join(tmpdir, f"bold{in_ext}")
+            img.to_filename(in_file)
+            in_img = nb.load(in_file)
+            for out_ext in (".nii", ".nii.gz"):
+                out_file = modified_data._drop_dummy_scans(
+                    in_file,
+                    dummy_scans=3,
+                    out_file=os.path.join(tmpdir, f"dropped{out_ext}"),
+                )
+                out_img = nb.load(out_file)
+                assert out_img.shape == (5, 6, 7, 7)
+                assert out_img.get_data_dtype() == in_img.get_data_dtype()
+                assert out_img.header.get_zooms() == in_img.header.get_zooms()
+                assert len(out_img.header.extensions) == len(in_img.header.extensions)
+                np.testing.assert_array_equal(out_img.get_fdata(), in_img.get_fdata()[..., 3:])
+
+    brain_models = nb.cifti2.BrainModelAxis.from_mask(np.ones(50, dtype=bool), name="CORTEX_LEFT")
+    cifti_file = os.path.join(tmpdir, "bold.dtseries.nii")
+    cifti_data = data.reshape(-1, 10)[:50].T
+    nb.Cifti2Image(
+        cifti_data,
+        (
+            nb.cifti2.SeriesAxis(start=0, step=0.8, size=10),
+            brain_models,
+        ),
+    ).to_filename(cifti_file)
+    out_file = modified_data._drop_dummy_scans(
+        cifti_file,
+        dummy_scans=3,
+        out_file=os.path.join(tmpdir, "dropped.dtseries.nii"),
+    )
+    out_img = nb.load(out_file)
+    assert out_img.get_data_dtype() == np.float32
+    assert out_img.header.get_axis(0).size == 7
+    np.testing.assert_array_equal(out_img.get_fdata(), nb.load(cifti_file).get_fdata()[3:])
@@ -0,0 +1,86 @@
+"""Tests for the xcp_d.utils.parallel module."""
+import functools
+
+import numpy as np
+import pytest
+
+from xcp_d.utils import parallel
+from xcp_d.utils.restingstate import compute_2d_reho, compute_alff
+from xcp_d.utils.utils import butter_bandpass
+
+
+def test_get_column_blocks():
+    """Test that columns are split into contiguous blocks that cover every column."""
+    assert parallel.get_column_blocks(10) == [slice(0, 10)]
+    assert parallel.get_column_blocks(10, block_size=4) == [
+        slice(0, 4),
+        slice(4, 8),
+        slice(8, 10),
+    ]
+    blocks = parallel.get_column_blocks(100, n_threads=2, block_size=50)
+    assert len(blocks) == 8
+    assert np.array_equal(np.hstack([np.arange(100)[block] for block in blocks]), np.arange(100))
+
+
+@pytest.mark.parametrize("backend", ["threads", "processes"])
+def test_map_column_blocks(backend):
+    """Test that parallel blocks give the same results as a single call to the kernel."""
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(20, 101))
+
+    cumsum = functools.partial(np.cumsum, axis=0)
+    expected = cumsum(data)
+    for n_threads in (1, 2):
+        result = parallel.map_column_blocks(
+            cumsum,
+            data,
+            n_out_rows=20,
+            n_threads=n_threads,
+            backend=backend,
+        )
+        np.testing.assert_array_equal(result, expected)
+
+    # Kernels can return one value per column.
+    result = parallel.map_column_blocks(
+        functools.partial(np.sum, axis=0),
+        data,
+        n_threads=2,
+        block_size=7,
+        backend=backend,
+    )
+    np.testing.assert_array_equal(result, np.sum(data, axis=0))
+
+    with pytest.raises(ValueError, match="shape"):
+        parallel.map_column_blocks(cumsum, data, out=np.empty((20, 3)), backend=backend)
+
+
+def test_parallel_kernels():
+    """Test that the parallelized kernels don't depend on the number of threads.
+
+    Vectorized routines may round differently for blocks of different widths,
+    so results are compared to within a few units in the last place.
+    """
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(60, 50))
+    adjacency_matrix = (rng.random((50, 50)) < 0.1).astype(np.uint8)
+    adjacency_matrix = adjacency_matrix + adjacency_matrix.T
+
+    filtered = butter_bandpass(data, 0.5, 0.08, 0.01, padlen=59)
+    alff = compute_alff(data.T, 0.08, 0.01, 2.0)
+    reho = compute_2d_reho(data.T, adjacency_matrix)
+    for n_threads in (2, 3):
+        np.testing.assert_allclose(
+            butter_bandpass(data, 0.5, 0.08, 0.01, padlen=59, n_threads=n_threads),
+            filtered,
+            rtol=1e-12,
+        )
+        np.testing.assert_allclose(
+            compute_alff(data.T, 0.08, 0.01, 2.0, n_threads),
+            alff,
+            rtol=1e-12,
+        )
+        np.testing.assert_allclose(
+            compute_2d_reho(data.T, adjacency_matrix, n_threads),
+            reho,
+            rtol=1e-12,
+        )
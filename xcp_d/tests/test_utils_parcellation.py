@@ -0,0 +1,103 @@
+"""Tests for the xcp_d.utils.parcellation module."""
+import os
+
+import nibabel as nb
+import numpy as np
+import pytest
+
+from xcp_d.utils import parcellation
+
+
+def test_parcellation_operator(tmp_path_factory):
+    """Compare the sparse operator to a parcel-by-parcel loop."""
+    tmpdir = tmp_path_factory.mktemp("test_parcellation_operator")
+
+    rng = np.random.default_rng(0)
+    atlas_arr = rng.integers(0, 8, size=(6, 7, 8)).astype(np.int16)
+    atlas_arr[atlas_arr == 4] = 0  # A parcel that was lost by resampling
+    atlas_file = os.path.join(tmpdir, "atlas.nii.gz")
+    nb.Nifti1Image(atlas_arr, np.eye(4)).to_filename(atlas_file)
+
+    operator = parcellation.get_parcellation_operator(atlas_file)
+    assert operator.shape == atlas_arr.shape
+    assert np.array_equal(operator.labels, [1, 2, 3, 5, 6, 7])
+
+    data = rng.normal(size=(20, atlas_arr.size))
+    data[3, :10] = np.nan
+    good_elements = rng.random(atlas_arr.size) > 0.3
+
+    flat_atlas = atlas_arr.ravel()
+    parcel_means, coverage = operator.parcellate(
+        data[:, operator.element_idx],
+        good_elements[operator.element_idx],
+    )
+    for i_parcel, label in enumerate(operator.labels):
+        in_parcel = flat_atlas == label
+        expected_coverage = good_elements[in_parcel].mean()
+        expected_means = np.nanmean(data[:, in_parcel & good_elements], axis=1)
+        assert np.isclose(coverage[i_parcel], expected_coverage)
+        assert np.allclose(parcel_means[:, i_parcel], expected_means)
+
+    # Blocks of volumes parcellated in parallel give the same results.
+    parallel_means, parallel_coverage = operator.parcellate(
+        data[:, operator.element_idx],
+        good_elements[operator.element_idx],
+        n_threads=2,
+    )
+    np.testing.assert_array_equal(parallel_means, parcel_means)
+    np.testing.assert_array_equal(parallel_coverage, coverage)
+
+
+def test_precomputed_atlases(tmp_path_factory, monkeypatch):
+    """Test that precomputed atlases are found by name and grid, and used with their operators."""
+    tmpdir = tmp_path_factory.mktemp("test_precomputed_atlases")
+
+    grid = parcellation.PRECOMPUTED_GRIDS["nifti"]
+    operator_dir = os.path.join(tmpdir, "operators")
+    os.makedirs(operator_dir)
+
+    rng = np.random.default_rng(0)
+    shape, affine = (6, 7, 8), np.diag([-2, 2, 2, 1])
+    for atlas_name in ("A", "B"):
+        prefix = os.path.join(operator_dir, f"atlas-{atlas_name}_{grid}")
+        atlas_arr = rng.integers(0, 5, size=shape).astype(np.int16)
+        nb.Nifti1Image(atlas_arr, affine).to_filename(f"{prefix}_dseg.nii.gz")
+        operator = parcellation.ParcellationOperator.from_labels(atlas_arr.ravel(), shape)
+        operator.save(f"{prefix}_operator.npz")
+
+    atlas_file, parcellated_atlas_file = parcellation.get_precomputed_atlas_files(
+        "B",
+        grid,
+        operator_dir=operator_dir,
+    )
+    assert atlas_file == os.path.join(operator_dir, f"atlas-B_{grid}_dseg.nii.gz")
+    assert parcellated_atlas_file is None
+    with pytest.raises(FileNotFoundError, match="DNE"):
+        parcellation.get_precomputed_atlas_files("C", grid, operator_dir=operator_dir)
+
+    # The stored operator is loaded instead of being rebuilt from the atlas's labels.
+    with monkeypatch.context() as m:
+        m.setattr(parcellation, "_load_label_array", None)
+        loaded_operator = parcellation.get_parcellation_operator(atlas_file)
+
+    assert loaded_operator.shape == shape
+    np.testing.assert_array_equal(loaded_operator.labels, operator.labels)
+    data = rng.normal(size=(5, atlas_arr.size))
+    np.testing.assert_array_equal(
+        loaded_operator.parcellate(data[:, loaded_operator.element_idx])[0],
+        operator.parcellate(data[:, operator.element_idx])[0],
+    )
+
+    # BOLD data on the grid use the precomputed atlases.
+    bold_file = os.path.join(tmpdir, f"sub-01_task-rest_{grid}_desc-preproc_bold.nii.gz")
+    nb.Nifti1Image(np.zeros(shape + (3,), dtype=np.float32), affine).to_filename(bold_file)
+    assert parcellation.get_precomputed_grid(bold_file, False, ["A", "B"], operator_dir) == grid
+    # Unless an atlas is missing, the grid doesn't match, or the space is different.
+    assert parcellation.get_precomputed_grid(bold_file, False, ["A", "C"], operator_dir) is None
+    assert parcellation.get_precomputed_grid(bold_file, True, ["A", "B"], operator_dir) is None
+
+    nb.Nifti1Image(np.zeros(shape + (3,), dtype=np.float32), np.eye(4)).to_filename(bold_file)
+    assert parcellation.get_precomputed_grid(bold_file, False, ["A", "B"], operator_dir) is None
+
+    other_file = os.path.join(tmpdir, "sub-01_task-rest_space-MNI152NLin6Asym_res-1_bold.nii.gz")
+    assert parcellation.get_precomputed_grid(other_file, False, ["A", "B"], operator_dir) is None
@@ -0,0 +1,98 @@
+"""Tests for the xcp_d.utils.profiling module."""
+import json
+import os
+
+import nibabel as nb
+import numpy as np
+import pandas as pd
+import pytest
+
+from xcp_d.cli import profile_summary
+from xcp_d.interfaces.restingstate import ComputeALFF
+from xcp_d.utils import profiling
+
+
+def test_profile_run(tmp_path_factory, monkeypatch):
+    """Test that profiled interfaces write per-phase traces, which can be summarized."""
+    tmpdir = tmp_path_factory.mktemp("test_profile_run")
+    profile_dir = os.path.join(tmpdir, "profiles")
+
+    rng = np.random.default_rng(0)
+    in_file = os.path.join(tmpdir, "bold.nii.gz")
+    nb.Nifti1Image(rng.normal(size=(5, 5, 5, 50)).astype(np.float32), np.eye(4)).to_filename(
+        in_file
+    )
+    mask_file = os.path.join(tmpdir, "mask.nii.gz")
+    nb.Nifti1Image(np.ones((5, 5, 5), dtype=np.uint8), np.eye(4)).to_filename(mask_file)
+
+    def _run_alff(node_name):
+        node_dir = os.path.join(tmpdir, "single_subject_01_wf", node_name)
+        os.makedirs(node_dir)
+        ComputeALFF(
+            in_file=in_file,
+            mask=mask_file,
+            TR=2,
+            low_pass=0.08,
+            high_pass=0.01,
+        ).run(cwd=node_dir)
+
+    # Profiling is disabled by default.
+    monkeypatch.delenv(profiling.PROFILE_DIR_ENV, raising=False)
+    _run_alff("alff_disabled")
+    assert not os.path.exists(profile_dir)
+
+    monkeypatch.setenv(profiling.PROFILE_DIR_ENV, profile_dir)
+    _run_alff("alff_1")
+    _run_alff("alff_2")
+    trace_files = sorted(os.listdir(profile_dir))
+    assert len(trace_files) == 2
+    assert all(f.startswith("ComputeALFF_") for f in trace_files)
+
+    with open(os.path.join(profile_dir, trace_files[0]), "r") as fobj:
+        trace = json.load(fobj)
+
+    assert trace["interface"] == "ComputeALFF"
+    assert trace["subject"] == "01"
+    assert trace["status"] == "succeeded"
+    assert [p["phase"] for p in trace["phases"]] == ["load", "compute", "write"]
+    assert sum(p["wall_time"] for p in trace["phases"]) <= trace["wall_time"]
+    # The data are loaded as float32, so loading takes at least 5 * 5 * 5 * 50 * 4 bytes.
+    assert trace["phases"][0]["peak_memory_mb"] * 2**20 >= 5 * 5 * 5 * 50 * 4
+
+    out_file = os.path.join(tmpdir, "summary.tsv")
+    profile_summary.main([str(tmpdir), "-o", out_file])
+    summary = pd.read_table(out_file)
+    assert set(summary["phase"]) == {"total", "load", "compute", "write"}
+    assert (summary["n_runs"] == 2).all()
+    assert (summary["n_subjects"] == 1).all()
+    total = summary.loc[summary["phase"] == "total"].iloc[0]
+    assert total["fraction_of_wall_time"] == 1
+    assert summary["fraction_of_wall_time"].iloc[0] == 1  # sorted by total wall time
+
+
+@pytest.mark.parametrize("has_reset_peak", [True, False])
+def test_node_profiler_phase_peaks(tmp_path_factory, monkeypatch, has_reset_peak):
+    """Test that memory freed in a later phase isn't counted, with or without reset_peak.
+
+    tracemalloc.reset_peak is missing on Python 3.8, where tracing is restarted instead.
+    """
+    tmpdir = tmp_path_factory.mktemp("test_node_profiler_phase_peaks")
+    if not has_reset_peak:
+        monkeypatch.delattr(profiling.tracemalloc, "reset_peak", raising=False)
+
+    with profiling.NodeProfiler("Test", str(tmpdir)) as profiler:
+        profiler.start_phase("allocate")
+        data = np.ones(2**20)  # 8 MB
+        profiler.start_phase("free")
+        del data
+        profiler.start_phase("reallocate")
+        data = np.ones(2**17)  # 1 MB
+        assert data.nbytes == 2**20
+
+    trace = profiler.to_dict()
+    assert [p["phase"] for p in trace["phases"]] == ["allocate", "free", "reallocate"]
+    assert trace["phases"][0]["peak_memory_mb"] >= 8
+    # Neither the freed array nor the memory it used counts towards the later phases.
+    assert trace["phases"][1]["peak_memory_mb"] < 1
+    assert 1 <= trace["phases"][2]["peak_memory_mb"] < 2
+    assert 8 <= trace["peak_memory_mb"] < 9
@@ -1,4 +1,6 @@
 """Tests for the xcp_d.utils.qcmetrics module."""
+import os
+
 import numpy as np
 
 from xcp_d.utils import qcmetrics
@@ -11,3 +13,59 @@ def test_compute_dvars():
 
     dvars = qcmetrics.compute_dvars(data)
     assert dvars.shape == (n_volumes,)
+
+
+def test_make_dcan_df(tmp_path_factory):
+    """Check that the vectorized DCAN QC file matches the threshold-wise definitions."""
+    import h5py
+    import pandas as pd
+
+    tmpdir = tmp_path_factory.mktemp("test_make_dcan_df")
+
+    TR = 2.0
+    rng = np.random.default_rng(0)
+    fd = rng.uniform(0, 0.5, size=50)
+    fd[0] = 0
+    filtered_motion = os.path.join(tmpdir, "motion.tsv")
+    pd.DataFrame({"framewise_displacement": fd}).to_csv(filtered_motion, sep="\t", index=False)
+
+    out_file = os.path.join(tmpdir, "desc-dcan_qc.hdf5")
+    qcmetrics.make_dcan_df(filtered_motion, out_file, TR, compact=True)
+
+    with h5py.File(out_file, "r") as dcan:
+        assert len(dcan["dcan_motion"].keys()) == 101
+        for i_thresh, thresh in enumerate(np.around(np.linspace(0, 1, 101), 2)):
+            group = dcan[f"dcan_motion/fd_{thresh}"]
+            retained_fd = fd[fd <= thresh]
+            assert group["threshold"][()] == thresh
+            assert group["skip"][()] == 0
+            assert group["total_frame_count"][()] == fd.size
+            assert group["remaining_total_frame_count"][()] == retained_fd.size
+            assert group["remaining_seconds"][()] == retained_fd.size * TR
+            assert np.allclose(group["remaining_frame_mean_FD"][()], retained_fd.mean())
+            assert np.array_equal(group["binary_mask"][()], (fd > thresh).astype(float))
+            assert np.array_equal(
+                dcan["dcan_motion_compact/binary_mask"][i_thresh, :],
+                (fd > thresh).astype(np.uint8),
+            )
+
+        assert dcan["dcan_motion_compact/binary_mask"].shape == (101, fd.size)
+
+
+def test_make_dcan_qc_file(tmp_path_factory, monkeypatch):
+    """Check that the DCAN QC node writes both the DCAN-format and compact groups."""
+    import h5py
+    import pandas as pd
+
+    tmpdir = tmp_path_factory.mktemp("test_make_dcan_qc_file")
+    filtered_motion = os.path.join(tmpdir, "motion.tsv")
+    fd = np.linspace(0, 0.5, 20)
+    pd.DataFrame({"framewise_displacement": fd}).to_csv(filtered_motion, sep="\t", index=False)
+
+    monkeypatch.chdir(tmpdir)
+    dcan_df_file = qcmetrics.make_dcan_qc_file(filtered_motion, 2.0)
+
+    with h5py.File(dcan_df_file, "r") as dcan:
+        assert len(dcan["dcan_motion"].keys()) == 101
+        assert dcan["dcan_motion_compact/binary_mask"].shape == (101, fd.size)
+        assert dcan["dcan_motion_compact/remaining_seconds"].shape == (101,)
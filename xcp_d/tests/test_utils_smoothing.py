@@ -0,0 +1,288 @@
+"""Tests for the xcp_d.utils.smoothing module."""
+import os
+import shutil
+import subprocess
+
+import nibabel as nb
+import numpy as np
+import pytest
+from nilearn.image import smooth_img
+from scipy.spatial import Delaunay
+
+from xcp_d.interfaces.smoothing import GaussianSmooth
+from xcp_d.utils import smoothing
+from xcp_d.utils.utils import fwhm2sigma
+
+
+def _make_grid_surface(out_file, n_side=15, spacing=1.0):
+    """Write a flat, triangulated square grid as a GIFTI surface."""
+    x, y = np.meshgrid(np.arange(n_side) * spacing, np.arange(n_side) * spacing, indexing="ij")
+    coords = np.column_stack((x.ravel(), y.ravel(), np.zeros(n_side**2))).astype(np.float32)
+    idx = np.arange(n_side**2).reshape(n_side, n_side)
+    lower = np.column_stack((idx[:-1, :-1].ravel(), idx[1:, :-1].ravel(), idx[:-1, 1:].ravel()))
+    upper = np.column_stack((idx[1:, :-1].ravel(), idx[1:, 1:].ravel(), idx[:-1, 1:].ravel()))
+    faces = np.vstack((lower, upper)).astype(np.int32)
+
+    surf_img = nb.gifti.GiftiImage(
+        darrays=[
+            nb.gifti.GiftiDataArray(coords, intent="NIFTI_INTENT_POINTSET"),
+            nb.gifti.GiftiDataArray(faces, intent="NIFTI_INTENT_TRIANGLE"),
+        ]
+    )
+    surf_img.to_filename(out_file)
+    return out_file
+
+
+def _make_cifti(out_file, n_vertices, data=None, intent="ConnDenseScalar"):
+    """Write a CIFTI file with a left cortex (with a "medial wall") and one subcortical ROI."""
+    vertex_mask = np.ones(n_vertices, dtype=bool)
+    vertex_mask[:5] = False
+    cortex = nb.cifti2.BrainModelAxis.from_mask(vertex_mask, name="CORTEX_LEFT")
+    roi = np.zeros((10, 10, 10), dtype=bool)
+    roi[2:7, 3:8, 4:8] = True
+    thalamus = nb.cifti2.BrainModelAxis.from_mask(
+        roi,
+        name="THALAMUS_LEFT",
+        affine=np.diag([2.0, 2.0, 2.0, 1.0]),
+    )
+    brain_models = cortex + thalamus
+    if data is None:
+        data = np.random.default_rng(0).normal(size=(3, len(brain_models)))
+
+    img = nb.Cifti2Image(
+        data.astype(np.float32),
+        (nb.cifti2.ScalarAxis([f"map{i}" for i in range(data.shape[0])]), brain_models),
+    )
+    img.nifti_header.set_intent(intent)
+    img.to_filename(out_file)
+    return out_file
+
+
+def test_smooth_nifti_img():
+    """Test that smooth_nifti_img matches nilearn's smooth_img."""
+    rng = np.random.default_rng(0)
+    img = nb.Nifti1Image(
+        rng.normal(size=(9, 10, 11, 4)).astype(np.float32),
+        np.diag([2.0, 2.5, 3.0, 1.0]),
+    )
+    smoothed_img = smoothing.smooth_nifti_img(img, 6)
+    assert smoothed_img.get_data_dtype() == np.float32
+    np.testing.assert_allclose(
+        smoothed_img.get_fdata(),
+        smooth_img(img, 6).get_fdata(),
+        rtol=1e-4,
+        atol=1e-5,
+    )
+
+    img_3d = nb.Nifti1Image(np.asanyarray(img.dataobj)[..., 0], img.affine)
+    np.testing.assert_allclose(
+        smoothing.smooth_nifti_img(img_3d, [2, 3, 4]).get_fdata(),
+        smooth_img(img_3d, [2, 3, 4]).get_fdata(),
+        rtol=1e-4,
+        atol=1e-5,
+    )
+
+
+def test_geodesic_distances():
+    """Test that geodesic distances on a flat mesh are close to Euclidean distances."""
+    rng = np.random.default_rng(0)
+    n_side = 30
+    x, y = np.meshgrid(np.arange(n_side), np.arange(n_side), indexing="ij")
+    points = np.column_stack((x.ravel(), y.ravel())).astype(np.float64)
+    points += rng.uniform(-0.35, 0.35, size=points.shape)
+    faces = Delaunay(points).simplices
+    coords = np.column_stack((points, np.zeros(points.shape[0])))
+
+    rows, cols, distances = smoothing._geodesic_distances(coords, faces, 8, chunk_size=100)
+    euclidean = np.linalg.norm(coords[rows] - coords[cols], axis=1)
+    assert np.all(distances >= euclidean - 1e-6)
+
+    # Paths along the edges alone are ~7% too long on average here, with a maximum of ~27%.
+    interior = (np.abs(points[rows] - n_side / 2).max(axis=1) < 5) & (euclidean > 3)
+    relative_error = distances[interior] / euclidean[interior] - 1
+    assert relative_error.mean() < 0.03
+    assert relative_error.max() < 0.15
+
+
+def test_cifti_smoothing_kernel(tmp_path_factory, monkeypatch):
+    """Test the CIFTI smoothing kernel and its cache."""
+    tmpdir = tmp_path_factory.mktemp("test_cifti_smoothing_kernel")
+    monkeypatch.delenv("XCPD_KERNEL_CACHE", raising=False)
+    n_side = 15
+    surface_files = {
+        "CIFTI_STRUCTURE_CORTEX_LEFT": _make_grid_surface(os.path.join(tmpdir, "L.surf.gii")),
+    }
+    cifti_file = _make_cifti(os.path.join(tmpdir, "test.dscalar.nii"), n_side**2)
+    brain_models = nb.load(cifti_file).header.get_axis(1)
+    n_vertices = brain_models.surface_mask.sum()
+
+    kernel = smoothing.build_cifti_smoothing_kernel(brain_models, 3, surface_files=surface_files)
+    assert kernel.shape == (len(brain_models), len(brain_models))
+    np.testing.assert_allclose(np.asarray(kernel.sum(axis=1)).ravel(), 1)
+    # Structures are smoothed separately.
+    assert kernel[:n_vertices, n_vertices:].nnz == 0
+    assert kernel[n_vertices:, :n_vertices].nnz == 0
+
+    # Constant data stay constant, and an impulse in the middle of the grid spreads evenly.
+    data = np.ones((1, len(brain_models)), dtype=np.float32)
+    np.testing.assert_allclose(smoothing.smooth_cifti_data(data, kernel), 1, rtol=1e-5)
+    center = np.flatnonzero(brain_models.vertex == (n_side**2) // 2)[0]
+    impulse = np.zeros_like(data)
+    impulse[0, center] = 1
+    smoothed = smoothing.smooth_cifti_data(impulse, kernel)[0, :n_vertices]
+    assert smoothed.argmax() == center
+    neighbors = [center - 1, center + 1]
+    np.testing.assert_allclose(smoothed[neighbors], smoothed[neighbors[0]], rtol=1e-5)
+
+    # The kernel is cached and reused.
+    cache_dir = os.path.join(tmpdir, "cache")
+    cached = smoothing.get_cifti_smoothing_kernel(
+        cifti_file,
+        3,
+        cache_dir=cache_dir,
+        surface_files=surface_files,
+    )
+    assert len(os.listdir(cache_dir)) == 1
+    assert (cached != kernel).nnz == 0
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("The kernel should have been loaded from the cache.")
+
+    monkeypatch.setattr(smoothing, "build_cifti_smoothing_kernel", _fail)
+    reloaded = smoothing.get_cifti_smoothing_kernel(
+        cifti_file,
+        3,
+        cache_dir=cache_dir,
+        surface_files=surface_files,
+    )
+    assert np.allclose(reloaded.toarray(), kernel.toarray())
+
+    # A different FWHM gets a different kernel.
+    with pytest.raises(AssertionError, match="loaded from the cache"):
+        smoothing.get_cifti_smoothing_kernel(
+            cifti_file,
+            4,
+            cache_dir=cache_dir,
+            surface_files=surface_files,
+        )
+
+    # Without a cache directory, the kernel is always built.
+    with pytest.raises(AssertionError, match="loaded from the cache"):
+        smoothing.get_cifti_smoothing_kernel(cifti_file, 3, surface_files=surface_files)
+
+    # The environment variable overrides the cache directory.
+    monkeypatch.setenv("XCPD_KERNEL_CACHE", os.path.join(tmpdir, "env_cache"))
+    with pytest.raises(AssertionError, match="loaded from the cache"):
+        smoothing.get_cifti_smoothing_kernel(
+            cifti_file,
+            3,
+            cache_dir=cache_dir,
+            surface_files=surface_files,
+        )
+
+
+def test_gaussiansmooth_cifti_intent(tmp_path_factory, monkeypatch):
+    """Test that GaussianSmooth writes CIFTIs with the intent that matches their extension."""
+    tmpdir = tmp_path_factory.mktemp("test_gaussiansmooth_cifti_intent")
+    surface_files = {
+        "CIFTI_STRUCTURE_CORTEX_LEFT": _make_grid_surface(os.path.join(tmpdir, "L.surf.gii")),
+    }
+    monkeypatch.setattr(smoothing, "SURFACE_FILES", surface_files)
+
+    # Workbench-style output, with a dtseries intent in a dscalar file.
+    cifti_file = _make_cifti(
+        os.path.join(tmpdir, "test.dscalar.nii"),
+        15**2,
+        intent="ConnDenseSeries",
+    )
+    interface = GaussianSmooth(in_file=cifti_file, fwhm=3, cache_dir=str(tmpdir / "cache"))
+    results = interface.run(cwd=tmpdir)
+
+    out_file = results.outputs.out_file
+    assert out_file.endswith("_smoothed.dscalar.nii")
+    out_img = nb.load(out_file)
+    assert out_img.nifti_header.get_intent()[0] == "ConnDenseScalar"
+    assert out_img.shape == nb.load(cifti_file).shape
+    assert np.std(out_img.get_fdata()) < np.std(nb.load(cifti_file).get_fdata())
+
+    # Other surfaces can be used for the cortical vertices.
+    interface = GaussianSmooth(
+        in_file=cifti_file,
+        fwhm=3,
+        left_surf=_make_grid_surface(os.path.join(tmpdir, "L2.surf.gii"), spacing=2.0),
+        cache_dir=str(tmpdir / "cache"),
+    )
+    wide_img = nb.load(interface.run(cwd=tmpdir).outputs.out_file)
+    n_vertices = out_img.header.get_axis(1).surface_mask.sum()
+    assert len(os.listdir(tmpdir / "cache")) == 2
+    assert np.std(wide_img.get_fdata()[:, :n_vertices]) > np.std(
+        out_img.get_fdata()[:, :n_vertices]
+    )
+    np.testing.assert_allclose(
+        wide_img.get_fdata()[:, n_vertices:],
+        out_img.get_fdata()[:, n_vertices:],
+    )
+
+
+@pytest.mark.skipif(shutil.which("wb_command") is None, reason="Workbench is not installed.")
+def test_gaussiansmooth_workbench(tmp_path_factory):
+    """Compare GaussianSmooth to wb_command -cifti-smoothing on a CIFTI file."""
+    tmpdir = tmp_path_factory.mktemp("test_gaussiansmooth_workbench")
+    rng = np.random.default_rng(0)
+    n_side, fwhm = 25, 4
+
+    # A gently curved, irregular surface.
+    x, y = np.meshgrid(np.arange(n_side), np.arange(n_side), indexing="ij")
+    points = np.column_stack((x.ravel(), y.ravel())).astype(np.float64)
+    points += rng.uniform(-0.3, 0.3, size=points.shape)
+    z = 2 * np.sin(points[:, 0] / 5)
+    surf_file = os.path.join(tmpdir, "L.surf.gii")
+    nb.gifti.GiftiImage(
+        darrays=[
+            nb.gifti.GiftiDataArray(
+                np.column_stack((points, z)).astype(np.float32),
+                intent="NIFTI_INTENT_POINTSET",
+            ),
+            nb.gifti.GiftiDataArray(
+                Delaunay(points).simplices.astype(np.int32),
+                intent="NIFTI_INTENT_TRIANGLE",
+            ),
+        ]
+    ).to_filename(surf_file)
+
+    cifti_file = _make_cifti(
+        os.path.join(tmpdir, "test.dscalar.nii"),
+        n_side**2,
+        data=rng.normal(size=(2, n_side**2 - 5 + 100)),
+    )
+
+    results = GaussianSmooth(in_file=cifti_file, fwhm=fwhm, left_surf=surf_file).run(cwd=tmpdir)
+    xcpd_data = nb.load(results.outputs.out_file).get_fdata()
+
+    sigma = fwhm2sigma(fwhm)
+    wb_file = os.path.join(tmpdir, "wb_smoothed.dscalar.nii")
+    subprocess.run(
+        [
+            "wb_command",
+            "-cifti-smoothing",
+            cifti_file,
+            str(sigma),
+            str(sigma),
+            "COLUMN",
+            wb_file,
+            "-left-surface",
+            surf_file,
+        ],
+        check=True,
+    )
+    wb_data = nb.load(wb_file).get_fdata()
+    assert xcpd_data.shape == wb_data.shape
+
+    # Residual differences come from the geodesic approximation and the kernel truncation,
+    # so they are small relative to the smoothed data.
+    scale = np.std(wb_data, axis=1, keepdims=True)
+    diff = np.abs(xcpd_data - wb_data) / scale
+    assert np.median(diff) < 0.02
+    assert np.max(diff) < 0.1
+    for xcpd_map, wb_map in zip(xcpd_data, wb_data):
+        assert np.corrcoef(xcpd_map, wb_map)[0, 1] > 0.995
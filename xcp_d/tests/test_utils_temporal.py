@@ -0,0 +1,97 @@
+"""Tests for the xcp_d.utils.temporal module."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.interpolate import CubicSpline
+
+from xcp_d.utils import temporal, utils
+
+
+def test_interpolate_volumes():
+    """Test that the interpolation operator matches per-voxel cubic spline interpolation."""
+    n_volumes, n_voxels, TR = 60, 50, 2
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(n_volumes, n_voxels))
+    sample_mask = np.ones(n_volumes, dtype=bool)
+    # Censor volumes at the edges of the run, so extrapolation is covered too.
+    sample_mask[[0, 1, 10, 11, 12, 30, 58, 59]] = False
+
+    frame_times = np.arange(n_volumes) * TR
+    spline = CubicSpline(frame_times[sample_mask], data[sample_mask, :])
+    expected = data.copy()
+    expected[~sample_mask, :] = spline(frame_times[~sample_mask])
+
+    operator = temporal.build_interpolation_operator(sample_mask, TR)
+    assert operator.shape == (n_volumes, sample_mask.sum())
+    np.testing.assert_array_equal(operator[sample_mask, :], np.eye(sample_mask.sum()))
+
+    # Small blocks, so that the columns are interpolated in several blocks.
+    interpolated = temporal.interpolate_volumes(data.copy(), sample_mask, TR, block_size=7)
+    np.testing.assert_allclose(interpolated, expected, atol=1e-10)
+
+    # float32 data stay float32.
+    interpolated = temporal.interpolate_volumes(data.astype(np.float32), sample_mask, TR)
+    assert interpolated.dtype == np.float32
+    np.testing.assert_allclose(interpolated, expected, atol=1e-4)
+
+    # Nothing to interpolate.
+    all_kept = np.ones(n_volumes, dtype=bool)
+    np.testing.assert_array_equal(temporal.interpolate_volumes(data.copy(), all_kept, TR), data)
+
+    with pytest.raises(ValueError, match="At least two retained volumes"):
+        temporal.build_interpolation_operator(np.eye(1, n_volumes, dtype=bool)[0], TR)
+
+    with pytest.raises(ValueError, match="does not match"):
+        temporal.apply_temporal_operator(operator, data)
+
+
+def test_interpolate_and_filter_operator(tmp_path_factory):
+    """Test that the composed operator matches interpolation followed by filtering."""
+    tmpdir = tmp_path_factory.mktemp("test_interpolate_and_filter_operator")
+    n_volumes, n_voxels, TR = 200, 100, 0.8
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(n_volumes, n_voxels)).astype(np.float32)
+    censored = np.zeros(n_volumes, dtype=int)
+    censored[[0, 50, 51, 52, 120, 199]] = 1
+    temporal_mask = os.path.join(tmpdir, "temporal_mask.tsv")
+    pd.DataFrame({"framewise_displacement": censored}).to_csv(
+        temporal_mask,
+        sep="\t",
+        index=False,
+    )
+
+    filters = [
+        {"low_pass": 0.08, "high_pass": 0.01},
+        {"low_pass": 0.08, "high_pass": 0},
+        {"low_pass": 0, "high_pass": 0.01},
+    ]
+    for filter_ in filters:
+        kwargs = {
+            "preprocessed_bold": data,
+            "confounds_file": None,
+            "temporal_mask": temporal_mask,
+            "filter_order": 2,
+            "TR": TR,
+            **filter_,
+        }
+        _, sequential = utils.denoise_with_nilearn(compose_filter=False, **kwargs)
+        _, composed = utils.denoise_with_nilearn(compose_filter=True, **kwargs)
+        assert composed.dtype == sequential.dtype == np.float32
+        np.testing.assert_allclose(composed, sequential, atol=1e-4, rtol=1e-4)
+
+    # The band-pass operator is butter_bandpass, applied to every column at once.
+    operator = temporal.build_bandpass_operator(
+        n_volumes,
+        sampling_rate=1 / TR,
+        low_pass=0.08,
+        high_pass=0.01,
+        padlen=n_volumes - 1,
+    )
+    data = data.astype(np.float64)
+    np.testing.assert_allclose(
+        operator @ data,
+        utils.butter_bandpass(data, 1 / TR, 0.08, 0.01, padlen=n_volumes - 1),
+        atol=1e-10,
+    )
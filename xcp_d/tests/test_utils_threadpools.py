@@ -0,0 +1,43 @@
+"""Tests for the xcp_d.utils.threadpools module."""
+from nipype.interfaces.base import (
+    BaseInterfaceInputSpec,
+    SimpleInterface,
+    TraitedSpec,
+    traits,
+)
+from threadpoolctl import threadpool_info
+
+from xcp_d.utils.threadpools import limit_threads
+
+
+class _ThreadCountInputSpec(BaseInterfaceInputSpec):
+    num_threads = traits.Int(1, usedefault=True, nohash=True)
+
+
+class _ThreadCountOutputSpec(TraitedSpec):
+    max_threads = traits.Int()
+
+
+class _ThreadCount(SimpleInterface):
+    """Report the largest BLAS/OpenMP thread pool during the run."""
+
+    input_spec = _ThreadCountInputSpec
+    output_spec = _ThreadCountOutputSpec
+
+    @limit_threads
+    def _run_interface(self, runtime):
+        self._results["max_threads"] = max(pool["num_threads"] for pool in threadpool_info())
+        return runtime
+
+
+def test_limit_threads():
+    """Test that limit_threads caps the thread pools during the run, and restores them after."""
+    before = {pool["filepath"]: pool["num_threads"] for pool in threadpool_info()}
+    n_threads = max(before.values())
+    for num_threads in (0, 1, n_threads):
+        results = _ThreadCount(num_threads=num_threads).run()
+        assert results.outputs.max_threads <= max(num_threads, 1)
+
+    # SciPy's BLAS library is loaded by the decorator, so only compare the pools from before.
+    after = {pool["filepath"]: pool["num_threads"] for pool in threadpool_info()}
+    assert {filepath: after[filepath] for filepath in before} == before
@@ -153,6 +153,58 @@ def test_denoise_with_nilearn(ds001419_data, tmp_path_factory):
     assert interpolated_filtered_bold.shape == (n_volumes, n_voxels)
 
 
+def test_denoise_strategies_with_nilearn(tmp_path_factory):
+    """Test that denoising several strategies at once matches denoise_with_nilearn."""
+    tmpdir = tmp_path_factory.mktemp("test_denoise_strategies_with_nilearn")
+
+    n_volumes, n_voxels, TR = 100, 50, 2
+    rng = np.random.default_rng(0)
+    data_arr = rng.standard_normal((n_volumes, n_voxels))
+
+    censoring_df = pd.DataFrame(columns=["framewise_displacement"], data=np.zeros((n_volumes, 1)))
+    censoring_df.loc[[10, 11, 50, 98, 99], "framewise_displacement"] = 1
+    temporal_mask = os.path.join(tmpdir, "censoring.tsv")
+    censoring_df.to_csv(temporal_mask, sep="\t", index=False)
+
+    confounds_files = []
+    for n_regressors in (3, 6):
+        confounds_df = pd.DataFrame(
+            rng.standard_normal((n_volumes, n_regressors)),
+            columns=[f"confound_{i}" for i in range(n_regressors)],
+        )
+        confounds_df["linear_trend"] = np.arange(n_volumes)
+        confounds_df["intercept"] = np.ones(n_volumes)
+        confounds_file = os.path.join(tmpdir, f"confounds_{n_regressors}.tsv")
+        confounds_df.to_csv(confounds_file, sep="\t", index=False)
+        confounds_files.append(confounds_file)
+
+    confounds_files.insert(1, None)
+    sample_mask = ~censoring_df["framewise_displacement"].to_numpy().astype(bool)
+    for low_pass, high_pass in ((0.08, 0.01), (None, None)):
+        strategies = utils.denoise_strategies_with_nilearn(
+            preprocessed_bold=data_arr,
+            confounds_files=confounds_files,
+            temporal_mask=temporal_mask,
+            low_pass=low_pass,
+            high_pass=high_pass,
+            filter_order=2,
+            TR=TR,
+            block_size=16,
+        )
+        for confounds_file, censored_denoised_bold in zip(confounds_files, strategies):
+            _, interpolated_filtered_bold = utils.denoise_with_nilearn(
+                preprocessed_bold=data_arr,
+                confounds_file=confounds_file,
+                temporal_mask=temporal_mask,
+                low_pass=low_pass,
+                high_pass=high_pass,
+                filter_order=2,
+                TR=TR,
+            )
+            assert censored_denoised_bold.shape == (sample_mask.sum(), n_voxels)
+            assert np.allclose(censored_denoised_bold, interpolated_filtered_bold[sample_mask, :])
+
+
 def test_list_to_str():
     """Test the list_to_str function."""
     lst = ["a"]
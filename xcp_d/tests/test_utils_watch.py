@@ -0,0 +1,133 @@
+"""Tests for the xcp_d.utils.watch module."""
+import os
+
+from xcp_d.utils import watch
+
+
+def _touch(path, content=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fo:
+        fo.write(content)
+
+    return path
+
+
+def _write_run(fmri_dir, prefix):
+    """Write the files of one preprocessed NIfTI run."""
+    subject = prefix.split("_")[0]
+    session = [part for part in prefix.split("_") if part.startswith("ses-")]
+    func_dir = os.path.join(fmri_dir, subject, *session, "func")
+    for suffix in (
+        "space-MNI152NLin2009cAsym_desc-preproc_bold.nii.gz",
+        "space-MNI152NLin2009cAsym_desc-brain_mask.nii.gz",
+        "desc-confounds_timeseries.tsv",
+    ):
+        _touch(os.path.join(func_dir, f"{prefix}_{suffix}"))
+
+    return func_dir
+
+
+def test_scan_preprocessed_runs(tmp_path_factory):
+    """Test that runs are found, filtered, and given signatures that track their files."""
+    fmri_dir = str(tmp_path_factory.mktemp("test_scan_preprocessed_runs"))
+    func_dir = _write_run(fmri_dir, "sub-01_ses-1_task-rest_run-1")
+    _write_run(fmri_dir, "sub-01_ses-2_task-nback")
+    _write_run(fmri_dir, "sub-02_task-rest")
+    # Runs without a preprocessed BOLD file are not post-processed.
+    _touch(
+        os.path.join(fmri_dir, "sub-03", "func", "sub-03_task-rest_desc-confounds_timeseries.tsv")
+    )
+
+    runs = watch.scan_preprocessed_runs(fmri_dir)
+    assert sorted(runs) == [
+        "sub-01_ses-1_task-rest_run-1",
+        "sub-01_ses-2_task-nback",
+        "sub-02_task-rest",
+    ]
+    assert runs["sub-01_ses-2_task-nback"]["session"] == "2"
+    assert runs["sub-02_task-rest"]["session"] is None
+
+    runs = watch.scan_preprocessed_runs(fmri_dir, participant_label=["sub-01"], task_id="rest")
+    assert sorted(runs) == ["sub-01_ses-1_task-rest_run-1"]
+    assert watch.scan_preprocessed_runs(fmri_dir, cifti=True) == {}
+
+    # Any change to a run's files changes its signature.
+    _touch(
+        os.path.join(func_dir, "sub-01_ses-1_task-rest_run-1_desc-confounds_timeseries.tsv"), "a"
+    )
+    new_runs = watch.scan_preprocessed_runs(fmri_dir, participant_label=["01"], task_id="rest")
+    signature = runs["sub-01_ses-1_task-rest_run-1"]["signature"]
+    assert new_runs["sub-01_ses-1_task-rest_run-1"]["signature"] != signature
+
+
+def test_find_settled_runs():
+    """Test that only new or changed runs whose files have stopped changing are selected."""
+    previous_runs = {
+        "sub-01_task-rest": {"subject": "01", "session": None, "signature": "a"},
+        "sub-02_task-rest": {"subject": "02", "session": None, "signature": "b"},
+        "sub-03_task-rest": {"subject": "03", "session": None, "signature": "c"},
+    }
+    current_runs = {
+        "sub-01_task-rest": {"subject": "01", "session": None, "signature": "a"},
+        "sub-02_task-rest": {"subject": "02", "session": None, "signature": "b2"},
+        "sub-03_task-rest": {"subject": "03", "session": None, "signature": "c"},
+        "sub-04_task-rest": {"subject": "04", "session": None, "signature": "d"},
+    }
+    state = {"sub-01_task-rest": "a"}
+
+    settled_runs = watch.find_settled_runs(previous_runs, current_runs, state)
+    assert sorted(settled_runs) == ["sub-03_task-rest"]
+
+
+def test_group_runs_and_restrict_bids_filters():
+    """Test that runs are grouped by participant, with sessions when every run has one."""
+    runs = {
+        "sub-01_ses-2_task-rest": {"subject": "01", "session": "2"},
+        "sub-01_ses-1_task-rest": {"subject": "01", "session": "1"},
+        "sub-01_ses-1_task-nback": {"subject": "01", "session": "1"},
+        "sub-02_ses-1_task-rest": {"subject": "02", "session": "1"},
+        "sub-02_task-rest": {"subject": "02", "session": None},
+    }
+    assert watch.group_runs(runs) == {"01": ["1", "2"], "02": None}
+
+    assert watch.restrict_bids_filters(None, None) is None
+    assert watch.restrict_bids_filters(None, ["1"]) == {"bold": {"session": ["1"]}}
+
+    bids_filters = {"bold": {"session": "2", "task": "rest"}, "t1w": {"space": None}}
+    restricted = watch.restrict_bids_filters(bids_filters, ["1", "2"])
+    assert restricted == {"bold": {"session": ["2"], "task": "rest"}, "t1w": {"space": None}}
+    # The original filters are not modified.
+    assert bids_filters["bold"]["session"] == "2"
+
+
+def test_watch_dataset(tmp_path_factory):
+    """Test that new runs are post-processed once, and that the state survives restarts."""
+    tmpdir = tmp_path_factory.mktemp("test_watch_dataset")
+    fmri_dir = os.path.join(tmpdir, "fmriprep")
+    xcpd_dir = os.path.join(tmpdir, "xcp_d")
+    _write_run(fmri_dir, "sub-01_ses-1_task-rest")
+    _write_run(fmri_dir, "sub-02_ses-1_task-rest")
+
+    batches = []
+
+    def process_batch(subject, sessions):
+        batches.append((subject, sessions))
+        return int(subject == "02")
+
+    # The failed run isn't retried by later polls, since its files don't change.
+    failed_runs = watch.watch_dataset(
+        fmri_dir, xcpd_dir, process_batch, interval=0.01, n_workers=2, max_polls=3
+    )
+    assert sorted(batches) == [("01", ["1"]), ("02", ["1"])]
+    assert list(failed_runs) == ["sub-02_ses-1_task-rest"]
+    assert list(watch.load_watch_state(xcpd_dir)) == ["sub-01_ses-1_task-rest"]
+
+    # After a restart, the new session and the previously failed run are post-processed.
+    batches.clear()
+    _write_run(fmri_dir, "sub-01_ses-2_task-rest")
+    watch.watch_dataset(fmri_dir, xcpd_dir, process_batch, interval=0.01, max_polls=2)
+    assert sorted(batches) == [("01", ["2"]), ("02", ["1"])]
+    assert sorted(watch.load_watch_state(xcpd_dir)) == [
+        "sub-01_ses-1_task-rest",
+        "sub-01_ses-2_task-rest",
+    ]
@@ -1,7 +1,10 @@
 """Tests for the xcp_d.utils.write_save module."""
 import os
 
+import nibabel as nb
+import numpy as np
 import pytest
+from nilearn import masking
 
 from xcp_d.utils import write_save
 
@@ -69,3 +72,109 @@ def test_write_ndata(ds001419_data, tmp_path_factory):
     assert cifti_data_loaded.shape == (91282,)
     # It won't equal exactly 1000
     assert (cifti_data_loaded[1000] - 1000) < 1
+
+
+def test_masked_nifti_round_trip(tmp_path_factory):
+    """Test that NIfTI data are read and written like nilearn's masking functions."""
+    tmpdir = tmp_path_factory.mktemp("test_masked_nifti_round_trip")
+
+    rng = np.random.default_rng(0)
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    mask = np.zeros((10, 11, 12), dtype=np.uint8)
+    mask[2:8, 3:9, 1:10] = 1
+    mask_file = os.path.join(tmpdir, "mask.nii.gz")
+    nb.Nifti1Image(mask, affine).to_filename(mask_file)
+
+    data = rng.normal(size=(10, 11, 12, 7)).astype(np.float32)
+    data[3, 4, 5, 2] = np.nan
+    for in_ext in (".nii", ".nii.gz"):
+        in_file = os.path.join(tmpdir, f"bold{in_ext}")
+        nb.Nifti1Image(data, affine).to_filename(in_file)
+
+        masked_data = write_save.read_ndata(in_file, maskfile=mask_file)
+        assert masked_data.dtype == np.float32
+        np.testing.assert_array_equal(masked_data, masking.apply_mask(in_file, mask_file).T)
+
+        for out_ext in (".nii", ".nii.gz"):
+            # Overwrite the input file, which may still be memory-mapped.
+            out_file = os.path.join(tmpdir, f"bold{out_ext}")
+            write_save.write_ndata(masked_data, in_file, out_file, mask=mask_file, TR=0.8)
+            out_img = nb.load(out_file)
+            assert out_img.get_data_dtype() == np.float32
+            np.testing.assert_allclose(out_img.header.get_zooms(), (2, 2, 2, 0.8))
+            np.testing.assert_array_equal(out_img.affine, affine)
+            np.testing.assert_array_equal(
+                out_img.get_fdata(),
+                masking.unmask(masked_data.T, mask_file).get_fdata(),
+            )
+
+    # Scaled integer data are scaled after masking.
+    scaled_file = os.path.join(tmpdir, "scaled.nii")
+    scaled_img = nb.Nifti1Image(data, affine)
+    scaled_img.set_data_dtype(np.int16)
+    scaled_img.to_filename(scaled_file)
+    np.testing.assert_allclose(
+        write_save.read_ndata(scaled_file, maskfile=mask_file),
+        masking.apply_mask(scaled_file, mask_file).T,
+    )
+
+    # Unscaled integer data are converted to floats.
+    int_file = os.path.join(tmpdir, "int.nii")
+    int_data = rng.integers(-100, 100, size=data.shape, dtype=np.int16)
+    nb.Nifti1Image(int_data, affine).to_filename(int_file)
+    int_masked_data = write_save.read_ndata(int_file, maskfile=mask_file)
+    assert int_masked_data.dtype == np.float32
+    np.testing.assert_array_equal(int_masked_data, int_data[mask.astype(bool)])
+
+    brain_models = nb.cifti2.BrainModelAxis.from_mask(mask, affine=affine)
+    series = nb.cifti2.SeriesAxis(start=0, step=0.8, size=7)
+    int_cifti_file = os.path.join(tmpdir, "int.dtseries.nii")
+    int_cifti_data = int_data[mask.astype(bool)].T
+    nb.Cifti2Image(int_cifti_data, (series, brain_models)).to_filename(int_cifti_file)
+    int_cifti_loaded = write_save.read_ndata(int_cifti_file)
+    assert int_cifti_loaded.dtype == np.float32
+    np.testing.assert_array_equal(int_cifti_loaded, int_cifti_data.T)
+
+    bad_mask_file = os.path.join(tmpdir, "bad_mask.nii.gz")
+    nb.Nifti1Image(mask[:-1], affine).to_filename(bad_mask_file)
+    with pytest.raises(ValueError, match="does not match"):
+        write_save.read_ndata(scaled_file, maskfile=bad_mask_file)
+
+
+def test_create_cifti_memmap(tmp_path_factory):
+    """Test that memory-mapped CIFTIs get the intent that matches their axis types."""
+    tmpdir = tmp_path_factory.mktemp("test_create_cifti_memmap")
+    brain_models = nb.cifti2.BrainModelAxis.from_mask(
+        np.ones((2, 3, 4), dtype=bool), affine=np.eye(4)
+    )
+    parcels_axis = nb.cifti2.ParcelsAxis.from_brain_models(
+        [("parcel1", brain_models[:10]), ("parcel2", brain_models[10:])]
+    )
+
+    # Parcels on the first matrix dimension and grayordinates on the second is a dpconn,
+    # and the reverse is a pdconn.
+    for extension, axes, intent in [
+        (".dpconn.nii", (parcels_axis, brain_models), "ConnDenseParcel"),
+        (".pdconn.nii", (brain_models, parcels_axis), "ConnParcelDense"),
+    ]:
+        out_file = os.path.join(tmpdir, f"test{extension}")
+        out_data = write_save.create_cifti_memmap(out_file, axes)
+        assert out_data.shape == (len(axes[0]), len(axes[1]))
+        out_data[:] = np.arange(out_data.size).reshape(out_data.shape)
+        out_data.flush()
+        del out_data
+
+        img = nb.load(out_file)
+        assert img.nifti_header.get_intent()[0] == intent
+        assert img.header.get_axis(0) == axes[0]
+        assert img.header.get_axis(1) == axes[1]
+        np.testing.assert_array_equal(
+            img.get_fdata(),
+            np.arange(img.shape[0] * img.shape[1]).reshape(img.shape),
+        )
+
+    with pytest.raises(ValueError, match="must have"):
+        write_save.create_cifti_memmap(
+            os.path.join(tmpdir, "bad.pdconn.nii"),
+            (parcels_axis, brain_models),
+        )
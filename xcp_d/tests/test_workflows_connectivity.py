@@ -32,6 +32,7 @@ def test_init_load_atlases_wf_nifti(ds001419_data, tmp_path_factory):
     load_atlases_wf = init_load_atlases_wf(
         output_dir=tmpdir,
         cifti=False,
+        atlas_cache_dir=os.path.join(tmpdir, "atlas_cache"),
         mem_gb=1,
         omp_nthreads=1,
         name="load_atlases_wf",
@@ -54,6 +55,7 @@ def test_init_load_atlases_wf_cifti(ds001419_data, tmp_path_factory):
     load_atlases_wf = init_load_atlases_wf(
         output_dir=tmpdir,
         cifti=True,
+        atlas_cache_dir=os.path.join(tmpdir, "atlas_cache"),
         mem_gb=1,
         omp_nthreads=1,
         name="load_atlases_wf",
@@ -63,10 +65,30 @@ def test_init_load_atlases_wf_cifti(ds001419_data, tmp_path_factory):
     load_atlases_wf.base_dir = tmpdir
     load_atlases_wf_res = load_atlases_wf.run()
     nodes = get_nodes(load_atlases_wf_res)
-    atlas_names = nodes["load_atlases_wf.cast_atlas_to_int16"].get_output("out_file")
+    atlas_names = nodes["load_atlases_wf.resample_atlas_to_data"].get_output("int16_atlas_file")
     assert len(atlas_names) == 14
 
 
+def test_init_load_atlases_wf_precomputed(tmp_path_factory):
+    """Test that init_load_atlases_wf skips resampling on grids with precomputed atlases."""
+    tmpdir = tmp_path_factory.mktemp("test_init_load_atlases_wf_precomputed")
+
+    for cifti, grid in ((False, "space-MNI152NLin6Asym_res-2"), (True, "space-fsLR_den-91k")):
+        load_atlases_wf = init_load_atlases_wf(
+            output_dir=tmpdir,
+            cifti=cifti,
+            atlas_cache_dir=None,
+            mem_gb=1,
+            omp_nthreads=1,
+            precomputed_grid=grid,
+            name="load_atlases_wf",
+        )
+        node_names = load_atlases_wf.list_node_names()
+        assert "get_precomputed_atlases" in node_names
+        assert "warp_atlases_to_bold_space" not in node_names
+        assert "resample_atlas_to_data" not in node_names
+
+
 def test_init_functional_connectivity_nifti_wf(ds001419_data, tmp_path_factory):
     """Test the nifti workflow."""
     tmpdir = tmp_path_factory.mktemp("test_init_functional_connectivity_nifti_wf")
@@ -127,6 +149,7 @@ def test_init_functional_connectivity_nifti_wf(ds001419_data, tmp_path_factory):
     connectivity_wf = init_functional_connectivity_nifti_wf(
         output_dir=tmpdir,
         min_coverage=0.5,
+        connectivity_measures=[],
         alff_available=False,
         mem_gb=4,
         name="connectivity_wf",
@@ -267,6 +290,7 @@ def test_init_functional_connectivity_cifti_wf(ds001419_data, tmp_path_factory):
     connectivity_wf = init_functional_connectivity_cifti_wf(
         output_dir=tmpdir,
         min_coverage=0.5,
+        connectivity_measures=[],
         alff_available=False,
         mem_gb=4,
         omp_nthreads=2,
@@ -5,37 +5,59 @@
 from xcp_d.utils import (
     atlas,
     bids,
+    cache,
+    columnar,
     concatenation,
     confounds,
+    connectivity,
     dcan2fmriprep,
     doc,
     execsummary,
     filemanip,
     hcp2fmriprep,
+    manifest,
     modified_data,
+    parallel,
+    parcellation,
     plotting,
+    profiling,
     qcmetrics,
     restingstate,
     sentry,
+    smoothing,
+    temporal,
+    threadpools,
     utils,
+    watch,
     write_save,
 )
 
 __all__ = [
     "atlas",
     "bids",
+    "cache",
+    "columnar",
     "concatenation",
     "confounds",
+    "connectivity",
     "dcan2fmriprep",
     "doc",
     "execsummary",
     "filemanip",
     "hcp2fmriprep",
+    "manifest",
     "modified_data",
+    "parallel",
+    "parcellation",
     "plotting",
+    "profiling",
     "qcmetrics",
     "restingstate",
     "sentry",
+    "smoothing",
+    "temporal",
+    "threadpools",
     "utils",
+    "watch",
     "write_save",
 ]
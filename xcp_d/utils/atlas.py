@@ -1,4 +1,16 @@
 """Functions for working with atlases."""
+import hashlib
+import os
+import shutil
+
+import nibabel as nb
+import numpy as np
+from nipype import logging
+
+LOGGER = logging.getLogger("nipype.utils")
+
+# Files hashed by this process, keyed by (path, size, modification time).
+_FILE_HASHES = {}
 
 
 def get_atlas_names(subset):
@@ -145,3 +157,148 @@ def get_atlas_cifti(atlas_name):
         )
 
     return atlas_file, atlas_labels_file, atlas_metadata_file
+
+
+def _hash_file(in_file, block_size=2**20):
+    """Hash a file's contents, reusing earlier results for unchanged files."""
+    in_file = os.path.realpath(in_file)
+    stat = os.stat(in_file)
+    memo_key = (in_file, stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _FILE_HASHES:
+        hasher = hashlib.sha1()
+        with open(in_file, "rb") as fo:
+            for block in iter(lambda: fo.read(block_size), b""):
+                hasher.update(block)
+
+        _FILE_HASHES[memo_key] = hasher.hexdigest()
+
+    return _FILE_HASHES[memo_key]
+
+
+def _hash_reference_grid(reference_file):
+    """Hash the parts of a reference image's header that determine a resampled atlas.
+
+    For NIfTIs, this is the voxel grid.
+    For CIFTIs, this is the brain model axis (i.e., the surfaces and subcortical voxels).
+    """
+    img = nb.load(reference_file)
+    hasher = hashlib.sha1()
+    if isinstance(img, nb.Cifti2Image):
+        brain_models = img.header.get_axis(img.ndim - 1)
+        hasher.update(b"cifti")
+        hasher.update(np.asarray(brain_models.name).astype(str).tobytes())
+        hasher.update(np.ascontiguousarray(brain_models.voxel, dtype=np.int64).tobytes())
+        hasher.update(np.ascontiguousarray(brain_models.vertex, dtype=np.int64).tobytes())
+        hasher.update(repr(sorted(brain_models.nvertices.items())).encode())
+        if brain_models.affine is not None:
+            hasher.update(np.ascontiguousarray(brain_models.affine, dtype=np.float64).tobytes())
+            hasher.update(repr(tuple(brain_models.volume_shape)).encode())
+    else:
+        hasher.update(b"nifti")
+        hasher.update(repr(tuple(img.shape[:3])).encode())
+        hasher.update(np.ascontiguousarray(img.affine, dtype=np.float64).round(6).tobytes())
+        header = img.header
+        hasher.update(repr((int(header["qform_code"]), int(header["sform_code"]))).encode())
+
+    return hasher.hexdigest()
+
+
+def get_atlas_cache_key(atlas_file, reference_file, transforms=None):
+    """Build a content-based key for an atlas resampled to a reference image.
+
+    The resampled atlas only depends on the atlas itself, the transforms applied to it,
+    and the grid of the reference image, so the same key is generated for every run
+    (and every subject) that shares a space and resolution.
+
+    Parameters
+    ----------
+    atlas_file : :obj:`str`
+        Path to the atlas file.
+    reference_file : :obj:`str`
+        Path to the reference image (a NIfTI or CIFTI file in the BOLD data's space).
+        Only its header is used.
+    transforms : :obj:`list` of :obj:`str` or None, optional
+        Transforms applied to the atlas. Entries that are not files, like "identity",
+        are used as-is.
+
+    Returns
+    -------
+    cache_key : :obj:`str`
+        A hexadecimal hash.
+    """
+    hasher = hashlib.sha1()
+    hasher.update(_hash_file(atlas_file).encode())
+    for transform in transforms or []:
+        transform = str(transform)
+        if os.path.isfile(transform):
+            hasher.update(_hash_file(transform).encode())
+        else:
+            hasher.update(transform.encode())
+
+    hasher.update(_hash_reference_grid(reference_file).encode())
+
+    return hasher.hexdigest()
+
+
+def get_cached_atlas_files(cache_dir, cache_key):
+    """Collect the files stored in the atlas cache under a key.
+
+    Parameters
+    ----------
+    cache_dir : :obj:`str`
+        The atlas cache directory.
+    cache_key : :obj:`str`
+        Key from :func:`get_atlas_cache_key`.
+
+    Returns
+    -------
+    cached_files : :obj:`dict` or None
+        Mapping from output names to cached paths, or None if nothing is cached under the key.
+    """
+    key_dir = os.path.join(cache_dir, cache_key)
+    if not os.path.isdir(key_dir):
+        return None
+
+    cached_files = {}
+    for output_name in sorted(os.listdir(key_dir)):
+        filenames = os.listdir(os.path.join(key_dir, output_name))
+        cached_files[output_name] = os.path.join(key_dir, output_name, filenames[0])
+
+    return cached_files
+
+
+def store_cached_atlas_files(cache_dir, cache_key, in_files):
+    """Copy resampled atlas files into the atlas cache.
+
+    The files are copied into a temporary directory, which is then renamed,
+    so concurrent runs never see a partially-written entry.
+    If another process stored the same key first, its files are used instead.
+
+    Parameters
+    ----------
+    cache_dir : :obj:`str`
+        The atlas cache directory.
+    cache_key : :obj:`str`
+        Key from :func:`get_atlas_cache_key`.
+    in_files : :obj:`dict`
+        Mapping from output names to the files to store.
+        Each file keeps its filename, in a subdirectory named after the output.
+
+    Returns
+    -------
+    cached_files : :obj:`dict`
+        Mapping from output names to cached paths.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_dir = os.path.join(cache_dir, f".{cache_key}.{os.getpid()}.tmp")
+    for output_name, in_file in in_files.items():
+        os.makedirs(os.path.join(temp_dir, output_name), exist_ok=True)
+        shutil.copyfile(in_file, os.path.join(temp_dir, output_name, os.path.basename(in_file)))
+
+    try:
+        os.rename(temp_dir, os.path.join(cache_dir, cache_key))
+    except OSError:
+        LOGGER.debug(f"Atlas cache entry {cache_key} was written by another process.")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return get_cached_atlas_files(cache_dir, cache_key)
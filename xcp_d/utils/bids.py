@@ -147,6 +147,45 @@ def collect_participants(bids_dir, participant_label=None, strict=False, bids_va
     return found_label
 
 
+def get_participant_indexer(participant_label=None, bids_validate=False):
+    """Build a pybids indexer that skips other participants' directories.
+
+    Indexing is the slowest part of building a :class:`~bids.layout.BIDSLayout` for a large
+    dataset, so when only some participants are post-processed,
+    the other participants' files are not indexed.
+
+    Parameters
+    ----------
+    participant_label : None, str, or list, optional
+        The participants to index, with or without the "sub-" prefix.
+    bids_validate : bool, optional
+        Whether to validate the indexed files. Default is False.
+
+    Returns
+    -------
+    indexer : :obj:`bids.layout.BIDSLayoutIndexer` or None
+        The indexer to pass to :class:`~bids.layout.BIDSLayout`.
+        None if all participants should be indexed.
+    """
+    import re
+
+    from bids.layout import BIDSLayoutIndexer
+    from bids.layout.validation import DEFAULT_LOCATIONS_TO_IGNORE
+
+    if not participant_label:
+        return None
+
+    participant_label = [
+        sub[4:] if sub.startswith("sub-") else sub for sub in ensure_list(participant_label)
+    ]
+    labels = "|".join(re.escape(label) for label in sorted(set(participant_label)))
+    # Paths are matched relative to the dataset root, with a leading slash.
+    ignore = sorted(DEFAULT_LOCATIONS_TO_IGNORE, key=str) + [
+        re.compile(rf"^/sub-(?!({labels})(/|$))[^/]+")
+    ]
+    return BIDSLayoutIndexer(validate=bids_validate, ignore=ignore)
+
+
 @fill_doc
 def collect_data(
     bids_dir,
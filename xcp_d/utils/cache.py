@@ -0,0 +1,366 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""A content-addressed cache of interface results, shared across working directories.
+
+Nipype only reuses results within a single working directory.
+Interfaces decorated with :func:`cache_results` also look up their results in a shared cache
+(``xcp_d --result-cache``), keyed by the contents of their input files and the values of
+their other inputs, so re-running xcp_d with different downstream options
+(e.g., a new atlas) reuses the expensive upstream steps.
+Least recently used entries are evicted once the cache exceeds its size cap.
+"""
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from nipype import logging
+from nipype.interfaces.base import isdefined
+
+from xcp_d.utils.atlas import _hash_file
+from xcp_d.utils.filemanip import get_work_compression
+
+LOGGER = logging.getLogger("nipype.utils")
+
+RESULT_CACHE_ENV = "XCPD_RESULT_CACHE"
+RESULT_CACHE_SIZE_ENV = "XCPD_RESULT_CACHE_SIZE"
+DEFAULT_RESULT_CACHE_SIZE = 50  # in GB
+
+_MANIFEST = "manifest.json"
+_HASH_DIR = ".hashes"
+
+
+def get_result_cache():
+    """Get the result cache's directory and size cap.
+
+    Returns
+    -------
+    cache_dir : :obj:`str` or None
+        The cache directory, or None if result caching is disabled.
+    max_size : :obj:`int` or None
+        The maximum size of the cache, in bytes.
+    """
+    cache_dir = os.environ.get(RESULT_CACHE_ENV) or None
+    if cache_dir is None:
+        return None, None
+
+    max_size = float(os.environ.get(RESULT_CACHE_SIZE_ENV, DEFAULT_RESULT_CACHE_SIZE))
+    return cache_dir, int(max_size * 2**30)
+
+
+def hash_input_file(in_file, cache_dir):
+    """Hash a file's contents, reusing hashes recorded in the cache for unchanged files.
+
+    Nodes run in separate processes, so hashes are recorded on disk,
+    keyed by the file's path, size, and modification time.
+    """
+    in_file = os.path.realpath(in_file)
+    stat = os.stat(in_file)
+    memo_key = hashlib.sha1(f"{in_file}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+    memo_file = os.path.join(cache_dir, _HASH_DIR, memo_key)
+    if os.path.isfile(memo_file):
+        with open(memo_file, "r") as fobj:
+            return fobj.read()
+
+    file_hash = _hash_file(in_file)
+    os.makedirs(os.path.dirname(memo_file), exist_ok=True)
+    temp_file = f"{memo_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w") as fobj:
+        fobj.write(file_hash)
+
+    os.replace(temp_file, memo_file)
+    return file_hash
+
+
+def _hash_value(value, hasher, cache_dir):
+    """Add an input value to a hash, using the contents (and basenames) of files."""
+    if isinstance(value, str) and os.path.isfile(value):
+        # Output names are derived from input names, so the basename is part of the key.
+        hasher.update(f"file:{os.path.basename(value)}:".encode())
+        hasher.update(hash_input_file(value, cache_dir).encode())
+    elif isinstance(value, (list, tuple)):
+        hasher.update(f"{type(value).__name__}:{len(value)}:".encode())
+        for item in value:
+            _hash_value(item, hasher, cache_dir)
+    elif isinstance(value, dict):
+        hasher.update(f"dict:{len(value)}:".encode())
+        for key in sorted(value):
+            hasher.update(repr(key).encode())
+            _hash_value(value[key], hasher, cache_dir)
+    else:
+        hasher.update(repr(value).encode())
+
+
+def get_result_cache_key(interface, cache_dir):
+    """Build a content-based key for an interface's results.
+
+    The key covers the interface, the xcp_d version, the working directory's compression policy,
+    and every defined input that is not marked with ``nohash``.
+
+    Parameters
+    ----------
+    interface : :obj:`nipype.interfaces.base.BaseInterface`
+        The interface, with its inputs set.
+    cache_dir : :obj:`str`
+        The result cache directory, where file hashes are recorded.
+
+    Returns
+    -------
+    cache_key : :obj:`str`
+        The interface's name and a hexadecimal hash.
+    """
+    from xcp_d import __version__
+
+    hasher = hashlib.sha1()
+    hasher.update(f"{__version__}:{get_work_compression()}".encode())
+    for name in sorted(interface.inputs.copyable_trait_names()):
+        value = getattr(interface.inputs, name)
+        if not isdefined(value) or interface.inputs.trait(name).nohash:
+            continue
+
+        hasher.update(f"input:{name}:".encode())
+        _hash_value(value, hasher, cache_dir)
+
+    return f"{type(interface).__name__}-{hasher.hexdigest()}"
+
+
+def _input_files(inputs):
+    """Map the paths of an interface's file inputs to the inputs' names."""
+    input_files = {}
+    for name in inputs.copyable_trait_names():
+        value = getattr(inputs, name)
+        if isinstance(value, str) and os.path.isfile(value):
+            input_files[os.path.abspath(value)] = name
+
+    return input_files
+
+
+def _link_or_copy(src, dst):
+    """Hard-link a file, or copy it if that is not possible (e.g., across file systems)."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _encode_results(results, input_files, entry_dir):
+    """Replace file paths in an interface's results with references to stored files or inputs.
+
+    Files that are passed through from the inputs are stored as references to those inputs.
+    """
+    n_files = 0
+
+    def _encode(value):
+        nonlocal n_files
+        if isinstance(value, str) and os.path.isfile(value):
+            if os.path.abspath(value) in input_files:
+                return {"__input__": input_files[os.path.abspath(value)]}
+
+            rel_path = os.path.join("files", str(n_files), os.path.basename(value))
+            n_files += 1
+            os.makedirs(os.path.dirname(os.path.join(entry_dir, rel_path)))
+            _link_or_copy(value, os.path.join(entry_dir, rel_path))
+            return {"__file__": rel_path}
+        elif isinstance(value, str) and os.path.exists(value):
+            raise ValueError(f"Only files can be cached, not {value}")
+        elif isinstance(value, (list, tuple)):
+            return [_encode(item) for item in value]
+        elif isinstance(value, dict):
+            return {key: _encode(item) for key, item in value.items()}
+
+        return value
+
+    return {name: _encode(value) for name, value in results.items()}
+
+
+def _decode_results(encoded, inputs, entry_dir, out_dir):
+    """Materialize cached files in the output directory and restore the results."""
+
+    def _decode(value):
+        if isinstance(value, dict) and "__input__" in value:
+            return getattr(inputs, value["__input__"])
+        elif isinstance(value, dict) and "__file__" in value:
+            out_file = os.path.join(out_dir, os.path.basename(value["__file__"]))
+            if os.path.lexists(out_file):
+                os.remove(out_file)
+
+            _link_or_copy(os.path.join(entry_dir, value["__file__"]), out_file)
+            return out_file
+        elif isinstance(value, list):
+            return [_decode(item) for item in value]
+        elif isinstance(value, dict):
+            return {key: _decode(item) for key, item in value.items()}
+
+        return value
+
+    return {name: _decode(value) for name, value in encoded.items()}
+
+
+def load_cached_results(cache_dir, cache_key, inputs, out_dir):
+    """Restore an interface's results from the cache, if they are there.
+
+    Parameters
+    ----------
+    cache_dir : :obj:`str`
+        The result cache directory.
+    cache_key : :obj:`str`
+        Key from :func:`get_result_cache_key`.
+    inputs : :obj:`nipype.interfaces.base.BaseTraitedSpec`
+        The interface's inputs, for results that pass input files through.
+    out_dir : :obj:`str`
+        Directory in which the cached files are linked or copied.
+
+    Returns
+    -------
+    results : :obj:`dict` or None
+        The interface's results, or None if they are not cached.
+    """
+    entry_dir = os.path.join(cache_dir, cache_key)
+    manifest_file = os.path.join(entry_dir, _MANIFEST)
+    try:
+        with open(manifest_file, "r") as fobj:
+            encoded = json.load(fobj)
+
+        results = _decode_results(encoded, inputs, entry_dir, out_dir)
+        # Mark the entry as recently used.
+        os.utime(manifest_file)
+    except (OSError, ValueError):
+        # Missing, or evicted while it was being read.
+        return None
+
+    return results
+
+
+def store_cached_results(cache_dir, cache_key, results, inputs):
+    """Store an interface's results in the cache.
+
+    The entry is written to a temporary directory, which is then renamed,
+    so concurrent runs never see a partially-written entry.
+
+    Parameters
+    ----------
+    cache_dir : :obj:`str`
+        The result cache directory.
+    cache_key : :obj:`str`
+        Key from :func:`get_result_cache_key`.
+    results : :obj:`dict`
+        The interface's results.
+    inputs : :obj:`nipype.interfaces.base.BaseTraitedSpec`
+        The interface's inputs.
+
+    Returns
+    -------
+    stored : :obj:`bool`
+        Whether the results were stored.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_dir = os.path.join(cache_dir, f".{cache_key}.{os.getpid()}.tmp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    try:
+        encoded = _encode_results(results, _input_files(inputs), temp_dir)
+        with open(os.path.join(temp_dir, _MANIFEST), "w") as fobj:
+            json.dump(encoded, fobj, indent=2)
+    except (TypeError, ValueError) as exc:
+        LOGGER.warning(f"Results of {cache_key} could not be cached: {exc}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return False
+
+    try:
+        os.rename(temp_dir, os.path.join(cache_dir, cache_key))
+    except OSError:
+        LOGGER.debug(f"Result cache entry {cache_key} was written by another process.")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return True
+
+
+def _entry_size(entry_dir):
+    """Get the total size of the files in a cache entry, in bytes."""
+    size = 0
+    for root, _, filenames in os.walk(entry_dir):
+        for filename in filenames:
+            size += os.lstat(os.path.join(root, filename)).st_size
+
+    return size
+
+
+def evict_cached_results(cache_dir, max_size, keep=()):
+    """Remove the least recently used entries until the cache fits within its size cap.
+
+    Parameters
+    ----------
+    cache_dir : :obj:`str`
+        The result cache directory.
+    max_size : :obj:`int`
+        The maximum size of the cache, in bytes.
+    keep : :obj:`tuple` of :obj:`str`, optional
+        Keys of entries that should not be evicted (e.g., the one that was just stored).
+
+    Returns
+    -------
+    evicted : :obj:`list` of :obj:`str`
+        Keys of the evicted entries.
+    """
+    entries = []
+    for cache_key in os.listdir(cache_dir):
+        manifest_file = os.path.join(cache_dir, cache_key, _MANIFEST)
+        if cache_key.startswith(".") or not os.path.isfile(manifest_file):
+            continue
+
+        entry_dir = os.path.join(cache_dir, cache_key)
+        entries.append((os.stat(manifest_file).st_mtime, cache_key, _entry_size(entry_dir)))
+
+    total_size = sum(entry[2] for entry in entries)
+    evicted = []
+    for _, cache_key, size in sorted(entries):
+        if total_size <= max_size:
+            break
+
+        if cache_key in keep:
+            continue
+
+        shutil.rmtree(os.path.join(cache_dir, cache_key), ignore_errors=True)
+        total_size -= size
+        evicted.append(cache_key)
+
+    if evicted:
+        LOGGER.info(f"Evicted {len(evicted)} entries from the result cache.")
+
+    return evicted
+
+
+def cache_results(run_interface):
+    """Cache an interface's results across working directories, if result caching is enabled.
+
+    Decorate a :class:`~nipype.interfaces.base.SimpleInterface`'s ``_run_interface`` method
+    with this.
+    Inputs that do not affect the results (e.g., numbers of threads) should be marked with
+    ``nohash=True``.
+    """
+
+    @functools.wraps(run_interface)
+    def wrapper(self, runtime):
+        cache_dir, max_size = get_result_cache()
+        if cache_dir is None:
+            return run_interface(self, runtime)
+
+        start = time.time()
+        cache_key = get_result_cache_key(self, cache_dir)
+        results = load_cached_results(cache_dir, cache_key, self.inputs, runtime.cwd)
+        if results is not None:
+            LOGGER.info(
+                f"Reusing cached results ({cache_key}), found in {time.time() - start:.1f} s."
+            )
+            self._results.update(results)
+            return runtime
+
+        runtime = run_interface(self, runtime)
+        if store_cached_results(cache_dir, cache_key, self._results, self.inputs):
+            evict_cached_results(cache_dir, max_size, keep=(cache_key,))
+
+        return runtime
+
+    return wrapper
@@ -0,0 +1,218 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""A parse-once columnar store for confounds TSVs.
+
+fMRIPrep's confounds files can have hundreds of columns, and many steps only need a few of them.
+The first time a TSV is read, it is parsed into an uncompressed NPZ file in the store
+(``$XCPD_COLUMNAR_STORE``, set to a folder in the working directory by ``xcp_d``),
+with one array per column and the TSV's JSON metadata attached.
+Later reads load only the requested columns from that file.
+
+Store files are keyed by the TSV's path, size, and modification time,
+so a modified TSV is parsed again.
+If the store is not set, TSVs are parsed directly.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from nipype import logging
+
+LOGGER = logging.getLogger("nipype.utils")
+
+COLUMNAR_STORE_ENV = "XCPD_COLUMNAR_STORE"
+
+# Pandas reads this as a missing value, so string columns round-trip through the store.
+_MISSING_STRING = "n/a"
+
+
+def get_store_file(tsv_file):
+    """Get the path to a TSV's file in the columnar store.
+
+    Parameters
+    ----------
+    tsv_file : :obj:`str`
+        Path to the TSV file.
+
+    Returns
+    -------
+    store_file : :obj:`str` or None
+        Path to the store file, which may not exist yet.
+        None if the columnar store is disabled.
+    """
+    store_dir = os.environ.get(COLUMNAR_STORE_ENV) or None
+    if store_dir is None:
+        return None
+
+    tsv_file = os.path.realpath(tsv_file)
+    stat = os.stat(tsv_file)
+    key = hashlib.sha1(f"{tsv_file}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+    return os.path.join(store_dir, f"{key}.npz")
+
+
+def read_columns(tsv_file, columns=None):
+    """Read columns from a TSV file, through the columnar store.
+
+    Parameters
+    ----------
+    tsv_file : :obj:`str`
+        Path to the TSV file.
+    columns : :obj:`list` of :obj:`str` or None, optional
+        The columns to read, in order. If None, all columns are read.
+
+    Returns
+    -------
+    df : :obj:`pandas.DataFrame`
+        The requested columns.
+    """
+    store = _load_store(tsv_file)
+    if store is None:
+        if columns is None:
+            return pd.read_table(tsv_file)
+
+        return pd.read_table(tsv_file, usecols=lambda c: c in columns)[list(columns)]
+
+    with store:
+        column_indices = {c: i for i, c in enumerate(store["__columns__"].tolist())}
+        if columns is None:
+            columns = list(column_indices)
+
+        missing = [c for c in columns if c not in column_indices]
+        if missing:
+            raise KeyError(f"Columns {missing} not found in {tsv_file}")
+
+        data = {}
+        for column in columns:
+            values = store[f"column{column_indices[column]}"]
+            if values.dtype.kind == "U":
+                values = values.astype(object)
+                values[values == _MISSING_STRING] = np.nan
+
+            data[column] = values
+
+        n_rows = int(store["__n_rows__"])
+
+    return pd.DataFrame(data, columns=list(columns), index=pd.RangeIndex(n_rows))
+
+
+def read_column_names(tsv_file):
+    """Read the names of a TSV file's columns, through the columnar store.
+
+    Parameters
+    ----------
+    tsv_file : :obj:`str`
+        Path to the TSV file.
+
+    Returns
+    -------
+    columns : :obj:`list` of :obj:`str`
+        The column names, in order.
+    """
+    store = _load_store(tsv_file)
+    if store is None:
+        return pd.read_table(tsv_file, nrows=0).columns.tolist()
+
+    with store:
+        return store["__columns__"].tolist()
+
+
+def read_metadata(tsv_file):
+    """Read the JSON metadata attached to a TSV file in the columnar store.
+
+    Parameters
+    ----------
+    tsv_file : :obj:`str`
+        Path to the TSV file.
+
+    Returns
+    -------
+    metadata : :obj:`dict`
+        The metadata. Empty if the TSV has no metadata.
+    """
+    store = _load_store(tsv_file)
+    if store is None:
+        return _read_sidecar(tsv_file)
+
+    with store:
+        return json.loads(str(store["__metadata__"]))
+
+
+def write_columns(df, tsv_file, metadata=None):
+    """Write a DataFrame to a TSV file and add it to the columnar store.
+
+    Steps that write confounds TSVs use this,
+    so the steps that read them do not need to parse them.
+
+    Parameters
+    ----------
+    df : :obj:`pandas.DataFrame`
+        The data to write.
+    tsv_file : :obj:`str`
+        Path to the TSV file to write.
+    metadata : :obj:`dict` or None, optional
+        Metadata to attach to the TSV in the store.
+        If None, the metadata are read from the TSV's JSON sidecar, if it exists.
+
+    Returns
+    -------
+    tsv_file : :obj:`str`
+        Path to the TSV file.
+    """
+    df.to_csv(tsv_file, sep="\t", index=False)
+    store_file = get_store_file(tsv_file)
+    if store_file is not None:
+        if metadata is None:
+            metadata = _read_sidecar(tsv_file)
+
+        _write_store(df, store_file, metadata)
+
+    return tsv_file
+
+
+def _read_sidecar(tsv_file):
+    """Read the JSON sidecar associated with a TSV file, if there is one."""
+    json_file = f"{os.path.splitext(tsv_file)[0]}.json"
+    if not os.path.isfile(json_file):
+        return {}
+
+    with open(json_file, "r") as fobj:
+        return json.load(fobj)
+
+
+def _load_store(tsv_file):
+    """Open a TSV file's store file, parsing the TSV into the store if necessary."""
+    store_file = get_store_file(tsv_file)
+    if store_file is None:
+        return None
+
+    if not os.path.isfile(store_file):
+        LOGGER.debug(f"Parsing {tsv_file} into the columnar store.")
+        _write_store(pd.read_table(tsv_file), store_file, _read_sidecar(tsv_file))
+
+    return np.load(store_file, allow_pickle=False)
+
+
+def _write_store(df, store_file, metadata):
+    """Write a DataFrame's columns and metadata to a store file."""
+    arrays = {
+        "__columns__": np.array(df.columns.astype(str).tolist(), dtype=str),
+        "__n_rows__": np.array(df.shape[0]),
+        "__metadata__": np.array(json.dumps(metadata)),
+    }
+    for i_column, column in enumerate(df.columns):
+        values = df[column]
+        if values.dtype == object:
+            # Store strings as fixed-width arrays, which can be loaded without pickling.
+            arrays[f"column{i_column}"] = values.fillna(_MISSING_STRING).to_numpy(dtype=str)
+        else:
+            arrays[f"column{i_column}"] = values.to_numpy()
+
+    # Nodes run in separate processes, so the file is written atomically.
+    os.makedirs(os.path.dirname(store_file), exist_ok=True)
+    temp_file = f"{store_file}.{os.getpid()}.tmp"
+    with open(temp_file, "wb") as fobj:
+        np.savez(fobj, **arrays)
+
+    os.replace(temp_file, store_file)
@@ -1,15 +1,15 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 """Functions for concatenating scans across runs."""
-import os
 from contextlib import suppress
 
 import nibabel as nb
 import numpy as np
 import pandas as pd
-from nilearn.image import concat_imgs
 from nipype import logging
 
+from xcp_d.utils.columnar import read_columns, read_metadata, write_columns
+
 LOGGER = logging.getLogger("nipype.interface")
 
 
@@ -33,29 +33,168 @@ def concatenate_tsvs(tsv_files, out_file):
         np.savetxt(out_file, data, fmt="%.5f", delimiter="\t")
     except ValueError:
         # Load file with header.
-        data = [pd.read_table(tsv_file) for tsv_file in tsv_files]
+        data = [read_columns(tsv_file) for tsv_file in tsv_files]
         data = pd.concat(data, axis=0)
-        data.to_csv(out_file, sep="\t", index=False)
+        write_columns(data, out_file, metadata=read_metadata(tsv_files[0]))
 
     return out_file
 
 
-def concatenate_niimgs(files, out_file):
+def concatenate_niimgs(files, out_file, block_size=256):
     """Concatenate niimgs.
 
+    The concatenated image is written out block by block, so only a small part of the input
+    data is in memory at any time.
+
     Parameters
     ----------
     files : :obj:`list` of :obj:`str`
         List of BOLD files to concatenate over the time dimension.
     out_file : :obj:`str`
         The concatenated file to write out.
+    block_size : :obj:`float`, optional
+        Approximate amount of data, in megabytes, to copy at once. Default is 256.
     """
     is_nifti = False
     with suppress(nb.filebasedimages.ImageFileError):
         is_nifti = isinstance(nb.load(files[0]), nb.Nifti1Image)
 
+    max_block_bytes = max(int(block_size * (1024**2)), 1)
     if is_nifti:
-        concat_preproc_img = concat_imgs(files)
-        concat_preproc_img.to_filename(out_file)
+        _concatenate_niftis(files, out_file, max_block_bytes=max_block_bytes)
     else:
-        os.system(f"wb_command -cifti-merge {out_file} -cifti {' -cifti '.join(files)}")
+        _concatenate_ciftis(files, out_file, max_block_bytes=max_block_bytes)
+
+
+def _get_concatenated_dtype(imgs):
+    """Determine the on-disk data type for a concatenated image.
+
+    The input data type is retained if it is shared by all inputs and none of them are scaled.
+    Otherwise, the data are written out as floats.
+    """
+    dtypes = [img.get_data_dtype() for img in imgs]
+    is_scaled = any(
+        (getattr(img.dataobj, "slope", 1.0) != 1.0) or (getattr(img.dataobj, "inter", 0.0) != 0.0)
+        for img in imgs
+    )
+    if is_scaled or any(dtype != dtypes[0] for dtype in dtypes):
+        return np.result_type(np.float32, *[dtype.newbyteorder("=") for dtype in dtypes])
+
+    return dtypes[0]
+
+
+def _concatenate_niftis(files, out_file, max_block_bytes):
+    """Concatenate NIfTI images over time, streaming volumes from the inputs into the output.
+
+    NIfTI data are stored in Fortran order, so each volume is contiguous on disk and the
+    concatenated data can be written out by appending the runs' volumes in order.
+    This also works for gzipped outputs.
+    """
+    from nibabel.openers import ImageOpener
+    from nibabel.volumeutils import seek_tell
+
+    imgs = [nb.load(f) for f in files]
+    ref_img = imgs[0]
+    spatial_shape = ref_img.shape[:3]
+    n_volumes = []
+    for img in imgs:
+        if img.shape[:3] != spatial_shape:
+            raise ValueError(
+                f"Image {img.get_filename()} has shape {img.shape[:3]}, not {spatial_shape}."
+            )
+        elif not np.allclose(img.affine, ref_img.affine):
+            raise ValueError(f"Image {img.get_filename()} has a different affine.")
+
+        n_volumes.append(img.shape[3] if img.ndim > 3 else 1)
+
+    header = ref_img.header.copy()
+    header.set_data_dtype(_get_concatenated_dtype(imgs))
+    header.set_data_shape(spatial_shape + (sum(n_volumes),))
+    header.set_slope_inter(None, None)
+    header["vox_offset"] = 0  # recalculated when the header is written
+    out_dtype = header.get_data_dtype()
+
+    volume_bytes = int(np.prod(spatial_shape)) * out_dtype.itemsize
+    volumes_per_block = max(max_block_bytes // volume_bytes, 1)
+
+    with ImageOpener(out_file, "wb") as fobj:
+        header.write_to(fobj)
+        seek_tell(fobj, header.get_data_offset(), write0=True)
+        for img, img_n_volumes in zip(imgs, n_volumes):
+            if img.ndim == 3:
+                block = np.asanyarray(img.dataobj)[..., None]
+                fobj.write(block.astype(out_dtype).tobytes(order="F"))
+                continue
+
+            for start in range(0, img_n_volumes, volumes_per_block):
+                block = img.dataobj[..., start : start + volumes_per_block]
+                fobj.write(block.astype(out_dtype).tobytes(order="F"))
+
+
+def _concatenate_ciftis(files, out_file, max_block_bytes):
+    """Concatenate CIFTI images over time, copying blocks of columns into a pre-allocated file.
+
+    CIFTI data are stored in Fortran order, with time as the fastest-changing dimension,
+    so the output file is pre-allocated and memory-mapped,
+    and each run's data are copied into it one block of brainordinates/parcels at a time.
+    The concatenated row axis (e.g., a :class:`~nibabel.cifti2.cifti2_axes.SeriesAxis`)
+    is built directly from the input headers.
+    """
+    from functools import reduce
+
+    from nibabel.cifti2.parse_cifti2 import Cifti2Extension
+    from nibabel.nifti1 import Nifti1Extensions
+
+    imgs = [nb.load(f) for f in files]
+    ref_img = imgs[0]
+    column_axis = ref_img.header.get_axis(1)
+    for img in imgs[1:]:
+        if img.header.get_axis(1) != column_axis:
+            raise ValueError(
+                f"Image {img.get_filename()} does not have the same brainordinates/parcels "
+                f"as {ref_img.get_filename()}."
+            )
+
+    # The row axes (e.g., SeriesAxis) implement concatenation with the + operator.
+    row_axis = reduce(lambda x, y: x + y, [img.header.get_axis(0) for img in imgs])
+    cifti_header = nb.cifti2.Cifti2Header.from_axes((row_axis, column_axis))
+    n_rows, n_columns = len(row_axis), len(column_axis)
+
+    header = ref_img.nifti_header.copy()
+    header.extensions = Nifti1Extensions(
+        ext for ext in header.extensions if not isinstance(ext, Cifti2Extension)
+    )
+    header.extensions.append(Cifti2Extension(Cifti2Extension.code, cifti_header.to_xml()))
+    header.set_data_dtype(_get_concatenated_dtype(imgs))
+    header.set_data_shape((1, 1, 1, 1, n_rows, n_columns))
+    header.set_slope_inter(None, None)
+    if header["qform_code"] == 0:
+        header["pixdim"][:4] = 1
+
+    header["vox_offset"] = 0  # recalculated when the header is written
+    out_dtype = header.get_data_dtype()
+
+    with open(out_file, "wb") as fobj:
+        header.write_to(fobj)
+        data_offset = header.get_data_offset()
+        fobj.truncate(data_offset + (n_rows * n_columns * out_dtype.itemsize))
+
+    out_data = np.memmap(
+        out_file,
+        dtype=out_dtype,
+        mode="r+",
+        offset=data_offset,
+        shape=(n_rows, n_columns),
+        order="F",
+    )
+    columns_per_block = max(max_block_bytes // (n_rows * out_dtype.itemsize), 1)
+    for start in range(0, n_columns, columns_per_block):
+        end = start + columns_per_block
+        row_start = 0
+        for img in imgs:
+            row_end = row_start + img.shape[0]
+            out_data[row_start:row_end, start:end] = img.dataobj[:, start:end]
+            row_start = row_end
+
+    out_data.flush()
+    del out_data
@@ -1,6 +1,7 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 """Confound matrix selection based on Ciric et al. 2007."""
+import json
 import os
 import warnings
 
@@ -10,11 +11,81 @@ from nilearn.interfaces.fmriprep.load_confounds import _load_single_confounds_fi
 from nipype import logging
 from scipy.signal import butter, filtfilt, iirnotch
 
+from xcp_d.utils.columnar import read_column_names, read_columns, read_metadata
 from xcp_d.utils.doc import fill_doc
 from xcp_d.utils.utils import list_to_str
 
 LOGGER = logging.getLogger("nipype.utils")
 
+# The six basic motion parameters, in the order used by load_motion.
+MOTION_COLUMNS = ["rot_x", "rot_y", "rot_z", "trans_x", "trans_y", "trans_z"]
+
+# Substrings of the fMRIPrep confounds that each load_confounds strategy may select.
+_STRATEGY_KEYWORDS = {
+    "non_steady_state": ("non_steady_state",),
+    "motion": ("trans_", "rot_"),
+    "wm_csf": ("csf", "white_matter"),
+    "global_signal": ("global_signal",),
+    "compcor": ("a_comp_cor", "c_comp_cor", "w_comp_cor", "t_comp_cor"),
+    "high_pass": ("cosine",),
+}
+
+
+# The load_confounds parameters of each fMRIPrep-based nuisance regression strategy.
+PARAM_KWARGS = {
+    # Get rot and trans values, as well as derivatives and square
+    "24P": {
+        "strategy": ["motion"],
+        "motion": "full",
+    },
+    # Get rot and trans values, as well as derivatives and square, WM, CSF,
+    "27P": {
+        "strategy": ["motion", "global_signal", "wm_csf"],
+        "motion": "full",
+        "global_signal": "basic",
+        "wm_csf": "basic",
+    },
+    # Get rot and trans values, as well as derivatives, WM, CSF,
+    # global signal, and square. Add the square and derivative of the WM, CSF
+    # and global signal as well.
+    "36P": {
+        "strategy": ["motion", "global_signal", "wm_csf"],
+        "motion": "full",
+        "global_signal": "full",
+        "wm_csf": "full",
+    },
+    # Get the rot and trans values, their derivative,
+    # as well as acompcor and cosine
+    "acompcor": {
+        "strategy": ["motion", "high_pass", "compcor"],
+        "motion": "derivatives",
+        "compcor": "anat_separated",
+        "n_compcor": 5,
+    },
+    # Get the rot and trans values, as well as their derivative,
+    # acompcor and cosine values as well as global signal
+    "acompcor_gsr": {
+        "strategy": ["motion", "high_pass", "compcor", "global_signal"],
+        "motion": "derivatives",
+        "compcor": "anat_separated",
+        "global_signal": "basic",
+        "n_compcor": 5,
+    },
+    # Get WM and CSF
+    # AROMA confounds are loaded separately
+    "aroma": {
+        "strategy": ["wm_csf"],
+        "wm_csf": "basic",
+    },
+    # Get WM, CSF, and global signal
+    # AROMA confounds are loaded separately
+    "aroma_gsr": {
+        "strategy": ["wm_csf", "global_signal"],
+        "wm_csf": "basic",
+        "global_signal": "basic",
+    },
+}
+
 
 @fill_doc
 def load_motion(
@@ -53,9 +124,7 @@ def load_motion(
         raise ValueError(f"Motion filter type '{motion_filter_type}' not supported.")
 
     # Select the motion columns from the overall confounds DataFrame
-    motion_confounds_df = confounds_df[
-        ["rot_x", "rot_y", "rot_z", "trans_x", "trans_y", "trans_z"]
-    ]
+    motion_confounds_df = confounds_df[MOTION_COLUMNS]
 
     # Apply LP or notch filter
     if motion_filter_type in ("lp", "notch"):
@@ -122,6 +191,30 @@ def get_custom_confounds(custom_confounds_folder, fmriprep_confounds_file):
     return custom_confounds_file
 
 
+@fill_doc
+def get_strategy_label(params):
+    """Convert a nuisance regression strategy into a label for the BIDS ``desc`` entity.
+
+    Parameters
+    ----------
+    %(params)s
+
+    Returns
+    -------
+    label : :obj:`str`
+        An alphanumeric, camel-cased version of ``params``.
+
+    Examples
+    --------
+    >>> get_strategy_label("24P")
+    '24P'
+    >>> get_strategy_label("acompcor_gsr")
+    'acompcorGsr'
+    """
+    first, *rest = params.split("_")
+    return first + "".join(part.capitalize() for part in rest)
+
+
 @fill_doc
 def describe_regression(params, custom_confounds_file, motion_filter_type):
     """Build a text description of the regression that will be performed.
@@ -327,9 +420,9 @@ def describe_censoring(
 
 
 def _get_acompcor_confounds(confounds_file):
-    confounds_df = pd.read_table(confounds_file)
-    csf_compcor_columns = [c for c in confounds_df.columns if c.startswith("c_comp_cor")]
-    wm_compcor_columns = [c for c in confounds_df.columns if c.startswith("w_comp_cor")]
+    columns = read_column_names(confounds_file)
+    csf_compcor_columns = [c for c in columns if c.startswith("c_comp_cor")]
+    wm_compcor_columns = [c for c in columns if c.startswith("w_comp_cor")]
     if not csf_compcor_columns:
         raise ValueError(f"No c_comp_cor columns in {confounds_file}")
 
@@ -339,7 +432,61 @@ def _get_acompcor_confounds(confounds_file):
     csf_compcor_columns = csf_compcor_columns[: min((5, len(csf_compcor_columns)))]
     wm_compcor_columns = wm_compcor_columns[: min((5, len(wm_compcor_columns)))]
     selected_columns = csf_compcor_columns + wm_compcor_columns
-    return confounds_df[selected_columns]
+    return read_columns(confounds_file, selected_columns)
+
+
+def _load_fmriprep_confounds(confounds_file, confounds_json_file, strategy, **kwargs):
+    """Select confounds from an fMRIPrep confounds file with nilearn's load_confounds.
+
+    Only the columns that the strategy may select are read, through the columnar store,
+    and written to a temporary TSV file, which nilearn then parses instead of the full file.
+
+    Parameters
+    ----------
+    confounds_file : :obj:`str`
+        The fMRIPrep confounds file.
+    confounds_json_file : :obj:`str` or None
+        The JSON file associated with the confounds file.
+        If None, the metadata attached to the confounds file in the columnar store are used.
+    strategy : :obj:`list` of :obj:`str`
+        The load_confounds noise components to select.
+    **kwargs
+        Parameters of the noise components (e.g., ``motion="full"``).
+
+    Returns
+    -------
+    confounds_df : :obj:`pandas.DataFrame`
+        The selected confounds, without demeaning.
+    """
+    import tempfile
+
+    # load_confounds finds some confounds by substring, so keep any column that contains one.
+    keywords = [
+        keyword
+        for component in ["non_steady_state"] + list(strategy)
+        for keyword in _STRATEGY_KEYWORDS[component]
+    ]
+    columns = [
+        c for c in read_column_names(confounds_file) if any(keyword in c for keyword in keywords)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        subset_file = os.path.join(tmpdir, "desc-confounds_timeseries.tsv")
+        read_columns(confounds_file, columns).to_csv(subset_file, sep="\t", index=False)
+        if confounds_json_file is None:
+            confounds_json_file = os.path.join(tmpdir, "desc-confounds_timeseries.json")
+            with open(confounds_json_file, "w") as fobj:
+                json.dump(read_metadata(confounds_file), fobj)
+
+        confounds_df = _load_single_confounds_file(
+            confounds_file=subset_file,
+            strategy=strategy,
+            demean=False,
+            confounds_json_file=confounds_json_file,
+            **kwargs,
+        )[1]
+
+    return confounds_df
 
 
 @fill_doc
@@ -372,72 +519,17 @@ def load_confound_matrix(
         These will be named something like "signal_[XX]".
         If ``params`` is "none", ``confounds_df`` will be None.
     """
-    PARAM_KWARGS = {
-        # Get rot and trans values, as well as derivatives and square
-        "24P": {
-            "strategy": ["motion"],
-            "motion": "full",
-        },
-        # Get rot and trans values, as well as derivatives and square, WM, CSF,
-        "27P": {
-            "strategy": ["motion", "global_signal", "wm_csf"],
-            "motion": "full",
-            "global_signal": "basic",
-            "wm_csf": "basic",
-        },
-        # Get rot and trans values, as well as derivatives, WM, CSF,
-        # global signal, and square. Add the square and derivative of the WM, CSF
-        # and global signal as well.
-        "36P": {
-            "strategy": ["motion", "global_signal", "wm_csf"],
-            "motion": "full",
-            "global_signal": "full",
-            "wm_csf": "full",
-        },
-        # Get the rot and trans values, their derivative,
-        # as well as acompcor and cosine
-        "acompcor": {
-            "strategy": ["motion", "high_pass", "compcor"],
-            "motion": "derivatives",
-            "compcor": "anat_separated",
-            "n_compcor": 5,
-        },
-        # Get the rot and trans values, as well as their derivative,
-        # acompcor and cosine values as well as global signal
-        "acompcor_gsr": {
-            "strategy": ["motion", "high_pass", "compcor", "global_signal"],
-            "motion": "derivatives",
-            "compcor": "anat_separated",
-            "global_signal": "basic",
-            "n_compcor": 5,
-        },
-        # Get WM and CSF
-        # AROMA confounds are loaded separately
-        "aroma": {
-            "strategy": ["wm_csf"],
-            "wm_csf": "basic",
-        },
-        # Get WM, CSF, and global signal
-        # AROMA confounds are loaded separately
-        "aroma_gsr": {
-            "strategy": ["wm_csf", "global_signal"],
-            "wm_csf": "basic",
-            "global_signal": "basic",
-        },
-    }
-
     if params == "none":
         return None
 
     if params in PARAM_KWARGS:
         kwargs = PARAM_KWARGS[params]
 
-        confounds_df = _load_single_confounds_file(
+        confounds_df = _load_fmriprep_confounds(
             confounds_file=confounds_file,
-            demean=False,
             confounds_json_file=confounds_json_file,
             **kwargs,
-        )[1]
+        )
 
     elif params == "custom":
         # For custom confounds with no other confounds
@@ -679,12 +771,14 @@ def _infer_dummy_scans(dummy_scans, confounds_file=None):
         Estimated number of dummy scans.
     """
     if dummy_scans == "auto":
-        confounds_df = pd.read_table(confounds_file)
-
-        nss_cols = [c for c in confounds_df.columns if c.startswith("non_steady_state_outlier")]
+        nss_cols = [
+            c
+            for c in read_column_names(confounds_file)
+            if c.startswith("non_steady_state_outlier")
+        ]
 
         if nss_cols:
-            initial_volumes_df = confounds_df[nss_cols]
+            initial_volumes_df = read_columns(confounds_file, nss_cols)
             dummy_scans = np.any(initial_volumes_df.to_numpy(), axis=1)
             dummy_scans = np.where(dummy_scans)[0]
 
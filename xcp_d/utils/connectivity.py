@@ -0,0 +1,631 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Functions for computing dense and seed-based functional connectivity.
+
+Pearson correlations are dot products of time series that have been centered and scaled
+to unit norm, so every correlation between two sets of time series is a single matrix product.
+For dense (grayordinate-by-grayordinate) connectivity, the product is far too large to hold
+in memory, so it is computed in blocks of columns and written straight into a memory-mapped
+output file.
+
+Dynamic (sliding-window) connectivity is computed from running sums and cross-products of
+parcel time series, which are updated with a rank-1 addition for each volume that enters the
+window and a rank-1 removal for each volume that leaves it,
+rather than by recomputing every window's correlation matrix from scratch.
+
+Regularized connectivity measures are derived from the Ledoit-Wolf shrinkage covariance.
+Each run's covariance matrix is factorized once (with a Cholesky decomposition) for its inverse,
+from which the partial correlations follow,
+and the group-level tangent-space embeddings use one eigendecomposition per matrix for each
+matrix function (logarithm, exponential, and inverse square root).
+"""
+import functools
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from nipype import logging
+from scipy.linalg import blas, lapack
+
+from xcp_d.utils.parallel import map_column_blocks
+
+LOGGER = logging.getLogger("nipype.utils")
+
+# The number of columns of the correlation matrix that are computed at a time.
+# For 91k grayordinates in float32, each block takes about 370 MB.
+DENSE_BLOCK_SIZE = 1024
+
+# Connectivity measures that can be estimated in addition to Pearson correlations.
+CONNECTIVITY_MEASURES = ("ledoitwolfcovariance", "partialcorrelation")
+
+# The exponential taper's time constant, as a fraction of the window length,
+# so the oldest volume in a window has about 5% of the newest volume's weight.
+EXPONENTIAL_TAPER_FRACTION = 1 / 3
+
+# The largest weight of a volume in the running sums before they are rescaled.
+MAX_WEIGHT = 1e100
+
+# Variances in a window below this fraction of a parcel's variance over the whole run are
+# treated as zero, since removing volumes from the running sums leaves round-off error.
+VARIANCE_RTOL = 1e-8
+
+
+def standardize_columns(data, dtype=np.float32):
+    """Center each column of a (T, S) array and scale it to unit norm.
+
+    Parameters
+    ----------
+    data : (T, S) :obj:`numpy.ndarray`
+        Time by voxels/vertices array of data.
+    dtype : :obj:`numpy.dtype`, optional
+        The output's dtype. Default is float32.
+
+    Returns
+    -------
+    standardized : (T, S) :obj:`numpy.ndarray`
+        The standardized data.
+        Constant columns, and columns with any NaNs, are all NaNs,
+        so their correlations are NaNs as well.
+    """
+    standardized = np.array(data, dtype=dtype)
+    standardized -= np.mean(standardized, axis=0)
+    norms = np.linalg.norm(standardized, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        standardized /= norms
+
+    return standardized
+
+
+def correlate_columns(standardized_a, standardized_b, out=None, block_size=None):
+    """Correlate every column of one standardized array with every column of another.
+
+    Parameters
+    ----------
+    standardized_a : (T, N) :obj:`numpy.ndarray`
+        Time series standardized with :func:`standardize_columns`.
+    standardized_b : (T, M) :obj:`numpy.ndarray`
+        Time series standardized with :func:`standardize_columns`.
+    out : (N, M) :obj:`numpy.ndarray` or None, optional
+        Array in which to write the correlations, such as a :obj:`numpy.memmap`.
+        If None, a new array is created.
+    block_size : :obj:`int` or None, optional
+        The number of columns of ``standardized_b`` that are correlated at a time.
+        If None, all columns are correlated at once.
+
+    Returns
+    -------
+    out : (N, M) :obj:`numpy.ndarray`
+        The correlations.
+    """
+    if standardized_a.shape[0] != standardized_b.shape[0]:
+        raise ValueError(
+            f"The arrays have different numbers of volumes ({standardized_a.shape[0]} and "
+            f"{standardized_b.shape[0]})."
+        )
+
+    # Each block is a single (N x T) @ (T x block_size) matrix product,
+    # which BLAS spreads over the available threads.
+    return map_column_blocks(
+        functools.partial(np.matmul, standardized_a.T),
+        standardized_b,
+        n_out_rows=standardized_a.shape[1],
+        out=out,
+        block_size=block_size,
+    )
+
+
+def get_sliding_windows(n_volumes, window_length, step=1):
+    """Get the onsets of the sliding windows that fit in a run.
+
+    Parameters
+    ----------
+    n_volumes : :obj:`int`
+        The number of volumes in the run, including censored volumes.
+    window_length : :obj:`int`
+        The number of volumes in each window.
+    step : :obj:`int`, optional
+        The number of volumes between the onsets of consecutive windows. Default is 1.
+
+    Returns
+    -------
+    onsets : :obj:`numpy.ndarray` of shape (n_windows,)
+        The index of each window's first volume.
+    """
+    if window_length < 2:
+        raise ValueError(f"Windows must have at least two volumes, not {window_length}.")
+
+    if step < 1:
+        raise ValueError(f"The step between windows must be at least one volume, not {step}.")
+
+    return np.arange(0, n_volumes - window_length + 1, step)
+
+
+def sliding_window_correlations(
+    timeseries,
+    window_length,
+    step=1,
+    taper="boxcar",
+    sample_mask=None,
+    min_volumes=None,
+    out=None,
+):
+    """Compute correlation matrices in sliding windows, with rank-1 updates.
+
+    Parameters
+    ----------
+    timeseries : (T, N) :obj:`numpy.ndarray`
+        Time by parcels array of time series, including censored volumes.
+        Parcels with any NaNs (e.g., from insufficient coverage) get NaN correlations.
+    window_length : :obj:`int`
+        The number of volumes in each window, including censored volumes.
+    step : :obj:`int`, optional
+        The number of volumes between the onsets of consecutive windows. Default is 1.
+    taper : {"boxcar", "exponential"}, optional
+        How volumes in each window are weighted.
+        "boxcar" weights all volumes equally.
+        "exponential" weights each volume by ``exp(-age / tau)``, where ``age`` is the number
+        of volumes from the end of the window and ``tau`` is a third of the window length,
+        so recent volumes contribute more than older ones.
+        Default is "boxcar".
+    sample_mask : (T,) :obj:`numpy.ndarray` of bool or None, optional
+        True for volumes to retain and False for censored volumes, which are skipped.
+        If None, all volumes are retained.
+    min_volumes : :obj:`int` or None, optional
+        The minimum number of retained volumes in a window.
+        Windows with fewer retained volumes are all NaNs.
+        If None, half of the window length (and at least three volumes) is used.
+    out : (n_windows, N, N) array-like or None, optional
+        Array in which to write each window's correlation matrix,
+        such as an :obj:`h5py.Dataset`.
+        If None, a new array is created.
+
+    Returns
+    -------
+    out : (n_windows, N, N) array-like
+        The windows' correlation matrices.
+    onsets : (n_windows,) :obj:`numpy.ndarray`
+        The index of each window's first volume.
+    n_retained : (n_windows,) :obj:`numpy.ndarray`
+        The number of retained volumes in each window.
+
+    Notes
+    -----
+    For each window, the weighted sum of the retained volumes' time series and the weighted
+    sum of their outer products are kept up to date as the window slides.
+    Each volume that enters or leaves the window changes those sums by a rank-1 term,
+    which is applied to the cross-products in place with BLAS's ``ger``.
+    Rather than decaying the sums with each volume, the exponential taper adds each volume
+    with a weight that grows exponentially over the run, which gives the same correlations.
+    Updating the sums costs O(N^2) operations per volume,
+    instead of O(window_length * N^2) to recompute each window.
+    """
+    if taper not in ("boxcar", "exponential"):
+        raise ValueError(f"Unknown taper '{taper}'. Must be 'boxcar' or 'exponential'.")
+
+    timeseries = np.asarray(timeseries, dtype=np.float64)
+    n_volumes, n_parcels = timeseries.shape
+    if sample_mask is None:
+        sample_mask = np.ones(n_volumes, dtype=bool)
+
+    sample_mask = np.asarray(sample_mask, dtype=bool)
+    if sample_mask.shape != (n_volumes,):
+        raise ValueError(
+            f"The sample mask's shape {sample_mask.shape} does not match the number of "
+            f"volumes ({n_volumes})."
+        )
+
+    if min_volumes is None:
+        min_volumes = max(window_length // 2, 3)
+
+    onsets = get_sliding_windows(n_volumes, window_length, step)
+    n_windows = onsets.size
+    if out is None:
+        out = np.empty((n_windows, n_parcels, n_parcels), dtype=np.float32)
+
+    # Parcels with NaNs are zeroed for the updates and get NaN correlations.
+    bad_parcels = np.any(np.isnan(timeseries[sample_mask]), axis=0)
+    # Centering on the retained volumes' mean keeps the running sums small,
+    # which limits the round-off error from removing volumes.
+    timeseries = timeseries - np.mean(timeseries[sample_mask], axis=0)
+    timeseries[:, bad_parcels] = 0
+    min_variances = VARIANCE_RTOL * np.mean(timeseries[sample_mask] ** 2, axis=0)
+
+    # Each volume's weight grows by a constant factor over the run, so the ratio of a volume's
+    # weight to the newest volume's weight decays exponentially with its age.
+    # The sums are only rescaled once the weights get too large.
+    growth_rate = 0.0
+    if taper == "exponential":
+        growth_rate = 1 / (EXPONENTIAL_TAPER_FRACTION * window_length)
+
+    ger = blas.get_blas_funcs("ger", dtype=np.float64)
+    sums = np.zeros(n_parcels)
+    cross_products = np.zeros((n_parcels, n_parcels), order="F")
+    total_weight = 0.0
+    log_offset = 0.0
+    correlations = np.empty((n_parcels, n_parcels), dtype=np.float32, order="F")
+    n_retained = np.zeros(n_windows, dtype=int)
+    for i_window, onset in enumerate(onsets):
+        start = 0 if i_window == 0 else onsets[i_window - 1] + window_length
+        for i_volume in range(start, onset + window_length):
+            weight = np.exp(i_volume * growth_rate - log_offset)
+            if weight > MAX_WEIGHT:
+                sums /= weight
+                cross_products /= weight
+                total_weight /= weight
+                log_offset += np.log(weight)
+                weight = 1.0
+
+            if sample_mask[i_volume]:
+                _add_volume(ger, timeseries[i_volume], weight, sums, cross_products)
+                total_weight += weight
+
+            i_leaving = i_volume - window_length
+            if i_leaving >= 0 and sample_mask[i_leaving]:
+                leaving_weight = np.exp(i_leaving * growth_rate - log_offset)
+                _add_volume(ger, timeseries[i_leaving], -leaving_weight, sums, cross_products)
+                total_weight -= leaving_weight
+
+        n_retained[i_window] = sample_mask[onset : onset + window_length].sum()
+        if n_retained[i_window] < min_volumes:
+            correlations.fill(np.nan)
+        else:
+            correlations = _weighted_correlations(
+                sums,
+                cross_products,
+                total_weight,
+                bad_parcels | (min_variances == 0),
+                min_variances,
+                correlations,
+            )
+
+        # The matrix is symmetric, so its C-ordered transpose is the fastest to copy.
+        out[i_window] = correlations.T
+
+    return out, onsets, n_retained
+
+
+def _add_volume(ger, volume, weight, sums, cross_products):
+    """Add a weighted volume to the running sums, in place, with a rank-1 BLAS update."""
+    sums += weight * volume
+    ger(weight, volume, volume, a=cross_products, overwrite_a=1)
+
+
+def _weighted_correlations(sums, cross_products, total_weight, bad_parcels, min_variances, out):
+    """Convert weighted sums and cross-products to a correlation matrix.
+
+    The correlation of parcels i and j is ``(C[i, j] - s[i] * s[j] / W) * u[i] * u[j]``,
+    where ``u`` is the inverse of the parcels' standard deviations (scaled by W),
+    so it is computed with two scalings and one rank-1 update of the cross-products,
+    in place in the Fortran-ordered, float32 ``out`` array.
+    """
+    variances = np.diag(cross_products) - sums**2 / total_weight
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse_stds = 1 / np.sqrt(variances)
+
+    # Parcels with NaNs or no variance in the window get NaN correlations.
+    inverse_stds[bad_parcels | (variances <= min_variances * total_weight)] = np.nan
+    scaled_sums = (sums * inverse_stds / np.sqrt(total_weight)).astype(np.float32)
+    inverse_stds = inverse_stds.astype(np.float32)
+
+    # Casting and scaling in place is much faster than broadcasting into a new array.
+    out[...] = cross_products
+    out *= inverse_stds[:, None]
+    out *= inverse_stds[None, :]
+    ger = blas.get_blas_funcs("ger", dtype=np.float32)
+    return ger(-1.0, scaled_sums, scaled_sums, a=out, overwrite_a=1)
+
+
+def ledoit_wolf_covariance(timeseries):
+    """Estimate the Ledoit-Wolf shrinkage covariance of a set of time series.
+
+    Parameters
+    ----------
+    timeseries : (T, N) :obj:`numpy.ndarray`
+        Time by parcels array of time series, without NaNs.
+
+    Returns
+    -------
+    covariance : (N, N) :obj:`numpy.ndarray`
+        The shrunk covariance matrix.
+    shrinkage : :obj:`float`
+        The Ledoit-Wolf shrinkage coefficient, between zero and one.
+
+    Notes
+    -----
+    The shrunk covariance is ``(1 - shrinkage) * S + shrinkage * mu * I``,
+    where ``S`` is the (biased) sample covariance and ``mu`` is its mean eigenvalue,
+    as in :func:`sklearn.covariance.ledoit_wolf`.
+    The shrinkage coefficient's fourth-moment term is the sum of the squared rows' sums,
+    rather than the sum of a second (N, N) matrix product.
+    """
+    timeseries = np.asarray(timeseries, dtype=np.float64)
+    n_volumes, n_parcels = timeseries.shape
+    centered = timeseries - np.mean(timeseries, axis=0)
+    sample_covariance = centered.T @ centered / n_volumes
+    mu = np.trace(sample_covariance) / n_parcels
+
+    # The shrinkage coefficient from Ledoit & Wolf (2004), reusing the sample covariance.
+    beta_ = np.sum(np.sum(centered**2, axis=1) ** 2) / n_volumes
+    delta_ = np.sum(sample_covariance**2)
+    beta = (beta_ - delta_) / (n_parcels * n_volumes)
+    delta = (delta_ - 2 * mu * np.trace(sample_covariance) + n_parcels * mu**2) / n_parcels
+    beta = min(beta, delta)
+    shrinkage = 0.0 if beta == 0 else beta / delta
+
+    covariance = sample_covariance
+    covariance *= 1 - shrinkage
+    covariance.flat[:: n_parcels + 1] += shrinkage * mu
+    return covariance, shrinkage
+
+
+def invert_covariance(covariance):
+    """Invert a symmetric positive definite matrix with a Cholesky decomposition.
+
+    Parameters
+    ----------
+    covariance : (N, N) :obj:`numpy.ndarray`
+        Symmetric positive definite matrix.
+
+    Returns
+    -------
+    precision : (N, N) :obj:`numpy.ndarray`
+        The matrix's inverse.
+    """
+    cholesky, info = lapack.dpotrf(covariance, lower=False)
+    if info == 0:
+        precision, info = lapack.dpotri(cholesky, lower=False)
+
+    if info != 0:
+        raise np.linalg.LinAlgError("The covariance matrix is not positive definite.")
+
+    # LAPACK only fills the upper triangle.
+    return np.triu(precision) + np.triu(precision, k=1).T
+
+
+def apply_eigenvalue_function(eigenvalues, eigenvectors, func=None):
+    """Rebuild a symmetric matrix from its eigendecomposition, with a function of its eigenvalues.
+
+    Parameters
+    ----------
+    eigenvalues : (N,) :obj:`numpy.ndarray`
+        The matrix's eigenvalues.
+    eigenvectors : (N, N) :obj:`numpy.ndarray`
+        The matrix's eigenvectors, in columns.
+    func : callable or None, optional
+        Function to apply to the eigenvalues, such as :func:`numpy.log` for the matrix
+        logarithm. If None, the matrix itself is rebuilt.
+
+    Returns
+    -------
+    matrix : (N, N) :obj:`numpy.ndarray`
+        The symmetric matrix ``V @ diag(func(w)) @ V.T``.
+    """
+    if func is not None:
+        eigenvalues = func(eigenvalues)
+
+    matrix = (eigenvectors * eigenvalues) @ eigenvectors.T
+    # Symmetrize the round-off error.
+    return (matrix + matrix.T) / 2
+
+
+def estimate_connectivity(timeseries, measures):
+    """Estimate regularized connectivity matrices from one shrunk covariance matrix.
+
+    Parameters
+    ----------
+    timeseries : (T, N) :obj:`numpy.ndarray`
+        Time by parcels array of time series.
+        Parcels with any NaNs (e.g., from insufficient coverage) are excluded from the
+        estimation, and their rows and columns are NaNs.
+    measures : :obj:`list` of :obj:`str`
+        The measures to estimate, from ``CONNECTIVITY_MEASURES``.
+        "ledoitwolfcovariance" is the Ledoit-Wolf shrinkage covariance.
+        "partialcorrelation" is the partial correlation derived from its inverse.
+
+    Returns
+    -------
+    connectivity : :obj:`dict`
+        The (N, N) matrix of each measure.
+    """
+    unknown_measures = sorted(set(measures) - set(CONNECTIVITY_MEASURES))
+    if unknown_measures:
+        raise ValueError(f"Unknown connectivity measures: {', '.join(unknown_measures)}")
+
+    timeseries = np.asarray(timeseries, dtype=np.float64)
+    n_parcels = timeseries.shape[1]
+    good_parcels = ~np.any(np.isnan(timeseries), axis=0)
+    covariance, shrinkage = ledoit_wolf_covariance(timeseries[:, good_parcels])
+    LOGGER.debug(f"Ledoit-Wolf shrinkage: {shrinkage:.3f}")
+
+    good_matrices = {"ledoitwolfcovariance": covariance}
+    if "partialcorrelation" in measures:
+        precision = invert_covariance(covariance)
+        inverse_stds = 1 / np.sqrt(np.diag(precision))
+        partial_correlation = -precision * np.outer(inverse_stds, inverse_stds)
+        np.fill_diagonal(partial_correlation, 1)
+        good_matrices["partialcorrelation"] = partial_correlation
+
+    connectivity = {}
+    for measure in measures:
+        matrix = np.full((n_parcels, n_parcels), np.nan)
+        matrix[np.ix_(good_parcels, good_parcels)] = good_matrices[measure]
+        connectivity[measure] = matrix
+
+    return connectivity
+
+
+def log_euclidean_mean(covariances):
+    """Compute the log-Euclidean mean of a stream of covariance matrices.
+
+    Parameters
+    ----------
+    covariances : iterable of (N, N) :obj:`numpy.ndarray`
+        Symmetric positive definite matrices, e.g., from a generator that loads one file at
+        a time, so only one matrix is held in memory at a time.
+
+    Returns
+    -------
+    mean : (N, N) :obj:`numpy.ndarray`
+        The matrix exponential of the mean of the matrices' logarithms.
+
+    Notes
+    -----
+    The log-Euclidean mean approximates the geometric mean that :mod:`nilearn` uses as the
+    reference for tangent-space embeddings, but can be accumulated in a single pass.
+    """
+    log_sum = None
+    n_matrices = 0
+    for covariance in covariances:
+        log_covariance = apply_eigenvalue_function(*np.linalg.eigh(covariance), np.log)
+        log_sum = log_covariance if log_sum is None else log_sum + log_covariance
+        n_matrices += 1
+
+    if n_matrices == 0:
+        raise ValueError("At least one covariance matrix is required.")
+
+    return apply_eigenvalue_function(*np.linalg.eigh(log_sum / n_matrices), np.exp)
+
+
+def get_whitening(reference):
+    """Compute the inverse square root of a reference covariance matrix.
+
+    Parameters
+    ----------
+    reference : (N, N) :obj:`numpy.ndarray`
+        Symmetric positive definite matrix, e.g., the group mean covariance matrix.
+
+    Returns
+    -------
+    whitening : (N, N) :obj:`numpy.ndarray`
+        The reference's inverse square root.
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh(reference)
+    return apply_eigenvalue_function(eigenvalues, eigenvectors, lambda w: 1 / np.sqrt(w))
+
+
+def tangent_embedding(covariance, whitening):
+    """Project a covariance matrix onto the tangent space at a reference matrix.
+
+    Parameters
+    ----------
+    covariance : (N, N) :obj:`numpy.ndarray`
+        Symmetric positive definite matrix, e.g., one run's Ledoit-Wolf covariance.
+    whitening : (N, N) :obj:`numpy.ndarray`
+        The reference matrix's inverse square root, from :func:`get_whitening`,
+        which is computed once and reused for every run.
+
+    Returns
+    -------
+    tangent : (N, N) :obj:`numpy.ndarray`
+        ``logm(whitening @ covariance @ whitening)``.
+    """
+    whitened = whitening @ covariance @ whitening
+    return apply_eigenvalue_function(*np.linalg.eigh(whitened), np.log)
+
+
+def write_tangent_embeddings(covariance_files, output_dir):
+    """Embed runs' Ledoit-Wolf covariance matrices in their group's tangent space.
+
+    Covariance files are grouped by atlas and description (e.g., exact numbers of volumes),
+    and each group's reference is the log-Euclidean mean of its covariance matrices.
+    The files are streamed, so only one covariance matrix is held in memory at a time.
+
+    Parameters
+    ----------
+    covariance_files : :obj:`list` of :obj:`str`
+        The runs' ``measure-ledoitwolfcovariance`` TSV files.
+    output_dir : :obj:`str`
+        Directory in which to write the ``measure-tangent`` TSV files,
+        with the same names as the covariance files otherwise,
+        and each group's ``stat-mean`` reference covariance matrix.
+
+    Returns
+    -------
+    out_files : :obj:`list` of :obj:`str`
+        The tangent-space embedding files.
+
+    Notes
+    -----
+    Parcels that are missing (all NaNs) in any run of a group are excluded from the group's
+    embeddings, so every run is embedded in the same space.
+    """
+    groups = defaultdict(list)
+    for covariance_file in covariance_files:
+        filename = os.path.basename(covariance_file)
+        if "_measure-ledoitwolfcovariance_" not in filename:
+            raise ValueError(f"Not a Ledoit-Wolf covariance file: {covariance_file}")
+
+        entities = []
+        for entity in ("atlas", "desc"):
+            match = re.search(f"_{entity}-([a-zA-Z0-9]+)", filename)
+            if match:
+                entities.append(f"{entity}-{match.group(1)}")
+
+        groups["_".join(entities)].append(covariance_file)
+
+    os.makedirs(output_dir, exist_ok=True)
+    out_files = []
+    for group, group_files in sorted(groups.items()):
+        LOGGER.info(f"Embedding {len(group_files)} runs in the tangent space of '{group}'.")
+        # The first pass finds the parcels that are present in every run.
+        node_labels, good_parcels = None, None
+        for covariance_file in group_files:
+            covariance_df = pd.read_table(covariance_file, index_col="Node")
+            if node_labels is None:
+                node_labels = covariance_df.index
+                good_parcels = np.ones(node_labels.size, dtype=bool)
+            elif not covariance_df.index.equals(node_labels):
+                raise ValueError(f"{covariance_file} has different nodes from {group_files[0]}.")
+
+            good_parcels &= ~np.isnan(np.diag(covariance_df.to_numpy()))
+
+        # The second pass computes the reference, and the third embeds each run.
+        reference = log_euclidean_mean(_iter_covariances(group_files, good_parcels))
+        whitening = get_whitening(reference)
+
+        n_parcels = node_labels.size
+        good_idx = np.ix_(good_parcels, good_parcels)
+        reference_arr = np.full((n_parcels, n_parcels), np.nan)
+        reference_arr[good_idx] = reference
+        reference_file = os.path.join(
+            output_dir,
+            f"{group}_measure-ledoitwolfcovariance_stat-mean_conmat.tsv".lstrip("_"),
+        )
+        _write_matrix_tsv(reference_arr, node_labels, reference_file)
+
+        for covariance_file, covariance in zip(
+            group_files,
+            _iter_covariances(group_files, good_parcels),
+        ):
+            tangent_arr = np.full((n_parcels, n_parcels), np.nan)
+            tangent_arr[good_idx] = tangent_embedding(covariance, whitening)
+            out_file = os.path.join(
+                output_dir,
+                os.path.basename(covariance_file).replace(
+                    "_measure-ledoitwolfcovariance_",
+                    "_measure-tangent_",
+                ),
+            )
+            _write_matrix_tsv(tangent_arr, node_labels, out_file)
+            out_files.append(out_file)
+
+    return out_files
+
+
+def _iter_covariances(covariance_files, good_parcels):
+    """Load covariance matrices one at a time, limited to the parcels present in every run."""
+    for covariance_file in covariance_files:
+        covariance = pd.read_table(covariance_file, index_col="Node").to_numpy()
+        yield covariance[np.ix_(good_parcels, good_parcels)]
+
+
+def _write_matrix_tsv(matrix, node_labels, out_file):
+    """Write a parcel-by-parcel matrix to a TSV file, in the same format as xcp_d's conmats."""
+    pd.DataFrame(matrix, index=node_labels, columns=node_labels).to_csv(
+        out_file,
+        sep="\t",
+        na_rep="n/a",
+        index_label="Node",
+    )
@@ -51,6 +51,16 @@ work_dir : :obj:`str`
     Directory in which to store workflow execution state and temporary files.
 """
 
+docdict[
+    "atlas_cache_dir"
+] = """
+atlas_cache_dir : :obj:`str` or None
+    Directory in which atlases resampled to the BOLD data's space are cached.
+    Entries are keyed on the atlas, the transforms, and the BOLD data's grid or brain models,
+    so they are shared by all runs and subjects with the same space and resolution.
+    If None, no caching is performed.
+"""
+
 docdict[
     "analysis_level"
 ] = """
@@ -123,6 +133,17 @@ params : {"36P", "24P", "27P", "acompcor", "acompcor_gsr", \
     Default is "36P", most expansive option.
 """
 
+docdict[
+    "additional_params"
+] = """
+additional_params : :obj:`list` of :obj:`str`
+    Additional nuisance regression strategies (see ``params``) to compare against the primary
+    one.
+    The BOLD data are denoised with all of them in a single pass,
+    and each strategy's outputs are labeled with its own ``desc`` entity.
+    Default is an empty list.
+"""
+
 docdict[
     "input_type"
 ] = """
@@ -146,6 +167,17 @@ dcan_qc : :obj:`bool`
     3. DCAN QC files will be generated.
 """
 
+docdict[
+    "combineruns_mode"
+] = """
+combineruns_mode : {"dense", "parcellated"}
+    Which derivatives to concatenate across runs.
+    "dense" concatenates the dense BOLD derivatives, as well as the parcellated time series.
+    "parcellated" only concatenates the parcellated time series, motion parameters, and
+    temporal masks.
+    In both cases, correlation matrices are calculated from the concatenated time series.
+"""
+
 docdict[
     "smoothing"
 ] = """
@@ -238,6 +270,20 @@ bpf_order : :obj:`int`
     ``upper_bpf``/``low_pass``.
 """
 
+docdict[
+    "compose_filter"
+] = """
+compose_filter : :obj:`bool`
+    If True, censored-volume interpolation and band-pass filtering are composed into a single
+    temporal operator, which is built once per run and applied to all voxels/vertices with one
+    matrix multiplication.
+    The results match the two-step interpolation and filtering to within floating-point
+    precision.
+    The matrix multiplication scales with the square of the number of volumes,
+    so it only pays off when many BLAS threads are available.
+    Default is False.
+"""
+
 docdict[
     "motion_filter_type"
 ] = """
@@ -369,6 +415,59 @@ process_surfaces : :obj:`bool`, optional
     By default, this workflow is disabled.
 """
 
+docdict[
+    "dense_connectivity"
+] = """
+dense_connectivity : {"none", "seeds", "all"}
+    Grayordinate-wise functional connectivity to compute from the censored, denoised CIFTI
+    data. Only used for CIFTI data.
+    "seeds" correlates each parcel's time series with every grayordinate, for every atlas.
+    "all" also correlates every pair of grayordinates, producing a dense connectome
+    (about 33 GB for 91k grayordinates).
+    Default is "none".
+"""
+
+docdict[
+    "connectivity_measures"
+] = """
+connectivity_measures : :obj:`list` of {"ledoitwolfcovariance", "partialcorrelation"}
+    Regularized connectivity measures to estimate from each atlas's parcellated time series,
+    in addition to Pearson correlations.
+    "ledoitwolfcovariance" is the Ledoit-Wolf shrinkage covariance,
+    which is also the input to the group-level tangent-space embedding
+    (``xcp_d-tangent-connectivity``).
+    "partialcorrelation" is the partial correlation from the shrunk covariance's inverse.
+    Default is an empty list.
+"""
+
+docdict[
+    "dynamic_window"
+] = """
+dynamic_window : :obj:`float` or None
+    Length, in seconds, of the sliding windows in which to compute dynamic functional
+    connectivity from each atlas's parcellated time series.
+    If None, dynamic connectivity is not computed.
+    Default is None.
+"""
+
+docdict[
+    "dynamic_step"
+] = """
+dynamic_step : :obj:`float` or None
+    Time, in seconds, between the onsets of consecutive dynamic connectivity windows.
+    If None, windows start at every volume.
+    Default is None.
+"""
+
+docdict[
+    "dynamic_taper"
+] = """
+dynamic_taper : {"boxcar", "exponential"}
+    How volumes are weighted within each dynamic connectivity window.
+    "boxcar" weights all volumes equally, while "exponential" down-weights older volumes.
+    Default is "boxcar".
+"""
+
 docdict[
     "subject_id"
 ] = """
@@ -424,6 +523,17 @@ min_time : :obj:`float`
     Default is 100.
 """
 
+docdict[
+    "kernel_cache_dir"
+] = """
+kernel_cache_dir : :obj:`str` or None
+    Directory in which CIFTI smoothing kernels are cached.
+    Kernels are keyed on the brain models, the surfaces, and the FWHM,
+    so they are shared by all runs and subjects with the same brain models.
+    The ``XCPD_KERNEL_CACHE`` environment variable, if set, overrides this directory.
+    If None (and ``XCPD_KERNEL_CACHE`` is not set), no caching is performed.
+"""
+
 docdict[
     "despike"
 ] = """
@@ -431,9 +541,20 @@ despike : :obj:`bool`
     If True, the BOLD data will be despiked before censoring/denoising/filtering/interpolation.
     If False, no despiking will be performed.
 
-    For NIFTI data, despiking is performed with AFNI's 3dDespike.
+    See ``despike_method`` for how the data are despiked.
+"""
+
+docdict[
+    "despike_method"
+] = """
+despike_method : {"afni", "native"}
+    How to despike the BOLD data.
+    If "afni", AFNI's 3dDespike is run with the -NEW option.
     For CIFTI data, the data will be converted to NIFTI format, 3dDespike will be run, and then
     the despiked data will be converted back to CIFTI format.
+    If "native", the L1 curve fit of 3dDespike (without -NEW) is reimplemented in Python,
+    and NIFTI and CIFTI data are despiked directly.
+    Default is "afni".
 """
 
 docdict[
@@ -2,6 +2,7 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 """Miscellaneous file manipulation functions."""
+import os
 import os.path as op
 
 import numpy as np
@@ -12,6 +13,17 @@ fmlogger = logging.getLogger("nipype.utils")
 
 related_filetype_sets = [(".hdr", ".img", ".mat"), (".nii", ".mat"), (".BRIK", ".HEAD")]
 
+# Compression of the NIfTI files written to the working directory.
+# Set from the command line (``--work-compression``), through an environment variable
+# so that it reaches every node's process.
+WORK_COMPRESSION_ENV = "XCPD_WORK_COMPRESSION"
+WORK_COMPRESSION_EXTENSIONS = {
+    # Uncompressed files are memory-mapped by nibabel when they are read.
+    "none": ".nii",
+    # nibabel writes gzipped files with compression level 1.
+    "fast": ".nii.gz",
+}
+
 
 def split_filename(fname):
     """Split a filename into parts: path, base filename and extension.
@@ -146,3 +158,52 @@ def ensure_list(filename):
         return [x for x in filename]
     else:
         return None
+
+
+def get_work_compression():
+    """Get the compression policy for NIfTI files in the working directory.
+
+    Returns
+    -------
+    work_compression : {"none", "fast"}
+        The policy set with ``--work-compression``. Default is "fast".
+    """
+    work_compression = os.getenv(WORK_COMPRESSION_ENV, "fast")
+    if work_compression not in WORK_COMPRESSION_EXTENSIONS:
+        raise ValueError(
+            f"Unsupported {WORK_COMPRESSION_ENV} value '{work_compression}'. "
+            f"Options are {sorted(WORK_COMPRESSION_EXTENSIONS)}."
+        )
+
+    return work_compression
+
+
+def set_work_extension(fname):
+    """Apply the working directory's compression policy to a NIfTI filename.
+
+    Parameters
+    ----------
+    fname : :obj:`str`
+        Filename of an intermediate file.
+
+    Returns
+    -------
+    fname : :obj:`str`
+        The filename, with a ``.nii`` or ``.nii.gz`` extension, depending on the policy.
+        Other files, including CIFTIs, are returned unchanged.
+
+    Examples
+    --------
+    >>> import os
+    >>> os.environ["XCPD_WORK_COMPRESSION"] = "none"
+    >>> set_work_extension("/tmp/sub-01_bold.nii.gz")
+    '/tmp/sub-01_bold.nii'
+    >>> set_work_extension("/tmp/sub-01_bold.dtseries.nii")
+    '/tmp/sub-01_bold.dtseries.nii'
+    >>> del os.environ["XCPD_WORK_COMPRESSION"]
+    """
+    pth, base, ext = split_filename(fname)
+    if ext not in (".nii", ".nii.gz"):
+        return fname
+
+    return op.join(pth, base + WORK_COMPRESSION_EXTENSIONS[get_work_compression()])
@@ -0,0 +1,264 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Utilities for tracking the derivatives written by xcp_d.
+
+Every file written by :class:`~xcp_d.interfaces.bids.DerivativesDataSink` is recorded in a
+small manifest under ``xcp_d/logs/manifests``, grouped by subject and run.
+The report-generation steps read these manifests instead of indexing the whole
+derivatives tree with :class:`bids.layout.BIDSLayout`.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from bids.layout import Config, Query, parse_file_entities
+from nipype import logging
+from pkg_resources import resource_filename as pkgrf
+
+LOGGER = logging.getLogger("nipype.utils")
+
+MANIFEST_DIR = os.path.join("logs", "manifests")
+
+# Entities that identify a single run, in the order they appear in BIDS filenames.
+RUN_ENTITIES = {
+    "session": "ses",
+    "task": "task",
+    "acquisition": "acq",
+    "ceagent": "ce",
+    "reconstruction": "rec",
+    "direction": "dir",
+    "run": "run",
+    "echo": "echo",
+}
+
+_CONFIG = None
+
+
+def _get_config():
+    """Load the pybids configurations used to parse xcp_d derivative filenames."""
+    global _CONFIG
+
+    if _CONFIG is None:
+        xcp_d_spec = json.loads(Path(pkgrf("xcp_d", "data/xcp_d_bids_config.json")).read_text())
+        _CONFIG = [Config.load("bids"), Config.load("derivatives"), Config.load(xcp_d_spec)]
+
+    return _CONFIG
+
+
+def parse_entities(filename):
+    """Parse BIDS entities from an xcp_d derivative filename.
+
+    Parameters
+    ----------
+    filename : :obj:`str`
+        Path to the file. Directory-based entities (e.g., ``datatype``) are only parsed
+        if the path includes the relevant directories.
+
+    Returns
+    -------
+    entities : :obj:`dict`
+        The entities found in the filename.
+    """
+    return parse_file_entities(str(filename), config=_get_config())
+
+
+def get_run_key(entities):
+    """Build the key under which a derivative's manifest entries are grouped.
+
+    Parameters
+    ----------
+    entities : :obj:`dict`
+        Entities parsed from a derivative filename.
+
+    Returns
+    -------
+    run_key : :obj:`str`
+        A BIDS-like prefix, such as ``sub-01_ses-1_task-rest_run-1``.
+        Subject-level (e.g., anatomical) derivatives only get the subject entity.
+    """
+    run_key = f"sub-{entities['subject']}"
+    for entity, abbreviation in RUN_ENTITIES.items():
+        if entity in entities:
+            run_key += f"_{abbreviation}-{entities[entity]}"
+
+    return run_key
+
+
+def write_manifest_entries(xcpd_dir, out_files, source_file=None):
+    """Record derivative files in the xcp_d manifest.
+
+    Each file is recorded in its own small JSON file, named after a hash of its path,
+    so concurrent nodes never write to the same manifest file and re-runs overwrite
+    their previous entries.
+
+    Parameters
+    ----------
+    xcpd_dir : :obj:`str`
+        Path to the xcp_d derivatives directory.
+    out_files : :obj:`str` or :obj:`list` of :obj:`str`
+        Paths to the derivative files to record.
+        Files outside of ``xcpd_dir`` or without a subject entity are skipped.
+    source_file : :obj:`str` or :obj:`list` of :obj:`str` or None, optional
+        The file(s) from which the derivatives were named.
+    """
+    from xcp_d.utils.filemanip import ensure_list
+
+    xcpd_dir = os.path.abspath(xcpd_dir)
+    source_files = [os.path.basename(f) for f in (ensure_list(source_file) or [])]
+
+    for out_file in ensure_list(out_files):
+        out_file = os.path.abspath(out_file)
+        rel_path = os.path.relpath(out_file, xcpd_dir)
+        if rel_path.startswith(os.pardir):
+            LOGGER.debug(f"Not recording {out_file} in manifest: outside of {xcpd_dir}.")
+            continue
+
+        entities = parse_entities(out_file)
+        if "subject" not in entities:
+            continue
+
+        run_dir = os.path.join(
+            xcpd_dir,
+            MANIFEST_DIR,
+            f"sub-{entities['subject']}",
+            get_run_key(entities),
+        )
+        os.makedirs(run_dir, exist_ok=True)
+
+        entry_file = os.path.join(
+            run_dir,
+            f"{hashlib.sha1(rel_path.encode()).hexdigest()[:16]}.json",
+        )
+        entry = {"path": rel_path, "source_file": source_files}
+
+        # Write to a temporary file first, so readers never see a partial entry.
+        temp_file = f"{entry_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w") as fo:
+            json.dump(entry, fo)
+
+        os.replace(temp_file, entry_file)
+
+
+def load_manifest(xcpd_dir, subject_id):
+    """Collect the derivative files recorded in a subject's manifest.
+
+    Parameters
+    ----------
+    xcpd_dir : :obj:`str`
+        Path to the xcp_d derivatives directory.
+    subject_id : :obj:`str`
+        Subject ID, with or without the "sub-" prefix.
+
+    Returns
+    -------
+    files : :obj:`list` of :obj:`str`
+        Sorted absolute paths to recorded files that still exist.
+        Empty if no manifest was written for the subject.
+    """
+    xcpd_dir = os.path.abspath(xcpd_dir)
+    subject_id = subject_id[4:] if subject_id.startswith("sub-") else subject_id
+    subject_dir = os.path.join(xcpd_dir, MANIFEST_DIR, f"sub-{subject_id}")
+
+    files = set()
+    for dirpath, _, filenames in os.walk(subject_dir):
+        for filename in filenames:
+            if not filename.endswith(".json"):
+                continue
+
+            with open(os.path.join(dirpath, filename), "r") as fo:
+                entry = json.load(fo)
+
+            out_file = os.path.join(xcpd_dir, entry["path"])
+            if os.path.isfile(out_file):
+                files.add(out_file)
+
+    return sorted(files)
+
+
+class ManifestFile(object):
+    """A derivative file recorded in the xcp_d manifest.
+
+    This mirrors the parts of :class:`bids.layout.BIDSFile` used by the report generators.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        Absolute path to the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.entities = parse_entities(path)
+
+    def get_entities(self):
+        """Return the file's entities."""
+        return self.entities
+
+
+class ManifestLayout(object):
+    """A lightweight, read-only stand-in for :class:`bids.layout.BIDSLayout`.
+
+    Queries are evaluated against the files recorded in the xcp_d manifest,
+    so the derivatives tree does not need to be indexed.
+
+    Parameters
+    ----------
+    root : :obj:`str`
+        The directory the layout represents.
+        Only files within this directory are included.
+    files : :obj:`list` of :obj:`str`
+        Paths to the files in the layout, as returned by :func:`load_manifest`.
+    """
+
+    def __init__(self, root, files):
+        self.root = str(root)
+        root = os.path.abspath(root)
+        self.files = [
+            ManifestFile(f) for f in files if not os.path.relpath(f, root).startswith(os.pardir)
+        ]
+
+    @staticmethod
+    def _matches(value, target):
+        if target is Query.ANY:
+            return value is not None
+        elif target is None or target is Query.NONE:
+            return value is None
+        elif value is None:
+            return False
+
+        return (value == target) or (str(value) == str(target))
+
+    def get(self, return_type="object", **filters):
+        """Retrieve files matching a set of entities.
+
+        Parameters
+        ----------
+        return_type : {"object", "file"}, optional
+            Return :class:`ManifestFile` objects or paths. Default is "object".
+        **filters
+            Entity values to match. Values may be strings, integers, lists of acceptable
+            values, ``None``/:obj:`bids.layout.Query.NONE` (the entity must be absent),
+            or :obj:`bids.layout.Query.ANY` (the entity must be present).
+
+        Returns
+        -------
+        :obj:`list`
+            The matching files, sorted by path.
+        """
+        found = []
+        for manifest_file in self.files:
+            entities = manifest_file.entities
+            for entity, target in filters.items():
+                value = entities.get(entity, None)
+                targets = target if isinstance(target, (list, tuple)) else [target]
+                if not any(self._matches(value, t) for t in targets):
+                    break
+            else:
+                found.append(manifest_file)
+
+        if return_type.startswith("file"):
+            return [f.path for f in found]
+
+        return found
@@ -8,7 +8,8 @@ import numpy as np
 import pandas as pd
 from nipype import logging
 
-from xcp_d.utils.confounds import _infer_dummy_scans, load_motion
+from xcp_d.utils.columnar import read_columns
+from xcp_d.utils.confounds import MOTION_COLUMNS, _infer_dummy_scans, load_motion
 from xcp_d.utils.doc import fill_doc
 from xcp_d.utils.filemanip import fname_presuffix
 
@@ -43,28 +44,35 @@ def compute_fd(confound, head_radius=50):
     return fdres
 
 
-def _drop_dummy_scans(bold_file, dummy_scans):
+def _drop_dummy_scans(bold_file, dummy_scans, out_file):
     """Remove the first X volumes from a BOLD file.
 
+    The data are never loaded as a whole, and they keep their on-disk data type.
+    NIfTI volumes are stored one after another, so the retained volumes are copied byte for byte,
+    in slabs, and only the header is modified.
+    CIFTI data are sliced from the memory-mapped array proxy.
+
     Parameters
     ----------
     bold_file : :obj:`str`
         Path to a nifti or cifti file.
     dummy_scans : :obj:`int`
         If an integer, the first ``dummy_scans`` volumes will be removed.
+    out_file : :obj:`str`
+        Path to the output file.
 
     Returns
     -------
-    dropped_image : img_like
-        The BOLD image, with the first X volumes removed.
+    out_file : :obj:`str`
+        The BOLD file, with the first X volumes removed.
     """
-    # read the bold file
-    bold_image = nb.load(bold_file)
+    from nibabel.openers import ImageOpener
 
-    data = bold_image.get_fdata()
+    # read the bold file
+    bold_image = nb.load(bold_file, mmap=True)
 
     if bold_image.ndim == 2:  # cifti
-        dropped_data = data[dummy_scans:, ...]  # time series is the first element
+        dropped_data = bold_image.dataobj[dummy_scans:, ...]  # time series is the first element
         time_axis, brain_model_axis = [
             bold_image.header.get_axis(i) for i in range(bold_image.ndim)
         ]
@@ -74,14 +82,38 @@ def _drop_dummy_scans(bold_file, dummy_scans):
         dropped_image = nb.Cifti2Image(
             dropped_data, header=dropped_header, nifti_header=bold_image.nifti_header
         )
+        dropped_image.set_data_dtype(dropped_data.dtype)
+        dropped_image.to_filename(out_file)
+        return out_file
+
+    # nifti
+    dataobj = bold_image.dataobj
+    n_volumes = bold_image.shape[3]
+    volume_size = int(np.prod(bold_image.shape[:3])) * dataobj.dtype.itemsize
+
+    dropped_header = bold_image.header.copy()
+    dropped_header.set_data_shape(bold_image.shape[:3] + (n_volumes - dummy_scans,))
+    # nibabel moves the scaling factors from the header to the array proxy on load.
+    dropped_header.set_slope_inter(dataobj.slope, dataobj.inter)
+
+    with ImageOpener(bold_file, "rb") as in_fobj, ImageOpener(out_file, "wb") as out_fobj:
+        # The header and its extensions have the same size as before, so the offset is unchanged.
+        dropped_header.write_to(out_fobj)
+        out_fobj.write(b"\x00" * (dataobj.offset - out_fobj.tell()))
+
+        in_fobj.seek(dataobj.offset + dummy_scans * volume_size)
+        # Copy about 64 MB at a time.
+        slab_size = max(1, (2**26) // volume_size) * volume_size
+        n_bytes = (n_volumes - dummy_scans) * volume_size
+        while n_bytes > 0:
+            chunk = in_fobj.read(min(slab_size, n_bytes))
+            if not chunk:
+                raise ValueError(f"Unexpected end of file: {bold_file}")
+
+            out_fobj.write(chunk)
+            n_bytes -= len(chunk)
 
-    else:  # nifti
-        dropped_data = data[..., dummy_scans:]
-        dropped_image = nb.Nifti1Image(
-            dropped_data, affine=bold_image.affine, header=bold_image.header
-        )
-
-    return dropped_image
+    return out_file
 
 
 def downcast_to_32(in_file):
@@ -213,8 +245,8 @@ def flag_bad_run(
         confounds_file=fmriprep_confounds_file,
     )
 
-    # Read in fmriprep confounds tsv to calculate FD
-    fmriprep_confounds_df = pd.read_table(fmriprep_confounds_file)
+    # Read in the motion parameters to calculate FD
+    fmriprep_confounds_df = read_columns(fmriprep_confounds_file, MOTION_COLUMNS)
 
     # Remove dummy volumes
     fmriprep_confounds_df = fmriprep_confounds_df.drop(np.arange(dummy_scans))
@@ -230,3 +262,99 @@ def flag_bad_run(
     )
     fd_arr = compute_fd(confound=motion_df, head_radius=head_radius)
     return np.sum(fd_arr <= fd_thresh) * TR
+
+
+@fill_doc
+def sweep_censoring_thresholds(
+    fmriprep_confounds_file,
+    TR,
+    fd_thresholds,
+    motion_filters=None,
+    dummy_scans=0,
+    head_radius=50,
+    min_time=100,
+):
+    """Evaluate censoring outcomes for a grid of FD thresholds and motion filters.
+
+    Framewise displacement is computed once per motion filter,
+    and every threshold is then applied to it at once.
+
+    Parameters
+    ----------
+    %(fmriprep_confounds_file)s
+    %(TR)s
+    fd_thresholds : :obj:`list` of :obj:`float`
+        Framewise displacement thresholds to evaluate, in millimeters.
+        Thresholds <= 0 disable censoring, as with ``fd_thresh``.
+    motion_filters : :obj:`list` of :obj:`dict` or None, optional
+        Motion filter settings to evaluate.
+        Each dictionary may contain ``motion_filter_type``, ``motion_filter_order``,
+        ``band_stop_min``, and ``band_stop_max``, as used by
+        :func:`~xcp_d.utils.confounds.load_motion`.
+        If None, only unfiltered motion parameters are used.
+    %(dummy_scans)s
+    %(head_radius)s
+    %(min_time)s
+
+    Returns
+    -------
+    sweep_df : :obj:`pandas.DataFrame`
+        Table with one row per motion filter and threshold combination.
+    temporal_masks : :obj:`numpy.ndarray` of shape (n_filters, n_thresholds, n_volumes)
+        Boolean arrays in which True indicates a censored volume.
+    """
+    if motion_filters is None:
+        motion_filters = [{}]
+
+    dummy_scans = _infer_dummy_scans(
+        dummy_scans=dummy_scans,
+        confounds_file=fmriprep_confounds_file,
+    )
+    fmriprep_confounds_df = read_columns(fmriprep_confounds_file, MOTION_COLUMNS)
+    fmriprep_confounds_df = fmriprep_confounds_df.drop(np.arange(dummy_scans))
+
+    filter_settings = []
+    fd_arrs = []
+    for motion_filter in motion_filters:
+        settings = {
+            "motion_filter_type": motion_filter.get("motion_filter_type", None),
+            "motion_filter_order": motion_filter.get("motion_filter_order", 4),
+            "band_stop_min": motion_filter.get("band_stop_min", None),
+            "band_stop_max": motion_filter.get("band_stop_max", None),
+        }
+        motion_df = load_motion(fmriprep_confounds_df.copy(), TR=TR, **settings)
+        fd_arrs.append(compute_fd(confound=motion_df, head_radius=head_radius))
+        filter_settings.append(settings)
+
+    fd_arr = np.vstack(fd_arrs)  # (n_filters, n_volumes)
+    fd_thresholds = np.asarray(fd_thresholds, dtype=float)
+    n_filters, n_volumes = fd_arr.shape
+    n_thresholds = fd_thresholds.size
+
+    censoring_enabled = fd_thresholds > 0
+    temporal_masks = (fd_arr[:, None, :] > fd_thresholds[None, :, None]) & censoring_enabled[
+        None, :, None
+    ]
+    n_censored = np.count_nonzero(temporal_masks, axis=2)
+    n_retained = n_volumes - n_censored
+    retained_duration = n_retained * TR
+
+    # Mirror flag_bad_run and the run-skipping logic in init_subject_wf.
+    passes_min_time = np.tile(~censoring_enabled, (n_filters, 1))
+    if min_time >= 0:
+        passes_min_time |= retained_duration >= min_time
+
+    sweep_df = pd.DataFrame(
+        {
+            key: np.repeat([settings[key] for settings in filter_settings], n_thresholds)
+            for key in filter_settings[0].keys()
+        }
+    )
+    sweep_df["fd_thresh"] = np.tile(fd_thresholds, n_filters)
+    sweep_df["n_volumes"] = n_volumes
+    sweep_df["n_retained_volumes"] = n_retained.ravel()
+    sweep_df["n_censored_volumes"] = n_censored.ravel()
+    sweep_df["retained_duration"] = retained_duration.ravel()
+    sweep_df["passes_min_time"] = passes_min_time.ravel()
+
+    return sweep_df, temporal_masks
@@ -0,0 +1,211 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Parallel execution of kernels that are independent across voxels or vertices.
+
+Many of xcp_d's numeric steps (filtering, interpolation, ALFF, ReHo's ranking,
+parcellation) transform each column of a (T, S) array independently.
+:func:`map_column_blocks` splits the columns into contiguous blocks and runs the kernel on
+each block in a pool of workers, writing the results into a single output array.
+
+Threads are used by default, since NumPy and SciPy release the GIL in their
+vectorized routines.
+Kernels that hold the GIL can use a pool of processes instead,
+in which case the input and output arrays are placed in shared memory,
+so the workers read and write their blocks without copying the whole array.
+While blocks run in parallel, each worker's BLAS/OpenMP thread pools are capped at one thread,
+so the total number of threads stays at ``n_threads``.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+from nipype import logging
+
+LOGGER = logging.getLogger("nipype.utils")
+
+# The number of blocks per worker, so that workers that finish early can take more blocks.
+BLOCKS_PER_WORKER = 4
+
+
+def get_column_blocks(n_columns, n_threads=1, block_size=None):
+    """Split a range of columns into contiguous blocks.
+
+    Parameters
+    ----------
+    n_columns : :obj:`int`
+        The number of columns.
+    n_threads : :obj:`int`, optional
+        The number of workers that will process the blocks. Default is 1.
+    block_size : :obj:`int` or None, optional
+        The maximum number of columns in each block.
+        If None, there is no maximum.
+        With more than one worker, blocks are also small enough that each worker
+        gets about four of them.
+
+    Returns
+    -------
+    blocks : :obj:`list` of :obj:`slice`
+        The blocks' slices.
+    """
+    n_threads = max(n_threads, 1)
+    if block_size is None:
+        block_size = n_columns
+
+    if n_threads > 1:
+        block_size = min(block_size, int(np.ceil(n_columns / (n_threads * BLOCKS_PER_WORKER))))
+
+    block_size = max(block_size, 1)
+    return [
+        slice(start, min(start + block_size, n_columns))
+        for start in range(0, n_columns, block_size)
+    ]
+
+
+def map_column_blocks(
+    func,
+    data,
+    n_out_rows=None,
+    dtype=None,
+    out=None,
+    n_threads=1,
+    block_size=None,
+    backend="threads",
+):
+    """Apply a column-separable kernel to a (T, S) array, in parallel blocks of columns.
+
+    Parameters
+    ----------
+    func : callable
+        The kernel. It is called with a (T, S_block) block of ``data``,
+        and must return a (n_out_rows, S_block) array, or a (S_block,) array
+        if ``n_out_rows`` is None.
+        With the "processes" backend, it must be picklable
+        (e.g., a module-level function or a :func:`functools.partial` of one).
+    data : (T, S) :obj:`numpy.ndarray`
+        Time by voxels/vertices array of data.
+    n_out_rows : :obj:`int` or None, optional
+        The number of rows in the kernel's output.
+        If None, the kernel returns one value per column.
+    dtype : :obj:`numpy.dtype` or None, optional
+        The output's dtype. If None, the data's floating-point dtype is used.
+        Ignored if ``out`` is provided.
+    out : :obj:`numpy.ndarray` or None, optional
+        Array in which to write the result. If None, a new array is created.
+    n_threads : :obj:`int`, optional
+        The number of blocks to process in parallel. Default is 1.
+    block_size : :obj:`int` or None, optional
+        The maximum number of columns in each block, e.g., to bound the kernel's memory use.
+        See :func:`get_column_blocks`.
+    backend : {"threads", "processes"}, optional
+        Whether to process blocks in a pool of threads or of processes. Default is "threads".
+
+    Returns
+    -------
+    out : (n_out_rows, S) or (S,) :obj:`numpy.ndarray`
+        The concatenated results of the kernel.
+    """
+    if backend not in ("threads", "processes"):
+        raise ValueError(f"Unknown backend '{backend}'. Must be 'threads' or 'processes'.")
+
+    data = np.asarray(data)
+    n_columns = data.shape[1]
+    out_shape = (n_columns,) if n_out_rows is None else (n_out_rows, n_columns)
+    if out is None:
+        dtype = dtype or np.result_type(data.dtype, np.float32)
+        out = np.empty(out_shape, dtype=dtype)
+    elif out.shape != out_shape:
+        raise ValueError(f"The output array's shape {out.shape} is not {out_shape}.")
+
+    n_threads = max(n_threads, 1)
+    blocks = get_column_blocks(n_columns, n_threads=n_threads, block_size=block_size)
+    if n_threads == 1 or len(blocks) == 1:
+        for block in blocks:
+            out[..., block] = func(data[:, block])
+
+        return out
+
+    n_workers = min(n_threads, len(blocks))
+    LOGGER.debug(f"Processing {len(blocks)} blocks of columns with {n_workers} {backend}.")
+    if backend == "processes":
+        return _map_column_blocks_processes(func, data, out, blocks, n_workers)
+
+    from threadpoolctl import threadpool_limits
+
+    def _run_block(block):
+        out[..., block] = func(data[:, block])
+
+    with threadpool_limits(limits=1), ThreadPoolExecutor(max_workers=n_workers) as executor:
+        # Iterate over the results so that any exceptions are raised.
+        list(executor.map(_run_block, blocks))
+
+    return out
+
+
+def _map_column_blocks_processes(func, data, out, blocks, n_workers):
+    """Process blocks of columns in a pool of processes, with the arrays in shared memory."""
+    shared_arrays = []
+    try:
+        in_spec, shared_in = _create_shared_array(data.shape, data.dtype)
+        shared_arrays.append(shared_in)
+        _shared_array(shared_in, in_spec)[...] = data
+        out_spec, shared_out = _create_shared_array(out.shape, out.dtype)
+        shared_arrays.append(shared_out)
+
+        # Workers are started with the platform's default method,
+        # which (on Linux) lets them reuse the parent's imported modules.
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=get_context(),
+            initializer=_initialize_worker,
+        ) as executor:
+            futures = [
+                executor.submit(_run_shared_block, func, in_spec, out_spec, block)
+                for block in blocks
+            ]
+            for future in futures:
+                future.result()
+
+        out[...] = _shared_array(shared_out, out_spec)
+    finally:
+        for shm in shared_arrays:
+            shm.close()
+            shm.unlink()
+
+    return out
+
+
+def _create_shared_array(shape, dtype):
+    """Create a shared memory block for an array, and the spec that workers use to view it."""
+    dtype = np.dtype(dtype)
+    nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    return (shm.name, tuple(shape), dtype.str), shm
+
+
+def _shared_array(shm, spec):
+    """View a shared memory block as an array."""
+    _, shape, dtype = spec
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _initialize_worker():
+    """Cap a worker process's BLAS/OpenMP thread pools at one thread."""
+    import scipy.linalg  # noqa: F401
+    from threadpoolctl import threadpool_limits
+
+    threadpool_limits(limits=1)
+
+
+def _run_shared_block(func, in_spec, out_spec, block):
+    """Run a kernel on one block of columns of arrays in shared memory."""
+    shm_in = shared_memory.SharedMemory(name=in_spec[0])
+    shm_out = shared_memory.SharedMemory(name=out_spec[0])
+    try:
+        data = _shared_array(shm_in, in_spec)
+        out = _shared_array(shm_out, out_spec)
+        out[..., block] = func(data[:, block])
+        # Drop the views before closing, since buffers with exported views can't be released.
+        del data, out
+    finally:
+        shm_in.close()
+        shm_out.close()
@@ -0,0 +1,296 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Sparse parcellation operators for atlases in the same space as the BOLD data.
+
+A parcellation operator is a sparse (parcels x elements) matrix of ones,
+where the elements are the atlas's labeled voxels or grayordinates.
+Parcel-wise means and coverage can then be calculated with a single sparse matrix product,
+instead of looping over parcels.
+
+The bundled atlases can also be resampled to the standard grids ahead of time
+(see ``xcp_d-build-parcellation-operators``).
+Each precomputed atlas is stored with its operator,
+under the atlas's name and the grid's space and resolution or density,
+so BOLD data on those grids skip atlas resampling altogether.
+"""
+import functools
+import os
+
+import nibabel as nb
+import numpy as np
+from nipype import logging
+from pkg_resources import resource_filename as pkgrf
+from scipy import sparse
+
+LOGGER = logging.getLogger("nipype.utils")
+
+OPERATOR_DIR = pkgrf("xcp_d", "data/parcellation_operators")
+
+# The standard grids that the bundled atlases are precomputed for.
+PRECOMPUTED_GRIDS = {
+    "nifti": "space-MNI152NLin6Asym_res-2",
+    "cifti": "space-fsLR_den-91k",
+}
+
+
+def _load_label_array(atlas_file):
+    """Load an atlas's labels as a flat integer array, in the order of the data's elements.
+
+    NIfTI atlases are flattened in C order. CIFTI atlases keep the grayordinate order.
+    """
+    atlas_img = nb.load(atlas_file)
+    atlas_arr = np.asanyarray(atlas_img.dataobj)
+    if isinstance(atlas_img, nb.Cifti2Image):
+        atlas_arr = np.squeeze(atlas_arr)  # first dim is singleton
+
+    return np.rint(atlas_arr).astype(np.int64).ravel(), atlas_arr.shape
+
+
+class ParcellationOperator(object):
+    """A sparse operator that averages data within the parcels of an atlas.
+
+    Parameters
+    ----------
+    labels : :obj:`numpy.ndarray` of shape (n_parcels,)
+        Sorted, non-zero atlas values of the parcels.
+    element_idx : :obj:`numpy.ndarray` of shape (n_labeled_elements,)
+        Indices of the labeled elements in the flattened atlas.
+    parcel_idx : :obj:`numpy.ndarray` of shape (n_labeled_elements,)
+        Row of the operator (i.e., the index into ``labels``) for each labeled element.
+    shape : :obj:`tuple`
+        The shape of the atlas's grid.
+    """
+
+    def __init__(self, labels, element_idx, parcel_idx, shape):
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.element_idx = np.asarray(element_idx, dtype=np.int64)
+        self.parcel_idx = np.asarray(parcel_idx, dtype=np.int64)
+        self.shape = tuple(int(i) for i in shape)
+        self.matrix = sparse.csr_matrix(
+            (
+                np.ones(self.element_idx.size, dtype=np.float64),
+                (self.parcel_idx, np.arange(self.element_idx.size)),
+            ),
+            shape=(self.labels.size, self.element_idx.size),
+        )
+        self.n_elements = np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    @classmethod
+    def from_labels(cls, label_arr, shape):
+        """Build an operator from a flat array of atlas labels."""
+        element_idx = np.flatnonzero(label_arr > 0)
+        labels, parcel_idx = np.unique(label_arr[element_idx], return_inverse=True)
+        return cls(labels, element_idx, parcel_idx, shape)
+
+    @classmethod
+    def load(cls, in_file):
+        """Load an operator saved with :meth:`save`."""
+        with np.load(in_file) as data:
+            labels = data["labels"]
+            element_idx = data["element_idx"]
+            parcel_idx = np.repeat(np.arange(labels.size), data["n_elements"])
+            return cls(labels, element_idx, parcel_idx, data["shape"])
+
+    def save(self, out_file):
+        """Save the operator to a compressed ``.npz`` file.
+
+        The labeled elements are stored sorted by parcel,
+        so the sparse matrix is fully described by the per-parcel element counts.
+        """
+        order = np.argsort(self.parcel_idx, kind="stable")
+        np.savez_compressed(
+            out_file,
+            labels=self.labels,
+            element_idx=self.element_idx[order],
+            n_elements=self.n_elements.astype(np.int64),
+            shape=np.array(self.shape, dtype=np.int64),
+        )
+
+    def parcellate(self, data, good_elements=None, n_threads=1):
+        """Average data within each parcel, ignoring NaNs and bad elements.
+
+        Parameters
+        ----------
+        data : :obj:`numpy.ndarray` of shape (n_volumes, n_labeled_elements)
+            Data from the labeled elements, in the order of ``element_idx``.
+        good_elements : :obj:`numpy.ndarray` of shape (n_labeled_elements,) or None, optional
+            Boolean array flagging elements with usable data. If None, all elements are used.
+        n_threads : :obj:`int`, optional
+            Number of threads used to parcellate blocks of volumes in parallel. Default is 1.
+
+        Returns
+        -------
+        parcel_means : :obj:`numpy.ndarray` of shape (n_volumes, n_parcels)
+            Mean of each parcel's good, finite elements. NaN if there are none.
+        coverage : :obj:`numpy.ndarray` of shape (n_parcels,)
+            The proportion of each parcel's elements that are good.
+        """
+        from xcp_d.utils.parallel import map_column_blocks
+
+        data = np.atleast_2d(data)
+        if good_elements is None:
+            good_elements = np.ones(self.element_idx.size, dtype=bool)
+
+        good_elements = np.asarray(good_elements, dtype=bool)
+
+        # Volumes are parcellated independently, so blocks of volumes can run in parallel.
+        parcel_means = map_column_blocks(
+            functools.partial(
+                _parcellate_volumes, matrix=self.matrix, good_elements=good_elements
+            ),
+            data.T,
+            n_out_rows=self.labels.size,
+            dtype=np.float64,
+            n_threads=n_threads,
+        ).T
+
+        coverage = (self.matrix @ good_elements.astype(np.float64)) / self.n_elements
+        return parcel_means, coverage
+
+
+def _parcellate_volumes(data, matrix, good_elements):
+    """Average the (n_labeled_elements, n_volumes) data within each parcel."""
+    finite = ~np.isnan(data) & good_elements[:, None]
+
+    # (P x E) @ (E x T) products, so scipy never has to densify the operator.
+    sums = matrix @ np.where(finite, data, 0)
+    counts = matrix @ finite.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return sums / counts
+
+
+def _get_operator_file(atlas_file):
+    """Find the operator stored next to a precomputed atlas, if there is one."""
+    atlas_dir, atlas_fname = os.path.split(atlas_file)
+    if "_dseg." not in atlas_fname:
+        return None
+
+    operator_file = os.path.join(atlas_dir, f"{atlas_fname.split('_dseg.')[0]}_operator.npz")
+    return operator_file if os.path.isfile(operator_file) else None
+
+
+def get_parcellation_operator(atlas_file):
+    """Get the parcellation operator for an atlas in the BOLD data's space.
+
+    Parameters
+    ----------
+    atlas_file : :obj:`str`
+        Path to the atlas, already resampled to the BOLD data's grid or brain models.
+
+    Returns
+    -------
+    operator : :obj:`ParcellationOperator`
+        The stored operator for a precomputed atlas, otherwise one built from the atlas's labels.
+    """
+    operator_file = _get_operator_file(atlas_file)
+    if operator_file:
+        LOGGER.debug(f"Using precomputed parcellation operator for {atlas_file}")
+        return ParcellationOperator.load(operator_file)
+
+    label_arr, shape = _load_label_array(atlas_file)
+    return ParcellationOperator.from_labels(label_arr, shape)
+
+
+def get_precomputed_atlas_files(atlas_name, grid, operator_dir=None):
+    """Select an atlas that was precomputed for a standard grid.
+
+    NOTE: This is a Node function.
+
+    Parameters
+    ----------
+    atlas_name : :obj:`str`
+        The name of the atlas.
+    grid : :obj:`str`
+        The grid's space and resolution or density entities, from ``PRECOMPUTED_GRIDS``.
+    operator_dir : :obj:`str` or None, optional
+        Directory with the precomputed atlases.
+        If None, the atlases installed with xcp_d are used.
+
+    Returns
+    -------
+    atlas_file : :obj:`str`
+        Path to the atlas on the grid. Its operator is stored next to it.
+    parcellated_atlas_file : :obj:`str` or None
+        Path to the parcellated atlas pscalar file. None for NIfTI grids.
+    """
+    import os
+
+    from xcp_d.utils.parcellation import OPERATOR_DIR, PRECOMPUTED_GRIDS
+
+    prefix = os.path.join(operator_dir or OPERATOR_DIR, f"atlas-{atlas_name}_{grid}")
+    if grid == PRECOMPUTED_GRIDS["cifti"]:
+        atlas_file = f"{prefix}_dseg.dlabel.nii"
+        parcellated_atlas_file = f"{prefix}_dseg.pscalar.nii"
+        out_files = [atlas_file, parcellated_atlas_file, f"{prefix}_operator.npz"]
+    else:
+        atlas_file = f"{prefix}_dseg.nii.gz"
+        parcellated_atlas_file = None
+        out_files = [atlas_file, f"{prefix}_operator.npz"]
+
+    missing_files = [f for f in out_files if not os.path.isfile(f)]
+    if missing_files:
+        raise FileNotFoundError("File(s) DNE:\n\t" + "\n\t".join(missing_files))
+
+    return atlas_file, parcellated_atlas_file
+
+
+def get_precomputed_grid(bold_file, cifti, atlas_names, operator_dir=None):
+    """Determine if the atlases were precomputed for the BOLD data's grid.
+
+    The grid is identified by the BOLD file's space and resolution or density,
+    and then checked against the precomputed atlases' headers.
+
+    Parameters
+    ----------
+    bold_file : :obj:`str`
+        The preprocessed BOLD file.
+    cifti : :obj:`bool`
+        Whether the BOLD file is a CIFTI.
+    atlas_names : :obj:`list` of :obj:`str`
+        The atlases that will be used.
+    operator_dir : :obj:`str` or None, optional
+        Directory with the precomputed atlases.
+        If None, the atlases installed with xcp_d are used.
+
+    Returns
+    -------
+    grid : :obj:`str` or None
+        The grid's entities (e.g., "space-fsLR_den-91k") if every atlas was precomputed for it,
+        otherwise None.
+    """
+    from xcp_d.utils.bids import get_entity
+
+    grid = PRECOMPUTED_GRIDS["cifti" if cifti else "nifti"]
+    for entity_value in grid.split("_"):
+        entity, value = entity_value.split("-")
+        if get_entity(bold_file, entity) != value:
+            return None
+
+    try:
+        atlas_files = [
+            get_precomputed_atlas_files(atlas_name, grid, operator_dir)[0]
+            for atlas_name in atlas_names
+        ]
+    except FileNotFoundError:
+        LOGGER.info(f"Atlases have not been precomputed for {grid}, so they will be resampled.")
+        return None
+
+    # The space and resolution should pin down the grid, but only the headers are needed to check.
+    bold_img = nb.load(bold_file)
+    for atlas_file in atlas_files:
+        atlas_img = nb.load(atlas_file)
+        if cifti:
+            same_grid = bold_img.header.get_axis(1) == atlas_img.header.get_axis(1)
+        else:
+            same_grid = bold_img.shape[:3] == atlas_img.shape[:3] and np.allclose(
+                bold_img.affine, atlas_img.affine, atol=1e-4
+            )
+
+        if not same_grid:
+            LOGGER.warning(
+                f"{bold_file} is not on the grid that the atlases were precomputed for, "
+                "so they will be resampled."
+            )
+            return None
+
+    return grid
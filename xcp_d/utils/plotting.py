@@ -602,10 +602,10 @@ def plot_fmri_es(
         ).T
 
         # Make a temporary file for niftis and ciftis
-        if preprocessed_bold.endswith(".nii.gz"):
-            temp_preprocessed_file = os.path.join(tempfile.mkdtemp(), "filex_raw.nii.gz")
-        else:
+        if preprocessed_bold.endswith(".dtseries.nii"):
             temp_preprocessed_file = os.path.join(tempfile.mkdtemp(), "filex_raw.dtseries.nii")
+        else:
+            temp_preprocessed_file = os.path.join(tempfile.mkdtemp(), "filex_raw.nii.gz")
 
         # Write out the scaled data
         temp_preprocessed_file = write_ndata(
@@ -0,0 +1,263 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Utilities for profiling the phases of xcp_d's interfaces.
+
+Profiling is enabled by setting the ``XCPD_PROFILE_DIR`` environment variable
+(``xcp_d --profile`` sets it to ``<output_dir>/xcp_d/logs/profiles``).
+Each profiled node then writes a JSON trace with the wall time, CPU time,
+and peak memory of each of its named phases.
+When profiling is disabled, the phase markers do nothing.
+"""
+import functools
+import glob
+import hashlib
+import json
+import os
+import re
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+from nipype import logging
+
+LOGGER = logging.getLogger("nipype.utils")
+
+PROFILE_DIR_ENV = "XCPD_PROFILE_DIR"
+
+# The profiler of the node that is currently running in this process, if any.
+_PROFILER = None
+
+
+def get_profile_dir():
+    """Get the directory profiling traces are written to, or None if profiling is disabled.
+
+    Returns
+    -------
+    profile_dir : :obj:`str` or None
+        The directory in which traces are written.
+    """
+    return os.environ.get(PROFILE_DIR_ENV) or None
+
+
+def _max_rss_mb():
+    """Get the peak resident set size of this process, in megabytes."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return max_rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+class NodeProfiler:
+    """Time and memory-track the named phases of a single interface run.
+
+    Phases are sequential: starting a phase ends the previous one.
+    Memory is measured with :mod:`tracemalloc`, which tracks NumPy arrays as well as Python
+    objects, so each phase's peak is the most memory allocated on top of what was in use when
+    the phase started.
+    On Python 3.8, which lacks :func:`tracemalloc.reset_peak`, tracing is restarted at each
+    phase instead, so peaks only count the memory allocated since the last restart.
+    """
+
+    def __init__(self, interface, node_dir):
+        self.interface = interface
+        self.node_dir = node_dir
+        self.phases = []
+        self._current = None
+        self._peak = 0
+        self._restarted = False
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        """Start tracking memory and the node's run time."""
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+
+        self.start_time = datetime.now().isoformat()
+        self._start = self._stamp()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """End the last phase and the node's run."""
+        self.end_phase()
+        self._end = self._stamp()
+        self.status = "failed" if exc_type else "succeeded"
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        return False
+
+    @staticmethod
+    def _stamp():
+        return {
+            "wall_time": time.perf_counter(),
+            "cpu_time": time.process_time(),
+            "memory": tracemalloc.get_traced_memory()[0],
+        }
+
+    def _reset_peak(self):
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        elif self._started_tracemalloc:
+            # tracemalloc.reset_peak is new in Python 3.9, so restart tracing instead.
+            # Blocks allocated before the restart are no longer traced (nor are their frees),
+            # so only peak deltas within each phase are meaningful afterwards.
+            tracemalloc.stop()
+            tracemalloc.start()
+            self._restarted = True
+
+    def start_phase(self, name):
+        """End the current phase, if any, and start a new one."""
+        self.end_phase()
+        self._reset_peak()
+        self._current = (name, self._stamp())
+
+    def end_phase(self):
+        """End the current phase, if any."""
+        if self._current is None:
+            return
+
+        name, start = self._current
+        end = self._stamp()
+        peak = max(tracemalloc.get_traced_memory()[1] - start["memory"], 0)
+        # Without restarts, the run's peak is measured from the start of the run.
+        run_peak = peak if self._restarted else peak + start["memory"] - self._start["memory"]
+        self._peak = max(self._peak, run_peak)
+        self.phases.append(
+            {
+                "phase": name,
+                "wall_time": end["wall_time"] - start["wall_time"],
+                "cpu_time": end["cpu_time"] - start["cpu_time"],
+                "peak_memory_mb": peak / 2**20,
+            }
+        )
+        self._current = None
+
+    def to_dict(self):
+        """Summarize the run as a JSON-serializable dictionary."""
+        match = re.search(r"single_subject_(.+?)_wf", self.node_dir)
+        return {
+            "interface": self.interface,
+            "node_dir": self.node_dir,
+            "subject": match.group(1) if match else None,
+            "start_time": self.start_time,
+            "status": self.status,
+            "wall_time": self._end["wall_time"] - self._start["wall_time"],
+            "cpu_time": self._end["cpu_time"] - self._start["cpu_time"],
+            "peak_memory_mb": max(self._peak, 0) / 2**20,
+            "max_rss_mb": _max_rss_mb(),
+            "phases": self.phases,
+        }
+
+    def write(self, profile_dir):
+        """Write the trace to a JSON file, named after the interface and node directory."""
+        os.makedirs(profile_dir, exist_ok=True)
+        node_hash = hashlib.sha1(self.node_dir.encode()).hexdigest()[:12]
+        out_file = os.path.join(profile_dir, f"{self.interface}_{node_hash}.json")
+        with open(out_file, "w") as fobj:
+            json.dump(self.to_dict(), fobj, indent=2)
+
+        return out_file
+
+
+def profile_run(run_interface):
+    """Profile an interface's ``_run_interface`` method, if profiling is enabled.
+
+    Phases within the method are marked with :func:`phase`.
+    """
+
+    @functools.wraps(run_interface)
+    def wrapper(self, runtime, *args, **kwargs):
+        global _PROFILER
+
+        profile_dir = get_profile_dir()
+        if profile_dir is None:
+            return run_interface(self, runtime, *args, **kwargs)
+
+        profiler = NodeProfiler(type(self).__name__, runtime.cwd)
+        try:
+            with profiler:
+                _PROFILER = profiler
+                return run_interface(self, runtime, *args, **kwargs)
+        finally:
+            _PROFILER = None
+            # Failed runs are traced too, so that crashes can be attributed to phases.
+            profiler.write(profile_dir)
+
+    return wrapper
+
+
+def phase(name):
+    """Start a named phase of the node that is currently being profiled.
+
+    This ends the previous phase, if any, and does nothing when profiling is disabled.
+
+    Parameters
+    ----------
+    name : :obj:`str`
+        Name of the phase, such as "load", "compute", or "write".
+    """
+    if _PROFILER is not None:
+        _PROFILER.start_phase(name)
+
+
+def summarize_traces(trace_files):
+    """Aggregate profiling traces into a per-phase cost table.
+
+    Parameters
+    ----------
+    trace_files : :obj:`list` of :obj:`str`
+        JSON traces, or directories that are searched recursively for them.
+
+    Returns
+    -------
+    summary : :obj:`pandas.DataFrame`
+        One row per interface and phase, sorted by total wall time.
+        Each interface's "total" row covers its whole run.
+    """
+    rows = []
+    for trace_file in trace_files:
+        if os.path.isdir(trace_file):
+            found_files = sorted(
+                glob.glob(os.path.join(trace_file, "**", "*.json"), recursive=True)
+            )
+        else:
+            found_files = [trace_file]
+
+        for found_file in found_files:
+            with open(found_file, "r") as fobj:
+                trace = json.load(fobj)
+
+            shared = {"interface": trace["interface"], "subject": trace["subject"]}
+            rows.append(
+                {
+                    **shared,
+                    "phase": "total",
+                    "wall_time": trace["wall_time"],
+                    "cpu_time": trace["cpu_time"],
+                    "peak_memory_mb": trace["peak_memory_mb"],
+                }
+            )
+            rows += [{**shared, **phase_} for phase_ in trace["phases"]]
+
+    if not rows:
+        raise ValueError(f"No profiling traces found in {trace_files}.")
+
+    df = pd.DataFrame(rows)
+    summary = df.groupby(["interface", "phase"]).agg(
+        n_runs=("wall_time", "size"),
+        n_subjects=("subject", "nunique"),
+        total_wall_time=("wall_time", "sum"),
+        mean_wall_time=("wall_time", "mean"),
+        max_wall_time=("wall_time", "max"),
+        mean_cpu_time=("cpu_time", "mean"),
+        max_peak_memory_mb=("peak_memory_mb", "max"),
+    )
+    # The share of all of the profiled nodes' time spent in each phase.
+    all_wall_time = df.loc[df["phase"] == "total", "wall_time"].sum()
+    summary["fraction_of_wall_time"] = summary["total_wall_time"] / all_wall_time
+    summary = summary.reset_index().sort_values("total_wall_time", ascending=False)
+
+    return summary.reset_index(drop=True)
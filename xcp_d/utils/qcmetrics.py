@@ -261,6 +261,8 @@ def make_dcan_qc_file(filtered_motion, TR):
     -------
     dcan_df_file : :obj:`str`
         Name of the HDF5-format file that is created.
+        The file has both the DCAN-format ``/dcan_motion`` group and
+        the ``/dcan_motion_compact`` group.
     """
     import os
 
@@ -268,12 +270,60 @@ def make_dcan_qc_file(filtered_motion, TR):
 
     dcan_df_file = os.path.abspath("desc-dcan_qc.hdf5")
 
-    make_dcan_df(filtered_motion, dcan_df_file, TR)
+    make_dcan_df(filtered_motion, dcan_df_file, TR, compact=True)
     return dcan_df_file
 
 
 @fill_doc
-def make_dcan_df(filtered_motion, name, TR):
+def compute_dcan_motion_metrics(fd, TR, thresholds=None):
+    """Compute the DCAN motion metrics for a range of FD thresholds at once.
+
+    Parameters
+    ----------
+    fd : (T,) :obj:`numpy.ndarray`
+        Framewise displacement time series.
+    %(TR)s
+    thresholds : (N,) :obj:`numpy.ndarray` or None, optional
+        FD thresholds to evaluate.
+        If None (the default), 101 thresholds between 0 and 1 (inclusive) will be used.
+
+    Returns
+    -------
+    metrics : :obj:`dict`
+        Dictionary of threshold-wise metrics.
+        ``binary_mask`` is an (N, T) array, in which high-motion volumes are flagged with 1.
+        All other entries are (N,) arrays.
+    """
+    fd = np.asarray(fd, dtype=float)
+    if thresholds is None:
+        thresholds = np.around(np.linspace(0, 1, 101), 2)
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    n_volumes = fd.size
+
+    # (N, T) mask of high-motion volumes for every threshold
+    binary_mask = fd[None, :] > thresholds[:, None]
+    retained = ~binary_mask
+
+    remaining_frame_count = np.count_nonzero(retained, axis=1)
+    retained_fd_sum = retained.astype(float) @ fd
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Thresholds with no retained volumes get NaN, as with numpy.mean on an empty array.
+        remaining_frame_mean_fd = retained_fd_sum / remaining_frame_count
+
+    metrics = {
+        "threshold": thresholds,
+        "binary_mask": binary_mask.astype(int),
+        "total_frame_count": np.full(thresholds.shape, n_volumes),
+        "remaining_total_frame_count": remaining_frame_count,
+        "remaining_seconds": remaining_frame_count * TR,
+        "remaining_frame_mean_FD": remaining_frame_mean_fd,
+    }
+    return metrics
+
+
+@fill_doc
+def make_dcan_df(filtered_motion, name, TR, compact=False):
     """Create an HDF5-format file containing a DCAN-format dataset.
 
     Parameters
@@ -282,6 +332,12 @@ def make_dcan_df(filtered_motion, name, TR):
     name : :obj:`str`
         Name of the HDF5-format file to be created.
     %(TR)s
+    compact : :obj:`bool`, optional
+        If True, the metrics will also be written to a ``/dcan_motion_compact`` group,
+        with one chunked (thresholds x volumes) binary mask dataset and one
+        (thresholds,) dataset per summary metric.
+        This layout is much faster to read for group-level QC.
+        Default is False.
 
     Notes
     -----
@@ -308,42 +364,34 @@ def make_dcan_df(filtered_motion, name, TR):
     filtered_motion_df = pd.read_table(filtered_motion)
     fd = filtered_motion_df["framewise_displacement"].values
 
-    with h5py.File(name, "w") as dcan:
-        for thresh in np.linspace(0, 1, 101):
-            thresh = np.around(thresh, 2)
+    metrics = compute_dcan_motion_metrics(fd, TR=TR)
+    scalar_metrics = [
+        "threshold",
+        "total_frame_count",
+        "remaining_total_frame_count",
+        "remaining_seconds",
+        "remaining_frame_mean_FD",
+    ]
 
-            dcan.create_dataset(
-                f"/dcan_motion/fd_{thresh}/skip",
-                data=0,
-                dtype="float",
-            )
-            dcan.create_dataset(
-                f"/dcan_motion/fd_{thresh}/binary_mask",
-                data=(fd > thresh).astype(int),
-                dtype="float",
-            )
-            dcan.create_dataset(
-                f"/dcan_motion/fd_{thresh}/threshold",
-                data=thresh,
-                dtype="float",
-            )
-            dcan.create_dataset(
-                f"/dcan_motion/fd_{thresh}/total_frame_count",
-                data=len(fd),
-                dtype="float",
-            )
-            dcan.create_dataset(
-                f"/dcan_motion/fd_{thresh}/remaining_total_frame_count",
-                data=len(fd[fd <= thresh]),
-                dtype="float",
-            )
-            dcan.create_dataset(
-                f"/dcan_motion/fd_{thresh}/remaining_seconds",
-                data=len(fd[fd <= thresh]) * TR,
+    with h5py.File(name, "w") as dcan:
+        for i_thresh, thresh in enumerate(metrics["threshold"]):
+            group = dcan.create_group(f"/dcan_motion/fd_{thresh}")
+            group.create_dataset("skip", data=0, dtype="float")
+            group.create_dataset(
+                "binary_mask",
+                data=metrics["binary_mask"][i_thresh, :],
                 dtype="float",
             )
-            dcan.create_dataset(
-                f"/dcan_motion/fd_{thresh}/remaining_frame_mean_FD",
-                data=(fd[fd <= thresh]).mean(),
-                dtype="float",
+            for metric in scalar_metrics:
+                group.create_dataset(metric, data=metrics[metric][i_thresh], dtype="float")
+
+        if compact:
+            compact_group = dcan.create_group("/dcan_motion_compact")
+            compact_group.create_dataset(
+                "binary_mask",
+                data=metrics["binary_mask"].astype(np.uint8),
+                chunks=(1, fd.size) if fd.size else None,
+                compression="gzip",
             )
+            for metric in scalar_metrics:
+                compact_group.create_dataset(metric, data=metrics[metric], dtype="float")
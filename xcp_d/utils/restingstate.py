@@ -1,6 +1,8 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 """Functions for calculating resting-state derivatives (ReHo and ALFF)."""
+import functools
+
 import nibabel as nb
 import numpy as np
 from nipype import logging
@@ -11,7 +13,7 @@ from templateflow.api import get as get_template
 LOGGER = logging.getLogger("nipype.utils")
 
 
-def compute_2d_reho(datat, adjacency_matrix):
+def compute_2d_reho(datat, adjacency_matrix, n_threads=1):
     """Calculate ReHo on 2D data.
 
     Parameters
@@ -20,6 +22,8 @@ def compute_2d_reho(datat, adjacency_matrix):
         data matrix in vertices by timepoints
     adjacency_matrix : numpy.ndarray of shape (V, V)
         surface adjacency matrix
+    n_threads : int, optional
+        Number of threads used to rank blocks of vertices in parallel. Default is 1.
 
     Returns
     -------
@@ -29,32 +33,50 @@ def compute_2d_reho(datat, adjacency_matrix):
     Notes
     -----
     From https://www.sciencedirect.com/science/article/pii/S0165178119305384#bib0045.
+
+    Each vertex's neighborhood is the vertex plus its neighbors in the adjacency matrix
+    (so a vertex that is its own neighbor is counted twice).
+    Every vertex's time series is ranked once,
+    and the neighborhoods' summed ranks are computed with a single sparse matrix product.
     """
-    KCC = np.zeros(datat.shape[0])  # a zero for each voxel
-
-    for i in range(datat.shape[0]):  # loop through each voxel
-        neigbor_index = np.where(adjacency_matrix[i, :] > 0)[0]  # the index of 4 neightbouts
-        nn = np.hstack((neigbor_index, np.array(i)))  # stack those indexes with voxel number
-        neidata = datat[nn, :]  # pull out data for relevant voxels
-
-        rankeddata = np.zeros_like(neidata)  # TODO: Fix typos #create 0s in same shape
-        # pull out index of voxel, timepoint
-        neigbor, timepoint = neidata.shape[0], neidata.shape[1]
-
-        for j in range(neidata.shape[0]):  # loop through each neighbour
-            rankeddata[j, :] = rankdata(neidata[j, :])  # assign ranks to timepoints for each voxel
-        rankmean = np.sum(rankeddata, axis=0)  # add up ranks
-        # KC is the sum of the squared rankmean minus the timepoints into
-        # the mean of the rankmean squared
-        KC = np.sum(np.power(rankmean, 2)) - timepoint * np.power(np.mean(rankmean), 2)
-        # square number of neighbours, multiply by (cubed timepoint - timepoint)
-        denom = np.power(neigbor, 2) * (np.power(timepoint, 3) - timepoint)
-        # the voxel value is 12*KC divided by denom
-        KCC[i] = 12 * KC / (denom)
+    from scipy import sparse
+
+    from xcp_d.utils.parallel import map_column_blocks
+
+    n_timepoints = datat.shape[1]
+    # Rank the timepoints of each vertex, in blocks of vertices.
+    ranks = map_column_blocks(
+        _rank_columns,
+        datat.T,
+        n_out_rows=n_timepoints,
+        dtype=np.float64,
+        n_threads=n_threads,
+    )
+
+    neighborhoods = sparse.csr_matrix(adjacency_matrix)
+    neighborhoods.data = (neighborhoods.data > 0).astype(np.float64)
+    neighborhoods = neighborhoods + sparse.identity(datat.shape[0], format="csr")
+    n_neighbors = np.asarray(neighborhoods.sum(axis=1)).ravel()
+
+    rankmean = np.asarray(neighborhoods @ ranks.T)  # add up ranks, (V, T)
+    # KC is the sum of the squared rankmean minus the timepoints into
+    # the mean of the rankmean squared
+    KC = np.sum(np.power(rankmean, 2), axis=1) - n_timepoints * np.power(
+        np.mean(rankmean, axis=1), 2
+    )
+    # square number of neighbours, multiply by (cubed timepoint - timepoint)
+    denom = np.power(n_neighbors, 2) * (np.power(n_timepoints, 3) - n_timepoints)
+    # the voxel value is 12*KC divided by denom
+    KCC = 12 * KC / denom
 
     return KCC
 
 
+def _rank_columns(data):
+    """Rank the values in each column of a (T, S) array."""
+    return rankdata(data, axis=0)
+
+
 def mesh_adjacency(hemi):
     """Calculate adjacency matrix from mesh timeseries.
 
@@ -91,7 +113,7 @@ def mesh_adjacency(hemi):
     return data_array + data_array.T  # transpose data_array and add it to itself
 
 
-def compute_alff(data_matrix, low_pass, high_pass, TR):
+def compute_alff(data_matrix, low_pass, high_pass, TR, n_threads=1):
     """Compute amplitude of low-frequency fluctuation (ALFF).
 
     Parameters
@@ -104,6 +126,8 @@ def compute_alff(data_matrix, low_pass, high_pass, TR):
         high pass frequency in Hz
     TR : float
         repetition time in seconds
+    n_threads : int, optional
+        Number of threads used to process blocks of voxels in parallel. Default is 1.
 
     Returns
     -------
@@ -114,25 +138,170 @@ def compute_alff(data_matrix, low_pass, high_pass, TR):
     -----
     Implementation based on https://pubmed.ncbi.nlm.nih.gov/16919409/.
     """
-    fs = 1 / TR  # sampling frequency
-    alff = np.zeros(data_matrix.shape[0])  # Create a matrix of zeros in the shape of
-    # number of voxels
-    for ii in range(data_matrix.shape[0]):  # Loop through the voxels
-        # get array of sample frequencies + power spectrum density
-        array_of_sample_frequencies, power_spec_density = signal.periodogram(
-            data_matrix[ii, :], fs, scaling="spectrum"
-        )
-        # square root of power spectrum density
-        power_spec_density_sqrt = np.sqrt(power_spec_density)
-        # get the position of the arguments closest to high_pass and low_pass, respectively
-        ff_alff = [
-            np.argmin(np.abs(array_of_sample_frequencies - high_pass)),
-            np.argmin(np.abs(array_of_sample_frequencies - low_pass)),
-        ]
-        # alff for that voxel is 2 * the mean of the sqrt of the power spec density
-        # from the value closest to the low pass cutoff, to the value closest
-        # to the high pass pass cutoff
-        alff[ii] = len(ff_alff) * np.mean(power_spec_density_sqrt[ff_alff[0] : ff_alff[1]])
+    from xcp_d.utils.parallel import map_column_blocks
+
+    alff = map_column_blocks(
+        functools.partial(_alff_columns, fs=1 / TR, low_pass=low_pass, high_pass=high_pass),
+        data_matrix.T,
+        dtype=np.float64,
+        n_threads=n_threads,
+    )
     # reshape alff so it's no longer 1 dimensional, but a #ofvoxels by 1 matrix
     alff = np.reshape(alff, [len(alff), 1])
     return alff
+
+
+def _alff_columns(data, fs, low_pass, high_pass):
+    """Compute the ALFF of each column of a (T, S) array."""
+    # get array of sample frequencies + power spectrum density
+    array_of_sample_frequencies, power_spec_density = signal.periodogram(
+        data,
+        fs,
+        scaling="spectrum",
+        axis=0,
+    )
+    # square root of power spectrum density
+    power_spec_density_sqrt = np.sqrt(power_spec_density)
+    # get the position of the arguments closest to high_pass and low_pass, respectively
+    ff_alff = [
+        np.argmin(np.abs(array_of_sample_frequencies - high_pass)),
+        np.argmin(np.abs(array_of_sample_frequencies - low_pass)),
+    ]
+    # alff for each voxel is 2 * the mean of the sqrt of the power spec density
+    # from the value closest to the low pass cutoff, to the value closest
+    # to the high pass pass cutoff
+    return len(ff_alff) * np.mean(power_spec_density_sqrt[ff_alff[0] : ff_alff[1], :], axis=0)
+
+
+def _despike_regressors(n_volumes, corder):
+    """Build the 3dDespike curve-fit regressors.
+
+    The curve is a quadratic polynomial plus ``corder`` pairs of sines and cosines,
+    with periods of ``n_volumes / k`` for k = 1, ..., ``corder``.
+    """
+    t = (np.arange(n_volumes) - 0.5 * (n_volumes - 1)) * (2.0 / n_volumes)
+    regressors = [np.ones(n_volumes), t, t**2]
+    for k in range(1, corder + 1):
+        regressors += [np.sin(k * np.pi * t), np.cos(k * np.pi * t)]
+
+    return np.stack(regressors, axis=1)
+
+
+def _fit_l1(regressors, data, max_iter=50, tol=1e-6):
+    """Fit regressors to many time series at once, minimizing the sum of absolute residuals.
+
+    The L1 fit is approximated with iteratively reweighted least squares,
+    vectorized over the columns of ``data``.
+    Each column stops being updated once its summed absolute residual changes by less than
+    ``tol`` (relative).
+
+    Parameters
+    ----------
+    regressors : numpy.ndarray of shape (T, P)
+    data : numpy.ndarray of shape (T, S)
+
+    Returns
+    -------
+    fitted : numpy.ndarray of shape (T, S)
+    """
+    n_volumes, n_regressors = regressors.shape
+    # The weighted normal equations are sums of weighted outer products of the regressors,
+    # so all of them can be built with a single matrix product.
+    outer_products = (regressors[:, :, None] * regressors[:, None, :]).reshape(n_volumes, -1)
+
+    betas = np.linalg.lstsq(regressors, data, rcond=None)[0]  # (P, S)
+    residuals = data - regressors @ betas
+    # Smoothing for the weights, so near-zero residuals don't produce huge weights.
+    eps = 1e-8 * np.maximum(np.mean(np.abs(residuals), axis=0), np.finfo(np.float64).tiny)
+    objective = np.sum(np.abs(residuals), axis=0)
+    active = np.ones(data.shape[1], dtype=bool)
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        weights = 1.0 / np.maximum(np.abs(residuals[:, idx]), eps[idx])  # (T, S')
+        lhs = (weights.T @ outer_products).reshape(idx.size, n_regressors, n_regressors)
+        rhs = (weights * data[:, idx]).T @ regressors
+        betas[:, idx] = np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0].T
+
+        residuals[:, idx] = data[:, idx] - regressors @ betas[:, idx]
+        new_objective = np.sum(np.abs(residuals[:, idx]), axis=0)
+        converged = np.abs(objective[idx] - new_objective) <= tol * objective[idx]
+        objective[idx] = new_objective
+        active[idx[converged]] = False
+        if not active.any():
+            break
+
+    return data - residuals
+
+
+def despike_data(data, corder=None, cut=(2.5, 4.0), block_size=1000, n_threads=1):
+    """Despike time series with the algorithm used by AFNI's 3dDespike.
+
+    Parameters
+    ----------
+    data : numpy.ndarray of shape (T, S)
+        Time series to despike, with time in the first dimension.
+    corder : int or None, optional
+        Number of sine/cosine pairs in the fitted curve.
+        If None, ``round(T / 30)`` (capped at 50) is used, as in 3dDespike.
+    cut : tuple of float, optional
+        The spike threshold (c1) and the upper range (c2) of the squashed values,
+        in units of the estimated standard deviation. Default is (2.5, 4.0).
+    block_size : int, optional
+        Number of time series to fit at once. Default is 1000.
+    n_threads : int, optional
+        Number of threads used to process blocks in parallel. Default is 1.
+
+    Returns
+    -------
+    despiked_data : numpy.ndarray of shape (T, S)
+        Despiked time series, as float32.
+    n_spikes : int
+        The number of values that were squashed.
+
+    Notes
+    -----
+    For each time series, a smooth curve (a quadratic polynomial plus ``corder``
+    sine/cosine pairs) is fitted with L1 regression.
+    The standard deviation of the residuals is estimated as ``sqrt(pi / 2)`` times their
+    mean absolute value.
+    Any value ``s`` standard deviations from the curve, with ``|s| > c1``, is replaced by
+    the value ``c1 + (c2 - c1) * tanh((|s| - c1) / (c2 - c1))`` standard deviations from
+    the curve, on the same side.
+
+    This matches the default (L1) fitting method of 3dDespike, not the ``-NEW`` method.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    n_volumes, n_series = data.shape
+    if corder is None:
+        corder = min(int(np.rint(n_volumes / 30)), 50)
+
+    if 4 * corder + 2 > n_volumes:
+        raise ValueError(f"corder={corder} is too large for {n_volumes} volumes.")
+
+    cut1, cut2 = cut
+    regressors = _despike_regressors(n_volumes, corder)
+    despiked_data = np.array(data, dtype=np.float32)
+
+    # Constant time series (e.g., background voxels) cannot contain spikes.
+    to_despike = np.flatnonzero(np.ptp(data, axis=0) > 0)
+
+    def _despike_block(block_idx):
+        block = np.asarray(data[:, block_idx], dtype=np.float64)
+        fitted = _fit_l1(regressors, block)
+        residuals = block - fitted
+        sigma = np.sqrt(np.pi / 2) * np.mean(np.abs(residuals), axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s = residuals / sigma
+
+        spikes = (np.abs(s) > cut1) & (sigma > 0)
+        squashed = cut1 + (cut2 - cut1) * np.tanh((np.abs(s) - cut1) / (cut2 - cut1))
+        block = np.where(spikes, fitted + np.sign(s) * squashed * sigma, block)
+        despiked_data[:, block_idx] = block
+        return np.sum(spikes)
+
+    blocks = [to_despike[i : i + block_size] for i in range(0, to_despike.size, block_size)]
+    with ThreadPoolExecutor(max_workers=max(n_threads, 1)) as executor:
+        n_spikes = sum(executor.map(_despike_block, blocks))
+
+    return despiked_data, int(n_spikes)
@@ -0,0 +1,369 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""In-process Gaussian smoothing of NIfTI and CIFTI data.
+
+CIFTI data are smoothed with a sparse (grayordinates x grayordinates) kernel,
+which combines geodesic Gaussian kernels on the fsLR 32k midthickness surfaces
+with Euclidean Gaussian kernels within each subcortical structure.
+Building the kernel is the expensive part, so kernels are cached on disk,
+keyed on the brain models, the surfaces, and the FWHM,
+and reused by every file that shares them.
+
+NIfTI data are smoothed with separable 1-D Gaussian convolutions, one volume at a time.
+"""
+import hashlib
+import os
+
+import nibabel as nb
+import numpy as np
+from nipype import logging
+from pkg_resources import resource_filename as pkgrf
+from scipy import ndimage, sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+
+from xcp_d.utils.utils import fwhm2sigma
+
+LOGGER = logging.getLogger("nipype.utils")
+
+SURFACE_FILES = {
+    "CIFTI_STRUCTURE_CORTEX_LEFT": pkgrf(
+        "xcp_d",
+        "data/ciftiatlas/Q1-Q6_RelatedParcellation210.L.midthickness_32k_fs_LR.surf.gii",
+    ),
+    "CIFTI_STRUCTURE_CORTEX_RIGHT": pkgrf(
+        "xcp_d",
+        "data/ciftiatlas/Q1-Q6_RelatedParcellation210.R.midthickness_32k_fs_LR.surf.gii",
+    ),
+}
+
+# Like Connectome Workbench, kernels are truncated at three standard deviations.
+KERNEL_CUTOFF = 3
+
+# Part of the kernels' cache key, so kernels cached by earlier versions are not reused.
+KERNEL_VERSION = 2
+
+
+def _vertex_areas(coords, faces):
+    """Assign a third of each triangle's area to each of its vertices."""
+    cross = np.cross(
+        coords[faces[:, 1]] - coords[faces[:, 0]], coords[faces[:, 2]] - coords[faces[:, 0]]
+    )
+    triangle_areas = np.linalg.norm(cross, axis=1) / 2
+    return np.bincount(
+        faces.ravel(), weights=np.repeat(triangle_areas / 3, 3), minlength=len(coords)
+    )
+
+
+def _unfolded_edges(coords, faces):
+    """Find straight paths across each pair of triangles that share an edge.
+
+    The two triangles are unfolded into a plane around their shared edge.
+    If the straight line between the two opposite vertices crosses the shared edge,
+    it is a shorter path between them than any path along the mesh's edges.
+
+    Returns
+    -------
+    edges : :obj:`numpy.ndarray` of shape (n_edges, 2)
+        The opposite vertices of each pair of triangles with a straight path.
+    lengths : :obj:`numpy.ndarray` of shape (n_edges,)
+        The lengths of the straight paths.
+    """
+    # Each triangle's three edges, with the vertex opposite to each one.
+    half_edges = np.vstack((faces[:, [0, 1, 2]], faces[:, [1, 2, 0]], faces[:, [2, 0, 1]]))
+    half_edges[:, :2] = np.sort(half_edges[:, :2], axis=1)
+    order = np.lexsort((half_edges[:, 1], half_edges[:, 0]))
+    half_edges = half_edges[order]
+
+    # Edges shared by two triangles are adjacent after sorting.
+    shared = np.flatnonzero(np.all(half_edges[:-1, :2] == half_edges[1:, :2], axis=1))
+    a, b, c = half_edges[shared].T
+    d = half_edges[shared + 1, 2]
+
+    def _angle(vertex, end1, end2):
+        vec1 = coords[end1] - coords[vertex]
+        vec2 = coords[end2] - coords[vertex]
+        cosine = np.sum(vec1 * vec2, axis=1) / (
+            np.linalg.norm(vec1, axis=1) * np.linalg.norm(vec2, axis=1)
+        )
+        return np.arccos(np.clip(cosine, -1, 1))
+
+    # The straight line crosses the shared edge if the unfolded quadrilateral is convex at a and b.
+    angle_a = _angle(a, b, c) + _angle(a, b, d)
+    angle_b = _angle(b, a, c) + _angle(b, a, d)
+    crosses = (angle_a < np.pi) & (angle_b < np.pi)
+
+    length_ac = np.linalg.norm(coords[c] - coords[a], axis=1)
+    length_ad = np.linalg.norm(coords[d] - coords[a], axis=1)
+    lengths = np.sqrt(
+        np.maximum(
+            length_ac**2 + length_ad**2 - 2 * length_ac * length_ad * np.cos(angle_a), 0
+        )
+    )
+    return np.column_stack((c, d))[crosses], lengths[crosses]
+
+
+def _geodesic_distances(coords, faces, max_distance, chunk_size=1000):
+    """Calculate geodesic distances between all pairs of vertices within a maximum distance.
+
+    Shortest paths along a mesh's edges overestimate geodesic distances,
+    by up to ~15% on irregular meshes, so paths may also cut straight across pairs of
+    adjacent triangles (see :func:`_unfolded_edges`), which removes most of that bias.
+
+    Returns
+    -------
+    rows, cols, distances : :obj:`numpy.ndarray`
+        The source vertices, target vertices, and distances of all pairs within
+        ``max_distance`` of each other, including each vertex and itself.
+    """
+    n_vertices = coords.shape[0]
+    edges = np.vstack((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    lengths = np.linalg.norm(coords[edges[:, 0]] - coords[edges[:, 1]], axis=1)
+
+    unfolded_edges, unfolded_lengths = _unfolded_edges(coords, faces)
+    edges = np.vstack((edges, unfolded_edges))
+    lengths = np.r_[lengths, unfolded_lengths]
+
+    # Keep the shortest path between each pair of vertices,
+    # since duplicate entries would be summed in the sparse matrix.
+    edges = np.vstack((edges, edges[:, ::-1]))
+    lengths = np.tile(lengths, 2)
+    order = np.lexsort((lengths, edges[:, 1], edges[:, 0]))
+    edges, lengths = edges[order], lengths[order]
+    first = np.r_[True, np.any(edges[1:] != edges[:-1], axis=1)]
+    graph = sparse.csr_matrix(
+        (lengths[first], (edges[first, 0], edges[first, 1])),
+        shape=(n_vertices, n_vertices),
+    )
+
+    rows, cols, distances = [], [], []
+    # Dijkstra's output is dense, so sources are processed in chunks.
+    for start in range(0, n_vertices, chunk_size):
+        sources = np.arange(start, min(start + chunk_size, n_vertices))
+        chunk_distances = csgraph.dijkstra(graph, indices=sources, limit=max_distance)
+        source_idx, target_idx = np.nonzero(np.isfinite(chunk_distances))
+        rows.append(sources[source_idx])
+        cols.append(target_idx)
+        distances.append(chunk_distances[source_idx, target_idx])
+
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(distances)
+
+
+def _surface_kernel(surf_file, sigma):
+    """Build an unnormalized geodesic Gaussian kernel for all vertices of a surface.
+
+    As with Workbench's GEO_GAUSS_AREA method, each neighbor's weight is scaled by its area.
+    """
+    surf_img = nb.load(surf_file)
+    coords = surf_img.agg_data("pointset").astype(np.float64)
+    faces = surf_img.agg_data("triangle").astype(np.int64)
+    n_vertices = coords.shape[0]
+
+    rows, cols, distances = _geodesic_distances(coords, faces, KERNEL_CUTOFF * sigma)
+    areas = _vertex_areas(coords, faces)
+    weights = np.exp(-(distances**2) / (2 * sigma**2)) * areas[cols]
+    return sparse.csr_matrix((weights, (rows, cols)), shape=(n_vertices, n_vertices))
+
+
+def _volume_kernel(ijk, affine, sigma):
+    """Build an unnormalized Euclidean Gaussian kernel for a set of voxels."""
+    coords = nb.affines.apply_affine(affine, ijk)
+    pairs = cKDTree(coords).query_pairs(KERNEL_CUTOFF * sigma, output_type="ndarray")
+    distances = np.linalg.norm(coords[pairs[:, 0]] - coords[pairs[:, 1]], axis=1)
+    weights = np.exp(-(distances**2) / (2 * sigma**2))
+    n_voxels = coords.shape[0]
+    diagonal = np.arange(n_voxels)
+    return sparse.csr_matrix(
+        (
+            np.r_[weights, weights, np.ones(n_voxels)],
+            (np.r_[pairs[:, 0], pairs[:, 1], diagonal], np.r_[pairs[:, 1], pairs[:, 0], diagonal]),
+        ),
+        shape=(n_voxels, n_voxels),
+    )
+
+
+def _normalize_rows(kernel):
+    """Scale a sparse kernel's rows to sum to one."""
+    row_sums = np.asarray(kernel.sum(axis=1)).ravel()
+    return sparse.diags(1 / row_sums) @ kernel
+
+
+def build_cifti_smoothing_kernel(brain_models, fwhm, surface_files=None):
+    """Build the sparse smoothing kernel for a CIFTI file's brain models.
+
+    Each structure is smoothed separately, as with ``wb_command -cifti-smoothing``.
+    Surface structures are smoothed within the vertices included in the CIFTI
+    (i.e., the medial wall is excluded), and subcortical structures within their own voxels.
+
+    Parameters
+    ----------
+    brain_models : :obj:`nibabel.cifti2.cifti2_axes.BrainModelAxis`
+        The CIFTI file's brain model axis.
+    fwhm : :obj:`float`
+        Full width at half maximum of the Gaussian kernel, in millimeters.
+    surface_files : :obj:`dict` or None, optional
+        Surfaces on which to smooth each cortical structure.
+        Structures without a surface use the fsLR 32k midthickness surfaces bundled with xcp_d.
+
+    Returns
+    -------
+    kernel : :obj:`scipy.sparse.csr_matrix` of shape (n_grayordinates, n_grayordinates)
+        Row-normalized smoothing kernel. Smoothed data are ``kernel @ data``.
+    """
+    surface_files = {**SURFACE_FILES, **(surface_files or {})}
+    sigma = fwhm2sigma(fwhm)
+
+    blocks = []
+    for structure, _, brain_model in brain_models.iter_structures():
+        if brain_model.surface_mask.all():
+            if structure not in surface_files:
+                raise ValueError(f"No surface available to smooth {structure}.")
+
+            full_kernel = _surface_kernel(surface_files[structure], sigma)
+            vertices = brain_model.vertex
+            block = full_kernel[vertices][:, vertices]
+        else:
+            block = _volume_kernel(brain_model.voxel, brain_models.affine, sigma)
+
+        blocks.append(_normalize_rows(block))
+
+    return sparse.block_diag(blocks, format="csr")
+
+
+def get_cifti_kernel_key(cifti_file, fwhm, surface_files=None):
+    """Build the key for a CIFTI file's smoothing kernel.
+
+    Parameters
+    ----------
+    cifti_file : :obj:`str`
+        Path to the CIFTI file. Only its brain models are used.
+    fwhm : :obj:`float`
+        Full width at half maximum of the Gaussian kernel, in millimeters.
+    surface_files : :obj:`dict` or None, optional
+        Surfaces on which to smooth each cortical structure.
+
+    Returns
+    -------
+    key : :obj:`str`
+        A hexadecimal hash.
+    """
+    from xcp_d.utils.atlas import _hash_file, _hash_reference_grid
+
+    hasher = hashlib.sha1()
+    hasher.update(_hash_reference_grid(cifti_file).encode())
+    hasher.update(repr(float(fwhm)).encode())
+    hasher.update(repr((KERNEL_CUTOFF, KERNEL_VERSION)).encode())
+    for structure, surf_file in sorted({**SURFACE_FILES, **(surface_files or {})}.items()):
+        hasher.update(structure.encode())
+        hasher.update(_hash_file(surf_file).encode())
+
+    return hasher.hexdigest()
+
+
+def get_cifti_smoothing_kernel(cifti_file, fwhm, cache_dir=None, surface_files=None):
+    """Load a CIFTI file's smoothing kernel from the cache, building it if necessary.
+
+    Parameters
+    ----------
+    cifti_file : :obj:`str`
+        Path to the CIFTI file. Only its brain models are used.
+    fwhm : :obj:`float`
+        Full width at half maximum of the Gaussian kernel, in millimeters.
+    cache_dir : :obj:`str` or None, optional
+        Directory in which kernels are cached.
+        The ``XCPD_KERNEL_CACHE`` environment variable, if set, overrides this directory.
+        If both are None, the kernel is built without caching.
+    surface_files : :obj:`dict` or None, optional
+        Surfaces on which to smooth each cortical structure.
+        Structures without a surface use the fsLR 32k midthickness surfaces bundled with xcp_d.
+
+    Returns
+    -------
+    kernel : :obj:`scipy.sparse.csr_matrix` of shape (n_grayordinates, n_grayordinates)
+        Row-normalized smoothing kernel.
+    """
+    cache_dir = os.getenv("XCPD_KERNEL_CACHE", cache_dir)
+    brain_models = nb.load(cifti_file).header.get_axis(1)
+    if not cache_dir:
+        return build_cifti_smoothing_kernel(brain_models, fwhm, surface_files=surface_files)
+
+    key = get_cifti_kernel_key(cifti_file, fwhm, surface_files=surface_files)
+    kernel_file = os.path.join(cache_dir, f"{key}.npz")
+    if os.path.isfile(kernel_file):
+        LOGGER.debug(f"Using cached smoothing kernel {kernel_file}")
+        return sparse.load_npz(kernel_file).tocsr()
+
+    kernel = build_cifti_smoothing_kernel(brain_models, fwhm, surface_files=surface_files)
+
+    # Write to a temporary file first, so concurrent runs never load a partial kernel.
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_file = os.path.join(cache_dir, f".{key}.{os.getpid()}.npz")
+        sparse.save_npz(temp_file, kernel)
+        os.replace(temp_file, kernel_file)
+    except OSError as exc:
+        LOGGER.warning(f"Could not cache smoothing kernel in {cache_dir}: {exc}")
+
+    return kernel
+
+
+def smooth_cifti_data(data, kernel):
+    """Apply a smoothing kernel to CIFTI data.
+
+    Parameters
+    ----------
+    data : :obj:`numpy.ndarray` of shape (n_maps, n_grayordinates)
+        CIFTI data, with maps or volumes in the first dimension.
+    kernel : :obj:`scipy.sparse.csr_matrix` of shape (n_grayordinates, n_grayordinates)
+        Kernel from :func:`get_cifti_smoothing_kernel`.
+
+    Returns
+    -------
+    smoothed_data : :obj:`numpy.ndarray` of shape (n_maps, n_grayordinates)
+        Smoothed data, as float32.
+    """
+    return (kernel @ np.asarray(data, dtype=np.float32).T).T.astype(np.float32)
+
+
+def smooth_nifti_img(img, fwhm):
+    """Smooth a 3D or 4D NIfTI image with a Gaussian kernel.
+
+    The kernel is applied as 1-D convolutions along each spatial axis,
+    as in :func:`nilearn.image.smooth_img`, but one volume at a time and in single precision,
+    so the 4D image is never copied in double precision.
+    Non-finite values are set to zero before smoothing.
+
+    Parameters
+    ----------
+    img : :obj:`nibabel.Nifti1Image`
+        Image to smooth.
+    fwhm : :obj:`float` or :obj:`list` of :obj:`float`
+        Full width at half maximum of the Gaussian kernel, in millimeters.
+        May be a list with one value per spatial axis.
+
+    Returns
+    -------
+    smoothed_img : :obj:`nibabel.Nifti1Image`
+        Smoothed image, as float32.
+    """
+    data = img.get_fdata(dtype=np.float32, caching="unchanged")
+    if isinstance(img.dataobj, np.ndarray) and np.may_share_memory(data, img.dataobj):
+        # Smoothing is done in place, so don't modify the input image's array.
+        data = data.copy()
+
+    data[~np.isfinite(data)] = 0
+
+    voxel_sizes = np.sqrt(np.sum(img.affine[:3, :3] ** 2, axis=0))
+    sigmas = fwhm2sigma(np.broadcast_to(np.asarray(fwhm, dtype=np.float64), (3,))) / voxel_sizes
+
+    volumes = data[..., None] if data.ndim == 3 else data
+    for i_volume in range(volumes.shape[3]):
+        volume = volumes[..., i_volume]
+        for axis, sigma in enumerate(sigmas):
+            if sigma > 0:
+                ndimage.gaussian_filter1d(volume, sigma, axis=axis, output=volume)
+
+    smoothed_img = nb.Nifti1Image(data, img.affine, img.header)
+    smoothed_img.set_data_dtype(np.float32)
+    return smoothed_img
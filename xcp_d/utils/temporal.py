@@ -0,0 +1,227 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Temporal operators that are shared by every voxel or vertex in a run.
+
+The temporal mask is the same for every voxel, so steps like censored-volume interpolation
+and zero-phase band-pass filtering are linear maps over time.
+These functions build those maps once, as matrices, and apply them to all voxels with
+matrix multiplications, in blocks of columns to bound memory use.
+"""
+import functools
+
+import numpy as np
+from nipype import logging
+
+from xcp_d.utils.doc import fill_doc
+from xcp_d.utils.parallel import map_column_blocks
+
+LOGGER = logging.getLogger("nipype.utils")
+
+# The number of voxels/vertices that are transformed in each matrix multiplication.
+BLOCK_SIZE = 16384
+
+
+@fill_doc
+def build_interpolation_operator(sample_mask, TR):
+    """Build the matrix that interpolates censored volumes from the retained volumes.
+
+    This reproduces cubic spline interpolation (:class:`scipy.interpolate.CubicSpline`,
+    with "not-a-knot" boundary conditions and extrapolation at the edges of the run),
+    which is linear in the data, by fitting a spline to each column of an identity matrix.
+
+    Parameters
+    ----------
+    sample_mask : (T,) :obj:`numpy.ndarray` of bool
+        True for retained volumes and False for censored volumes.
+    %(TR)s
+
+    Returns
+    -------
+    operator : (T, T_kept) :obj:`numpy.ndarray`
+        The interpolation matrix.
+        Rows for retained volumes select those volumes unchanged.
+    """
+    from scipy.interpolate import CubicSpline
+
+    sample_mask = np.asarray(sample_mask, dtype=bool)
+    n_kept = int(sample_mask.sum())
+    if n_kept < 2:
+        raise ValueError(
+            f"At least two retained volumes are needed to interpolate, but {n_kept} were retained."
+        )
+
+    frame_times = np.arange(sample_mask.size) * TR
+    operator = np.zeros((sample_mask.size, n_kept))
+    operator[sample_mask, :] = np.eye(n_kept)
+    if n_kept < sample_mask.size:
+        spline = CubicSpline(frame_times[sample_mask], np.eye(n_kept))
+        operator[~sample_mask, :] = spline(frame_times[~sample_mask])
+
+    return operator
+
+
+def build_bandpass_operator(
+    n_volumes,
+    sampling_rate,
+    low_pass,
+    high_pass,
+    padtype="constant",
+    padlen=None,
+    order=2,
+):
+    """Build the matrix that applies :func:`~xcp_d.utils.utils.butter_bandpass` to a run.
+
+    Zero-phase filtering with :func:`scipy.signal.filtfilt` is linear in the data,
+    so the filter is applied once to each basis vector (each row of an identity matrix).
+
+    Parameters
+    ----------
+    n_volumes : :obj:`int`
+        The number of volumes in the run.
+    sampling_rate : float
+        Sampling frequency. 1/TR(s).
+    low_pass : float
+        frequency, in Hertz
+    high_pass : float
+        frequency, in Hertz
+    padlen
+    padtype
+    order : int
+        The order of the filter.
+
+    Returns
+    -------
+    operator : (T, T) :obj:`numpy.ndarray`
+        The filtering matrix.
+    """
+    from scipy.signal import filtfilt
+
+    from xcp_d.utils.utils import get_butter_coefficients
+
+    b, a = get_butter_coefficients(sampling_rate, low_pass, high_pass, order=order)
+    # Filtering along the contiguous (last) axis is much faster.
+    # Row i of the result is the filtered i-th basis vector, i.e., column i of the operator.
+    impulse_responses = filtfilt(
+        b,
+        a,
+        np.eye(n_volumes),
+        axis=-1,
+        padtype=padtype,
+        padlen=padlen,
+    )
+    return np.ascontiguousarray(impulse_responses.T)
+
+
+@fill_doc
+def build_interpolate_and_filter_operator(sample_mask, TR, low_pass, high_pass, filter_order):
+    """Compose censored-volume interpolation and band-pass filtering into a single matrix.
+
+    The operator maps the retained volumes directly to the interpolated, filtered run,
+    with the same padding as :func:`~xcp_d.utils.utils.denoise_with_nilearn`.
+
+    Parameters
+    ----------
+    sample_mask : (T,) :obj:`numpy.ndarray` of bool
+        True for retained volumes and False for censored volumes.
+    %(TR)s
+    low_pass, high_pass : float
+        Lowpass and high_pass thresholds, in Hertz.
+    filter_order : int
+        Filter order.
+
+    Returns
+    -------
+    operator : (T, T_kept) :obj:`numpy.ndarray`
+        The composed matrix.
+    """
+    n_volumes = np.asarray(sample_mask).size
+    interpolation_operator = build_interpolation_operator(sample_mask, TR)
+    bandpass_operator = build_bandpass_operator(
+        n_volumes,
+        sampling_rate=1 / TR,
+        low_pass=low_pass,
+        high_pass=high_pass,
+        order=filter_order / 2,
+        padtype="constant",
+        padlen=n_volumes - 1,
+    )
+    return bandpass_operator @ interpolation_operator
+
+
+def apply_temporal_operator(operator, data, out=None, block_size=BLOCK_SIZE, n_threads=1):
+    """Apply a temporal operator to every column of a (T, S) array.
+
+    Parameters
+    ----------
+    operator : (T_out, T_in) :obj:`numpy.ndarray`
+        The temporal operator.
+    data : (T_in, S) :obj:`numpy.ndarray`
+        Time by voxels/vertices array of data.
+    out : (T_out, S) :obj:`numpy.ndarray` or None, optional
+        Array in which to write the result.
+        If None, a new array is created, with the data's floating-point dtype.
+    block_size : :obj:`int`, optional
+        The maximum number of columns that are transformed at a time.
+    n_threads : :obj:`int`, optional
+        The number of blocks that are transformed in parallel. Default is 1.
+
+    Returns
+    -------
+    out : (T_out, S) :obj:`numpy.ndarray`
+        The transformed data.
+    """
+    if operator.shape[1] != data.shape[0]:
+        raise ValueError(
+            f"The operator's shape {operator.shape} does not match the data's {data.shape}."
+        )
+
+    if out is None:
+        dtype = np.result_type(data.dtype, np.float32)
+        out = np.empty((operator.shape[0], data.shape[1]), dtype=dtype)
+
+    # Multiply in the data's precision, so float32 data use float32 BLAS routines.
+    operator = operator.astype(out.dtype, copy=False)
+    return map_column_blocks(
+        functools.partial(np.matmul, operator),
+        data,
+        n_out_rows=operator.shape[0],
+        out=out,
+        n_threads=n_threads,
+        block_size=block_size,
+    )
+
+
+@fill_doc
+def interpolate_volumes(data, sample_mask, TR, block_size=BLOCK_SIZE, n_threads=1):
+    """Replace censored volumes with cubic spline interpolations of the retained volumes.
+
+    Parameters
+    ----------
+    data : (T, S) :obj:`numpy.ndarray`
+        Time by voxels/vertices array of data. Censored volumes are overwritten in place.
+    sample_mask : (T,) :obj:`numpy.ndarray` of bool
+        True for retained volumes and False for censored volumes.
+    %(TR)s
+    block_size : :obj:`int`, optional
+        The maximum number of columns that are interpolated at a time.
+    n_threads : :obj:`int`, optional
+        The number of blocks that are interpolated in parallel. Default is 1.
+
+    Returns
+    -------
+    data : (T, S) :obj:`numpy.ndarray`
+        The data, with the censored volumes interpolated.
+    """
+    sample_mask = np.asarray(sample_mask, dtype=bool)
+    if sample_mask.all():
+        return data
+
+    operator = build_interpolation_operator(sample_mask, TR)
+    # Only the censored volumes change, so only their rows of the operator are applied.
+    data[~sample_mask, :] = apply_temporal_operator(
+        operator[~sample_mask, :],
+        data[sample_mask, :],
+        block_size=block_size,
+        n_threads=n_threads,
+    )
+    return data
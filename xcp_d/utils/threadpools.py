@@ -0,0 +1,44 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Control of the BLAS and OpenMP thread pools used by xcp_d's numeric interfaces.
+
+NumPy and SciPy start as many BLAS/OpenMP threads as there are cores,
+while the MultiProc plugin runs up to ``--nthreads`` nodes at once,
+so without a cap the nodes' threads compete for the same cores.
+Interfaces decorated with :func:`limit_threads` cap their thread pools
+at their ``num_threads`` input, which the workflows set to the node's ``n_procs``.
+"""
+import functools
+
+from nipype import logging
+
+LOGGER = logging.getLogger("nipype.utils")
+
+
+def limit_threads(run_interface):
+    """Cap an interface's BLAS and OpenMP thread pools at its ``num_threads`` input.
+
+    Parameters
+    ----------
+    run_interface : callable
+        The interface's ``_run_interface`` method.
+
+    Returns
+    -------
+    run_interface : callable
+        The wrapped method.
+    """
+
+    @functools.wraps(run_interface)
+    def _run_interface(self, runtime):
+        # SciPy ships its own BLAS library, which is only loaded with scipy.linalg.
+        # Pools are capped when the limit is entered, so the library must already be loaded.
+        import scipy.linalg  # noqa: F401
+        from threadpoolctl import threadpool_limits
+
+        num_threads = max(self.inputs.num_threads, 1)
+        with threadpool_limits(limits=num_threads):
+            LOGGER.debug(f"{type(self).__name__}: thread pools capped at {num_threads}.")
+            return run_interface(self, runtime)
+
+    return _run_interface
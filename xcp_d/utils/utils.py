@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """Miscellaneous utility functions for xcp_d."""
+import functools
 import warnings
 
 import nibabel as nb
@@ -236,38 +237,26 @@ def fwhm2sigma(fwhm):
     return fwhm / np.sqrt(8 * np.log(2))
 
 
-def butter_bandpass(
-    data,
-    sampling_rate,
-    low_pass,
-    high_pass,
-    padtype="constant",
-    padlen=None,
-    order=2,
-):
-    """Apply a Butterworth bandpass filter to data.
+def get_butter_coefficients(sampling_rate, low_pass, high_pass, order=2):
+    """Get the coefficients of a Butterworth filter.
 
     Parameters
     ----------
-    data : (T, S) numpy.ndarray
-        Time by voxels/vertices array of data.
     sampling_rate : float
         Sampling frequency. 1/TR(s).
     low_pass : float
         frequency, in Hertz
     high_pass : float
         frequency, in Hertz
-    padlen
-    padtype
     order : int
         The order of the filter.
 
     Returns
     -------
-    filtered_data : (T, S) numpy.ndarray
-        The filtered data.
+    b, a : numpy.ndarray
+        Numerator and denominator polynomials of the filter.
     """
-    from scipy.signal import butter, filtfilt
+    from scipy.signal import butter
 
     if low_pass > 0 and high_pass > 0:
         btype = "bandpass"
@@ -288,20 +277,62 @@ def butter_bandpass(
         output="ba",
         fs=sampling_rate,  # eliminates need to normalize cutoff frequencies
     )
+    return b, a
 
-    filtered_data = np.zeros_like(data)  # create something to populate filtered values with
 
-    # apply the filter, loop through columns of regressors
-    for i_voxel in range(filtered_data.shape[1]):
-        filtered_data[:, i_voxel] = filtfilt(
-            b,
-            a,
-            data[:, i_voxel],
-            padtype=padtype,
-            padlen=padlen,
-        )
+def butter_bandpass(
+    data,
+    sampling_rate,
+    low_pass,
+    high_pass,
+    padtype="constant",
+    padlen=None,
+    order=2,
+    n_threads=1,
+):
+    """Apply a Butterworth bandpass filter to data.
+
+    Parameters
+    ----------
+    data : (T, S) numpy.ndarray
+        Time by voxels/vertices array of data.
+    sampling_rate : float
+        Sampling frequency. 1/TR(s).
+    low_pass : float
+        frequency, in Hertz
+    high_pass : float
+        frequency, in Hertz
+    padlen
+    padtype
+    order : int
+        The order of the filter.
+    n_threads : int, optional
+        Number of threads used to filter blocks of columns in parallel. Default is 1.
+
+    Returns
+    -------
+    filtered_data : (T, S) numpy.ndarray
+        The filtered data.
+    """
+    from xcp_d.utils.parallel import map_column_blocks
+
+    b, a = get_butter_coefficients(sampling_rate, low_pass, high_pass, order=order)
 
-    return filtered_data
+    return map_column_blocks(
+        functools.partial(_filtfilt_columns, b=b, a=a, padtype=padtype, padlen=padlen),
+        data,
+        n_out_rows=data.shape[0],
+        dtype=data.dtype,
+        n_threads=n_threads,
+    )
+
+
+def _filtfilt_columns(data, b, a, padtype, padlen):
+    """Apply a zero-phase filter to each column of a (T, S) array."""
+    from scipy.signal import filtfilt
+
+    # Filter along the last axis of the transposed data, which filtfilt makes contiguous.
+    return filtfilt(b, a, data.T, axis=-1, padtype=padtype, padlen=padlen).T
 
 
 @fill_doc
@@ -352,6 +383,8 @@ def denoise_with_nilearn(
     high_pass,
     filter_order,
     TR,
+    compose_filter=False,
+    n_threads=1,
 ):
     """Denoise an array with Nilearn.
 
@@ -381,6 +414,10 @@ def denoise_with_nilearn(
     filter_order : int
         Filter order.
     %(TR)s
+    %(compose_filter)s
+    n_threads : int, optional
+        Number of threads used to interpolate and filter blocks of voxels/vertices in parallel.
+        Default is 1.
 
     Returns
     -------
@@ -391,23 +428,191 @@ def denoise_with_nilearn(
         This is the primary output.
     """
     import pandas as pd
-    from nilearn import signal
 
-    n_volumes, n_voxels = preprocessed_bold.shape
     censoring_df = pd.read_table(temporal_mask)
     # Only remove high-motion outliers in this step (not the random volumes for trimming).
     sample_mask = ~censoring_df["framewise_displacement"].to_numpy().astype(bool)
 
-    signal_columns = None
-    denoise = bool(confounds_file)
-    if denoise:
-        confounds_df = pd.read_table(confounds_file)
+    # Censor the data and confounds
+    preprocessed_bold_censored = preprocessed_bold[sample_mask, :]
+    nuisance_arr, nuisance_censored = _load_nuisance_regressors(confounds_file, sample_mask)
+    if nuisance_arr is not None:
+        # Estimate betas using only the censored data
+        betas = np.linalg.lstsq(nuisance_censored, preprocessed_bold_censored, rcond=None)[0]
 
-        assert "intercept" in confounds_df.columns
-        assert "linear_trend" in confounds_df.columns
-        assert confounds_df.columns[-1] == "intercept"
+        # Apply the betas to denoise the *full* (uncensored) BOLD data
+        uncensored_denoised_bold = preprocessed_bold - np.dot(nuisance_arr, betas)
 
-        signal_columns = [c for c in confounds_df.columns if c.startswith("signal__")]
+        # Also denoise the censored BOLD data
+        censored_denoised_bold = preprocessed_bold_censored - np.dot(nuisance_censored, betas)
+    else:
+        uncensored_denoised_bold = preprocessed_bold.copy()
+        censored_denoised_bold = preprocessed_bold_censored.copy()
+
+    interpolated_filtered_bold = _interpolate_and_filter(
+        censored_denoised_bold,
+        sample_mask=sample_mask,
+        low_pass=low_pass,
+        high_pass=high_pass,
+        filter_order=filter_order,
+        TR=TR,
+        compose_filter=compose_filter,
+        n_threads=n_threads,
+    )
+
+    return uncensored_denoised_bold, interpolated_filtered_bold
+
+
+@fill_doc
+def denoise_strategies_with_nilearn(
+    preprocessed_bold,
+    confounds_files,
+    temporal_mask,
+    low_pass,
+    high_pass,
+    filter_order,
+    TR,
+    compose_filter=False,
+    block_size=16384,
+    n_threads=1,
+):
+    """Denoise an array with several sets of nuisance regressors, in one pass over the data.
+
+    Each strategy is denoised as in :func:`denoise_with_nilearn`,
+    and its interpolated, filtered data are re-censored.
+    The data are censored once, and the cross-products of every strategy's nuisance regressors
+    with the censored data are computed in a single matrix multiplication,
+    so each additional strategy only costs a small least-squares solve,
+    its residuals, and its temporal filtering.
+
+    Parameters
+    ----------
+    preprocessed_bold : :obj:`numpy.ndarray` of shape (T, S)
+        Preprocessed BOLD data, after dummy volume removal,
+        but without any additional censoring.
+    confounds_files : :obj:`list` of :obj:`str` or None
+        Paths to TSV files containing each strategy's selected confounds,
+        after dummy volume removal, but without any additional censoring.
+        None for strategies without nuisance regression.
+    %(temporal_mask)s
+    low_pass, high_pass : float or None
+        Lowpass and high_pass thresholds, in Hertz.
+    filter_order : int
+        Filter order.
+    %(TR)s
+    %(compose_filter)s
+    block_size : :obj:`int`, optional
+        The number of voxels/vertices for which cross-products are computed at a time.
+    n_threads : int, optional
+        Number of threads used to interpolate and filter blocks of voxels/vertices in parallel.
+        Default is 1.
+
+    Yields
+    ------
+    censored_denoised_bold : :obj:`numpy.ndarray` of shape (T_kept, S)
+        Each strategy's censored, denoised, interpolated, filtered, and re-censored data,
+        in the order of ``confounds_files``.
+        Strategies are yielded one at a time, so only one is held in memory.
+    """
+    import pandas as pd
+
+    censoring_df = pd.read_table(temporal_mask)
+    sample_mask = ~censoring_df["framewise_displacement"].to_numpy().astype(bool)
+    preprocessed_bold_censored = preprocessed_bold[sample_mask, :]
+
+    designs = [_load_nuisance_regressors(f, sample_mask)[1] for f in confounds_files]
+    regressed_designs = [design for design in designs if design is not None]
+    if regressed_designs:
+        # One pass over the data for all of the strategies' cross-products.
+        stacked_designs = np.hstack(regressed_designs)
+        cross_products = np.empty((stacked_designs.shape[1], preprocessed_bold.shape[1]))
+        for start in range(0, preprocessed_bold.shape[1], block_size):
+            block = slice(start, start + block_size)
+            cross_products[:, block] = stacked_designs.T @ preprocessed_bold_censored[:, block]
+
+    bandpass_filter = low_pass is not None and high_pass is not None
+    i_column = 0
+    for nuisance_censored in designs:
+        if nuisance_censored is None:
+            censored_denoised_bold = preprocessed_bold_censored.copy()
+        else:
+            n_regressors = nuisance_censored.shape[1]
+            betas = _solve_least_squares(
+                nuisance_censored,
+                cross_products[i_column : i_column + n_regressors, :],
+            )
+            i_column += n_regressors
+            censored_denoised_bold = preprocessed_bold_censored - np.dot(nuisance_censored, betas)
+
+        if not bandpass_filter:
+            # Interpolation does not change retained volumes, so re-censoring undoes it.
+            yield censored_denoised_bold
+            continue
+
+        interpolated_filtered_bold = _interpolate_and_filter(
+            censored_denoised_bold,
+            sample_mask=sample_mask,
+            low_pass=low_pass,
+            high_pass=high_pass,
+            filter_order=filter_order,
+            TR=TR,
+            compose_filter=compose_filter,
+            n_threads=n_threads,
+        )
+        yield interpolated_filtered_bold[sample_mask, :]
+
+
+def _solve_least_squares(design, cross_products):
+    """Solve a least-squares problem from the design and its cross-products with the data.
+
+    This gives the same minimum-norm solution as :func:`numpy.linalg.lstsq`,
+    with the same cutoff for small singular values,
+    without needing the data themselves.
+
+    Parameters
+    ----------
+    design : (T, R) :obj:`numpy.ndarray`
+    cross_products : (R, S) :obj:`numpy.ndarray`
+        ``design.T @ data``.
+
+    Returns
+    -------
+    betas : (R, S) :obj:`numpy.ndarray`
+    """
+    _, singular_values, vh = np.linalg.svd(design, full_matrices=False)
+    cutoff = np.finfo(design.dtype).eps * max(design.shape) * singular_values.max()
+    keep = singular_values > cutoff
+    vh, singular_values = vh[keep, :], singular_values[keep]
+    # pinv(design) @ data = V S^-2 V^T design^T data
+    return vh.T @ ((vh @ cross_products) / (singular_values**2)[:, None])
+
+
+def _load_nuisance_regressors(confounds_file, sample_mask):
+    """Load the nuisance regressors and prepare them for regression.
+
+    Nuisance regressors are orthogonalized w.r.t. any signal regressors,
+    then mean-centered based on the censored regressors.
+
+    Returns
+    -------
+    nuisance_arr : (T, R) :obj:`numpy.ndarray` or None
+        The full (uncensored) nuisance regressors.
+        None if ``confounds_file`` is None.
+    nuisance_censored : (T_kept, R) :obj:`numpy.ndarray` or None
+        The censored nuisance regressors.
+    """
+    import pandas as pd
+
+    if not confounds_file:
+        return None, None
+
+    confounds_df = pd.read_table(confounds_file)
+
+    assert "intercept" in confounds_df.columns
+    assert "linear_trend" in confounds_df.columns
+    assert confounds_df.columns[-1] == "intercept"
+
+    signal_columns = [c for c in confounds_df.columns if c.startswith("signal__")]
 
     # Orthogonalize full nuisance regressors w.r.t. any signal regressors
     if signal_columns:
@@ -429,28 +634,55 @@ def denoise_with_nilearn(
         temp_confounds_df.loc[:, columns_to_denoise] = orth_noise_regressors
         confounds_df = temp_confounds_df
 
-    # Censor the data and confounds
-    preprocessed_bold_censored = preprocessed_bold[sample_mask, :]
-    if denoise:
-        nuisance_arr = confounds_df.to_numpy()
-        nuisance_censored = nuisance_arr[sample_mask, :]
+    nuisance_arr = confounds_df.to_numpy()
+    nuisance_censored = nuisance_arr[sample_mask, :]
 
-        # Mean-center all of the confounds, except the intercept, to be safe
-        nuisance_censored_mean = np.mean(nuisance_censored[:, :-1], axis=0)
-        nuisance_arr[:, :-1] -= nuisance_censored_mean
-        nuisance_censored[:, :-1] -= nuisance_censored_mean  # use censored mean on full regressors
+    # Mean-center all of the confounds, except the intercept, to be safe
+    nuisance_censored_mean = np.mean(nuisance_censored[:, :-1], axis=0)
+    nuisance_arr[:, :-1] -= nuisance_censored_mean
+    nuisance_censored[:, :-1] -= nuisance_censored_mean  # use censored mean on full regressors
 
-        # Estimate betas using only the censored data
-        betas = np.linalg.lstsq(nuisance_censored, preprocessed_bold_censored, rcond=None)[0]
+    return nuisance_arr, nuisance_censored
 
-        # Apply the betas to denoise the *full* (uncensored) BOLD data
-        uncensored_denoised_bold = preprocessed_bold - np.dot(nuisance_arr, betas)
 
-        # Also denoise the censored BOLD data
-        censored_denoised_bold = preprocessed_bold_censored - np.dot(nuisance_censored, betas)
-    else:
-        uncensored_denoised_bold = preprocessed_bold.copy()
-        censored_denoised_bold = preprocessed_bold_censored.copy()
+def _interpolate_and_filter(
+    censored_denoised_bold,
+    sample_mask,
+    low_pass,
+    high_pass,
+    filter_order,
+    TR,
+    compose_filter=False,
+    n_threads=1,
+):
+    """Interpolate the censored volumes of denoised data, then band-pass filter the data.
+
+    Returns
+    -------
+    interpolated_filtered_bold : (T, S) :obj:`numpy.ndarray`
+    """
+    from xcp_d.utils.temporal import (
+        apply_temporal_operator,
+        build_interpolate_and_filter_operator,
+        interpolate_volumes,
+    )
+
+    n_volumes, n_voxels = sample_mask.size, censored_denoised_bold.shape[1]
+    bandpass_filter = low_pass is not None and high_pass is not None
+    if bandpass_filter and compose_filter:
+        # Interpolate and filter the censored, denoised data with a single temporal operator
+        temporal_operator = build_interpolate_and_filter_operator(
+            sample_mask,
+            TR=TR,
+            low_pass=low_pass,
+            high_pass=high_pass,
+            filter_order=filter_order,
+        )
+        return apply_temporal_operator(
+            temporal_operator,
+            censored_denoised_bold,
+            n_threads=n_threads,
+        )
 
     # Now interpolate the censored, denoised data with cubic spline interpolation
     interpolated_unfiltered_bold = np.zeros(
@@ -458,14 +690,15 @@ def denoise_with_nilearn(
         dtype=censored_denoised_bold.dtype,
     )
     interpolated_unfiltered_bold[sample_mask, :] = censored_denoised_bold
-    interpolated_unfiltered_bold = signal._interpolate_volumes(
+    interpolated_unfiltered_bold = interpolate_volumes(
         interpolated_unfiltered_bold,
         sample_mask=sample_mask,
-        t_r=TR,
+        TR=TR,
+        n_threads=n_threads,
     )
 
     # Now apply the bandpass filter to the interpolated, denoised data
-    if low_pass is not None and high_pass is not None:
+    if bandpass_filter:
         # TODO: Replace with nilearn.signal.butterworth once 0.10.1 is released.
         interpolated_filtered_bold = butter_bandpass(
             interpolated_unfiltered_bold.copy(),
@@ -475,11 +708,12 @@ def denoise_with_nilearn(
             order=filter_order / 2,
             padtype="constant",
             padlen=n_volumes - 1,
+            n_threads=n_threads,
         )
     else:
         interpolated_filtered_bold = interpolated_unfiltered_bold
 
-    return uncensored_denoised_bold, interpolated_filtered_bold
+    return interpolated_filtered_bold
 
 
 def _select_first(lst):
@@ -0,0 +1,374 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Utilities for incrementally post-processing newly arriving preprocessed data.
+
+In watch mode (``--watch``), xcp_d polls the preprocessed dataset for new or changed BOLD runs,
+instead of indexing the whole dataset once and processing every participant.
+Each poll only lists the participants' ``func`` directories and compares the files'
+sizes and modification times to those seen by the previous poll and to those of the runs
+that have already been post-processed, which are recorded in
+``xcp_d/logs/watch_state.json``.
+
+Runs whose files have not changed for a full polling interval are grouped by participant
+(and session) and queued for post-processing in a bounded pool of workers.
+A participant is never processed by two workers at once, since their anatomical and
+run-concatenation derivatives would collide.
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from nipype import logging
+
+from xcp_d.utils.manifest import get_run_key, parse_entities
+
+LOGGER = logging.getLogger("nipype.utils")
+
+WATCH_STATE_FILE = os.path.join("logs", "watch_state.json")
+
+
+def scan_preprocessed_runs(fmri_dir, cifti=False, participant_label=None, task_id=None):
+    """Find the preprocessed BOLD runs in a dataset, with a signature of each run's files.
+
+    Parameters
+    ----------
+    fmri_dir : :obj:`str`
+        Path to the preprocessed dataset.
+    cifti : :obj:`bool`, optional
+        Whether to look for CIFTI (``_bold.dtseries.nii``) rather than NIfTI
+        (``_desc-preproc_bold.nii.gz``) BOLD files. Default is False.
+    participant_label : :obj:`list` of :obj:`str` or None, optional
+        Participants to look for, with or without the "sub-" prefix.
+        If None, all participants are included.
+    task_id : :obj:`str` or None, optional
+        Task to look for. If None, all tasks are included.
+
+    Returns
+    -------
+    runs : :obj:`dict`
+        Information about each run, keyed by its BIDS-like prefix
+        (e.g., ``sub-01_ses-1_task-rest_run-1``).
+        Each value has the run's "subject", "session" (None if the dataset has no sessions),
+        and a "signature" that changes whenever any of the run's files
+        (e.g., its BOLD files, confounds, or masks) is added, removed, or modified.
+    """
+    bold_suffix = "_bold.dtseries.nii" if cifti else "_desc-preproc_bold.nii.gz"
+    if participant_label:
+        subject_dirs = [f"sub-{label.replace('sub-', '', 1)}" for label in participant_label]
+    else:
+        subject_dirs = sorted(
+            entry.name
+            for entry in os.scandir(fmri_dir)
+            if entry.is_dir() and entry.name.startswith("sub-")
+        )
+
+    func_dirs = []
+    for subject_dir in subject_dirs:
+        subject_path = os.path.join(fmri_dir, subject_dir)
+        if not os.path.isdir(subject_path):
+            continue
+
+        func_dirs.append(os.path.join(subject_path, "func"))
+        func_dirs += [
+            os.path.join(entry.path, "func")
+            for entry in os.scandir(subject_path)
+            if entry.is_dir() and entry.name.startswith("ses-")
+        ]
+
+    runs, run_files = {}, {}
+    for func_dir in func_dirs:
+        if not os.path.isdir(func_dir):
+            continue
+
+        for entry in os.scandir(func_dir):
+            if not entry.is_file():
+                continue
+
+            entities = parse_entities(entry.path)
+            if "subject" not in entities or "task" not in entities:
+                continue
+            elif task_id and entities["task"] != task_id:
+                continue
+
+            run_key = get_run_key(entities)
+            stat = entry.stat()
+            run_files.setdefault(run_key, []).append(
+                f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}"
+            )
+            if entry.name.endswith(bold_suffix):
+                runs[run_key] = {
+                    "subject": entities["subject"],
+                    "session": entities.get("session", None),
+                }
+
+    # Only runs with a preprocessed BOLD file are post-processed,
+    # but any of their files may change the signature.
+    for run_key, run_info in runs.items():
+        run_info["signature"] = hashlib.sha1(
+            "\n".join(sorted(run_files[run_key])).encode()
+        ).hexdigest()
+
+    return runs
+
+
+def load_watch_state(xcpd_dir):
+    """Load the signatures of the runs that have already been post-processed.
+
+    Parameters
+    ----------
+    xcpd_dir : :obj:`str`
+        Path to the xcp_d derivatives directory.
+
+    Returns
+    -------
+    state : :obj:`dict`
+        The signature of each post-processed run, keyed by the run's BIDS-like prefix.
+        Empty if no runs have been post-processed in watch mode.
+    """
+    state_file = os.path.join(xcpd_dir, WATCH_STATE_FILE)
+    if not os.path.isfile(state_file):
+        return {}
+
+    with open(state_file, "r") as fo:
+        return json.load(fo)
+
+
+def save_watch_state(xcpd_dir, state):
+    """Record the signatures of the runs that have been post-processed.
+
+    Parameters
+    ----------
+    xcpd_dir : :obj:`str`
+        Path to the xcp_d derivatives directory.
+    state : :obj:`dict`
+        The signature of each post-processed run, keyed by the run's BIDS-like prefix.
+    """
+    state_file = os.path.join(xcpd_dir, WATCH_STATE_FILE)
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+
+    # Write to a temporary file first, so an interrupted write never loses the state.
+    temp_file = f"{state_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w") as fo:
+        json.dump(state, fo, indent=4, sort_keys=True)
+
+    os.replace(temp_file, state_file)
+
+
+def find_settled_runs(previous_runs, current_runs, state):
+    """Find runs that need post-processing and whose files are no longer changing.
+
+    Parameters
+    ----------
+    previous_runs : :obj:`dict`
+        The runs found by the previous poll, from :func:`scan_preprocessed_runs`.
+    current_runs : :obj:`dict`
+        The runs found by the current poll, from :func:`scan_preprocessed_runs`.
+    state : :obj:`dict`
+        The signature of each post-processed run, from :func:`load_watch_state`.
+
+    Returns
+    -------
+    settled_runs : :obj:`dict`
+        The new or changed runs whose signatures are the same in both polls,
+        so that runs are not post-processed while the preprocessing pipeline is still
+        writing their files.
+    """
+    return {
+        run_key: run_info
+        for run_key, run_info in current_runs.items()
+        if run_info["signature"] != state.get(run_key, None)
+        and run_info["signature"] == previous_runs.get(run_key, {}).get("signature", None)
+    }
+
+
+def group_runs(runs):
+    """Group runs into post-processing batches, one per participant.
+
+    Parameters
+    ----------
+    runs : :obj:`dict`
+        Runs from :func:`scan_preprocessed_runs`.
+
+    Returns
+    -------
+    batches : :obj:`dict`
+        The sessions to post-process for each participant, keyed by participant ID.
+        The sessions are None if any of the participant's runs have no session,
+        in which case all of the participant's runs are post-processed.
+    """
+    batches = {}
+    for run_info in runs.values():
+        sessions = batches.setdefault(run_info["subject"], [])
+        if sessions is None or run_info["session"] is None:
+            batches[run_info["subject"]] = None
+        elif run_info["session"] not in sessions:
+            sessions.append(run_info["session"])
+
+    return {
+        subject: sorted(sessions) if sessions is not None else None
+        for subject, sessions in sorted(batches.items())
+    }
+
+
+def restrict_bids_filters(bids_filters, sessions):
+    """Restrict the preprocessed BOLD query to a set of sessions.
+
+    Parameters
+    ----------
+    bids_filters : :obj:`dict` or None
+        The filters from ``--bids-filter-file``.
+    sessions : :obj:`list` of :obj:`str` or None
+        Sessions to post-process. If None, the filters are not changed.
+
+    Returns
+    -------
+    bids_filters : :obj:`dict` or None
+        A copy of the filters, where the "bold" query is limited to the sessions
+        (and to any sessions already in the filters).
+    """
+    if sessions is None:
+        return bids_filters
+
+    bids_filters = {query: dict(entities) for query, entities in (bids_filters or {}).items()}
+    bold_filters = bids_filters.setdefault("bold", {})
+    if "session" in bold_filters:
+        allowed_sessions = bold_filters["session"]
+        if not isinstance(allowed_sessions, (list, tuple)):
+            allowed_sessions = [allowed_sessions]
+
+        sessions = [session for session in sessions if session in allowed_sessions]
+
+    bold_filters["session"] = sessions
+    return bids_filters
+
+
+def watch_dataset(
+    fmri_dir,
+    xcpd_dir,
+    process_batch,
+    cifti=False,
+    participant_label=None,
+    task_id=None,
+    interval=60,
+    n_workers=1,
+    max_polls=None,
+):
+    """Poll a preprocessed dataset and post-process new or changed runs as they arrive.
+
+    Parameters
+    ----------
+    fmri_dir : :obj:`str`
+        Path to the preprocessed dataset.
+    xcpd_dir : :obj:`str`
+        Path to the xcp_d derivatives directory, where the watch state is recorded.
+    process_batch : callable
+        Function that post-processes a batch of runs.
+        It is called with a participant ID and a list of sessions (or None, for all of the
+        participant's runs), and must return zero if the batch was post-processed successfully.
+        It is called from a worker thread, so it should run the workflow in its own process.
+    cifti : :obj:`bool`, optional
+        Whether the BOLD runs are CIFTI files. Default is False.
+    participant_label : :obj:`list` of :obj:`str` or None, optional
+        Participants to watch. If None, all participants are watched, including new ones.
+    task_id : :obj:`str` or None, optional
+        Task to watch. If None, all tasks are watched.
+    interval : :obj:`float`, optional
+        Time between polls, in seconds. Default is 60.
+    n_workers : :obj:`int`, optional
+        The maximum number of batches to post-process at once. Default is 1.
+    max_polls : :obj:`int` or None, optional
+        Stop after this many polls, once any queued batches finish.
+        If None, the dataset is watched until the process is interrupted.
+
+    Returns
+    -------
+    failed_runs : :obj:`dict`
+        The signature of each run whose batch failed, keyed by its BIDS-like prefix.
+        Failed runs are only retried once their files change.
+    """
+    state = load_watch_state(xcpd_dir)
+    failed_runs = {}
+    # Batches in progress, with the signatures of their runs when they were queued.
+    running = {}
+    previous_runs = {}
+    n_polls = 0
+
+    def _collect(futures):
+        for future in futures:
+            subject, batch_runs = running.pop(future)
+            try:
+                return_code = future.result()
+            except Exception as e:
+                LOGGER.error(f"Post-processing of sub-{subject} failed: {e}")
+                return_code = 1
+
+            batch_signatures = {run_key: info["signature"] for run_key, info in batch_runs.items()}
+            if return_code == 0:
+                LOGGER.info(f"Post-processed {len(batch_runs)} run(s) of sub-{subject}.")
+                state.update(batch_signatures)
+                save_watch_state(xcpd_dir, state)
+                for run_key in batch_signatures:
+                    failed_runs.pop(run_key, None)
+            else:
+                LOGGER.error(
+                    f"Post-processing of sub-{subject} failed. "
+                    "Its runs will be retried when their files change."
+                )
+                failed_runs.update(batch_signatures)
+
+    with ThreadPoolExecutor(max_workers=max(n_workers, 1)) as executor:
+        while max_polls is None or n_polls < max_polls:
+            current_runs = scan_preprocessed_runs(
+                fmri_dir,
+                cifti=cifti,
+                participant_label=participant_label,
+                task_id=task_id,
+            )
+            n_polls += 1
+
+            busy_subjects = {subject for subject, _ in running.values()}
+            settled_runs = {
+                run_key: run_info
+                for run_key, run_info in find_settled_runs(
+                    previous_runs,
+                    current_runs,
+                    state,
+                ).items()
+                if run_info["subject"] not in busy_subjects
+                and run_info["signature"] != failed_runs.get(run_key, None)
+            }
+            for subject, sessions in group_runs(settled_runs).items():
+                batch_runs = {
+                    run_key: run_info
+                    for run_key, run_info in settled_runs.items()
+                    if run_info["subject"] == subject
+                }
+                LOGGER.info(
+                    f"Queueing {len(batch_runs)} new or changed run(s) of sub-{subject}"
+                    + (f" (sessions: {', '.join(sessions)})." if sessions else ".")
+                )
+                future = executor.submit(process_batch, subject, sessions)
+                running[future] = (subject, batch_runs)
+
+            previous_runs = current_runs
+            if max_polls is not None and n_polls >= max_polls:
+                break
+
+            # Sleep until the next poll, but record finished batches as soon as they finish.
+            deadline = time.monotonic() + interval
+            while time.monotonic() < deadline:
+                done, _ = wait(
+                    list(running),
+                    timeout=deadline - time.monotonic(),
+                    return_when=FIRST_COMPLETED,
+                )
+                _collect(done)
+                if not running:
+                    time.sleep(max(deadline - time.monotonic(), 0))
+
+        done, _ = wait(list(running))
+        _collect(done)
+
+    return failed_runs
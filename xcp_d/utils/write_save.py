@@ -5,7 +5,6 @@ import os
 
 import nibabel as nb
 import numpy as np
-from nilearn import masking
 from templateflow.api import get as get_template
 
 from xcp_d.utils.doc import fill_doc
@@ -15,6 +14,12 @@ from xcp_d.utils.filemanip import split_filename
 def read_ndata(datafile, maskfile=None):
     """Read nifti or cifti file.
 
+    Uncompressed files are memory-mapped (copy-on-write), and floating-point data keep their
+    on-disk dtype, so CIFTI data are returned as a transposed view of the file without any copies.
+    Integer data are converted to float32, so they can be denoised and filtered in place.
+    NIfTI data are read directly from the (memory-mapped) array, so only the masked voxels
+    are ever copied into memory.
+
     Parameters
     ----------
     datafile : :obj:`str`
@@ -25,18 +30,32 @@ def read_ndata(datafile, maskfile=None):
 
     Outputs
     -------
-    data : (TxS) :obj:`numpy.ndarray`
+    data : (SxT) :obj:`numpy.ndarray`
         Vertices or voxels by timepoints.
     """
     # read cifti series
     cifti_extensions = [".dtseries.nii", ".dlabel.nii", ".ptseries.nii"]
     if any([datafile.endswith(ext) for ext in cifti_extensions]):
-        data = nb.load(datafile).get_fdata()
+        data = np.asanyarray(nb.load(datafile, mmap=True).dataobj)
+        if not np.issubdtype(data.dtype, np.floating):
+            data = data.astype(np.float32)
 
     # or nifti data, mask is required
-    elif datafile.endswith(".nii.gz"):
+    elif datafile.endswith((".nii", ".nii.gz")):
         assert maskfile is not None, "Input `maskfile` must be provided if `datafile` is a nifti."
-        data = masking.apply_mask(datafile, maskfile)
+        img = nb.load(datafile, mmap=True)
+        mask = _load_mask(maskfile, img)
+
+        # Index the unscaled array, so scaling is only applied to the masked voxels.
+        data = img.dataobj.get_unscaled()[mask]
+        data = nb.volumeutils.apply_read_scaling(data, img.dataobj.slope, img.dataobj.inter)
+        if np.issubdtype(data.dtype, np.floating):
+            data[~np.isfinite(data)] = 0
+        else:
+            data = data.astype(np.float32)
+
+        # Voxels are already in the first dimension.
+        return data
 
     else:
         raise ValueError(f"Unknown extension for {datafile}")
@@ -47,6 +66,78 @@ def read_ndata(datafile, maskfile=None):
     return data
 
 
+def _load_mask(maskfile, img):
+    """Load a binary mask as a boolean array, checking that it matches an image's grid."""
+    mask_img = nb.load(maskfile)
+    if mask_img.shape[:3] != img.shape[:3] or not np.allclose(mask_img.affine, img.affine):
+        raise ValueError(
+            f"The mask {maskfile} (shape {mask_img.shape}) does not match the grid of the data "
+            f"(shape {img.shape})."
+        )
+
+    return np.asanyarray(mask_img.dataobj).astype(bool)
+
+
+def _write_masked_nifti(data_matrix, mask_img, filename, TR):
+    """Write masked (SxT) data to a NIfTI file, one volume at a time.
+
+    Uncompressed files are pre-allocated on disk and filled through a memory map.
+    Compressed files are streamed volume by volume.
+    Either way, only one volume is held in memory, rather than the full 4D image.
+    """
+    from nibabel.openers import ImageOpener
+
+    mask = np.asanyarray(mask_img.dataobj).astype(bool)
+    if data_matrix.shape[0] != mask.sum():
+        raise ValueError(
+            f"The data have {data_matrix.shape[0]} voxels, but the mask has {mask.sum()}."
+        )
+
+    data_matrix = data_matrix[:, None] if data_matrix.ndim == 1 else data_matrix
+    n_volumes = data_matrix.shape[1]
+    shape = mask.shape + (n_volumes,)
+
+    header = nb.Nifti1Image(
+        np.zeros((1, 1, 1, 1), dtype=data_matrix.dtype), mask_img.affine
+    ).header
+    header.set_data_shape(shape)
+    header.set_zooms(mask_img.header.get_zooms()[:3] + (TR,))
+    # A new header has no extensions, so the data start right after it.
+    offset = 352
+    header.set_data_offset(offset)
+
+    if filename.endswith(".gz"):
+        with ImageOpener(filename, "wb") as fobj:
+            header.write_to(fobj)
+            fobj.write(b"\x00" * (offset - fobj.tell()))
+            volume = np.zeros(mask.shape, dtype=data_matrix.dtype)
+            for i_volume in range(n_volumes):
+                volume[mask] = data_matrix[:, i_volume]
+                fobj.write(volume.tobytes(order="F"))
+
+        return filename
+
+    with open(filename, "wb") as fobj:
+        header.write_to(fobj)
+        fobj.truncate(offset + int(np.prod(shape)) * data_matrix.dtype.itemsize)
+
+    out_data = np.memmap(
+        filename,
+        dtype=data_matrix.dtype,
+        mode="r+",
+        offset=offset,
+        shape=shape,
+        order="F",
+    )
+    for i_volume in range(n_volumes):
+        out_data[..., i_volume][mask] = data_matrix[:, i_volume]
+
+    out_data.flush()
+    del out_data
+
+    return filename
+
+
 def get_cifti_intents():
     """Return a dictionary of CIFTI extensions and associated intents.
 
@@ -102,7 +193,7 @@ def write_ndata(data_matrix, template, filename, mask=None, TR=1):
     _, _, template_extension = split_filename(template)
     if template_extension in cifti_intents.keys():
         file_format = "cifti"
-    elif template.endswith(".nii.gz"):
+    elif template.endswith((".nii", ".nii.gz")):
         file_format = "nifti"
         assert mask is not None, "A binary mask must be provided for nifti inputs."
         assert os.path.isfile(mask), f"The mask file does not exist: {mask}"
@@ -112,6 +203,13 @@ def write_ndata(data_matrix, template, filename, mask=None, TR=1):
     # transpose from SxT to TxS
     data_matrix = data_matrix.T
 
+    # Data read with read_ndata may be memory-mapped from an existing file at this path,
+    # so write to a temporary file and move it into place, rather than truncating that file.
+    tmp_filename = os.path.join(
+        os.path.dirname(os.path.abspath(filename)),
+        f".{os.getpid()}_{os.path.basename(filename)}",
+    )
+
     if file_format == "cifti":
         # write cifti series
         template_img = nb.load(template)
@@ -155,19 +253,96 @@ def write_ndata(data_matrix, template, filename, mask=None, TR=1):
 
         img.nifti_header.set_intent(target_intent)
 
+        img.to_filename(tmp_filename)
+
     else:
-        # write nifti series
-        img = masking.unmask(data_matrix, mask)
-        # we'll override the default TR (1) in the header
-        pixdim = list(img.header.get_zooms())
-        pixdim[3] = TR
-        img.header.set_zooms(pixdim)
+        # write nifti series, streaming the masked data into the file
+        _write_masked_nifti(data_matrix.T, nb.load(mask), tmp_filename, TR)
 
-    img.to_filename(filename)
+    os.replace(tmp_filename, filename)
 
     return filename
 
 
+# The axis types of the CIFTI intents whose files are written with create_cifti_memmap,
+# in matrix dimension order (rows, then columns).
+_CIFTI_INTENT_AXES = {
+    "ConnDense": ("BrainModelAxis", "BrainModelAxis"),
+    "ConnParcels": ("ParcelsAxis", "ParcelsAxis"),
+    "ConnParcelDense": ("BrainModelAxis", "ParcelsAxis"),
+    "ConnDenseParcel": ("ParcelsAxis", "BrainModelAxis"),
+    "ConnDenseSeries": ("SeriesAxis", "BrainModelAxis"),
+    "ConnParcelSries": ("SeriesAxis", "ParcelsAxis"),
+    "ConnDenseScalar": ("ScalarAxis", "BrainModelAxis"),
+    "ConnParcelScalr": ("ScalarAxis", "ParcelsAxis"),
+}
+
+
+def create_cifti_memmap(filename, axes, dtype=np.float32):
+    """Create a CIFTI file and return a writable memory map of its data.
+
+    The header is written and the file is pre-allocated on disk,
+    so CIFTIs that are too large to hold in memory (e.g., dense connectomes)
+    can be filled in blocks.
+
+    Parameters
+    ----------
+    filename : :obj:`str`
+        Name of the output file to be written.
+        The extension determines the CIFTI intent, which must match the axis types.
+    axes : :obj:`tuple` of :obj:`nibabel.cifti2.cifti2_axes.Axis`
+        The CIFTI's row and column axes.
+    dtype : :obj:`numpy.dtype`, optional
+        The data's dtype. Default is float32.
+
+    Returns
+    -------
+    out_data : :obj:`numpy.memmap`
+        The CIFTI's uninitialized data, with one row per element of the first axis.
+        Flush and delete it once it has been filled.
+    """
+    from nibabel.cifti2.parse_cifti2 import Cifti2Extension
+
+    _, _, out_extension = split_filename(filename)
+    target_intent = get_cifti_intents().get(out_extension, None)
+    if target_intent is None:
+        raise ValueError(f"Unknown CIFTI extension '{out_extension}'")
+
+    axis_types = tuple(type(axis).__name__ for axis in axes)
+    expected_axis_types = _CIFTI_INTENT_AXES.get(target_intent, axis_types)
+    if axis_types != expected_axis_types:
+        raise ValueError(
+            f"A {out_extension} file ({target_intent}) must have {expected_axis_types} axes, "
+            f"not {axis_types}."
+        )
+
+    cifti_header = nb.cifti2.Cifti2Header.from_axes(axes)
+    shape = cifti_header.matrix.get_data_shape()
+
+    # This is the NIfTI-2 header that nibabel writes for a Cifti2Image.
+    header = nb.Nifti2Header()
+    header.set_data_dtype(dtype)
+    header.set_data_shape((1, 1, 1, 1) + shape)
+    header.set_intent(target_intent)
+    header["pixdim"][:4] = 1
+    header.extensions.append(Cifti2Extension.from_bytes(cifti_header.to_xml()))
+
+    with open(filename, "wb") as fobj:
+        # The data offset, after the CIFTI extension, is set when the header is written.
+        header.write_to(fobj)
+        offset = int(header.get_data_offset())
+        fobj.truncate(offset + int(np.prod(shape)) * header.get_data_dtype().itemsize)
+
+    return np.memmap(
+        filename,
+        dtype=header.get_data_dtype(),
+        mode="r+",
+        offset=offset,
+        shape=shape,
+        order="F",
+    )
+
+
 def write_gii(datat, template, filename, hemi):
     """Use nibabel to write surface file.
 
@@ -21,6 +21,7 @@ from niworkflows.engine.workflows import LiterateWorkflow as Workflow
 from xcp_d.__about__ import __version__
 from xcp_d.interfaces.bids import DerivativesDataSink
 from xcp_d.interfaces.report import AboutSummary, SubjectSummary
+from xcp_d.utils.atlas import get_atlas_names
 from xcp_d.utils.bids import (
     _get_tr,
     collect_data,
@@ -34,6 +35,7 @@ from xcp_d.utils.bids import (
 )
 from xcp_d.utils.doc import fill_doc
 from xcp_d.utils.modified_data import flag_bad_run
+from xcp_d.utils.parcellation import get_precomputed_grid
 from xcp_d.utils.utils import estimate_brain_radius
 from xcp_d.workflows.anatomical import (
     init_postprocess_anat_wf,
@@ -63,6 +65,7 @@ def init_xcpd_wf(
     high_pass,
     low_pass,
     bpf_order,
+    compose_filter,
     fd_thresh,
     motion_filter_type,
     motion_filter_order,
@@ -71,6 +74,12 @@ def init_xcpd_wf(
     despike,
     head_radius,
     params,
+    additional_params,
+    dense_connectivity,
+    dynamic_window,
+    dynamic_step,
+    dynamic_taper,
+    connectivity_measures,
     smoothing,
     custom_confounds_folder,
     dummy_scans,
@@ -85,6 +94,8 @@ def init_xcpd_wf(
     min_coverage=0.5,
     min_time=100,
     combineruns=False,
+    combineruns_mode="dense",
+    despike_method="afni",
     name="xcpd_wf",
 ):
     """Build and organize execution of xcp_d pipeline.
@@ -120,6 +131,7 @@ def init_xcpd_wf(
                 high_pass=0.01,
                 low_pass=0.08,
                 bpf_order=2,
+                compose_filter=False,
                 fd_thresh=0.3,
                 motion_filter_type=None,
                 motion_filter_order=4,
@@ -128,6 +140,12 @@ def init_xcpd_wf(
                 despike=True,
                 head_radius=50.,
                 params="36P",
+                additional_params=[],
+                dense_connectivity="none",
+                dynamic_window=None,
+                dynamic_step=None,
+                dynamic_taper="boxcar",
+                connectivity_measures=[],
                 smoothing=6,
                 custom_confounds_folder=None,
                 dummy_scans=0,
@@ -142,6 +160,8 @@ def init_xcpd_wf(
                 min_coverage=0.5,
                 min_time=100,
                 combineruns=False,
+                combineruns_mode="dense",
+                despike_method="afni",
                 name="xcpd_wf",
             )
 
@@ -152,7 +172,9 @@ def init_xcpd_wf(
     %(high_pass)s
     %(low_pass)s
     %(despike)s
+    %(despike_method)s
     %(bpf_order)s
+    %(compose_filter)s
     %(analysis_level)s
     %(motion_filter_type)s
     %(motion_filter_order)s
@@ -172,6 +194,12 @@ def init_xcpd_wf(
     %(work_dir)s
     %(head_radius)s
     %(params)s
+    %(additional_params)s
+    %(dense_connectivity)s
+    %(dynamic_window)s
+    %(dynamic_step)s
+    %(dynamic_taper)s
+    %(connectivity_measures)s
     %(smoothing)s
     %(custom_confounds_folder)s
     %(dummy_scans)s
@@ -183,6 +211,7 @@ def init_xcpd_wf(
     %(min_time)s
     %(exact_time)s
     combineruns
+    %(combineruns_mode)s
     %(name)s
 
     References
@@ -201,6 +230,7 @@ def init_xcpd_wf(
             high_pass=high_pass,
             low_pass=low_pass,
             bpf_order=bpf_order,
+            compose_filter=compose_filter,
             motion_filter_type=motion_filter_type,
             motion_filter_order=motion_filter_order,
             band_stop_min=band_stop_min,
@@ -211,8 +241,15 @@ def init_xcpd_wf(
             subject_id=subject_id,
             cifti=cifti,
             despike=despike,
+            despike_method=despike_method,
             head_radius=head_radius,
             params=params,
+            additional_params=additional_params,
+            dense_connectivity=dense_connectivity,
+            dynamic_window=dynamic_window,
+            dynamic_step=dynamic_step,
+            dynamic_taper=dynamic_taper,
+            connectivity_measures=connectivity_measures,
             task_id=task_id,
             bids_filters=bids_filters,
             smoothing=smoothing,
@@ -228,6 +265,9 @@ def init_xcpd_wf(
             min_time=min_time,
             exact_time=exact_time,
             combineruns=combineruns,
+            combineruns_mode=combineruns_mode,
+            atlas_cache_dir=os.path.join(work_dir, "atlas_cache"),
+            kernel_cache_dir=os.path.join(work_dir, "smoothing_kernels"),
             name=f"single_subject_{subject_id}_wf",
         )
 
@@ -252,6 +292,7 @@ def init_subject_wf(
     input_type,
     process_surfaces,
     combineruns,
+    combineruns_mode,
     cifti,
     task_id,
     bids_filters,
@@ -259,6 +300,7 @@ def init_subject_wf(
     high_pass,
     low_pass,
     bpf_order,
+    compose_filter,
     motion_filter_type,
     motion_filter_order,
     band_stop_min,
@@ -266,16 +308,25 @@ def init_subject_wf(
     smoothing,
     head_radius,
     params,
+    additional_params,
+    dense_connectivity,
+    dynamic_window,
+    dynamic_step,
+    dynamic_taper,
+    connectivity_measures,
     output_dir,
     custom_confounds_folder,
     dummy_scans,
     random_seed,
     fd_thresh,
     despike,
+    despike_method,
     dcan_qc,
     min_coverage,
     min_time,
     exact_time,
+    atlas_cache_dir,
+    kernel_cache_dir,
     omp_nthreads,
     layout,
     name,
@@ -298,6 +349,7 @@ def init_subject_wf(
                 input_type="fmriprep",
                 process_surfaces=False,
                 combineruns=False,
+                combineruns_mode="dense",
                 cifti=False,
                 task_id="imagery",
                 bids_filters=None,
@@ -305,6 +357,7 @@ def init_subject_wf(
                 high_pass=0.01,
                 low_pass=0.08,
                 bpf_order=2,
+                compose_filter=False,
                 motion_filter_type=None,
                 motion_filter_order=4,
                 band_stop_min=12,
@@ -312,16 +365,25 @@ def init_subject_wf(
                 smoothing=6.,
                 head_radius=50,
                 params="36P",
+                additional_params=[],
+                dense_connectivity="none",
+                dynamic_window=None,
+                dynamic_step=None,
+                dynamic_taper="boxcar",
+                connectivity_measures=[],
                 output_dir=".",
                 custom_confounds_folder=None,
                 dummy_scans=0,
                 random_seed=None,
                 fd_thresh=0.3,
                 despike=True,
+                despike_method="afni",
                 dcan_qc=False,
                 min_coverage=0.5,
                 min_time=100,
                 exact_time=[],
+                atlas_cache_dir=None,
+                kernel_cache_dir=None,
                 omp_nthreads=1,
                 layout=None,
                 name="single_subject_sub-01_wf",
@@ -334,6 +396,7 @@ def init_subject_wf(
     %(input_type)s
     %(process_surfaces)s
     combineruns
+    %(combineruns_mode)s
     %(cifti)s
     task_id : :obj:`str` or None
         Task ID of BOLD  series to be selected for postprocess , or ``None`` to postprocess all
@@ -342,6 +405,7 @@ def init_subject_wf(
     %(high_pass)s
     %(low_pass)s
     %(bpf_order)s
+    %(compose_filter)s
     %(motion_filter_type)s
     %(motion_filter_order)s
     %(band_stop_min)s
@@ -349,16 +413,25 @@ def init_subject_wf(
     %(smoothing)s
     %(head_radius)s
     %(params)s
+    %(additional_params)s
+    %(dense_connectivity)s
+    %(dynamic_window)s
+    %(dynamic_step)s
+    %(dynamic_taper)s
+    %(connectivity_measures)s
     %(output_dir)s
     %(custom_confounds_folder)s
     %(dummy_scans)s
     %(random_seed)s
     %(fd_thresh)s
     %(despike)s
+    %(despike_method)s
     %(dcan_qc)s
     %(min_coverage)s
     %(min_time)s
     %(exact_time)s
+    %(atlas_cache_dir)s
+    %(kernel_cache_dir)s
     %(omp_nthreads)s
     %(layout)s
     %(name)s
@@ -540,8 +613,14 @@ It is released under the [CC0](https://creativecommons.org/publicdomain/zero/1.0
     load_atlases_wf = init_load_atlases_wf(
         output_dir=output_dir,
         cifti=cifti,
+        atlas_cache_dir=atlas_cache_dir,
         mem_gb=1,
         omp_nthreads=omp_nthreads,
+        precomputed_grid=get_precomputed_grid(
+            preproc_files[0],
+            cifti=cifti,
+            atlas_names=get_atlas_names("all"),
+        ),
         name="load_atlases_wf",
     )
     load_atlases_wf.inputs.inputnode.name_source = preproc_files[0]
@@ -719,6 +798,7 @@ It is released under the [CC0](https://creativecommons.org/publicdomain/zero/1.0
                 high_pass=high_pass,
                 low_pass=low_pass,
                 bpf_order=bpf_order,
+                compose_filter=compose_filter,
                 motion_filter_type=motion_filter_type,
                 motion_filter_order=motion_filter_order,
                 band_stop_min=band_stop_min,
@@ -726,12 +806,19 @@ It is released under the [CC0](https://creativecommons.org/publicdomain/zero/1.0
                 smoothing=smoothing,
                 head_radius=head_radius,
                 params=params,
+                additional_params=additional_params,
+                dense_connectivity=dense_connectivity,
+                dynamic_window=dynamic_window,
+                dynamic_step=dynamic_step,
+                dynamic_taper=dynamic_taper,
+                connectivity_measures=connectivity_measures,
                 output_dir=output_dir,
                 custom_confounds_folder=custom_confounds_folder,
                 dummy_scans=dummy_scans,
                 random_seed=random_seed,
                 fd_thresh=fd_thresh,
                 despike=despike,
+                despike_method=despike_method,
                 dcan_qc=dcan_qc,
                 run_data=run_data,
                 t1w_available=t1w_available,
@@ -739,6 +826,7 @@ It is released under the [CC0](https://creativecommons.org/publicdomain/zero/1.0
                 n_runs=n_runs,
                 min_coverage=min_coverage,
                 exact_scans=exact_scans,
+                kernel_cache_dir=kernel_cache_dir,
                 omp_nthreads=omp_nthreads,
                 layout=layout,
                 name=f"{'cifti' if cifti else 'nifti'}_postprocess_{run_counter}_wf",
@@ -798,6 +886,7 @@ It is released under the [CC0](https://creativecommons.org/publicdomain/zero/1.0
                 smoothing=smoothing,
                 cifti=cifti,
                 dcan_qc=dcan_qc,
+                combineruns_mode=combineruns_mode,
                 mem_gb=1,
                 omp_nthreads=omp_nthreads,
                 name=f"concatenate_entity_set_{ent_set}_wf",
@@ -13,12 +13,17 @@ from num2words import num2words
 from xcp_d.interfaces.utils import ConvertTo32
 from xcp_d.utils.confounds import get_custom_confounds
 from xcp_d.utils.doc import fill_doc
-from xcp_d.workflows.connectivity import init_functional_connectivity_cifti_wf
+from xcp_d.workflows.connectivity import (
+    init_dense_connectivity_wf,
+    init_dynamic_connectivity_wf,
+    init_functional_connectivity_cifti_wf,
+)
 from xcp_d.workflows.execsummary import init_execsummary_functional_plots_wf
 from xcp_d.workflows.outputs import init_postproc_derivatives_wf
 from xcp_d.workflows.plotting import init_qc_report_wf
 from xcp_d.workflows.postprocessing import (
     init_denoise_bold_wf,
+    init_denoise_strategies_wf,
     init_despike_wf,
     init_prepare_confounds_wf,
 )
@@ -34,6 +39,7 @@ def init_postprocess_cifti_wf(
     high_pass,
     low_pass,
     bpf_order,
+    compose_filter,
     motion_filter_type,
     motion_filter_order,
     band_stop_min,
@@ -41,11 +47,18 @@ def init_postprocess_cifti_wf(
     smoothing,
     head_radius,
     params,
+    additional_params,
+    dense_connectivity,
+    dynamic_window,
+    dynamic_step,
+    dynamic_taper,
+    connectivity_measures,
     output_dir,
     custom_confounds_folder,
     dummy_scans,
     fd_thresh,
     despike,
+    despike_method,
     dcan_qc,
     run_data,
     t1w_available,
@@ -54,6 +67,7 @@ def init_postprocess_cifti_wf(
     min_coverage,
     exact_scans,
     random_seed,
+    kernel_cache_dir,
     omp_nthreads,
     layout=None,
     name="cifti_postprocess_wf",
@@ -98,6 +112,7 @@ def init_postprocess_cifti_wf(
                 high_pass=0.01,
                 low_pass=0.08,
                 bpf_order=2,
+                compose_filter=False,
                 motion_filter_type="notch",
                 motion_filter_order=4,
                 band_stop_min=12,
@@ -105,11 +120,18 @@ def init_postprocess_cifti_wf(
                 smoothing=6,
                 head_radius=50.,
                 params="27P",
+                additional_params=[],
+                dense_connectivity="none",
+                dynamic_window=None,
+                dynamic_step=None,
+                dynamic_taper="boxcar",
+                connectivity_measures=[],
                 output_dir=".",
                 custom_confounds_folder=custom_confounds_folder,
                 dummy_scans=2,
                 fd_thresh=0.3,
                 despike=True,
+                despike_method="afni",
                 dcan_qc=True,
                 run_data=run_data,
                 t1w_available=True,
@@ -118,6 +140,7 @@ def init_postprocess_cifti_wf(
                 min_coverage=0.5,
                 exact_scans=[],
                 random_seed=None,
+                kernel_cache_dir=None,
                 omp_nthreads=1,
                 layout=layout,
                 name="cifti_postprocess_wf",
@@ -131,6 +154,7 @@ def init_postprocess_cifti_wf(
     %(high_pass)s
     %(low_pass)s
     %(bpf_order)s
+    %(compose_filter)s
     %(motion_filter_type)s
     %(motion_filter_order)s
     %(band_stop_min)s
@@ -139,11 +163,18 @@ def init_postprocess_cifti_wf(
     %(head_radius)s
         This will already be estimated before this workflow.
     %(params)s
+    %(additional_params)s
+    %(dense_connectivity)s
+    %(dynamic_window)s
+    %(dynamic_step)s
+    %(dynamic_taper)s
+    %(connectivity_measures)s
     %(output_dir)s
     %(custom_confounds_folder)s
     %(dummy_scans)s
     %(fd_thresh)s
     %(despike)s
+    %(despike_method)s
     %(dcan_qc)s
     run_data : dict
     t1w_available
@@ -153,6 +184,7 @@ def init_postprocess_cifti_wf(
         This is just used for the boilerplate, as this workflow only posprocesses one run.
     %(min_coverage)s
     %(random_seed)s
+    %(kernel_cache_dir)s
     %(exact_scans)s
     %(omp_nthreads)s
     %(layout)s
@@ -331,11 +363,13 @@ def init_postprocess_cifti_wf(
         low_pass=low_pass,
         high_pass=high_pass,
         bpf_order=bpf_order,
+        compose_filter=compose_filter,
         bandpass_filter=bandpass_filter,
         smoothing=smoothing,
         cifti=True,
         mem_gb=mem_gbx["timeseries"],
         omp_nthreads=omp_nthreads,
+        kernel_cache_dir=kernel_cache_dir,
         name="denoise_bold_wf",
     )
 
@@ -359,6 +393,7 @@ def init_postprocess_cifti_wf(
             TR=TR,
             cifti=True,
             mem_gb=mem_gbx["timeseries"],
+            despike_method=despike_method,
             omp_nthreads=omp_nthreads,
             name="despike_wf",
         )
@@ -385,6 +420,7 @@ def init_postprocess_cifti_wf(
 
     connectivity_wf = init_functional_connectivity_cifti_wf(
         min_coverage=min_coverage,
+        connectivity_measures=connectivity_measures,
         alff_available=bandpass_filter and (fd_thresh <= 0),
         output_dir=output_dir,
         mem_gb=mem_gbx["timeseries"],
@@ -414,6 +450,92 @@ def init_postprocess_cifti_wf(
     ])
     # fmt:on
 
+    if dense_connectivity != "none":
+        dense_connectivity_wf = init_dense_connectivity_wf(
+            name_source=bold_file,
+            output_dir=output_dir,
+            dense_connectivity=dense_connectivity,
+            mem_gb=mem_gbx["timeseries"],
+            omp_nthreads=omp_nthreads,
+            name="dense_connectivity_wf",
+        )
+
+        # fmt:off
+        workflow.connect([
+            (inputnode, dense_connectivity_wf, [("atlas_names", "inputnode.atlas_names")]),
+            (denoise_bold_wf, dense_connectivity_wf, [
+                ("outputnode.censored_denoised_bold", "inputnode.denoised_bold"),
+            ]),
+            (connectivity_wf, dense_connectivity_wf, [
+                ("outputnode.timeseries_ciftis", "inputnode.timeseries_ciftis"),
+            ]),
+        ])
+        # fmt:on
+
+    if dynamic_window:
+        dynamic_connectivity_wf = init_dynamic_connectivity_wf(
+            name_source=bold_file,
+            output_dir=output_dir,
+            TR=TR,
+            dynamic_window=dynamic_window,
+            dynamic_step=dynamic_step,
+            dynamic_taper=dynamic_taper,
+            mem_gb=mem_gbx["timeseries"],
+            omp_nthreads=omp_nthreads,
+            name="dynamic_connectivity_wf",
+        )
+
+        # fmt:off
+        workflow.connect([
+            (inputnode, dynamic_connectivity_wf, [("atlas_names", "inputnode.atlas_names")]),
+            (prepare_confounds_wf, dynamic_connectivity_wf, [
+                ("outputnode.temporal_mask", "inputnode.temporal_mask"),
+            ]),
+            (connectivity_wf, dynamic_connectivity_wf, [
+                ("outputnode.timeseries", "inputnode.timeseries"),
+            ]),
+        ])
+        # fmt:on
+
+    if additional_params:
+        denoise_strategies_wf = init_denoise_strategies_wf(
+            name_source=bold_file,
+            output_dir=output_dir,
+            TR=TR,
+            additional_params=additional_params,
+            low_pass=low_pass,
+            high_pass=high_pass,
+            bpf_order=bpf_order,
+            compose_filter=compose_filter,
+            bandpass_filter=bandpass_filter,
+            min_coverage=min_coverage,
+            cifti=True,
+            mem_gb=mem_gbx["timeseries"],
+            omp_nthreads=omp_nthreads,
+            name="denoise_strategies_wf",
+        )
+        denoise_strategies_wf.inputs.inputnode.custom_confounds_file = custom_confounds_file
+
+        # fmt:off
+        workflow.connect([
+            (inputnode, denoise_strategies_wf, [
+                ("fmriprep_confounds_json", "inputnode.fmriprep_confounds_json"),
+                ("atlas_names", "inputnode.atlas_names"),
+                ("atlas_files", "inputnode.atlas_files"),
+                ("atlas_labels_files", "inputnode.atlas_labels_files"),
+                ("parcellated_atlas_files", "inputnode.parcellated_atlas_files"),
+            ]),
+            (prepare_confounds_wf, denoise_strategies_wf, [
+                ("outputnode.filtered_confounds_file", "inputnode.fmriprep_confounds_file"),
+                ("outputnode.dummy_scans", "inputnode.dummy_scans"),
+                ("outputnode.temporal_mask", "inputnode.temporal_mask"),
+            ]),
+            (denoise_bold_wf, denoise_strategies_wf, [
+                ("inputnode.preprocessed_bold", "inputnode.preprocessed_bold"),
+            ]),
+        ])
+        # fmt:on
+
     if bandpass_filter:
         alff_wf = init_alff_wf(
             name_source=bold_file,
@@ -425,6 +547,7 @@ def init_postprocess_cifti_wf(
             cifti=True,
             mem_gb=mem_gbx["timeseries"],
             omp_nthreads=omp_nthreads,
+            kernel_cache_dir=kernel_cache_dir,
             name="alff_wf",
         )
 
@@ -490,6 +613,7 @@ def init_postprocess_cifti_wf(
         bandpass_filter=bandpass_filter,
         params=params,
         exact_scans=exact_scans,
+        connectivity_measures=connectivity_measures,
         cifti=True,
         dcan_qc=dcan_qc,
         output_dir=output_dir,
@@ -527,6 +651,8 @@ def init_postprocess_cifti_wf(
             ("outputnode.timeseries", "inputnode.timeseries"),
             ("outputnode.correlations", "inputnode.correlations"),
             ("outputnode.correlations_exact", "inputnode.correlations_exact"),
+            ("outputnode.connectivity", "inputnode.connectivity"),
+            ("outputnode.connectivity_exact", "inputnode.connectivity_exact"),
             ("outputnode.parcellated_reho", "inputnode.parcellated_reho"),
         ]),
     ])
@@ -9,6 +9,7 @@ from xcp_d.interfaces.concatenation import (
     ConcatenateInputs,
     FilterOutFailedRuns,
 )
+from xcp_d.interfaces.connectivity import TSVConnect
 from xcp_d.utils.doc import fill_doc
 from xcp_d.utils.utils import _select_first
 from xcp_d.workflows.plotting import init_qc_report_wf
@@ -26,6 +27,7 @@ def init_concatenate_data_wf(
     smoothing,
     cifti,
     dcan_qc,
+    combineruns_mode,
     name="concatenate_data_wf",
 ):
     """Concatenate postprocessed data.
@@ -48,6 +50,7 @@ def init_concatenate_data_wf(
                 smoothing=None,
                 cifti=False,
                 dcan_qc=True,
+                combineruns_mode="dense",
                 name="concatenate_data_wf",
             )
 
@@ -63,6 +66,9 @@ def init_concatenate_data_wf(
     %(smoothing)s
     %(cifti)s
     %(dcan_qc)s
+    %(combineruns_mode)s
+        If "parcellated", the dense BOLD derivatives are not concatenated or written out,
+        and the QC report is not generated for the concatenated data.
     %(name)s
         Default is "concatenate_data_wf".
 
@@ -98,8 +104,19 @@ def init_concatenate_data_wf(
     """
     workflow = Workflow(name=name)
 
-    workflow.__desc__ = """
+    dense = combineruns_mode == "dense"
+
+    if dense:
+        workflow.__desc__ = """
 Postprocessing derivatives from multi-run tasks were then concatenated across runs.
+"""
+    else:
+        workflow.__desc__ = """
+Parcellated time series from multi-run tasks were then concatenated across runs.
+"""
+
+    workflow.__desc__ += """\
+Correlation matrices were calculated from the concatenated parcellated time series.
 """
 
     inputnode = pe.Node(
@@ -162,65 +179,32 @@ Postprocessing derivatives from multi-run tasks were then concatenated across ru
     # fmt:on
 
     concatenate_inputs = pe.Node(
-        ConcatenateInputs(),
+        ConcatenateInputs(num_threads=omp_nthreads),
         name="concatenate_inputs",
+        n_procs=omp_nthreads,
     )
 
     # fmt:off
     workflow.connect([
         (filter_out_failed_runs, concatenate_inputs, [
-            ("preprocessed_bold", "preprocessed_bold"),
             ("fmriprep_confounds_file", "fmriprep_confounds_file"),
             ("filtered_motion", "filtered_motion"),
             ("temporal_mask", "temporal_mask"),
-            ("uncensored_denoised_bold", "uncensored_denoised_bold"),
-            ("interpolated_filtered_bold", "interpolated_filtered_bold"),
-            ("censored_denoised_bold", "censored_denoised_bold"),
-            ("smoothed_denoised_bold", "smoothed_denoised_bold"),
             ("timeseries", "timeseries"),
             ("timeseries_ciftis", "timeseries_ciftis"),
         ]),
     ])
     # fmt:on
 
-    # Now, run the QC report workflow on the concatenated BOLD file.
-    qc_report_wf = init_qc_report_wf(
-        output_dir=output_dir,
-        TR=TR,
-        head_radius=head_radius,
-        params=params,
-        cifti=cifti,
-        dcan_qc=dcan_qc,
-        mem_gb=mem_gb,
-        omp_nthreads=omp_nthreads,
-        name="concat_qc_report_wf",
+    # Calculate correlations from the concatenated parcellated time series.
+    correlate_timeseries = pe.MapNode(
+        TSVConnect(),
+        name="correlate_timeseries",
+        iterfield=["timeseries"],
     )
-    qc_report_wf.inputs.inputnode.dummy_scans = 0
 
     # fmt:off
-    workflow.connect([
-        (inputnode, qc_report_wf, [
-            ("template_to_anat_xfm", "inputnode.template_to_anat_xfm"),
-            ("anat_brainmask", "inputnode.anat_brainmask"),
-        ]),
-        (clean_name_source, qc_report_wf, [("name_source", "inputnode.name_source")]),
-        (filter_out_failed_runs, qc_report_wf, [
-            # nifti-only inputs
-            (("bold_mask", _select_first), "inputnode.bold_mask"),
-            (("boldref", _select_first), "inputnode.boldref"),
-            (("anat_to_native_xfm", _select_first), "inputnode.anat_to_native_xfm"),
-        ]),
-        (concatenate_inputs, qc_report_wf, [
-            ("preprocessed_bold", "inputnode.preprocessed_bold"),
-            ("uncensored_denoised_bold", "inputnode.uncensored_denoised_bold"),
-            ("interpolated_filtered_bold", "inputnode.interpolated_filtered_bold"),
-            ("censored_denoised_bold", "inputnode.censored_denoised_bold"),
-            ("fmriprep_confounds_file", "inputnode.fmriprep_confounds_file"),
-            ("filtered_motion", "inputnode.filtered_motion"),
-            ("temporal_mask", "inputnode.temporal_mask"),
-            ("run_index", "inputnode.run_index"),
-        ]),
-    ])
+    workflow.connect([(concatenate_inputs, correlate_timeseries, [("timeseries", "timeseries")])])
     # fmt:on
 
     ds_filtered_motion = pe.Node(
@@ -283,20 +267,29 @@ Postprocessing derivatives from multi-run tasks were then concatenated across ru
     ])
     # fmt:on
 
-    if cifti:
-        ds_censored_filtered_bold = pe.Node(
-            DerivativesDataSink(
-                base_directory=output_dir,
-                dismiss_entities=["den"],
-                desc="denoised",
-                den="91k",
-                extension=".dtseries.nii",
-            ),
-            name="ds_censored_filtered_bold",
-            run_without_submitting=True,
-            mem_gb=2,
-        )
+    ds_correlations = pe.MapNode(
+        DerivativesDataSink(
+            base_directory=output_dir,
+            dismiss_entities=["desc"],
+            measure="pearsoncorrelation",
+            suffix="conmat",
+            extension=".tsv",
+        ),
+        name="ds_correlations",
+        run_without_submitting=True,
+        mem_gb=1,
+        iterfield=["atlas", "in_file"],
+    )
+
+    # fmt:off
+    workflow.connect([
+        (inputnode, ds_correlations, [("atlas_names", "atlas")]),
+        (clean_name_source, ds_correlations, [("name_source", "source_file")]),
+        (correlate_timeseries, ds_correlations, [("correlations", "in_file")]),
+    ])
+    # fmt:on
 
+    if cifti:
         ds_timeseries_cifti_files = pe.MapNode(
             DerivativesDataSink(
                 base_directory=output_dir,
@@ -320,6 +313,76 @@ Postprocessing derivatives from multi-run tasks were then concatenated across ru
         ])
         # fmt:on
 
+    if not dense:
+        # Only the parcellated derivatives are concatenated.
+        return workflow
+
+    # fmt:off
+    workflow.connect([
+        (filter_out_failed_runs, concatenate_inputs, [
+            ("preprocessed_bold", "preprocessed_bold"),
+            ("uncensored_denoised_bold", "uncensored_denoised_bold"),
+            ("interpolated_filtered_bold", "interpolated_filtered_bold"),
+            ("censored_denoised_bold", "censored_denoised_bold"),
+            ("smoothed_denoised_bold", "smoothed_denoised_bold"),
+        ]),
+    ])
+    # fmt:on
+
+    # Now, run the QC report workflow on the concatenated BOLD file.
+    qc_report_wf = init_qc_report_wf(
+        output_dir=output_dir,
+        TR=TR,
+        head_radius=head_radius,
+        params=params,
+        cifti=cifti,
+        dcan_qc=dcan_qc,
+        mem_gb=mem_gb,
+        omp_nthreads=omp_nthreads,
+        name="concat_qc_report_wf",
+    )
+    qc_report_wf.inputs.inputnode.dummy_scans = 0
+
+    # fmt:off
+    workflow.connect([
+        (inputnode, qc_report_wf, [
+            ("template_to_anat_xfm", "inputnode.template_to_anat_xfm"),
+            ("anat_brainmask", "inputnode.anat_brainmask"),
+        ]),
+        (clean_name_source, qc_report_wf, [("name_source", "inputnode.name_source")]),
+        (filter_out_failed_runs, qc_report_wf, [
+            # nifti-only inputs
+            (("bold_mask", _select_first), "inputnode.bold_mask"),
+            (("boldref", _select_first), "inputnode.boldref"),
+            (("anat_to_native_xfm", _select_first), "inputnode.anat_to_native_xfm"),
+        ]),
+        (concatenate_inputs, qc_report_wf, [
+            ("preprocessed_bold", "inputnode.preprocessed_bold"),
+            ("uncensored_denoised_bold", "inputnode.uncensored_denoised_bold"),
+            ("interpolated_filtered_bold", "inputnode.interpolated_filtered_bold"),
+            ("censored_denoised_bold", "inputnode.censored_denoised_bold"),
+            ("fmriprep_confounds_file", "inputnode.fmriprep_confounds_file"),
+            ("filtered_motion", "inputnode.filtered_motion"),
+            ("temporal_mask", "inputnode.temporal_mask"),
+            ("run_index", "inputnode.run_index"),
+        ]),
+    ])
+    # fmt:on
+
+    if cifti:
+        ds_censored_filtered_bold = pe.Node(
+            DerivativesDataSink(
+                base_directory=output_dir,
+                dismiss_entities=["den"],
+                desc="denoised",
+                den="91k",
+                extension=".dtseries.nii",
+            ),
+            name="ds_censored_filtered_bold",
+            run_without_submitting=True,
+            mem_gb=2,
+        )
+
         if smoothing:
             ds_smoothed_denoised_bold = pe.Node(
                 DerivativesDataSink(
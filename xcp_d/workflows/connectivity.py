@@ -1,19 +1,28 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 """Workflows for extracting time series and computing functional connectivity."""
+import numpy as np
 from nipype import Function
 from nipype.interfaces import utility as niu
 from nipype.pipeline import engine as pe
 from niworkflows.engine.workflows import LiterateWorkflow as Workflow
 
-from xcp_d.interfaces.ants import ApplyTransforms
 from xcp_d.interfaces.bids import DerivativesDataSink
-from xcp_d.interfaces.connectivity import CiftiConnect, ConnectPlot, NiftiConnect
+from xcp_d.interfaces.connectivity import (
+    CiftiConnect,
+    ConnectPlot,
+    DenseConnect,
+    DynamicConnect,
+    NiftiConnect,
+    ResampleAtlasToCifti,
+    WarpAtlasToBOLD,
+)
 from xcp_d.interfaces.nilearn import IndexImage
 from xcp_d.interfaces.workbench import CiftiCreateDenseFromTemplate, CiftiParcellate
 from xcp_d.utils.atlas import get_atlas_cifti, get_atlas_names, get_atlas_nifti
+from xcp_d.utils.bids import get_entity
 from xcp_d.utils.doc import fill_doc
-from xcp_d.utils.modified_data import cast_cifti_to_int16
+from xcp_d.utils.parcellation import get_precomputed_atlas_files
 from xcp_d.utils.utils import get_std2bold_xfms
 
 
@@ -21,12 +30,17 @@ from xcp_d.utils.utils import get_std2bold_xfms
 def init_load_atlases_wf(
     output_dir,
     cifti,
+    atlas_cache_dir,
     mem_gb,
     omp_nthreads,
+    precomputed_grid=None,
     name="load_atlases_wf",
 ):
     """Load atlases and warp them to the same space as the BOLD file.
 
+    If the atlases were precomputed for the BOLD data's grid
+    (see ``xcp_d-build-parcellation-operators``), the precomputed atlases are used instead.
+
     Workflow Graph
         .. workflow::
             :graph2use: orig
@@ -37,6 +51,7 @@ def init_load_atlases_wf(
             wf = init_load_atlases_wf(
                 output_dir=".",
                 cifti=True,
+                atlas_cache_dir=None,
                 mem_gb=0.1,
                 omp_nthreads=1,
                 name="load_atlases_wf",
@@ -46,8 +61,13 @@ def init_load_atlases_wf(
     ----------
     %(output_dir)s
     %(cifti)s
+    %(atlas_cache_dir)s
     %(mem_gb)s
     %(omp_nthreads)s
+    precomputed_grid : :obj:`str` or None, optional
+        The BOLD data's grid (e.g., "space-fsLR_den-91k"), if the atlases were precomputed for it.
+        If None, the atlases are resampled to the BOLD data.
+        Default is None.
     %(name)s
         Default is "load_atlases_wf".
 
@@ -114,7 +134,37 @@ def init_load_atlases_wf(
 
     atlas_buffer = pe.Node(niu.IdentityInterface(fields=["atlas_file"]), name="atlas_buffer")
 
-    if not cifti:
+    if precomputed_grid:
+        # The atlases were already resampled to this grid, so warping/resampling is skipped.
+        get_precomputed_atlases = pe.MapNode(
+            Function(
+                input_names=["atlas_name", "grid"],
+                output_names=["atlas_file", "parcellated_atlas_file"],
+                function=get_precomputed_atlas_files,
+            ),
+            name="get_precomputed_atlases",
+            iterfield=["atlas_name"],
+        )
+        get_precomputed_atlases.inputs.grid = precomputed_grid
+
+        # fmt:off
+        workflow.connect([
+            (atlas_name_grabber, get_precomputed_atlases, [("atlas_names", "atlas_name")]),
+            (get_precomputed_atlases, outputnode, [("atlas_file", "atlas_files")]),
+            (get_precomputed_atlases, atlas_buffer, [("atlas_file", "atlas_file")]),
+        ])
+        # fmt:on
+
+        if cifti:
+            # fmt:off
+            workflow.connect([
+                (get_precomputed_atlases, outputnode, [
+                    ("parcellated_atlas_file", "parcellated_atlas_files"),
+                ]),
+            ])
+            # fmt:on
+
+    elif not cifti:
         get_transforms_to_bold_space = pe.Node(
             Function(
                 input_names=["bold_file"],
@@ -138,15 +188,12 @@ def init_load_atlases_wf(
 
         workflow.connect([(inputnode, grab_first_volume, [("bold_file", "in_file")])])
 
-        # Using the generated transforms, apply them to get everything in the correct MNI form
+        # Using the generated transforms, apply them to get everything in the correct MNI form.
+        # Warped atlases are cached, so each atlas is only warped once per space and resolution.
         warp_atlases_to_bold_space = pe.MapNode(
-            ApplyTransforms(
-                interpolation="GenericLabel",
-                input_image_type=3,
-                dimension=3,
-            ),
+            WarpAtlasToBOLD(cache_dir=atlas_cache_dir, num_threads=omp_nthreads),
             name="warp_atlases_to_bold_space",
-            iterfield=["input_image"],
+            iterfield=["atlas_file"],
             mem_gb=mem_gb,
             n_procs=omp_nthreads,
         )
@@ -154,7 +201,7 @@ def init_load_atlases_wf(
         # fmt:off
         workflow.connect([
             (grab_first_volume, warp_atlases_to_bold_space, [("out_file", "reference_image")]),
-            (atlas_file_grabber, warp_atlases_to_bold_space, [("atlas_file", "input_image")]),
+            (atlas_file_grabber, warp_atlases_to_bold_space, [("atlas_file", "atlas_file")]),
             (get_transforms_to_bold_space, warp_atlases_to_bold_space, [
                 ("transformfile", "transforms"),
             ]),
@@ -164,55 +211,25 @@ def init_load_atlases_wf(
         # fmt:on
 
     else:
+        # Resampled and parcellated atlases are cached,
+        # so each atlas is only processed once per CIFTI density.
         resample_atlas_to_data = pe.MapNode(
-            CiftiCreateDenseFromTemplate(),
+            ResampleAtlasToCifti(cache_dir=atlas_cache_dir),
             name="resample_atlas_to_data",
-            n_procs=omp_nthreads,
-            iterfield=["label"],
-        )
-
-        # fmt:off
-        workflow.connect([
-            (inputnode, resample_atlas_to_data, [("bold_file", "template_cifti")]),
-            (atlas_file_grabber, resample_atlas_to_data, [("atlas_file", "label")]),
-            (resample_atlas_to_data, outputnode, [("cifti_out", "atlas_files")]),
-        ])
-        # fmt:on
-
-        parcellate_atlas = pe.MapNode(
-            CiftiParcellate(
-                direction="COLUMN",
-                only_numeric=True,
-                out_file="parcellated_atlas.pscalar.nii",
-            ),
-            name="parcellate_atlas",
             mem_gb=mem_gb,
             n_procs=omp_nthreads,
-            iterfield=["in_file", "atlas_label"],
+            iterfield=["atlas_file"],
         )
 
         # fmt:off
         workflow.connect([
-            (atlas_file_grabber, parcellate_atlas, [("atlas_file", "atlas_label")]),
-            (resample_atlas_to_data, parcellate_atlas, [("cifti_out", "in_file")]),
-            (parcellate_atlas, outputnode, [("out_file", "parcellated_atlas_files")]),
-        ])
-        # fmt:on
-
-        cast_atlas_to_int16 = pe.MapNode(
-            Function(
-                function=cast_cifti_to_int16,
-                input_names=["in_file"],
-                output_names=["out_file"],
-            ),
-            name="cast_atlas_to_int16",
-            iterfield=["in_file"],
-        )
-
-        # fmt:off
-        workflow.connect([
-            (resample_atlas_to_data, cast_atlas_to_int16, [("cifti_out", "in_file")]),
-            (cast_atlas_to_int16, atlas_buffer, [("out_file", "atlas_file")]),
+            (inputnode, resample_atlas_to_data, [("bold_file", "template_cifti")]),
+            (atlas_file_grabber, resample_atlas_to_data, [("atlas_file", "atlas_file")]),
+            (resample_atlas_to_data, outputnode, [
+                ("atlas_file", "atlas_files"),
+                ("parcellated_atlas_file", "parcellated_atlas_files"),
+            ]),
+            (resample_atlas_to_data, atlas_buffer, [("int16_atlas_file", "atlas_file")]),
         ])
         # fmt:on
 
@@ -434,7 +451,11 @@ def init_parcellate_surfaces_wf(
 
         # Parcellate the ciftis
         parcellate_surface = pe.MapNode(
-            CiftiConnect(min_coverage=min_coverage, correlate=False),
+            CiftiConnect(
+                min_coverage=min_coverage,
+                correlate=False,
+                num_threads=omp_nthreads,
+            ),
             mem_gb=mem_gb,
             name=f"parcellate_{file_to_parcellate}",
             n_procs=omp_nthreads,
@@ -481,6 +502,7 @@ def init_functional_connectivity_nifti_wf(
     output_dir,
     alff_available,
     min_coverage,
+    connectivity_measures,
     mem_gb,
     name="connectivity_wf",
 ):
@@ -497,6 +519,7 @@ def init_functional_connectivity_nifti_wf(
                 output_dir=".",
                 alff_available=True,
                 min_coverage=0.5,
+                connectivity_measures=[],
                 mem_gb=0.1,
                 name="connectivity_wf",
             )
@@ -506,6 +529,7 @@ def init_functional_connectivity_nifti_wf(
     %(output_dir)s
     alff_available
     %(min_coverage)s
+    %(connectivity_measures)s
     %(mem_gb)s
     %(name)s
         Default is "connectivity_wf".
@@ -528,6 +552,12 @@ def init_functional_connectivity_nifti_wf(
     %(timeseries)s
     %(correlations)s
     %(correlations_exact)s
+    connectivity
+        Regularized connectivity matrix files, one list per atlas,
+        with one file per measure in ``connectivity_measures``.
+    connectivity_exact
+        Regularized connectivity matrix files limited to exact numbers of volumes,
+        one list per atlas.
     parcellated_alff
     parcellated_reho
     """
@@ -547,6 +577,7 @@ In cases of partial coverage, uncovered voxels (values of all zeros or NaNs) wer
 ignored (when the parcel had >{min_coverage * 100}% coverage)
 or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
 """
+    workflow.__desc__ += _describe_connectivity_measures(connectivity_measures)
 
     inputnode = pe.Node(
         niu.IdentityInterface(
@@ -571,6 +602,8 @@ or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
                 "timeseries",
                 "correlations",
                 "correlations_exact",
+                "connectivity",
+                "connectivity_exact",
                 "parcellated_alff",
                 "parcellated_reho",
             ],
@@ -579,7 +612,11 @@ or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
     )
 
     functional_connectivity = pe.MapNode(
-        NiftiConnect(min_coverage=min_coverage, correlate=True),
+        NiftiConnect(
+            min_coverage=min_coverage,
+            correlate=True,
+            connectivity_measures=connectivity_measures,
+        ),
         name="functional_connectivity",
         iterfield=["atlas", "atlas_labels"],
         mem_gb=mem_gb,
@@ -599,6 +636,8 @@ or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
             ("timeseries", "timeseries"),
             ("correlations", "correlations"),
             ("correlations_exact", "correlations_exact"),
+            ("connectivity", "connectivity"),
+            ("connectivity_exact", "connectivity_exact"),
         ]),
     ])
     # fmt:on
@@ -684,6 +723,7 @@ def init_functional_connectivity_cifti_wf(
     output_dir,
     alff_available,
     min_coverage,
+    connectivity_measures,
     mem_gb,
     omp_nthreads,
     name="connectivity_wf",
@@ -700,6 +740,7 @@ def init_functional_connectivity_cifti_wf(
                 output_dir=".",
                 alff_available=True,
                 min_coverage=0.5,
+                connectivity_measures=[],
                 mem_gb=0.1,
                 omp_nthreads=1,
                 name="connectivity_wf",
@@ -710,6 +751,7 @@ def init_functional_connectivity_cifti_wf(
     %(output_dir)s
     alff_available
     %(min_coverage)s
+    %(connectivity_measures)s
     %(mem_gb)s
     %(omp_nthreads)s
     %(name)s
@@ -740,6 +782,12 @@ def init_functional_connectivity_cifti_wf(
     %(timeseries)s
     %(correlations)s
     correlations_exact
+    connectivity
+        Regularized connectivity matrix files, one list per atlas,
+        with one file per measure in ``connectivity_measures``.
+    connectivity_exact
+        Regularized connectivity matrix files limited to exact numbers of volumes,
+        one list per atlas.
     parcellated_reho
     parcellated_alff
     """
@@ -760,6 +808,7 @@ In cases of partial coverage, uncovered vertices (values of all zeros or NaNs) w
 ignored (when the parcel had >{min_coverage * 100}% coverage)
 or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
 """
+    workflow.__desc__ += _describe_connectivity_measures(connectivity_measures)
 
     inputnode = pe.Node(
         niu.IdentityInterface(
@@ -788,6 +837,8 @@ or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
                 "timeseries",
                 "correlations",
                 "correlations_exact",
+                "connectivity",
+                "connectivity_exact",
                 "parcellated_alff",
                 "parcellated_reho",
             ],
@@ -796,7 +847,12 @@ or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
     )
 
     functional_connectivity = pe.MapNode(
-        CiftiConnect(min_coverage=min_coverage, correlate=True),
+        CiftiConnect(
+            min_coverage=min_coverage,
+            correlate=True,
+            connectivity_measures=connectivity_measures,
+            num_threads=omp_nthreads,
+        ),
         mem_gb=mem_gb,
         name="functional_connectivity",
         n_procs=omp_nthreads,
@@ -821,12 +877,14 @@ or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
             ("timeseries", "timeseries"),
             ("correlations", "correlations"),
             ("correlations_exact", "correlations_exact"),
+            ("connectivity", "connectivity"),
+            ("connectivity_exact", "connectivity_exact"),
         ]),
     ])
     # fmt:on
 
     parcellate_reho = pe.MapNode(
-        CiftiConnect(min_coverage=min_coverage, correlate=False),
+        CiftiConnect(min_coverage=min_coverage, correlate=False, num_threads=omp_nthreads),
         mem_gb=mem_gb,
         name="parcellate_reho",
         n_procs=omp_nthreads,
@@ -847,7 +905,11 @@ or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
 
     if alff_available:
         parcellate_alff = pe.MapNode(
-            CiftiConnect(min_coverage=min_coverage, correlate=False),
+            CiftiConnect(
+                min_coverage=min_coverage,
+                correlate=False,
+                num_threads=omp_nthreads,
+            ),
             mem_gb=mem_gb,
             name="parcellate_alff",
             n_procs=omp_nthreads,
@@ -901,3 +963,290 @@ or were set to zero (when the parcel had <{min_coverage * 100}% coverage).
     # fmt:on
 
     return workflow
+
+
+@fill_doc
+def init_dense_connectivity_wf(
+    name_source,
+    output_dir,
+    dense_connectivity,
+    mem_gb,
+    omp_nthreads,
+    name="dense_connectivity_wf",
+):
+    """Compute dense and seed-based functional connectivity from CIFTI data.
+
+    Workflow Graph
+        .. workflow::
+            :graph2use: orig
+            :simple_form: yes
+
+            from xcp_d.workflows.connectivity import init_dense_connectivity_wf
+            wf = init_dense_connectivity_wf(
+                name_source="sub-01_task-rest_space-fsLR_den-91k_bold.dtseries.nii",
+                output_dir=".",
+                dense_connectivity="all",
+                mem_gb=0.1,
+                omp_nthreads=1,
+                name="dense_connectivity_wf",
+            )
+
+    Parameters
+    ----------
+    %(name_source)s
+    %(output_dir)s
+    %(dense_connectivity)s
+    %(mem_gb)s
+    %(omp_nthreads)s
+    %(name)s
+        Default is "dense_connectivity_wf".
+
+    Inputs
+    ------
+    denoised_bold
+        Clean CIFTI after filtering and nuisance regression.
+    %(atlas_names)s
+    %(timeseries_ciftis)s
+
+    Outputs
+    -------
+    dense_correlations
+        The grayordinate-by-grayordinate correlation matrix, as a .dconn.nii file.
+        Only produced if ``dense_connectivity`` is "all".
+    seed_correlations
+        The parcel-to-grayordinate correlation matrices, as .dpconn.nii files,
+        one per atlas.
+    """
+    workflow = Workflow(name=name)
+    workflow.__desc__ = """
+Each parcel's time series was also correlated with the time series of every grayordinate,
+producing parcel-to-grayordinate (seed-based) connectivity maps for each atlas.
+"""
+    if dense_connectivity == "all":
+        workflow.__desc__ += """\
+Dense functional connectivity was computed as the Pearson's correlation between the time series
+of every pair of grayordinates.
+"""
+
+    inputnode = pe.Node(
+        niu.IdentityInterface(fields=["denoised_bold", "atlas_names", "timeseries_ciftis"]),
+        name="inputnode",
+    )
+    outputnode = pe.Node(
+        niu.IdentityInterface(fields=["dense_correlations", "seed_correlations"]),
+        name="outputnode",
+    )
+
+    dense_connect = pe.Node(
+        DenseConnect(dense=dense_connectivity == "all", num_threads=omp_nthreads),
+        name="dense_connect",
+        mem_gb=mem_gb,
+        n_procs=omp_nthreads,
+    )
+
+    # fmt:off
+    workflow.connect([
+        (inputnode, dense_connect, [
+            ("denoised_bold", "data_file"),
+            ("timeseries_ciftis", "timeseries_ciftis"),
+        ]),
+        (dense_connect, outputnode, [("seed_correlations", "seed_correlations")]),
+    ])
+    # fmt:on
+
+    cohort = get_entity(name_source, "cohort")
+    ds_seed_correlations = pe.MapNode(
+        DerivativesDataSink(
+            base_directory=output_dir,
+            source_file=name_source,
+            check_hdr=False,
+            dismiss_entities=["desc", "den"],
+            cohort=cohort,
+            den="91k",
+            measure="pearsoncorrelation",
+            suffix="conmat",
+            extension=".dpconn.nii",
+        ),
+        name="ds_seed_correlations",
+        run_without_submitting=True,
+        mem_gb=1,
+        iterfield=["atlas", "in_file"],
+    )
+
+    # fmt:off
+    workflow.connect([
+        (inputnode, ds_seed_correlations, [("atlas_names", "atlas")]),
+        (dense_connect, ds_seed_correlations, [("seed_correlations", "in_file")]),
+    ])
+    # fmt:on
+
+    if dense_connectivity == "all":
+        ds_dense_correlations = pe.Node(
+            DerivativesDataSink(
+                base_directory=output_dir,
+                source_file=name_source,
+                check_hdr=False,
+                dismiss_entities=["desc", "den"],
+                cohort=cohort,
+                den="91k",
+                measure="pearsoncorrelation",
+                suffix="conmat",
+                extension=".dconn.nii",
+            ),
+            name="ds_dense_correlations",
+            run_without_submitting=True,
+            mem_gb=1,
+        )
+
+        # fmt:off
+        workflow.connect([
+            (dense_connect, ds_dense_correlations, [("dense_correlations", "in_file")]),
+            (dense_connect, outputnode, [("dense_correlations", "dense_correlations")]),
+        ])
+        # fmt:on
+
+    return workflow
+
+
+@fill_doc
+def init_dynamic_connectivity_wf(
+    name_source,
+    output_dir,
+    TR,
+    dynamic_window,
+    dynamic_step,
+    dynamic_taper,
+    mem_gb,
+    omp_nthreads,
+    name="dynamic_connectivity_wf",
+):
+    """Compute sliding-window functional connectivity from parcellated time series.
+
+    Workflow Graph
+        .. workflow::
+            :graph2use: orig
+            :simple_form: yes
+
+            from xcp_d.workflows.connectivity import init_dynamic_connectivity_wf
+            wf = init_dynamic_connectivity_wf(
+                name_source="sub-01_task-rest_space-MNI152NLin2009cAsym_desc-preproc_bold.nii.gz",
+                output_dir=".",
+                TR=0.8,
+                dynamic_window=60,
+                dynamic_step=None,
+                dynamic_taper="boxcar",
+                mem_gb=0.1,
+                omp_nthreads=1,
+                name="dynamic_connectivity_wf",
+            )
+
+    Parameters
+    ----------
+    %(name_source)s
+    %(output_dir)s
+    %(TR)s
+    %(dynamic_window)s
+    %(dynamic_step)s
+    %(dynamic_taper)s
+    %(mem_gb)s
+    %(omp_nthreads)s
+    %(name)s
+        Default is "dynamic_connectivity_wf".
+
+    Inputs
+    ------
+    %(timeseries)s
+    %(temporal_mask)s
+    %(atlas_names)s
+
+    Outputs
+    -------
+    dynamic_correlations
+        The sliding-window correlation matrices, as HDF5 files, one per atlas.
+    """
+    window_length = int(np.round(dynamic_window / TR))
+    step = max(int(np.round(dynamic_step / TR)), 1) if dynamic_step else 1
+
+    workflow = Workflow(name=name)
+    taper_str = "an exponentially tapered" if dynamic_taper == "exponential" else "a"
+    workflow.__desc__ = f"""
+Dynamic functional connectivity was estimated as the Pearson's correlation between each pair of
+parcels' time series within {taper_str} sliding window of {window_length} volumes
+({dynamic_window} seconds), moved in steps of {step} volume(s).
+Censored volumes were excluded from each window.
+"""
+
+    inputnode = pe.Node(
+        niu.IdentityInterface(fields=["timeseries", "temporal_mask", "atlas_names"]),
+        name="inputnode",
+    )
+    outputnode = pe.Node(
+        niu.IdentityInterface(fields=["dynamic_correlations"]),
+        name="outputnode",
+    )
+
+    dynamic_connect = pe.MapNode(
+        DynamicConnect(
+            window_length=window_length,
+            step=step,
+            taper=dynamic_taper,
+            num_threads=omp_nthreads,
+        ),
+        name="dynamic_connect",
+        iterfield=["timeseries"],
+        mem_gb=mem_gb,
+        n_procs=omp_nthreads,
+    )
+
+    # fmt:off
+    workflow.connect([
+        (inputnode, dynamic_connect, [
+            ("timeseries", "timeseries"),
+            ("temporal_mask", "temporal_mask"),
+        ]),
+        (dynamic_connect, outputnode, [("dynamic_correlations", "dynamic_correlations")]),
+    ])
+    # fmt:on
+
+    ds_dynamic_correlations = pe.MapNode(
+        DerivativesDataSink(
+            base_directory=output_dir,
+            source_file=name_source,
+            dismiss_entities=["desc"],
+            cohort=get_entity(name_source, "cohort"),
+            measure="pearsoncorrelation",
+            desc="dynamic",
+            suffix="conmat",
+            extension=".h5",
+        ),
+        name="ds_dynamic_correlations",
+        run_without_submitting=True,
+        mem_gb=1,
+        iterfield=["atlas", "in_file"],
+    )
+
+    # fmt:off
+    workflow.connect([
+        (inputnode, ds_dynamic_correlations, [("atlas_names", "atlas")]),
+        (dynamic_connect, ds_dynamic_correlations, [("dynamic_correlations", "in_file")]),
+    ])
+    # fmt:on
+
+    return workflow
+
+
+def _describe_connectivity_measures(connectivity_measures):
+    """Describe the regularized connectivity measures for the workflow's boilerplate."""
+    if not connectivity_measures:
+        return ""
+
+    desc = """
+Covariance matrices were also estimated with Ledoit-Wolf shrinkage [@ledoit2004well].
+"""
+    if "partialcorrelation" in connectivity_measures:
+        desc += """\
+Partial correlations between all pairs of parcels were computed from the inverse of each
+shrunk covariance matrix.
+"""
+
+    return desc
@@ -132,6 +132,7 @@ def init_postproc_derivatives_wf(
     smoothing,
     params,
     exact_scans,
+    connectivity_measures,
     cifti,
     dcan_qc,
     output_dir,
@@ -157,6 +158,7 @@ def init_postproc_derivatives_wf(
                 smoothing=6,
                 params="36P",
                 exact_scans=[],
+                connectivity_measures=[],
                 cifti=False,
                 dcan_qc=True,
                 output_dir=".",
@@ -177,6 +179,7 @@ def init_postproc_derivatives_wf(
     %(smoothing)s
     %(params)s
     %(exact_scans)s
+    %(connectivity_measures)s
     %(cifti)s
     %(dcan_qc)s
     output_dir : :obj:`str`
@@ -191,6 +194,12 @@ def init_postproc_derivatives_wf(
         Used for indexing ``timeseries`` and ``correlations``.
     %(timeseries)s
     %(correlations)s
+    connectivity
+        Regularized connectivity matrix files, one list per atlas,
+        with one file per measure in ``connectivity_measures``.
+    connectivity_exact
+        Regularized connectivity matrix files limited to exact numbers of volumes,
+        one list per atlas, ordered by measure and then by exact number of volumes.
     %(coverage)s
     %(timeseries_ciftis)s
     %(correlation_ciftis)s
@@ -225,6 +234,8 @@ def init_postproc_derivatives_wf(
                 "timeseries",
                 "correlations",
                 "correlations_exact",
+                "connectivity",
+                "connectivity_exact",
                 "qc_file",
                 "censored_denoised_bold",
                 "smoothed_denoised_bold",
@@ -410,6 +421,67 @@ def init_postproc_derivatives_wf(
         ])
         # fmt:on
 
+    for i_measure, measure in enumerate(connectivity_measures):
+        select_connectivity_files = pe.MapNode(
+            niu.Select(index=i_measure),
+            name=f"select_{measure}_files",
+            iterfield=["inlist"],
+        )
+        ds_connectivity = pe.MapNode(
+            DerivativesDataSink(
+                base_directory=output_dir,
+                source_file=name_source,
+                dismiss_entities=["desc"],
+                cohort=cohort,
+                measure=measure,
+                suffix="conmat",
+                extension=".tsv",
+            ),
+            name=f"ds_{measure}",
+            run_without_submitting=True,
+            mem_gb=1,
+            iterfield=["atlas", "in_file"],
+        )
+
+        # fmt:off
+        workflow.connect([
+            (inputnode, select_connectivity_files, [("connectivity", "inlist")]),
+            (inputnode, ds_connectivity, [("atlas_names", "atlas")]),
+            (select_connectivity_files, ds_connectivity, [("out", "in_file")]),
+        ])
+        # fmt:on
+
+        for i_exact_scan, exact_scan in enumerate(exact_scans):
+            select_exact_scan_files = pe.MapNode(
+                niu.Select(index=i_measure * len(exact_scans) + i_exact_scan),
+                name=f"select_{measure}_exact_scan_files_{i_exact_scan}",
+                iterfield=["inlist"],
+            )
+            ds_connectivity_exact = pe.MapNode(
+                DerivativesDataSink(
+                    base_directory=output_dir,
+                    source_file=name_source,
+                    dismiss_entities=["desc"],
+                    cohort=cohort,
+                    measure=measure,
+                    desc=f"{exact_scan}volumes",
+                    suffix="conmat",
+                    extension=".tsv",
+                ),
+                name=f"ds_{measure}_exact_{i_exact_scan}",
+                run_without_submitting=True,
+                mem_gb=1,
+                iterfield=["atlas", "in_file"],
+            )
+
+            # fmt:off
+            workflow.connect([
+                (inputnode, select_exact_scan_files, [("connectivity_exact", "inlist")]),
+                (inputnode, ds_connectivity_exact, [("atlas_names", "atlas")]),
+                (select_exact_scan_files, ds_connectivity_exact, [("out", "in_file")]),
+            ])
+            # fmt:on
+
     ds_parcellated_reho = pe.MapNode(
         DerivativesDataSink(
             base_directory=output_dir,
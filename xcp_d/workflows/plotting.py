@@ -282,6 +282,7 @@ def init_qc_report_wf(
             TR=TR,
             head_radius=head_radius,
             template_mask=nlin2009casym_brain_mask,
+            num_threads=omp_nthreads,
         ),
         name="qc_report",
         mem_gb=mem_gb,
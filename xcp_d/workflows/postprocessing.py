@@ -2,11 +2,9 @@
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 """Workflows for post-processing BOLD data."""
 from nipype.interfaces import utility as niu
-from nipype.interfaces.workbench.cifti import CiftiSmooth
 from nipype.pipeline import engine as pe
 from niworkflows.engine.workflows import LiterateWorkflow as Workflow
 from num2words import num2words
-from pkg_resources import resource_filename as pkgrf
 
 from xcp_d.interfaces.bids import DerivativesDataSink
 from xcp_d.interfaces.censoring import (
@@ -15,14 +13,14 @@ from xcp_d.interfaces.censoring import (
     RandomCensor,
     RemoveDummyVolumes,
 )
-from xcp_d.interfaces.nilearn import DenoiseCifti, DenoiseNifti, Smooth
+from xcp_d.interfaces.nilearn import DenoiseCifti, DenoiseNifti
 from xcp_d.interfaces.plotting import CensoringPlot
-from xcp_d.interfaces.restingstate import DespikePatch
-from xcp_d.interfaces.workbench import CiftiConvert, FixCiftiIntent
+from xcp_d.interfaces.restingstate import DespikePatch, NativeDespike
+from xcp_d.interfaces.smoothing import GaussianSmooth
+from xcp_d.interfaces.workbench import CiftiConvert
 from xcp_d.utils.confounds import describe_censoring, describe_regression
 from xcp_d.utils.doc import fill_doc
 from xcp_d.utils.plotting import plot_design_matrix as _plot_design_matrix
-from xcp_d.utils.utils import fwhm2sigma
 
 
 @fill_doc
@@ -110,6 +108,8 @@ def init_prepare_confounds_wf(
     -------
     preprocessed_bold : :obj:`str`
     %(fmriprep_confounds_file)s
+    filtered_confounds_file : :obj:`str`
+        The fMRIPrep confounds, with filtered motion parameters, before dummy scan removal.
     confounds_file : :obj:`str`
         The selected confounds, potentially including custom confounds, after dummy scan removal.
     %(dummy_scans)s
@@ -180,6 +180,7 @@ def init_prepare_confounds_wf(
             fields=[
                 "preprocessed_bold",
                 "fmriprep_confounds_file",  # used to calculate motion in concatenation workflow
+                "filtered_confounds_file",  # used to build additional denoising strategies
                 "confounds_file",
                 "dummy_scans",
                 "filtered_motion",
@@ -216,7 +217,10 @@ def init_prepare_confounds_wf(
             ("fmriprep_confounds_json", "fmriprep_confounds_json"),
             ("custom_confounds_file", "custom_confounds_file"),
         ]),
-        (generate_confounds, outputnode, [("motion_metadata", "motion_metadata")]),
+        (generate_confounds, outputnode, [
+            ("motion_metadata", "motion_metadata"),
+            ("filtered_confounds_file", "filtered_confounds_file"),
+        ]),
     ])
     # fmt:on
 
@@ -401,9 +405,10 @@ def init_despike_wf(
     cifti,
     mem_gb,
     omp_nthreads,
+    despike_method="afni",
     name="despike_wf",
 ):
-    """Despike BOLD data with AFNI's 3dDespike.
+    """Despike BOLD data with AFNI's 3dDespike or a reimplementation of it.
 
     Despiking truncates large spikes in the BOLD times series.
     Despiking reduces/limits the amplitude or magnitude of large spikes,
@@ -424,6 +429,7 @@ def init_despike_wf(
                 cifti=True,
                 mem_gb=0.1,
                 omp_nthreads=1,
+                despike_method="afni",
                 name="despike_wf",
             )
 
@@ -433,6 +439,7 @@ def init_despike_wf(
     %(cifti)s
     %(mem_gb)s
     %(omp_nthreads)s
+    %(despike_method)s
     %(name)s
         Default is "despike_wf".
 
@@ -450,6 +457,28 @@ def init_despike_wf(
     inputnode = pe.Node(niu.IdentityInterface(fields=["bold_file"]), name="inputnode")
     outputnode = pe.Node(niu.IdentityInterface(fields=["bold_file"]), name="outputnode")
 
+    if despike_method == "native":
+        despike3d = pe.Node(
+            NativeDespike(num_threads=omp_nthreads),
+            name="despike3d",
+            mem_gb=mem_gb,
+            n_procs=omp_nthreads,
+        )
+
+        workflow.__desc__ = f"""
+The BOLD data were despiked with a reimplementation of *AFNI*'s *3dDespike* algorithm,
+applied directly to each {'grayordinate' if cifti else 'voxel'}'s time series.
+"""
+
+        # fmt:off
+        workflow.connect([
+            (inputnode, despike3d, [("bold_file", "in_file")]),
+            (despike3d, outputnode, [("out_file", "bold_file")]),
+        ])
+        # fmt:on
+
+        return workflow
+
     despike3d = pe.Node(
         DespikePatch(outputtype="NIFTI_GZ", args="-nomask -NEW"),
         name="despike3d",
@@ -515,11 +544,13 @@ def init_denoise_bold_wf(
     low_pass,
     high_pass,
     bpf_order,
+    compose_filter,
     bandpass_filter,
     smoothing,
     cifti,
     mem_gb,
     omp_nthreads,
+    kernel_cache_dir=None,
     name="denoise_bold_wf",
 ):
     """Denoise BOLD data.
@@ -536,11 +567,13 @@ def init_denoise_bold_wf(
                 high_pass=0.01,
                 low_pass=0.08,
                 bpf_order=2,
+                compose_filter=False,
                 bandpass_filter=True,
                 smoothing=6,
                 cifti=False,
                 mem_gb=0.1,
                 omp_nthreads=1,
+                kernel_cache_dir=None,
                 name="denoise_bold_wf",
             )
 
@@ -550,11 +583,13 @@ def init_denoise_bold_wf(
     %(low_pass)s
     %(high_pass)s
     %(bpf_order)s
+    %(compose_filter)s
     %(bandpass_filter)s
     %(smoothing)s
     %(cifti)s
     %(mem_gb)s
     %(omp_nthreads)s
+    %(kernel_cache_dir)s
     %(name)s
         Default is "denoise_bold_wf".
 
@@ -632,7 +667,9 @@ def init_denoise_bold_wf(
             low_pass=low_pass,
             high_pass=high_pass,
             filter_order=bpf_order,
+            compose_filter=compose_filter,
             bandpass_filter=bandpass_filter,
+            num_threads=omp_nthreads,
         ),
         name="regress_and_filter_bold",
         mem_gb=mem_gb,
@@ -680,6 +717,7 @@ def init_denoise_bold_wf(
             cifti=cifti,
             mem_gb=mem_gb,
             omp_nthreads=omp_nthreads,
+            kernel_cache_dir=kernel_cache_dir,
             name="resd_smoothing_wf",
         )
 
@@ -703,6 +741,7 @@ def init_resd_smoothing_wf(
     cifti,
     mem_gb,
     omp_nthreads,
+    kernel_cache_dir=None,
     name="resd_smoothing_wf",
 ):
     """Smooth BOLD residuals.
@@ -719,6 +758,7 @@ def init_resd_smoothing_wf(
                 cifti=True,
                 mem_gb=0.1,
                 omp_nthreads=1,
+                kernel_cache_dir=None,
                 name="resd_smoothing_wf",
             )
 
@@ -728,6 +768,7 @@ def init_resd_smoothing_wf(
     %(cifti)s
     %(mem_gb)s
     %(omp_nthreads)s
+    %(kernel_cache_dir)s
     %(name)s
         Default is "resd_smoothing_wf".
 
@@ -743,77 +784,350 @@ def init_resd_smoothing_wf(
     inputnode = pe.Node(niu.IdentityInterface(fields=["bold_file"]), name="inputnode")
     outputnode = pe.Node(niu.IdentityInterface(fields=["smoothed_bold"]), name="outputnode")
 
-    # Turn specified FWHM (Full-Width at Half Maximum) to standard deviation.
-    sigma_lx = fwhm2sigma(smoothing)
     if cifti:
         workflow.__desc__ = f""" \
-The denoised BOLD was then smoothed using *Connectome Workbench* with a Gaussian kernel
-(FWHM={str(smoothing)} mm).
+The denoised BOLD was then smoothed with a Gaussian kernel (FWHM={str(smoothing)} mm),
+using geodesic distances on the fsLR 32k midthickness surfaces for cortical vertices,
+and Euclidean distances within each subcortical structure.
+"""
+    else:
+        workflow.__desc__ = f""" \
+The denoised BOLD was smoothed with a Gaussian kernel (FWHM={str(smoothing)} mm).
 """
 
-        # Call connectome workbench to smooth for each hemisphere
-        smooth_data = pe.Node(
-            CiftiSmooth(
-                sigma_surf=sigma_lx,  # the size of the surface kernel
-                sigma_vol=sigma_lx,  # the volume of the surface kernel
-                direction="COLUMN",  # which direction to smooth along@
-                right_surf=pkgrf(  # pull out atlases for each hemisphere
-                    "xcp_d",
-                    (
-                        "data/ciftiatlas/"
-                        "Q1-Q6_RelatedParcellation210.R.midthickness_32k_fs_LR.surf.gii"
-                    ),
+    smooth_data = pe.Node(
+        GaussianSmooth(fwhm=smoothing, cache_dir=kernel_cache_dir),
+        name="cifti_smoothing" if cifti else "nifti_smoothing",
+        mem_gb=mem_gb,
+        n_procs=omp_nthreads,
+    )
+
+    # fmt:off
+    workflow.connect([
+        (smooth_data, outputnode, [("out_file", "smoothed_bold")]),
+    ])
+    # fmt:on
+
+    # fmt:off
+    workflow.connect([
+        (inputnode, smooth_data, [("bold_file", "in_file")]),
+    ])
+    # fmt:on
+
+    return workflow
+
+
+@fill_doc
+def init_denoise_strategies_wf(
+    name_source,
+    output_dir,
+    TR,
+    additional_params,
+    low_pass,
+    high_pass,
+    bpf_order,
+    compose_filter,
+    bandpass_filter,
+    min_coverage,
+    cifti,
+    mem_gb,
+    omp_nthreads,
+    name="denoise_strategies_wf",
+):
+    """Denoise the BOLD data with additional nuisance regression strategies, in one pass.
+
+    Each strategy's censored, denoised BOLD data, design matrix, and parcellated time series
+    and correlation matrices are written out with a strategy-specific ``desc`` entity.
+
+    Workflow Graph
+        .. workflow::
+            :graph2use: orig
+            :simple_form: yes
+
+            from xcp_d.workflows.postprocessing import init_denoise_strategies_wf
+
+            wf = init_denoise_strategies_wf(
+                name_source="sub-01_task-rest_space-fsLR_den-91k_bold.dtseries.nii",
+                output_dir=".",
+                TR=0.8,
+                additional_params=["24P", "acompcor"],
+                low_pass=0.08,
+                high_pass=0.01,
+                bpf_order=2,
+                compose_filter=False,
+                bandpass_filter=True,
+                min_coverage=0.5,
+                cifti=True,
+                mem_gb=0.1,
+                omp_nthreads=1,
+                name="denoise_strategies_wf",
+            )
+
+    Parameters
+    ----------
+    %(name_source)s
+    %(output_dir)s
+    %(TR)s
+    %(additional_params)s
+    %(low_pass)s
+    %(high_pass)s
+    %(bpf_order)s
+    %(compose_filter)s
+    %(bandpass_filter)s
+    %(min_coverage)s
+    %(cifti)s
+    %(mem_gb)s
+    %(omp_nthreads)s
+    %(name)s
+        Default is "denoise_strategies_wf".
+
+    Inputs
+    ------
+    preprocessed_bold
+        The preprocessed BOLD data that are denoised with the primary strategy.
+    mask
+        Only used for NIfTIs.
+    fmriprep_confounds_file
+        The fMRIPrep confounds, with filtered motion parameters, before dummy volume removal.
+    fmriprep_confounds_json
+    %(custom_confounds_file)s
+    %(dummy_scans)s
+    %(temporal_mask)s
+    atlas_names
+    atlas_files
+    atlas_labels_files
+    parcellated_atlas_files
+        Only used for CIFTIs.
+
+    Outputs
+    -------
+    confounds_files
+        Each strategy's design matrix, after dummy volume removal.
+    censored_denoised_bold
+        Each strategy's censored, denoised BOLD data.
+    """
+    from xcp_d.interfaces.connectivity import CiftiConnect, NiftiConnect
+    from xcp_d.interfaces.nilearn import DenoiseStrategies
+    from xcp_d.utils.bids import get_entity
+    from xcp_d.utils.confounds import get_strategy_label
+
+    workflow = Workflow(name=name)
+
+    workflow.__desc__ = (
+        " For comparison, the BOLD data were also denoised with the following nuisance "
+        f"regression strategies: {', '.join(additional_params)}. "
+        "Each strategy was applied with the same censoring, interpolation, and filtering "
+        "as the primary strategy."
+    )
+
+    inputnode = pe.Node(
+        niu.IdentityInterface(
+            fields=[
+                "preprocessed_bold",
+                "mask",  # only used for NIFTIs
+                "fmriprep_confounds_file",
+                "fmriprep_confounds_json",
+                "custom_confounds_file",
+                "dummy_scans",
+                "temporal_mask",
+                "atlas_names",
+                "atlas_files",
+                "atlas_labels_files",
+                "parcellated_atlas_files",  # only used for CIFTIs
+            ],
+        ),
+        name="inputnode",
+    )
+    outputnode = pe.Node(
+        niu.IdentityInterface(fields=["confounds_files", "censored_denoised_bold"]),
+        name="outputnode",
+    )
+
+    denoise_strategies = pe.Node(
+        DenoiseStrategies(
+            params=additional_params,
+            name_source=name_source,
+            TR=TR,
+            low_pass=low_pass,
+            high_pass=high_pass,
+            filter_order=bpf_order,
+            compose_filter=compose_filter,
+            bandpass_filter=bandpass_filter,
+            num_threads=omp_nthreads,
+        ),
+        name="denoise_strategies",
+        mem_gb=mem_gb,
+        n_procs=omp_nthreads,
+    )
+
+    # fmt:off
+    workflow.connect([
+        (inputnode, denoise_strategies, [
+            ("preprocessed_bold", "preprocessed_bold"),
+            ("fmriprep_confounds_file", "fmriprep_confounds_file"),
+            ("fmriprep_confounds_json", "fmriprep_confounds_json"),
+            ("custom_confounds_file", "custom_confounds_file"),
+            ("dummy_scans", "dummy_scans"),
+            ("temporal_mask", "temporal_mask"),
+        ]),
+        (denoise_strategies, outputnode, [
+            ("confounds_files", "confounds_files"),
+            ("censored_denoised_bold", "censored_denoised_bold"),
+        ]),
+    ])
+    if not cifti:
+        workflow.connect([(inputnode, denoise_strategies, [("mask", "mask")])])
+    # fmt:on
+
+    cohort = get_entity(name_source, "cohort")
+    for i_strategy, params in enumerate(additional_params):
+        label = get_strategy_label(params)
+
+        select_bold = pe.Node(niu.Select(index=i_strategy), name=f"select_bold_{label}")
+        workflow.connect(
+            [(denoise_strategies, select_bold, [("censored_denoised_bold", "inlist")])]
+        )
+
+        if cifti:
+            ds_denoised_bold = pe.Node(
+                DerivativesDataSink(
+                    base_directory=output_dir,
+                    meta_dict={"RepetitionTime": TR, "nuisance parameters": params},
+                    source_file=name_source,
+                    dismiss_entities=["den"],
+                    cohort=cohort,
+                    desc=f"denoised{label}",
+                    den="91k",
+                    extension=".dtseries.nii",
                 ),
-                left_surf=pkgrf(
-                    "xcp_d",
-                    (
-                        "data/ciftiatlas/"
-                        "Q1-Q6_RelatedParcellation210.L.midthickness_32k_fs_LR.surf.gii"
-                    ),
+                name=f"ds_denoised_bold_{label}",
+                run_without_submitting=True,
+                mem_gb=2,
+            )
+            functional_connectivity = pe.MapNode(
+                CiftiConnect(
+                    min_coverage=min_coverage,
+                    correlate=True,
+                    num_threads=omp_nthreads,
+                ),
+                mem_gb=mem_gb,
+                name=f"functional_connectivity_{label}",
+                n_procs=omp_nthreads,
+                iterfield=["atlas_labels", "atlas_file", "parcellated_atlas"],
+            )
+
+            # fmt:off
+            workflow.connect([
+                (inputnode, functional_connectivity, [
+                    ("temporal_mask", "temporal_mask"),
+                    ("atlas_files", "atlas_file"),
+                    ("atlas_labels_files", "atlas_labels"),
+                    ("parcellated_atlas_files", "parcellated_atlas"),
+                ]),
+                (select_bold, functional_connectivity, [("out", "data_file")]),
+            ])
+            # fmt:on
+        else:
+            ds_denoised_bold = pe.Node(
+                DerivativesDataSink(
+                    base_directory=output_dir,
+                    meta_dict={"RepetitionTime": TR, "nuisance parameters": params},
+                    source_file=name_source,
+                    cohort=cohort,
+                    desc=f"denoised{label}",
+                    extension=".nii.gz",
+                    compression=True,
                 ),
+                name=f"ds_denoised_bold_{label}",
+                run_without_submitting=True,
+                mem_gb=2,
+            )
+            functional_connectivity = pe.MapNode(
+                NiftiConnect(min_coverage=min_coverage, correlate=True),
+                name=f"functional_connectivity_{label}",
+                iterfield=["atlas", "atlas_labels"],
+                mem_gb=mem_gb,
+            )
+
+            # fmt:off
+            workflow.connect([
+                (inputnode, functional_connectivity, [
+                    ("temporal_mask", "temporal_mask"),
+                    ("mask", "mask"),
+                    ("atlas_files", "atlas"),
+                    ("atlas_labels_files", "atlas_labels"),
+                ]),
+                (select_bold, functional_connectivity, [("out", "filtered_file")]),
+            ])
+            # fmt:on
+
+        workflow.connect([(select_bold, ds_denoised_bold, [("out", "in_file")])])
+
+        ds_timeseries = pe.MapNode(
+            DerivativesDataSink(
+                base_directory=output_dir,
+                source_file=name_source,
+                dismiss_entities=["desc"],
+                cohort=cohort,
+                desc=label,
+                suffix="timeseries",
+                extension=".tsv",
             ),
-            name="cifti_smoothing",
-            mem_gb=mem_gb,
-            n_procs=omp_nthreads,
+            name=f"ds_timeseries_{label}",
+            run_without_submitting=True,
+            mem_gb=1,
+            iterfield=["atlas", "in_file"],
         )
-
-        # Always check the intent code in CiftiSmooth's output file
-        fix_cifti_intent = pe.Node(
-            FixCiftiIntent(),
-            name="fix_cifti_intent",
-            mem_gb=mem_gb,
-            n_procs=omp_nthreads,
+        ds_correlations = pe.MapNode(
+            DerivativesDataSink(
+                base_directory=output_dir,
+                source_file=name_source,
+                dismiss_entities=["desc"],
+                cohort=cohort,
+                desc=label,
+                measure="pearsoncorrelation",
+                suffix="conmat",
+                extension=".tsv",
+            ),
+            name=f"ds_correlations_{label}",
+            run_without_submitting=True,
+            mem_gb=1,
+            iterfield=["atlas", "in_file"],
         )
 
         # fmt:off
         workflow.connect([
-            (smooth_data, fix_cifti_intent, [("out_file", "in_file")]),
-            (fix_cifti_intent, outputnode, [("out_file", "smoothed_bold")]),
+            (inputnode, ds_timeseries, [("atlas_names", "atlas")]),
+            (functional_connectivity, ds_timeseries, [("timeseries", "in_file")]),
+            (inputnode, ds_correlations, [("atlas_names", "atlas")]),
+            (functional_connectivity, ds_correlations, [("correlations", "in_file")]),
         ])
         # fmt:on
 
-    else:
-        workflow.__desc__ = f""" \
-The denoised BOLD was smoothed using *Nilearn* with a Gaussian kernel (FWHM={str(smoothing)} mm).
-"""
-        # Use nilearn to smooth the image
-        smooth_data = pe.Node(
-            Smooth(fwhm=smoothing),  # FWHM = kernel size
-            name="nifti_smoothing",
-            mem_gb=mem_gb,
-            n_procs=omp_nthreads,
-        )
-
-        # fmt:off
-        workflow.connect([
-            (smooth_data, outputnode, [("out_file", "smoothed_bold")]),
-        ])
-        # fmt:on
+        if params != "none":
+            select_confounds = pe.Node(
+                niu.Select(index=i_strategy),
+                name=f"select_confounds_{label}",
+            )
+            ds_confounds = pe.Node(
+                DerivativesDataSink(
+                    base_directory=output_dir,
+                    source_file=name_source,
+                    dismiss_entities=["space", "cohort", "den", "res"],
+                    datatype="func",
+                    desc=label,
+                    suffix="design",
+                    extension=".tsv",
+                ),
+                name=f"ds_confounds_{label}",
+                run_without_submitting=False,
+            )
 
-    # fmt:off
-    workflow.connect([
-        (inputnode, smooth_data, [("bold_file", "in_file")]),
-    ])
-    # fmt:on
+            # fmt:off
+            workflow.connect([
+                (denoise_strategies, select_confounds, [("confounds_files", "inlist")]),
+                (select_confounds, ds_confounds, [("out", "in_file")]),
+            ])
+            # fmt:on
 
     return workflow
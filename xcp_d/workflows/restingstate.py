@@ -3,23 +3,20 @@
 """Workflows for calculating resting state-specific metrics."""
 from nipype import Function
 from nipype.interfaces import utility as niu
-from nipype.interfaces.workbench.cifti import CiftiSmooth
 from nipype.pipeline import engine as pe
 from niworkflows.engine.workflows import LiterateWorkflow as Workflow
 from templateflow.api import get as get_template
 
 from xcp_d.interfaces.bids import DerivativesDataSink
-from xcp_d.interfaces.nilearn import Smooth
 from xcp_d.interfaces.restingstate import ComputeALFF, ReHoNamePatch, SurfaceReHo
+from xcp_d.interfaces.smoothing import GaussianSmooth
 from xcp_d.interfaces.workbench import (
     CiftiCreateDenseScalar,
     CiftiSeparateMetric,
     CiftiSeparateVolumeAll,
-    FixCiftiIntent,
 )
 from xcp_d.utils.doc import fill_doc
 from xcp_d.utils.plotting import plot_alff_reho_surface, plot_alff_reho_volumetric
-from xcp_d.utils.utils import fwhm2sigma
 
 
 @fill_doc
@@ -33,6 +30,7 @@ def init_alff_wf(
     cifti,
     mem_gb,
     omp_nthreads,
+    kernel_cache_dir=None,
     name="alff_wf",
 ):
     """Compute alff for both nifti and cifti.
@@ -53,6 +51,7 @@ def init_alff_wf(
                 cifti=False,
                 mem_gb=0.1,
                 omp_nthreads=1,
+                kernel_cache_dir=None,
                 name="alff_wf",
             )
 
@@ -67,6 +66,7 @@ def init_alff_wf(
     %(cifti)s
     %(mem_gb)s
     %(omp_nthreads)s
+    %(kernel_cache_dir)s
     %(name)s
         Default is "compute_alff_wf".
 
@@ -105,7 +105,7 @@ calculated at each voxel to yield voxel-wise ALFF measures.
 
     # compute alff
     alff_compt = pe.Node(
-        ComputeALFF(TR=TR, low_pass=low_pass, high_pass=high_pass),
+        ComputeALFF(TR=TR, low_pass=low_pass, high_pass=high_pass, num_threads=omp_nthreads),
         mem_gb=mem_gb,
         name="alff_compt",
         n_procs=omp_nthreads,
@@ -136,65 +136,37 @@ calculated at each voxel to yield voxel-wise ALFF measures.
     if smoothing:  # If we want to smooth
         if not cifti:  # If nifti
             workflow.__desc__ = workflow.__desc__ + (
-                " The ALFF maps were smoothed with Nilearn using a Gaussian kernel "
+                " The ALFF maps were smoothed with a Gaussian kernel "
                 f"(FWHM={str(smoothing)} mm)."
             )
-            # Smooth via Nilearn
-            smooth_data = pe.Node(
-                Smooth(fwhm=smoothing),
-                name="niftismoothing",
-                n_procs=omp_nthreads,
-            )
-            # fmt:off
-            workflow.connect([
-                (alff_compt, smooth_data, [("alff", "in_file")]),
-                (smooth_data, outputnode, [("out_file", "smoothed_alff")])
-            ])
-            # fmt:on
-
         else:  # If cifti
             workflow.__desc__ = workflow.__desc__ + (
-                " The ALFF maps were smoothed with the Connectome Workbench using a Gaussian "
-                f"kernel (FWHM={str(smoothing)} mm)."
+                " The ALFF maps were smoothed with a Gaussian kernel "
+                f"(FWHM={str(smoothing)} mm), using geodesic distances on the fsLR 32k "
+                "spheres for cortical vertices."
             )
 
-            # Smooth via Connectome Workbench
-            sigma_lx = fwhm2sigma(smoothing)  # Convert fwhm to standard deviation
-            # Get templates for each hemisphere
-            lh_midthickness = str(
+        smooth_data = pe.Node(
+            GaussianSmooth(fwhm=smoothing, cache_dir=kernel_cache_dir),
+            name="ciftismoothing" if cifti else "niftismoothing",
+            mem_gb=mem_gb,
+            n_procs=omp_nthreads,
+        )
+        if cifti:
+            # ALFF maps have always been smoothed on the spheres, rather than the midthickness.
+            smooth_data.inputs.left_surf = str(
                 get_template("fsLR", hemi="L", suffix="sphere", density="32k")[0]
             )
-            rh_midthickness = str(
+            smooth_data.inputs.right_surf = str(
                 get_template("fsLR", hemi="R", suffix="sphere", density="32k")[0]
             )
-            smooth_data = pe.Node(
-                CiftiSmooth(
-                    sigma_surf=sigma_lx,
-                    sigma_vol=sigma_lx,
-                    direction="COLUMN",
-                    right_surf=rh_midthickness,
-                    left_surf=lh_midthickness,
-                ),
-                name="ciftismoothing",
-                mem_gb=mem_gb,
-                n_procs=omp_nthreads,
-            )
-
-            # Always check the intent code in CiftiSmooth's output file
-            fix_cifti_intent = pe.Node(
-                FixCiftiIntent(),
-                name="fix_cifti_intent",
-                mem_gb=mem_gb,
-                n_procs=omp_nthreads,
-            )
 
-            # fmt:off
-            workflow.connect([
-                (alff_compt, smooth_data, [("alff", "in_file")]),
-                (smooth_data, fix_cifti_intent, [("out_file", "in_file")]),
-                (fix_cifti_intent, outputnode, [("out_file", "smoothed_alff")]),
-            ])
-            # fmt:on
+        # fmt:off
+        workflow.connect([
+            (alff_compt, smooth_data, [("alff", "in_file")]),
+            (smooth_data, outputnode, [("out_file", "smoothed_alff")]),
+        ])
+        # fmt:on
 
     ds_alff_plot = pe.Node(
         DerivativesDataSink(
@@ -300,13 +272,13 @@ For the subcortical, volumetric data, ReHo was computed with neighborhood voxels
 
     # Calculate the reho by hemipshere
     lh_reho = pe.Node(
-        SurfaceReHo(surf_hemi="L"),
+        SurfaceReHo(surf_hemi="L", num_threads=omp_nthreads),
         name="reho_lh",
         mem_gb=mem_gb,
         n_procs=omp_nthreads,
     )
     rh_reho = pe.Node(
-        SurfaceReHo(surf_hemi="R"),
+        SurfaceReHo(surf_hemi="R", num_threads=omp_nthreads),
         name="reho_rh",
         mem_gb=mem_gb,
         n_procs=omp_nthreads,